@@ -56,6 +56,7 @@ setup(
             'rockon-json = scripts.rockon_util:main',
             'send-replica = scripts.scheduled_tasks.send_replica:main',
             'st-pool-scrub = scripts.scheduled_tasks.pool_scrub:main',
+            'st-smart-sample = scripts.scheduled_tasks.smart_sample:main',
             'st-snapshot = scripts.scheduled_tasks.snapshot:main',
             'st-system-power = scripts.scheduled_tasks.reboot_shutdown:main',
         ],
@@ -18,6 +18,7 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 import collections
 import json
 import re
+import threading
 import time
 import os
 from system.osi import (
@@ -52,6 +53,8 @@ UMOUNT = "/usr/bin/umount"
 DEFAULT_MNT_DIR = "/mnt2/"
 RMDIR = "/usr/bin/rmdir"
 QID = "2015"
+# See btrfs_progs_version().
+_btrfs_progs_version = None
 # The following model/db default setting is also used when quotas are disabled.
 PQGROUP_DEFAULT = settings.MODEL_DEFS["pqgroup"]
 # Potential candidate for settings.conf.in but currently only used here and
@@ -86,6 +89,10 @@ ROOT_SUBVOL_EXCLUDE = [
 # this is to help distinguish our .snapshots from snapper's rollback subvol.
 # System-wide subvolume exclude list.
 SUBVOL_EXCLUDE = [".beeshome", "@/.beeshome"]
+# Seconds for which our process-wide btrfs state snapshot (see BtrfsStateCache)
+# is considered current. Keeps model construction, e.g. Pool.objects.all(), from
+# re-running the same 'btrfs fi show' / 'btrfs device stats' per instance.
+BTRFS_STATE_TTL = 10
 
 # tuple subclass for devices from a btrfs view.
 Dev = collections.namedtuple("Dev", "temp_name is_byid devid size allocated")
@@ -95,6 +102,10 @@ DevPoolInfo = collections.namedtuple("DevPoolInfo", "devid size allocated uuid l
 DevUsageInfo = collections.namedtuple("DevUsageInfo", "temp_name size allocated")
 # Named Tuple for default_subvol info: id (string) path (string) boot_to_snap (boolean)
 DefaultSubvol = collections.namedtuple("DefaultSubvol", "id path boot_to_snap")
+# Named Tuple for a 'btrfs subvol list' entry, absent columns are None.
+Subvol = collections.namedtuple(
+    "Subvol", "id gen cgen parent top_level parent_uuid received_uuid uuid path"
+)
 
 
 def add_pool(pool, disks):
@@ -120,6 +131,7 @@ def add_pool(pool, disks):
     # additional level of isolation.
     # Only execute enable_quota on above btrfs command having an rc=0
     if rc == 0:
+        btrfs_state.invalidate()
         out2, err2, rc2 = enable_quota(pool)
         if rc2 != 0:
             e_msg = (
@@ -196,6 +208,50 @@ def get_dev_io_error_stats(target, json_format=True):
     return json.dumps(stats)
 
 
+def get_pool_io_error_stats(mnt_pt):
+    """
+    Single call, whole pool, equivalent of get_dev_io_error_stats() via
+    'btrfs device stats mnt_pt'. Intended for bulk population of the disk model
+    io_error_stats property where one call per device would otherwise be made.
+    Output lines are of the form:
+    [/dev/vdb].write_io_errs    0
+    :param mnt_pt: Mount point of a mounted pool.
+    :return: dict indexed by the real path (symlinks resolved) of each pool
+    member, ie /dev/sda, with values of a stats dict as per
+    get_dev_io_error_stats(json_format=False). Members that failed to report,
+    ie on a degraded pool, are absent.
+    """
+    cmd = [BTRFS, "device", "stats", mnt_pt]
+    o, e, rc = run_command(cmd, throw=False)
+    if rc != 0:
+        # Members that did report are still listed in our output.
+        logger.error(
+            "Error reading io error stats of pool ({}). rc = {}, err: {}".format(
+                mnt_pt, rc, e
+            )
+        )
+    pool_stats = {}
+    for line in o:
+        fields = line.split("]")
+        # e.g. ['[/dev/vdb', '.write_io_errs    0']
+        if len(fields) != 2 or not fields[0].startswith("["):
+            continue
+        sub_fields = fields[1].lstrip(".").split()
+        if len(sub_fields) != 2:
+            continue
+        dev_path = os.path.realpath(fields[0][1:])
+        if dev_path not in pool_stats:
+            pool_stats[dev_path] = {
+                "write_io_errs": "0",
+                "read_io_errs": "0",
+                "flush_io_errs": "0",
+                "corruption_errs": "0",
+                "generation_errs": "0",
+            }
+        pool_stats[dev_path][sub_fields[0]] = sub_fields[1]
+    return pool_stats
+
+
 def is_pool_missing_dev(label):
     """
     Simple and fast wrapper around 'btrfs fi show --raw label' to return True /
@@ -250,6 +306,160 @@ def degraded_pools_found():
     return degraded_pool_count
 
 
+def fi_show_missing_map():
+    """
+    Single pass parser of 'btrfs fi show --raw' returning a map of every pool
+    label found against a boolean indicating if a device is reported missing
+    from that pool. Matches the is_pool_missing_dev() criteria, i.e. any line
+    ending in "missing", but for all pools at once. Warning lines preceding a
+    "Label" line are attributed to the pool that follows.
+    :return: dict indexed by pool label with boolean missing device status.
+    """
+    # --raw used to minimise pre-processing of irrelevant 'used' info (units).
+    cmd = [BTRFS, "fi", "show", "--raw"]
+    o, e, rc = run_command(cmd, throw=False)
+    missing_map = {}
+    pending_missing = False
+    label = None
+    for line in o:
+        if line[0:3] == "Lab":
+            # e.g. "Label: 'rock-pool'  uuid: 924d9d64-4943-4eac-a52e-19..."
+            label = line.split("'")[1] if line.count("'") >= 2 else None
+            if label is not None:
+                missing_map[label] = pending_missing
+            pending_missing = False
+            continue
+        if line == "":
+            # pool listings delimited by blank lines
+            label = None
+            continue
+        if line.endswith("missing"):
+            if label is not None:
+                missing_map[label] = True
+            else:
+                # e.g. "warning, device 2 is missing" prior to the Label line.
+                pending_missing = True
+    return missing_map
+
+
+class BtrfsStateCache(object):
+    """
+    Process-wide, TTL bound, snapshot of btrfs filesystem facts that would
+    otherwise be re-established via a subprocess for every Pool model instance.
+    - Missing device status for all pools from a single 'btrfs fi show --raw'.
+    - The default subvol of "/", which can only change across a reboot.
+    - Per mount point 'btrfs device stats -c', quota status, and pool usage.
+    Entries age out after ttl seconds and can be dropped early via
+    invalidate(), or invalidate_usage() for pool usage alone, by code paths
+    that knowingly change pool state.
+    """
+
+    def __init__(self, ttl=BTRFS_STATE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._missing_map = None
+        self._missing_map_time = 0
+        self._default_subvol = None
+        # mnt_pt indexed dicts of (timestamp, value) tuples.
+        self._dev_stats = {}
+        self._quotas = {}
+        self._usage = {}
+
+    def _fresh(self, timestamp):
+        return (time.time() - timestamp) < self.ttl
+
+    def _mnt_pt_value(self, store, mnt_pt, func):
+        with self._lock:
+            entry = store.get(mnt_pt)
+            if entry is not None and self._fresh(entry[0]):
+                return entry[1]
+        value = func(mnt_pt)
+        with self._lock:
+            store[mnt_pt] = (time.time(), value)
+        return value
+
+    def missing_dev(self, label):
+        """
+        Cached equivalent of is_pool_missing_dev(label).
+        """
+        if label is None:
+            return False
+        with self._lock:
+            missing_map = self._missing_map
+            if missing_map is None or not self._fresh(self._missing_map_time):
+                missing_map = None
+        if missing_map is None:
+            missing_map = fi_show_missing_map()
+            with self._lock:
+                self._missing_map = missing_map
+                self._missing_map_time = time.time()
+        return missing_map.get(label, False)
+
+    def default_subvol(self):
+        """
+        Cached equivalent of default_subvol(), resolved once per process as
+        only a reboot can change the default subvol of the running system.
+        """
+        with self._lock:
+            if self._default_subvol is not None:
+                return self._default_subvol
+        subvol = default_subvol()
+        with self._lock:
+            self._default_subvol = subvol
+        return subvol
+
+    def dev_stats_zero(self, mnt_pt):
+        """
+        Cached equivalent of dev_stats_zero(mnt_pt).
+        """
+        return self._mnt_pt_value(self._dev_stats, mnt_pt, dev_stats_zero)
+
+    def quotas_enabled(self, mnt_pt):
+        """
+        Cached equivalent of are_quotas_enabled(mnt_pt).
+        """
+        return self._mnt_pt_value(self._quotas, mnt_pt, are_quotas_enabled)
+
+    def pool_usage(self, mnt_pt):
+        """
+        Cached equivalent of pool_usage(mnt_pt).
+        """
+        return self._mnt_pt_value(self._usage, mnt_pt, pool_usage)
+
+    def invalidate(self, mnt_pt=None, default_subvol=False):
+        """
+        Drop cached state so the next read re-runs the relevant btrfs command.
+        :param mnt_pt: Only drop the per mount point entries for this mount
+        point (plus the all pools missing device map). None drops all entries.
+        :param default_subvol: Also drop the, otherwise per process, default
+        subvol entry.
+        """
+        with self._lock:
+            self._missing_map = None
+            if mnt_pt is None:
+                self._dev_stats.clear()
+                self._quotas.clear()
+                self._usage.clear()
+            else:
+                for store in (self._dev_stats, self._quotas, self._usage):
+                    store.pop(mnt_pt, None)
+            if default_subvol:
+                self._default_subvol = None
+
+    def invalidate_usage(self, mnt_pt):
+        """
+        Drop the cached pool usage of mnt_pt, ie after share or qgroup
+        changes which leave the pool's devices and quota status as they were.
+        :param mnt_pt: Mount point of the pool concerned.
+        """
+        with self._lock:
+            self._usage.pop(mnt_pt, None)
+
+
+# Shared by all callers within this process, i.e. Pool models and data_collector.
+btrfs_state = BtrfsStateCache()
+
+
 def set_pool_label(label, dev_temp_name, root_pool=False):
     """
     Wrapper around 'btrfs fi label dev|mnt_pt' initially intended to auto label
@@ -549,6 +759,7 @@ def mount_root(pool):
         if len(mnt_options) > 0:
             mnt_cmd.extend(["-o", mnt_options])
         run_command(mnt_cmd)
+        btrfs_state.invalidate(root_pool_mnt)
         return root_pool_mnt
     # If we cannot mount by-label, let's try mounting by device; one by one
     # until we get our first success. All devices known to our pool object
@@ -568,6 +779,7 @@ def mount_root(pool):
                 mnt_cmd.extend(["-o", mnt_options])
             try:
                 run_command(mnt_cmd)
+                btrfs_state.invalidate(root_pool_mnt)
                 return root_pool_mnt
             except Exception as e:
                 if device.name == last_device.name:
@@ -589,6 +801,7 @@ def mount_root(pool):
 def umount_root(root_pool_mnt):
     if not os.path.exists(root_pool_mnt):
         return
+    btrfs_state.invalidate(root_pool_mnt)
     try:
         o, e, rc = run_command([UMOUNT, "-l", root_pool_mnt])
     except CommandException as ce:
@@ -645,7 +858,9 @@ def add_share(pool, share_name, qid):
     toggle_path_rw(root_pool_mnt, rw=True)
     if not is_subvol(subvol_mnt_pt):
         sub_vol_cmd = [BTRFS, "subvolume", "create", "-i", qid, subvol_mnt_pt]
-        return run_command(sub_vol_cmd)
+        out, err, rc = run_command(sub_vol_cmd)
+        btrfs_state.invalidate_usage(root_pool_mnt)
+        return out, err, rc
     return True
 
 
@@ -735,7 +950,196 @@ def snapshot_idmap(pool_mnt_pt):
     return snap_idmap
 
 
-def shares_info(pool):
+def parse_subvol_line(line):
+    """
+    Parses a line of 'btrfs subvol list' output, for any combination of the
+    -p -c -q -R -u -s -a options, by its column keywords, ie:
+    'ID 258 gen 12 parent 5 top level 5 parent_uuid - received_uuid - uuid
+    2f1...e4 path home'
+    The '<FS_TREE>/' prefix added by -a, to subvols outside the listed path,
+    is removed so paths match those of a listing without -a.
+    :param line: line of btrfs subvol list output.
+    :return: Subvol named tuple, or None if line is not a subvol entry.
+    """
+    if re.match("ID ", line) is None:
+        return None
+    line, path = line.split(" path ", 1)
+    fields = line.split()
+    values = dict.fromkeys(Subvol._fields)
+    i = 0
+    while i < len(fields) - 1:
+        key = fields[i]
+        if key == "top":
+            # 'top level' is the only two word column name.
+            key = "top_level"
+            i += 1
+        elif key == "otime":
+            # otime value is itself a date and a time.
+            i += 3
+            continue
+        value = fields[i + 1]
+        values[key.lower()] = None if value == "-" else value
+        i += 2
+    if path.startswith("<FS_TREE>/"):
+        path = path[len("<FS_TREE>/") :]
+    values["path"] = path.strip()
+    return Subvol(**values)
+
+
+def parse_qgroup_show(out):
+    """
+    Parses 'btrfs qgroup show' output into a map of qgroup usage.
+    :param out: output lines of btrfs qgroup show.
+    :return: dict indexed by qgroupid, ie '0/261' or '2015/4', with values of
+    (rfer, excl) in KiB.
+    """
+    qgroups = {}
+    for line in out:
+        fields = line.split()
+        # We may index up to [2] fields (3 values) so ensure they exist.
+        if len(fields) > 2 and "/" in fields[0]:
+            qgroups[fields[0]] = (convert_to_kib(fields[1]), convert_to_kib(fields[2]))
+    return qgroups
+
+
+class SubvolInventory(object):
+    """
+    Single pass inventory of a pool's subvolumes, their read-only status and
+    qgroup usage. Replaces the many per share and per snapshot 'btrfs subvol
+    list', 'btrfs property get' and 'btrfs qgroup show' calls otherwise made
+    by a share and snapshot state refresh with three commands in all.
+    """
+
+    def __init__(self, mnt_pt):
+        self.mnt_pt = mnt_pt
+        # -a all, -p parent id, -q parent uuid, -u uuid, -R received uuid.
+        o, e, rc = run_command(
+            [BTRFS, "subvolume", "list", "-a", "-p", "-q", "-u", "-R", mnt_pt]
+        )
+        # Ordered by subvol id, as listed, so parents precede their children.
+        self.subvols = collections.OrderedDict()
+        for line in o:
+            subvol = parse_subvol_line(line)
+            if subvol is not None:
+                self.subvols[subvol.id] = subvol
+        # Batched read of the 'ro' property: -r lists read-only subvols only.
+        o, e, rc = run_command([BTRFS, "subvolume", "list", "-r", mnt_pt])
+        self.ro_ids = set()
+        for line in o:
+            subvol = parse_subvol_line(line)
+            if subvol is not None:
+                self.ro_ids.add(subvol.id)
+        # Here we depend on fail through throw=False if quotas are disabled.
+        o, e, rc = run_command([BTRFS, "qgroup", "show", mnt_pt], throw=False)
+        self.quotas_readable = rc == 0
+        self.qgroups = parse_qgroup_show(o)
+        self._fingerprint = None
+        self._by_path = {}
+        self._by_parent = collections.defaultdict(list)
+        for subvol in self.subvols.values():
+            self._by_path.setdefault(subvol.path.replace("@/", "", 1), subvol)
+            self._by_parent[subvol.parent].append(subvol)
+            if subvol.parent_uuid is not None:
+                self._by_parent[subvol.parent_uuid].append(subvol)
+
+    def is_snapshot(self, subvol):
+        # Only snapshots, including incremental receives, have a parent uuid.
+        return subvol.parent_uuid is not None
+
+    def writable(self, subvol):
+        return subvol.id not in self.ro_ids
+
+    def snap_idmap(self):
+        """
+        Equivalent of snapshot_idmap() for this inventory.
+        """
+        return {
+            s.id: s.path.replace("@/", "", 1)
+            for s in self.subvols.values()
+            if self.is_snapshot(s)
+        }
+
+    def share_subvol(self, share_name):
+        return self._by_path.get(share_name)
+
+    def snap_candidates(self, share_subvol):
+        """
+        Snapshots that may belong to the given share: those located under it,
+        snapshots of it, and recursively snapshots of those snapshots.
+        :param share_subvol: Subvol of the share.
+        :return: list of snapshot Subvols in subvol list order.
+        """
+        found = {}
+        pending = [share_subvol.id, share_subvol.uuid]
+        while len(pending) > 0:
+            key = pending.pop()
+            for subvol in self._by_parent.get(key, []):
+                if subvol.id in found or not self.is_snapshot(subvol):
+                    continue
+                found[subvol.id] = subvol
+                pending.append(subvol.uuid)
+        return sorted(found.values(), key=lambda s: int(s.id))
+
+    def fingerprint(self):
+        """
+        Summary of the pool's subvol and qgroup state which changes whenever a
+        subvol is added or removed, written to (moving its generation on), or
+        its qgroup usage changes.
+        """
+        if self._fingerprint is None:
+            self._fingerprint = (
+                tuple((s.id, s.gen) for s in self.subvols.values()),
+                tuple(sorted(self.qgroups.items())),
+            )
+        return self._fingerprint
+
+    def subvol_state(self, volume_id, pvolume_id=None):
+        """
+        Per subvol counterpart to fingerprint().
+        :param volume_id: qgroupid of subvol eg '0/261'
+        :param pvolume_id: qgroupid eg '2015/4'
+        :return: tuple of subvol generation and its usage(), generation being
+        None if the subvol is unknown.
+        """
+        subvol = self.subvols.get(volume_id.split("/")[-1])
+        gen = None if subvol is None else subvol.gen
+        return gen, self.usage(volume_id, pvolume_id)
+
+    def usage(self, volume_id, pvolume_id=None):
+        """
+        volume_usage() equivalent from our single qgroup show.
+        :return: as for volume_usage(), or None if a requested qgroup is not
+        known to this inventory, ie created after it was taken.
+        """
+        if self.quotas_readable:
+            if volume_id not in self.qgroups:
+                return None
+            if pvolume_id not in (None, PQGROUP_DEFAULT) and (
+                pvolume_id not in self.qgroups
+            ):
+                return None
+        volume_id_sizes = list(self.qgroups.get(volume_id, (0, 0)))
+        if pvolume_id is None:
+            return volume_id_sizes
+        return volume_id_sizes + list(self.qgroups.get(pvolume_id, (0, 0)))
+
+
+def subvol_inventory(pool):
+    """
+    Mounts the given pool, if need be, and returns its SubvolInventory.
+    :param pool: Pool object
+    :return: SubvolInventory or None if the pool failed to mount.
+    """
+    try:
+        return SubvolInventory(mount_root(pool))
+    except CommandException as e:
+        if e.rc == 32:
+            # mount failed, see shares_info().
+            return None
+        raise
+
+
+def shares_info(pool, inventory=None):
     """
     Returns a dictionary of share/subvol names via passed pool mount point
     lookup and using this to run "btrfs subvol list -s mnt_point" for snapshots
@@ -744,32 +1148,37 @@ def shares_info(pool):
     are immediate children of a pool (vol) are not ignored and regarded as
     shares in their own right (a Share 'clone' in Rockstor parlance).
     :param pool: Pool object
+    :param inventory: SubvolInventory of pool, to use instead of running our
+    own btrfs commands.
     :return: dictionary indexed by share/subvol names found directly under
     Pool.name. Indexed values are share/subvol qgroup ie "0/266" see
     Share.qgroup model definition.
     """
-    try:
-        pool_mnt_pt = mount_root(pool)
-    except CommandException as e:
-        if e.rc == 32:
-            # mount failed, so we just assume that something has gone wrong at
-            # a lower level, like a device failure. Return empty share map.
-            # application state can be removed. If the low level failure is
-            # recovered, state gets reconstructed anyway.
-            return {}
-        raise
-    snap_idmap = snapshot_idmap(pool_mnt_pt)
+    if inventory is not None:
+        pool_mnt_pt = inventory.mnt_pt
+        snap_idmap = inventory.snap_idmap()
+        subvols = inventory.subvols.values()
+    else:
+        try:
+            pool_mnt_pt = mount_root(pool)
+        except CommandException as e:
+            if e.rc == 32:
+                # mount failed, so we just assume that something has gone wrong
+                # at a lower level, like a device failure. Return empty share
+                # map. application state can be removed. If the low level
+                # failure is recovered, state gets reconstructed anyway.
+                return {}
+            raise
+        snap_idmap = snapshot_idmap(pool_mnt_pt)
+        o, e, rc = run_command([BTRFS, "subvolume", "list", "-p", pool_mnt_pt])
+        subvols = [s for s in map(parse_subvol_line, o) if s is not None]
     default_id = default_subvol().id
-    o, e, rc = run_command([BTRFS, "subvolume", "list", "-p", pool_mnt_pt])
     shares_d = {}
     share_ids = []
-    for l in o:
-        if re.match("ID ", l) is None:
-            continue
-        fields = l.split()
-        if fields[-1] in SUBVOL_EXCLUDE:
+    for subvol in subvols:
+        if subvol.path in SUBVOL_EXCLUDE:
             logger.debug(
-                "Skipping system-wide excluded subvol: name=({}).".format(fields[-1])
+                "Skipping system-wide excluded subvol: name=({}).".format(subvol.path)
             )
             continue
         # Exclude root fs (in subvol) to avoid dependence on subvol name to
@@ -782,18 +1191,19 @@ def shares_info(pool):
             # Vol/subvol auto mounted if no subvol/subvolid options are used.
             # Skipped to surface it's subvols as we only surface one layer.
             # Relevant to system rollback by booting from snapshots.
-            if fields[-1] in ROOT_SUBVOL_EXCLUDE or fields[1] == default_id:
-                logger.debug("Skipping excluded subvol: name=({}).".format(fields[-1]))
+            if subvol.path in ROOT_SUBVOL_EXCLUDE or subvol.id == default_id:
+                logger.debug("Skipping excluded subvol: name=({}).".format(subvol.path))
                 continue
-        vol_id = fields[1]
+        vol_id = subvol.id
         if vol_id in snap_idmap:
             # snapshot so check if is_clone:
+            writable = None if inventory is None else inventory.writable(subvol)
             s_name, writable, is_clone = parse_snap_details(
-                pool_mnt_pt, snap_idmap[vol_id]
+                pool_mnt_pt, snap_idmap[vol_id], writable
             )
             if not is_clone:
                 continue
-        parent_id = fields[5]
+        parent_id = subvol.parent
         if parent_id in share_ids:
             # subvol of subvol. add it so child subvols can also be ignored.
             share_ids.append(vol_id)
@@ -801,7 +1211,7 @@ def shares_info(pool):
             # Boot to snapshot root pools are themselves a snapshot.
             # snapshot/subvol of snapshot.
             # add it so child subvols can also be ignored.
-            snap_idmap[vol_id] = fields[-1].replace("@/", "", 1)
+            snap_idmap[vol_id] = subvol.path.replace("@/", "", 1)
         else:
             # Found subvol of pool or excluded subvol-  storing for return.
             # Non snapper root rollback config:
@@ -814,18 +1224,20 @@ def shares_info(pool):
             # vol/subvol via it's label we have /mnt2/ROOT not /mnt2/@.
             # Remove '@/' from rel path if found ie '@/home' to 'home' as then
             # pool+relative path works.
-            shares_d[fields[-1].replace("@/", "", 1)] = "0/{}".format(vol_id)
+            shares_d[subvol.path.replace("@/", "", 1)] = "0/{}".format(vol_id)
             share_ids.append(vol_id)
     return shares_d
 
 
-def parse_snap_details(pool_mnt_pt, snap_rel_path):
+def parse_snap_details(pool_mnt_pt, snap_rel_path, writable=None):
     """
     Returns a snapshot,s name or None if that snap is deemed to be a clone.
     Clone (is_clone) = writable snapshot + direct child of pool_mnt_pt.
     All calls also return writable, and is_clone booleans.
     :param pool_mnt_pt:  Pool (vol) mount point, ie: settings.MNT_PT/pool.name
     :param snap_rel_path: Relative snapshot path .
+    :param writable: Boolean if already known, ie via SubvolInventory, saves
+    a 'btrfs property get' of the ro property.
     :return: snap_name (None if clone), writable (Boolean), is_clone (Boolean)
     Note: is_clone is redundant but serves as a convenience boolean.
     """
@@ -833,7 +1245,8 @@ def parse_snap_details(pool_mnt_pt, snap_rel_path):
         full_snap_path = pool_mnt_pt + snap_rel_path
     else:
         full_snap_path = pool_mnt_pt + "/" + snap_rel_path
-    writable = not get_property(full_snap_path, "ro")
+    if writable is None:
+        writable = not get_property(full_snap_path, "ro")
     snap_name = None
     is_clone = False
     if writable and (len(snap_rel_path.split("/")) == 1):
@@ -844,7 +1257,7 @@ def parse_snap_details(pool_mnt_pt, snap_rel_path):
     return snap_name, writable, is_clone
 
 
-def snaps_info(pool_mnt_pt, share_name):
+def snaps_info(pool_mnt_pt, share_name, inventory=None):
     """
     Generates a dictionary of Rockstor relevant on-pool snapshots which do not
     include clones. See parse_snap_details() for clone definition.
@@ -853,50 +1266,57 @@ def snaps_info(pool_mnt_pt, share_name):
     and
     :param pool_mnt_pt: Pool (vol) mount point, ie: settings.MNT_PT/pool.name
     :param share_name: share/snap.name
+    :param inventory: SubvolInventory of the pool, to use instead of running
+    our own btrfs commands.
     :return: dict indexed by snap name with tuple values of:
     (qgroup, writable) where qgroup = 0/subvolid and writable = Boolean.
     """
-    # -p = show parent ID, -u = uuid of subvol, -q = parent uuid of subvol
-    o, e, rc = run_command([BTRFS, "subvolume", "list", "-u", "-p", "-q", pool_mnt_pt])
-    subvol_id = share_uuid = None
-    for l in o:
-        if re.match("ID ", l) is not None:
-            fields = l.split()
-            if fields[-1].replace("@/", "", 1) == share_name:
-                subvol_id = fields[1]
-                share_uuid = fields[12]
-    if subvol_id is None:
-        return {}
-    # addition options to above subvol list: -s = only show snapshot subvols
-    o, e, rc = run_command(
-        [BTRFS, "subvolume", "list", "-s", "-p", "-q", "-u", pool_mnt_pt]
-    )
+    if inventory is not None:
+        share_subvol = inventory.share_subvol(share_name)
+        if share_subvol is None:
+            return {}
+        snaps = inventory.snap_candidates(share_subvol)
+    else:
+        # -p = show parent ID, -u = uuid of subvol, -q = parent uuid of subvol
+        o, e, rc = run_command(
+            [BTRFS, "subvolume", "list", "-u", "-p", "-q", pool_mnt_pt]
+        )
+        share_subvol = None
+        for subvol in map(parse_subvol_line, o):
+            if subvol is not None and subvol.path.replace("@/", "", 1) == share_name:
+                share_subvol = subvol
+        if share_subvol is None:
+            return {}
+        # addition options to above subvol list: -s = only show snapshot subvols
+        o, e, rc = run_command(
+            [BTRFS, "subvolume", "list", "-s", "-p", "-q", "-u", pool_mnt_pt]
+        )
+        snaps = [s for s in map(parse_subvol_line, o) if s is not None]
     snaps_d = {}
     snap_uuids = []
-    for l in o:
-        if re.match("ID ", l) is not None:
-            fields = l.split()
-            # parent uuid must be share_uuid or another snapshot's uuid
-            if (
-                fields[7] != subvol_id
-                and fields[15] != share_uuid
-                and fields[15] not in snap_uuids
-            ):
-                continue
-            # Strip @/ prior to calling parse_snap_details, see:
-            # snapshot_idmap() for same.
-            stripped_path = fields[-1].replace("@/", "", 1)
-            snap_name, writable, is_clone = parse_snap_details(
-                pool_mnt_pt, stripped_path
-            )
-            # Redundant second clause - defence against 'None' dict index.
-            if not is_clone and snap_name is not None:
-                snaps_d[snap_name] = ("0/{}".format(fields[1]), writable)
-                # we rely on the observation that child snaps are listed after
-                # their parents, so no need to iterate through results
-                # separately. Instead, we add the uuid of a snap to the list
-                # and look up if it's a parent of subsequent entries.
-                snap_uuids.append(fields[17])
+    for snap in snaps:
+        # parent uuid must be share_uuid or another snapshot's uuid
+        if (
+            snap.parent != share_subvol.id
+            and snap.parent_uuid != share_subvol.uuid
+            and snap.parent_uuid not in snap_uuids
+        ):
+            continue
+        # Strip @/ prior to calling parse_snap_details, see:
+        # snapshot_idmap() for same.
+        stripped_path = snap.path.replace("@/", "", 1)
+        writable = None if inventory is None else inventory.writable(snap)
+        snap_name, writable, is_clone = parse_snap_details(
+            pool_mnt_pt, stripped_path, writable
+        )
+        # Redundant second clause - defence against 'None' dict index.
+        if not is_clone and snap_name is not None:
+            snaps_d[snap_name] = ("0/{}".format(snap.id), writable)
+            # we rely on the observation that child snaps are listed after
+            # their parents, so no need to iterate through results
+            # separately. Instead, we add the uuid of a snap to the list
+            # and look up if it's a parent of subsequent entries.
+            snap_uuids.append(snap.uuid)
     return snaps_d
 
 
@@ -968,6 +1388,7 @@ def remove_share(pool, share_name, pqgroup, force=False):
     qgroup = "0/{}".format(share_id(pool, share_name))
     delete_cmd = [BTRFS, "subvolume", "delete", subvol_mnt_pt]
     run_command(delete_cmd, log=True)
+    btrfs_state.invalidate_usage(root_pool_mnt)
     qgroup_destroy(qgroup, root_pool_mnt)
     return qgroup_destroy(pqgroup, root_pool_mnt)
 
@@ -1048,6 +1469,7 @@ def switch_quota(pool, flag="enable"):
             return e.out, e.err, e.rc
         # otherwise we raise an exception as normal.
         raise e
+    btrfs_state.invalidate(root_mnt_pt)
     return o, e, rc
 
 
@@ -1277,6 +1699,56 @@ def qgroup_destroy(qid, mnt_pt):
     return False
 
 
+def qgroup_clean(mnt_pt, inventory=None):
+    """
+    Destroy the level 0 qgroups, bar that of the top level subvol (0/5), of
+    subvols that no longer exist. See scripts/qgroup_clean.py.
+    :param mnt_pt: pool mount point.
+    :param inventory: SubvolInventory of the pool, taken if None.
+    :return: list of destroyed qgroupids, or None if quotas are disabled.
+    """
+    if inventory is None:
+        inventory = SubvolInventory(mnt_pt)
+    if not inventory.quotas_readable:
+        return None
+    destroyed = []
+    for qgroup in sorted(inventory.qgroups.keys()):
+        level, subvol_id = qgroup.split("/")
+        if level != "0" or subvol_id == "5" or subvol_id in inventory.subvols:
+            continue
+        run_command([BTRFS, "qgroup", "destroy", qgroup, mnt_pt])
+        destroyed.append(qgroup)
+    return destroyed
+
+
+def qgroup_maxout_limits(mnt_pt):
+    """
+    Remove the limits of all parent qgroups of our level 0 qgroups. See
+    scripts/qgroup_maxout_limit.py.
+    :param mnt_pt: pool mount point.
+    :return: list of parent qgroupids so relaxed, or None if quotas are
+    disabled.
+    """
+    o, e, rc = run_command([BTRFS, "qgroup", "show", "-p", mnt_pt], throw=False)
+    if rc != 0:
+        return None
+    parents = []
+    for l in o:
+        if re.match("qgroupid", l) is not None or re.match("-------", l) is not None:
+            continue
+        cols = l.strip().split()
+        if len(cols) != 4:
+            if len(cols) > 0:
+                logger.debug("Ignoring unexpected line ({}).".format(l))
+            continue
+        if cols[3] == "---" or cols[3] in parents:
+            continue
+        parents.append(cols[3])
+    for qgroup in parents:
+        run_command([BTRFS, "qgroup", "limit", "none", qgroup, mnt_pt])
+    return parents
+
+
 def qgroup_is_assigned(qid, pqid, mnt_pt):
     # Returns true if the given qgroup qid is already assigned to pqid for the
     # path(mnt_pt)
@@ -1464,10 +1936,11 @@ def update_quota(pool, qgroup, size_bytes):
             return out, err, rc
         # raise an exception as usual otherwise
         raise
+    btrfs_state.invalidate_usage(root_pool_mnt)
     return out, err, rc
 
 
-def volume_usage(pool, volume_id, pvolume_id=None):
+def volume_usage(pool, volume_id, pvolume_id=None, inventory=None):
     """
     New function to collect volumes rusage and eusage instead of share_usage
     plus parent rusage and eusage (2015/* qgroup)
@@ -1478,10 +1951,16 @@ def volume_usage(pool, volume_id, pvolume_id=None):
     :param pool: Pool object
     :param volume_id: qgroupid eg '0/261'
     :param pvolume_id: qgroupid eg '2015/4'
+    :param inventory: SubvolInventory of pool, consulted before running our own
+    btrfs commands.
     :return: list of len 2 (when pvolume_id=None) or 4 elements. The first 2
     pertain to the qgroupid=volume_id the second 2, if present, are for the
     qgroupid=pvolume_id. I.e [rfer, excl, rfer, excl]
     """
+    if inventory is not None:
+        usage = inventory.usage(volume_id, pvolume_id)
+        if usage is not None:
+            return usage
     # Obtain path to share in pool, this preserved because
     # granting pool exists
     root_pool_mnt = mount_root(pool)
@@ -1514,24 +1993,11 @@ def volume_usage(pool, volume_id, pvolume_id=None):
     # Here we depend on fail through throw=False if quotas are disabled/indeterminate
     cmd = [BTRFS, "qgroup", "show", volume_dir]
     out, err, rc = run_command(cmd, log=True, throw=False)
-    volume_id_sizes = [0, 0]
-    pvolume_id_sizes = [0, 0]
-    for line in out:
-        fields = line.split()
-        # We may index up to [2] fields (3 values) so ensure they exist.
-        if len(fields) > 2 and "/" in fields[0]:
-            qgroup = fields[0]
-            if qgroup == volume_id:
-                rusage = convert_to_kib(fields[1])
-                eusage = convert_to_kib(fields[2])
-                volume_id_sizes = [rusage, eusage]
-            if pvolume_id is not None and qgroup == pvolume_id:
-                pqgroup_rusage = convert_to_kib(fields[1])
-                pqgroup_eusage = convert_to_kib(fields[2])
-                pvolume_id_sizes = [pqgroup_rusage, pqgroup_eusage]
+    qgroups = parse_qgroup_show(out)
+    volume_id_sizes = list(qgroups.get(volume_id, (0, 0)))
     if pvolume_id is None:
         return volume_id_sizes
-    return volume_id_sizes + pvolume_id_sizes
+    return volume_id_sizes + list(qgroups.get(pvolume_id, (0, 0)))
 
 
 def shares_usage(pool, share_map, snap_map):
@@ -1647,13 +2113,44 @@ def usage_bound(disk_sizes, num_devices, raid_level):
     return bound * ((chunks / data_ratio) - parity) + new_bound
 
 
-def scrub_start(pool, force=False):
+def scrub_start(pool, force=False, ioprio_class=None):
+    mnt_pt = mount_root(pool)
+    p = PoolScrub(mnt_pt, force, ioprio_class=ioprio_class)
+    p.start()
+    return p.pid
+
+
+def scrub_pause(pool):
+    """
+    Pause a running scrub: btrfs records the progress of a cancelled scrub
+    and scrub_resume() continues from there.
+    :param pool: pool object.
+    """
+    mnt_pt = mount_root(pool)
+    run_command([BTRFS, "scrub", "cancel", mnt_pt], log=True)
+
+
+def scrub_resume(pool, ioprio_class=None):
     mnt_pt = mount_root(pool)
-    p = PoolScrub(mnt_pt, force)
+    p = PoolScrub(mnt_pt, resume=True, ioprio_class=ioprio_class)
     p.start()
     return p.pid
 
 
+def btrfs_progs_version():
+    """
+    Version of the installed btrfs-progs, as reported by 'btrfs version', ie
+    "v5.10". Read once per process: btrfs-progs updates, as with those of
+    rockstor itself, are followed by a restart of our services.
+    :return: version string.
+    """
+    global _btrfs_progs_version
+    if _btrfs_progs_version is None:
+        out, err, rc = run_command([BTRFS, "version"])
+        _btrfs_progs_version = out[0].strip().split()[1]
+    return _btrfs_progs_version
+
+
 def scrub_status(pool):
     """
     Returns the raw statistics per-device (-R option) of the ongoing or last
@@ -1668,8 +2165,7 @@ def scrub_status(pool):
     """
     stats = {"status": "unknown"}
     mnt_pt = mount_root(pool)
-    out3, err3, rc3 = run_command([BTRFS, "version"])
-    btrfsProgsVers = out3[0].strip().split()[1]
+    btrfsProgsVers = btrfs_progs_version()
     # Based on version of btrfs progs, set the offset to parse properly
     if parse_version(btrfsProgsVers) < parse_version("v5.1.2"):
         statOffset = 1
@@ -1809,6 +2305,22 @@ def start_balance(mnt_pt, force=False, convert=None):
     run_command(cmd)
 
 
+def balance_pause(pool):
+    """
+    Pause a running balance, the blocking 'btrfs balance start' of our
+    start_balance() task then returns. See resume_balance().
+    :param pool: pool object.
+    """
+    mnt_pt = mount_root(pool)
+    run_command([BTRFS, "balance", "pause", mnt_pt], log=True)
+
+
+@task()
+def resume_balance(mnt_pt):
+    logger.debug("Resuming balance of ({}).".format(mnt_pt))
+    run_command([BTRFS, "balance", "resume", mnt_pt])
+
+
 def balance_status(pool):
     """
     Wrapper around btrfs balance status pool_mount_point to extract info about
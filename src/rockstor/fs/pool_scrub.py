@@ -21,15 +21,21 @@ import subprocess
 
 
 class PoolScrub(Process):
-    def __init__(self, mnt_pt, force=False):
+    def __init__(self, mnt_pt, force=False, resume=False, ioprio_class=None):
         self.mnt_pt = mnt_pt
         self.force = force
+        self.resume = resume
+        # See ionice(1), ie 3 for idle.
+        self.ioprio_class = ioprio_class
         super(PoolScrub, self).__init__()
 
     def run(self):
-        cmd = ["btrfs", "scrub", "start", "-B", self.mnt_pt]
-        if self.force:
-            cmd.insert(3, "-f")
+        cmd = ["btrfs", "scrub", "resume" if self.resume else "start", "-B"]
+        if self.force and not self.resume:
+            cmd.append("-f")
+        if self.ioprio_class is not None:
+            cmd.extend(["-c", str(self.ioprio_class)])
+        cmd.append(self.mnt_pt)
         subprocess.Popen(
             cmd, shell=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE
         )
@@ -19,7 +19,10 @@ from fs.btrfs import (pool_raid, is_subvol, volume_usage, balance_status,
                       degraded_pools_found, snapshot_idmap, get_property,
                       parse_snap_details, shares_info, get_snap,
                       dev_stats_zero, get_dev_io_error_stats, DefaultSubvol,
-                      default_subvol)
+                      default_subvol, fi_show_missing_map, BtrfsStateCache,
+                      get_pool_io_error_stats, SubvolInventory,
+                      snaps_info, btrfs_progs_version, add_share,
+                      remove_share, update_quota)
 from mock import patch
 
 
@@ -49,6 +52,11 @@ class BTRFSTests(unittest.TestCase):
         # some procedures use os.path.exists so setup mock
         self.patch_os_path_exists = patch('os.path.exists')
         self.mock_os_path_exists = self.patch_os_path_exists.start()
+        # btrfs-progs version as read once per process: our scrub status
+        # output examples are all of the pre v5.1.2 format.
+        self.patch_btrfs_progs_version = patch('fs.btrfs._btrfs_progs_version',
+                                               'v4.12')
+        self.patch_btrfs_progs_version.start()
 
     def tearDown(self):
         patch.stopall()
@@ -462,6 +470,17 @@ class BTRFSTests(unittest.TestCase):
                          msg=("Failed to correctly identify balance unknown"
                               "status via parsing failure"))
 
+    def test_btrfs_progs_version(self):
+        """
+        Test btrfs_progs_version() reads 'btrfs version' once only.
+        """
+        self.mock_run_command.return_value = (['btrfs-progs v5.10 ', ''],
+                                              [''], 0)
+        with patch('fs.btrfs._btrfs_progs_version', None):
+            self.assertEqual(btrfs_progs_version(), 'v5.10')
+            self.assertEqual(btrfs_progs_version(), 'v5.10')
+        self.assertEqual(self.mock_run_command.call_count, 1)
+
     def test_scrub_status_running(self):
         """
         Test to see if scrub_status correctly identifies running status
@@ -955,6 +974,164 @@ class BTRFSTests(unittest.TestCase):
                              msg='Un-expected degraded pool count. Mock ({}) '
                                  'count expected ({})'.format(out, count))
 
+    def test_fi_show_missing_map(self):
+        """
+        Test fi_show_missing_map() attributes missing devices per pool label,
+        including "warning, device # is missing" lines preceding a Label line.
+        """
+        out = [
+            "Label: 'rockstor_install-test'  uuid: b3d201a8-b497-4365-a90d-a50c50b8e808",  # noqa E501
+            '\tTotal devices 1 FS bytes used 2306293760',
+            '\tdevid    1 size 7204765696 used 3489660928 path /dev/vdb3',
+            '',
+            "Label: 'rock-pool-2'  uuid: 52053a67-1a53-4cb8-bf17-69abca623bef",
+            '\tTotal devices 2 FS bytes used 409600',
+            '\tdevid    1 size 5368709120 used 2155872256 path /dev/vde',
+            '\tdevid    2 size 5368709120 used 16777216 path /dev/vdd',
+            '',
+            'warning, device 2 is missing',
+            "Label: 'rock-pool'  uuid: 924d9d64-4943-4eac-a52e-1918e963a34f",
+            '\tTotal devices 3 FS bytes used 475136',
+            '\tdevid    1 size 5368709120 used 310378496 path /dev/vda',
+            '\t*** Some devices missing',
+            '', '']
+        self.mock_run_command.return_value = (out, [''], 0)
+        expected = {'rockstor_install-test': False,
+                    'rock-pool-2': False,
+                    'rock-pool': True}
+        self.assertEqual(fi_show_missing_map(), expected,
+                         msg='Un-expected missing device map.')
+
+    def test_btrfs_state_cache(self):
+        """
+        Test BtrfsStateCache serves all pools from a single 'btrfs fi show'
+        and per mount point dev stats until invalidated.
+        """
+        out = [
+            "Label: 'rock-pool'  uuid: 924d9d64-4943-4eac-a52e-1918e963a34f",
+            '\tTotal devices 3 FS bytes used 475136',
+            '\tdevid    1 size 5368709120 used 310378496 path /dev/vda',
+            '\t*** Some devices missing',
+            '',
+            "Label: 'rock-pool-2'  uuid: 52053a67-1a53-4cb8-bf17-69abca623bef",
+            '\tTotal devices 1 FS bytes used 409600',
+            '\tdevid    1 size 5368709120 used 2155872256 path /dev/vde',
+            '', '']
+        self.mock_run_command.return_value = (out, [''], 0)
+        cache = BtrfsStateCache(ttl=60)
+        self.assertTrue(cache.missing_dev('rock-pool'))
+        self.assertFalse(cache.missing_dev('rock-pool-2'))
+        self.assertFalse(cache.missing_dev('unknown-pool'))
+        self.assertEqual(self.mock_run_command.call_count, 1)
+        # dev stats: rc bit 6 set indicates non zero errors.
+        self.mock_run_command.return_value = ([''], [''], 64)
+        self.assertFalse(cache.dev_stats_zero('/mnt2/rock-pool'))
+        self.assertFalse(cache.dev_stats_zero('/mnt2/rock-pool'))
+        self.assertEqual(self.mock_run_command.call_count, 2)
+        cache.invalidate('/mnt2/rock-pool')
+        self.mock_run_command.return_value = ([''], [''], 0)
+        self.assertTrue(cache.dev_stats_zero('/mnt2/rock-pool'))
+        self.assertEqual(self.mock_run_command.call_count, 3)
+
+    def test_btrfs_state_cache_usage(self):
+        """
+        Test share create, delete and resize (qgroup limit) drop the cached
+        usage of their pool, and only that pool's usage.
+        """
+        cache = BtrfsStateCache(ttl=60)
+        patch('fs.btrfs.btrfs_state', cache).start()
+        mock_pool_usage = patch('fs.btrfs.pool_usage').start()
+        mock_pool_usage.side_effect = lambda mnt_pt: mock_pool_usage.call_count
+        patch('fs.btrfs.toggle_path_rw').start()
+        patch('fs.btrfs.is_share_mounted', return_value=False).start()
+        patch('fs.btrfs.share_id', return_value='258').start()
+        patch('fs.btrfs.qgroup_destroy').start()
+        mock_is_subvol = patch('fs.btrfs.is_subvol').start()
+        self.mock_mount_root.return_value = '/mnt2/rock-pool'
+        self.mock_run_command.return_value = ([''], [''], 0)
+        pool = Pool(raid='single', name='rock-pool')
+        self.assertEqual(cache.pool_usage('/mnt2/rock-pool'), 1)
+        self.assertEqual(cache.pool_usage('/mnt2/rock-pool-2'), 2)
+        self.assertEqual(cache.pool_usage('/mnt2/rock-pool'), 1)
+        self.assertEqual(cache.dev_stats_zero('/mnt2/rock-pool'), True)
+        mock_is_subvol.return_value = False
+        add_share(pool, 'share1', '2015/2')
+        self.assertEqual(cache.pool_usage('/mnt2/rock-pool'), 3)
+        update_quota(pool, '2015/2', 1024)
+        self.assertEqual(cache.pool_usage('/mnt2/rock-pool'), 4)
+        mock_is_subvol.return_value = True
+        remove_share(pool, 'share1', '2015/2')
+        self.assertEqual(cache.pool_usage('/mnt2/rock-pool'), 5)
+        self.assertEqual(cache.pool_usage('/mnt2/rock-pool-2'), 2)
+        # Device stats survive, their 'btrfs device stats' is not re-run.
+        run_count = self.mock_run_command.call_count
+        cache.dev_stats_zero('/mnt2/rock-pool')
+        self.assertEqual(self.mock_run_command.call_count, run_count)
+
+    def test_subvol_inventory(self):
+        """
+        Test SubvolInventory derived shares, snapshots, writable state and
+        usage match those of the per share / per snapshot btrfs commands.
+        """
+        subvol_list = [
+            'ID 257 gen 33 parent 5 top level 5 parent_uuid - received_uuid - uuid 9e1a-share path share',  # noqa E501
+            'ID 258 gen 30 parent 5 top level 5 parent_uuid - received_uuid - uuid 4c3b-other path other share',  # noqa E501
+            'ID 259 gen 31 parent 5 top level 5 parent_uuid 9e1a-share received_uuid - uuid 77a0-snap path .snapshots/share/snap-1',  # noqa E501
+            'ID 260 gen 32 parent 5 top level 5 parent_uuid 77a0-snap received_uuid - uuid 0b2e-snap path .snapshots/share/snap-2',  # noqa E501
+            'ID 261 gen 33 parent 5 top level 5 parent_uuid 9e1a-share received_uuid - uuid 5d4f-clone path clone',  # noqa E501
+            'ID 262 gen 33 parent 5 top level 5 parent_uuid 4c3b-other received_uuid - uuid 3a9c-snap path <FS_TREE>/.snapshots/other/snap-3',  # noqa E501
+            '']
+        ro_list = [
+            'ID 259 gen 31 top level 5 path .snapshots/share/snap-1',
+            'ID 262 gen 33 top level 5 path .snapshots/other/snap-3',
+            '']
+        qgroup_show = [
+            'qgroupid         rfer         excl ',
+            '--------         ----         ---- ',
+            '0/5          16.00KiB     16.00KiB ',
+            '0/257         2.00MiB      1.00MiB ',
+            '0/259         2.00MiB     16.00KiB ',
+            '2015/1        3.00MiB      3.00MiB ',
+            '']
+        self.mock_run_command.side_effect = [
+            (subvol_list, [''], 0), (ro_list, [''], 0), (qgroup_show, [''], 0)]
+        inventory = SubvolInventory('/mnt2/test-pool')
+        self.assertEqual(self.mock_run_command.call_count, 3)
+        pool = Pool(raid='single', name='test-pool')
+        self.patch_default_subvol = patch('fs.btrfs.default_subvol')
+        self.mock_default_subvol = self.patch_default_subvol.start()
+        self.mock_default_subvol.return_value = DefaultSubvol('5', '(FS_TREE)',
+                                                              False)
+        self.assertEqual(shares_info(pool, inventory),
+                         {'share': '0/257', 'other share': '0/258',
+                          'clone': '0/261'})
+        self.assertEqual(snaps_info('/mnt2/test-pool', 'share', inventory),
+                         {'snap-1': ('0/259', False),
+                          'snap-2': ('0/260', True)})
+        self.assertEqual(snaps_info('/mnt2/test-pool', 'other share',
+                                    inventory),
+                         {'snap-3': ('0/262', False)})
+        self.assertEqual(snaps_info('/mnt2/test-pool', 'missing', inventory),
+                         {})
+        self.assertEqual(volume_usage(pool, '0/257', '2015/1', inventory),
+                         [2048, 1024, 3072, 3072])
+        self.assertEqual(volume_usage(pool, '0/259', inventory=inventory),
+                         [2048, 16])
+        self.assertEqual(volume_usage(pool, '0/257', '-1/-1', inventory),
+                         [2048, 1024, 0, 0])
+        self.assertEqual(inventory.subvol_state('0/257', '2015/1'),
+                         ('33', [2048, 1024, 3072, 3072]))
+        # No further btrfs commands were run.
+        self.assertEqual(self.mock_run_command.call_count, 3)
+        # A write to any subvol moves the pool fingerprint on.
+        subvol_list[1] = subvol_list[1].replace('gen 30', 'gen 34')
+        self.mock_run_command.side_effect = [
+            (subvol_list, [''], 0), (ro_list, [''], 0), (qgroup_show, [''], 0)]
+        written = SubvolInventory('/mnt2/test-pool')
+        self.assertNotEqual(written.fingerprint(), inventory.fingerprint())
+        self.assertEqual(written.subvol_state('0/257', '2015/1'),
+                         inventory.subvol_state('0/257', '2015/1'))
+
     def test_snapshot_idmap_no_snaps(self):
         """
          Tests for empty return when no snapshots found
@@ -1745,6 +1922,45 @@ class BTRFSTests(unittest.TestCase):
                                                                 expected))
             self.assertEqual(returned, expected, msg=msg)
 
+    def test_get_pool_io_error_stats(self):
+        """
+        Present whole pool 'btrfs device stats' output to
+        get_pool_io_error_stats() and expect a per member stats dict.
+        """
+        out = ['[/dev/vdb].write_io_errs    0',
+               '[/dev/vdb].read_io_errs     0',
+               '[/dev/vdb].flush_io_errs    0',
+               '[/dev/vdb].corruption_errs  0',
+               '[/dev/vdb].generation_errs  0',
+               '[/dev/sdc].write_io_errs    204669',
+               '[/dev/sdc].read_io_errs     81232',
+               '[/dev/sdc].flush_io_errs    782',
+               '[/dev/sdc].corruption_errs  2985',
+               '[/dev/sdc].generation_errs  47',
+               '']
+        self.mock_run_command.return_value = (out, [''], 0)
+        expected = {
+            '/dev/vdb': {'write_io_errs': '0', 'read_io_errs': '0',
+                         'flush_io_errs': '0', 'corruption_errs': '0',
+                         'generation_errs': '0'},
+            '/dev/sdc': {'write_io_errs': '204669', 'read_io_errs': '81232',
+                         'flush_io_errs': '782', 'corruption_errs': '2985',
+                         'generation_errs': '47'},
+        }
+        self.assertEqual(get_pool_io_error_stats('/mnt2/test-pool'), expected,
+                         msg='Un-expected get_pool_io_error_stats() result.')
+        # Non btrfs mount point.
+        self.mock_run_command.return_value = (
+            [''], ["ERROR: '/mnt2/test-pool' is not a mounted btrfs device",
+                   ''], 1)
+        self.assertEqual(get_pool_io_error_stats('/mnt2/test-pool'), {})
+        # Degraded pool: members that did report are kept.
+        self.mock_run_command.return_value = (
+            out[:5], ["ERROR: cannot get device stats for devid 2: "
+                      "No such device", ''], 1)
+        self.assertEqual(get_pool_io_error_stats('/mnt2/test-pool'),
+                         {'/dev/vdb': expected['/dev/vdb']})
+
     def test_get_dev_io_error_stats(self):
         """
         Present various device io error stats and return codes to
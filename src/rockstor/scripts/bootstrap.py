@@ -20,17 +20,9 @@ import sys
 import time
 from cli.api_wrapper import APIWrapper
 from fs.btrfs import device_scan
-from system.osi import run_command
-from django.conf import settings
 from storageadmin.models import Setup
 
 
-BASE_DIR = settings.ROOT_DIR
-BASE_BIN = "%sbin" % BASE_DIR
-QGROUP_CLEAN = "%s/qgroup-clean" % BASE_BIN
-QGROUP_MAXOUT_LIMIT = "%s/qgroup-maxout-limit" % BASE_BIN
-
-
 def main():
 
     try:
@@ -56,7 +48,7 @@ def main():
             aw = APIWrapper()
             time.sleep(2)
             aw.api_call("network")
-            aw.api_call("commands/bootstrap", calltype="post")
+            report = aw.api_call("commands/bootstrap", calltype="post")
             break
         except Exception as e:
             # Retry on every exception, primarily because of django-oauth
@@ -76,18 +68,23 @@ def main():
             time.sleep(2)
             num_attempts += 1
     print("Bootstrapping complete")
-
-    try:
-        print("Running qgroup cleanup. %s" % QGROUP_CLEAN)
-        run_command([QGROUP_CLEAN])
-    except Exception as e:
-        print("Exception while running %s: %s" % (QGROUP_CLEAN, e.__str__()))
-
-    try:
-        print("Running qgroup limit maxout. %s" % QGROUP_MAXOUT_LIMIT)
-        run_command([QGROUP_MAXOUT_LIMIT])
-    except Exception as e:
-        print("Exception while running %s: %s" % (QGROUP_MAXOUT_LIMIT, e.__str__()))
+    # Per phase timing, as reported by CommandView._bootstrap().
+    if isinstance(report, dict):
+        print("Bootstrap took %ss" % report.get("total"))
+        for phase, p in report.get("phases", {}).items():
+            print(
+                "  %s: %d tasks (%d failed, %d skipped) from %ss to %ss, "
+                "busy %ss"
+                % (
+                    phase,
+                    p["tasks"],
+                    p["failed"],
+                    p["skipped"],
+                    p["start"],
+                    p["end"],
+                    p["busy"],
+                )
+            )
 
 
 if __name__ == "__main__":
@@ -22,14 +22,14 @@ from datetime import datetime, time
 # snapshots and scrubs tasks
 
 
-def crontab_range(range):
+def crontab_range(range, now=None):
     inrange = False
     # logger.debug('Crontab window is %s' % range)
     if range == "*-*-*-*-*-*":
         # on range value equal to always (*-*-*-*-*-*), always exec tasks
         inrange = True
     else:
-        today = datetime.today()
+        today = datetime.today() if now is None else now
         today_time = today.time()
         today_weekday = today.weekday()
         range_windows = range.split("-")
@@ -22,6 +22,8 @@ import json
 from datetime import datetime
 import crontabwindow  # load crontabwindow module
 from smart_manager.models import Task, TaskDefinition
+from smart_manager.scrub_monitor import ACTIVE_SCRUB_STATES, scrub_is_stale
+from storageadmin.models import PoolScrub
 from cli.api_wrapper import APIWrapper
 from django.utils.timezone import utc
 import logging
@@ -33,12 +35,18 @@ TERMINAL_SCRUB_STATES = ["error", "finished", "halted", "cancelled", "conn-reset
 
 
 def update_state(t, pool, aw):
-    url = "pools/%s/scrub/status" % pool
     try:
-        status = aw.api_call(url, data=None, calltype="post", save_error=False)
-        t.state = status["status"]
+        ps = PoolScrub.objects.filter(pool_id=pool).order_by("-id")[0]
+        if ps.status in ACTIVE_SCRUB_STATES and scrub_is_stale(ps):
+            # Not recently followed by data-collector's scrub monitor: have
+            # our api read, and record, the current status.
+            url = "pools/%s/scrub/status" % pool
+            status = aw.api_call(url, data=None, calltype="post", save_error=False)
+            t.state = status["status"]
+        else:
+            t.state = ps.status
     except Exception as e:
-        logger.error("Failed to get scrub status at %s" % url)
+        logger.error("Failed to get scrub status of pool(%s)" % pool)
         t.state = "error"
         logger.exception(e)
     finally:
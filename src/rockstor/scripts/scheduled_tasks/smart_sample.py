@@ -0,0 +1,67 @@
+"""
+Copyright (c) 2012-2021 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+from datetime import datetime
+import crontabwindow  # load crontabwindow module
+from storageadmin.models import Disk
+from storageadmin.views.smart_helpers import sample_smart_history
+from smart_manager.models import Task, TaskDefinition
+from django.utils.timezone import utc
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    tid = int(sys.argv[1])
+    cwindow = sys.argv[2] if len(sys.argv) > 2 else "*-*-*-*-*-*"
+    if crontabwindow.crontab_range(cwindow):
+        # Performance note: immediately check task execution time/day window
+        # range to avoid other calls
+        tdo = TaskDefinition.objects.get(id=tid)
+        if tdo.task_type != "smart":
+            return logger.error("task_type(%s) is not smart." % tdo.task_type)
+        now = datetime.utcnow().replace(second=0, microsecond=0, tzinfo=utc)
+        t = Task(task_def=tdo, state="started", start=now)
+        t.save()
+        try:
+            # Each collection extends our SMART attribute history and updates
+            # the disk's smart_risk score: without a full SMARTInfo snapshot.
+            disks = list(Disk.objects.filter(offline=False, smart_enabled=True))
+            sampled = sample_smart_history(disks)
+            logger.debug(
+                "Sampled S.M.A.R.T data of %d of %d disks." % (len(sampled), len(disks))
+            )
+            t.state = "finished"
+        except Exception as e:
+            logger.error("Failed to sample S.M.A.R.T data.")
+            t.state = "error"
+            logger.exception(e)
+        finally:
+            t.end = datetime.utcnow().replace(tzinfo=utc)
+            t.save()
+    else:
+        logger.debug(
+            "Cron scheduled task not executed because outside time/day window ranges"
+        )
+
+
+if __name__ == "__main__":
+    # takes two arguments. taskdef object id and crontabwindow.
+    main()
@@ -52,7 +52,30 @@ import time  # noqa E402
 from django.utils.timezone import utc  # noqa E402
 from storageadmin.models import Disk, Pool  # noqa E402
 from smart_manager.models import Service  # noqa E402
-from system.services import service_status  # noqa E402
+from system.services import service_status, service_statuses  # noqa E402
+from smart_manager.metrics import (  # noqa E402
+    MetricsRecorder,
+    disk_deltas,
+    net_deltas,
+    read_diskstats,
+    read_meminfo,
+    read_net_dev,
+)
+from smart_manager.scrub_monitor import ScrubMonitor  # noqa E402
+from smart_manager.maintenance import MaintenanceScheduler  # noqa E402
+from system.logreader import (  # noqa E402
+    read_page,
+    tail_lines,
+    follow,
+    search_log,
+    parse_time,
+    SearchCancelled,
+)
+from system.udev import (  # noqa E402
+    UDEV_MONITOR_CMD,
+    BlockDeviceTable,
+    read_udev_events,
+)
 from cli.api_wrapper import APIWrapper  # noqa E402
 from system.pkg_mgmt import rockstor_pkg_update_check, pkg_update_check  # noqa E402
 import distro
@@ -60,6 +83,10 @@ import logging  # noqa E402
 
 logger = logging.getLogger(__name__)
 
+# Seconds between full disk re-scans, when otherwise only devices flagged by
+# udev events are re-scanned.
+DISK_FULL_SCAN_INTERVAL = 600
+
 
 class RockstorIO(socketio.Namespace):
     "RockstorIO socketio.NameSpace SubClass"
@@ -232,9 +259,7 @@ class PincardManagerNamespace(RockstorIO):
 
 class LogManagerNamespace(RockstorIO):
 
-    # Livereader subprocess append with self so accessible by all funcs
-    livereader_process = None
-    # Live reading switch to kill/stop tail -f process
+    # Live reading switch to stop following a log
     livereading = False
     # Set common vars used both for log reading and downloading
     system_logs = "/var/log/"
@@ -242,12 +267,12 @@ class LogManagerNamespace(RockstorIO):
     samba_subd_logs = "%ssamba/" % system_logs
     nginx_subd_logs = "%snginx/" % system_logs
 
-    readers = {
-        "cat": {"command": "/usr/bin/cat", "args": "-n"},
-        "tail200": {"command": "/usr/bin/tail", "args": "-n 200"},
-        "tail30": {"command": "/usr/bin/tail", "args": "-n 30"},
-        "tailf": {"command": "/usr/bin/tail", "args": "-f"},
-    }
+    # Readers of the last n lines, others being "cat" (whole log, numbered)
+    # and "tailf" (follow).
+    tail_readers = {"tail200": 200, "tail30": 30}
+    # Lines per logcontent emit when reading a whole log, and max lines per
+    # readlogpage request.
+    page_lines = 200
 
     logs = {
         "rockstor": {"logfile": "rockstor.log", "logdir": rockstor_logs},
@@ -292,6 +317,11 @@ class LogManagerNamespace(RockstorIO):
 
     tar_utility = ["/usr/bin/tar", "czf"]
 
+    # Per client id of its current log search, a new search or cancelsearch
+    # abandoning any prior one still scanning
+    searches = {}
+    search_count = 0
+
     def on_connect(self, sid, environ):
 
         # On first connection emit a welcome just to have a recv_connect func
@@ -303,10 +333,10 @@ class LogManagerNamespace(RockstorIO):
 
     def on_disconnect(self, sid):
 
-        # Func to secure tail -f reader If browser close/crash/accidentally
-        # ends while a tail -f running, this ensures running process to get
-        # stopped
+        # Func to secure live reader If browser close/crash/accidentally
+        # ends while following a log, this ensures we stop following it
         self.spawn(self.kill_live_reading, sid)
+        self.searches.pop(sid, None)
         self.cleanup(sid)
 
     def build_log_path(self, selectedlog):
@@ -317,16 +347,10 @@ class LogManagerNamespace(RockstorIO):
 
     def kill_live_reading(self):
 
-        # When user close modal log reader check livereading switch and
-        # livereader_process Immediately set livereading switch to False and
-        # stop emitting to frontend If livereader_process is None we were
-        # reading logs with cat, tail -n 200 or tail -n 30 Otherwise it was
-        # changed to a subprocess by tail -f, so we kill it and set back to
-        # None to avoid other readers trying killing nothing
+        # When user close modal log reader immediately set livereading
+        # switch to False: live_reader then stops following the log and
+        # emitting to frontend within logreader.FOLLOW_TIMEOUT
         self.livereading = False
-        if self.livereader_process is not None:
-            self.livereader_process.kill()
-            self.livereader_process = None
 
     def find_rotating_logs(self):
 
@@ -431,7 +455,7 @@ class LogManagerNamespace(RockstorIO):
     def on_readlog(self, sid, reader, logfile):
 
         logs_loader = {
-            "slow": {"lines": 200, "sleep": 0.50},
+            "slow": {"lines": self.page_lines, "sleep": 0.50},
             "fast": {"lines": 1, "sleep": 0.05},
         }
 
@@ -443,40 +467,32 @@ class LogManagerNamespace(RockstorIO):
             else:
                 return False
 
-        def build_reader_command(reader):
-
-            command = []
-            command.append(self.readers[reader]["command"])
-            # If our reader has opt args we add them to popen command
-            if "args" in self.readers[reader]:
-                command.append(self.readers[reader]["args"])
-            # Queue log file to popen command
-            command.append(log_path)
-            return command
+        def log_chunks(reader, log_path):
+            # Generator of (lines, total_rows) read via our seekable line
+            # index so memory use is independent of log size
+            if reader in self.tail_readers:
+                log_content = tail_lines(log_path, self.tail_readers[reader])
+                yield log_content, len(log_content)
+                return
+            start, total_rows = 0, None
+            while total_rows is None or start < total_rows:
+                start, log_content, total_rows = read_page(
+                    log_path, start, self.page_lines
+                )
+                if len(log_content) == 0:
+                    break
+                # As per cat -n
+                yield [
+                    "{:6d}\t{}".format(start + n + 1, line)
+                    for n, line in enumerate(log_content)
+                ], total_rows
+                start += len(log_content)
 
         def static_reader(reader, log_path):
             if valid_log(log_path):
                 # Log file exist and greater than 0, perform data collecting
-
-                # Build reader command
-                read_command = build_reader_command(reader)
-
-                # Define popen process and once completed split stdout by lines
-                reader_process = Popen(read_command, bufsize=1, stdout=PIPE)
-                log_content = reader_process.communicate()[0]
-                log_contentsize = getsizeof(log_content)
-                log_content = log_content.splitlines(True)
-
-                # Starting from content num of lines decide if serve it 1
-                # line/time or in 200 lines chunks
-                reader_type = "fast" if (len(log_content) <= 200) else "slow"
-                chunk_size = logs_loader[reader_type]["lines"]
-                reader_sleep = logs_loader[reader_type]["sleep"]
-                log_content_chunks = [
-                    log_content[x : x + chunk_size]
-                    for x in xrange(0, len(log_content), chunk_size)
-                ]  # noqa F821
-                total_rows = len(log_content)
+                log_contentsize = path.getsize(log_path)
+                chunks = log_chunks(reader, log_path)
 
             else:  # Log file missing or size 0, gently inform user
 
@@ -485,56 +501,62 @@ class LogManagerNamespace(RockstorIO):
                 # client side extra checks
                 log_content = "Selected log file is empty or doesn't exist"
                 log_content = log_content.splitlines(True)
-                total_rows = 1
                 log_contentsize = getsizeof(log_content)
-                log_content_chunks = []
-                log_content_chunks.append(log_content)
-                reader_sleep = 0
+                chunks = [(log_content, 1)]
 
             # Serve each chunk with emit and sleep before next one to avoid
-            # client side browser overload
+            # client side browser overload. Starting from content num of lines
+            # decide if serve it 1 line/time or in 200 lines chunks
             current_rows = 0
-
-            for data_chunks in log_content_chunks:
-                chunk_content = "".join(data_chunks)
-                current_rows += len(data_chunks)
-                self.emit(
-                    "logcontent",
-                    {
-                        "key": "logManager:logcontent",
-                        "data": {
-                            "current_rows": current_rows,
-                            "total_rows": total_rows,
-                            "chunk_content": chunk_content,
-                            "content_size": log_contentsize,
+            for log_content, total_rows in chunks:
+                reader_type = "fast" if (total_rows <= self.page_lines) else "slow"
+                chunk_size = logs_loader[reader_type]["lines"]
+                reader_sleep = logs_loader[reader_type]["sleep"]
+                if total_rows == 1:
+                    reader_sleep = 0
+                for x in xrange(0, len(log_content), chunk_size):  # noqa F821
+                    data_chunks = log_content[x : x + chunk_size]
+                    current_rows += len(data_chunks)
+                    self.emit(
+                        "logcontent",
+                        {
+                            "key": "logManager:logcontent",
+                            "data": {
+                                "current_rows": current_rows,
+                                "total_rows": total_rows,
+                                "chunk_content": "".join(data_chunks),
+                                "content_size": log_contentsize,
+                            },
                         },
-                    },
-                )
-                gevent.sleep(reader_sleep)
+                    )
+                    gevent.sleep(reader_sleep)
 
         def live_reader(log_path):
 
             # Switch live reader state to True
             self.livereading = True
 
-            # Build reader command from readers dict
-            read_command = build_reader_command("tailf")
-
-            self.livereader_process = Popen(read_command, bufsize=1, stdout=PIPE)
-            while self.livereading:
-                live_out = self.livereader_process.stdout.readline()
-                self.emit(
-                    "logcontent",
-                    {
-                        "key": "logManager:logcontent",
-                        "data": {
-                            "current_rows": 1,
-                            "total_rows": 1,
-                            "chunk_content": live_out,
-                            "content_size": 1,
+            appended = follow(log_path)
+            try:
+                for live_out in appended:
+                    if not self.livereading:
+                        break
+                    if len(live_out) == 0:
+                        continue
+                    self.emit(
+                        "logcontent",
+                        {
+                            "key": "logManager:logcontent",
+                            "data": {
+                                "current_rows": 1,
+                                "total_rows": 1,
+                                "chunk_content": "".join(live_out),
+                                "content_size": 1,
+                            },
                         },
-                    },
-                )
+                    )
+            finally:
+                appended.close()
 
         log_path = self.build_log_path(logfile)
 
@@ -543,6 +565,79 @@ class LogManagerNamespace(RockstorIO):
         else:
             self.spawn(static_reader, sid, reader, log_path)
 
+    def on_readlogpage(self, sid, logfile, start, count):
+        def page_reader(logfile, start, count):
+            # Arbitrary page of a log, by 0 based line number, negative start
+            # counting from the end of the log ie -200 for its last 200 lines
+            log_path = self.build_log_path(logfile)
+            count = min(int(count), self.page_lines)
+            try:
+                start, log_content, total_rows = read_page(log_path, int(start), count)
+            except (IOError, OSError):
+                start, log_content, total_rows = 0, [], 0
+            self.emit(
+                "logpage",
+                {
+                    "key": "logManager:logpage",
+                    "data": {
+                        "log": logfile,
+                        "start": start,
+                        "lines": log_content,
+                        "total_rows": total_rows,
+                    },
+                },
+            )
+
+        self.spawn(page_reader, sid, logfile, start, count)
+
+    def on_searchlog(self, sid, logfile, query):
+
+        self.search_count += 1
+        search_id = self.search_count
+        self.searches[sid] = search_id
+
+        def cancelled():
+            # Also our yield to other greenlets during a long scan
+            gevent.sleep(0)
+            return self.searches.get(sid) != search_id
+
+        def log_searcher(logfile, query):
+            # query: {"pattern": "NT_STATUS", "regex": false,
+            # "ignore_case": false, "since": "2021-10-18 19:00:00",
+            # "until": "", "start": 0, "count": 100}
+            data = {"log": logfile, "query": query}
+            try:
+                result = search_log(
+                    self.build_log_path(logfile),
+                    query["pattern"],
+                    regex=query.get("regex", False),
+                    ignore_case=query.get("ignore_case", False),
+                    since=parse_time(query.get("since")),
+                    until=parse_time(query.get("until")),
+                    start=int(query.get("start", 0)),
+                    count=min(int(query.get("count", 100)), self.page_lines),
+                    cancelled=cancelled,
+                )
+                data.update(result)
+            except SearchCancelled:
+                return
+            except Exception as e:
+                logger.error(
+                    "Exception while searching log ({}): {}".format(logfile, e)
+                )
+                data["error"] = "{}".format(e)
+            if self.searches.get(sid) == search_id:
+                del self.searches[sid]
+            self.emit(
+                "logsearch", {"key": "logManager:logsearch", "data": data}, room=sid
+            )
+
+        self.spawn(log_searcher, sid, logfile, query)
+
+    def on_cancelsearch(self, sid):
+
+        self.searches.pop(sid, None)
+
     def on_getfilesize(self, sid, logfile):
         def file_size(logfile):
 
@@ -552,292 +647,186 @@ class LogManagerNamespace(RockstorIO):
         self.spawn(file_size, sid, logfile)
 
 
-class DisksWidgetNamespace(RockstorIO):
+class SamplerNamespace(RockstorIO):
+    """
+    Base for dashboard widget namespaces whose data is the same for every
+    client. A single sampling greenlet per namespace, started on the first
+    connection and killed after the last disconnection, emits to a room
+    holding all connected clients. Sampling cost is therefore independent of
+    the number of open dashboards. Subclasses implement sample().
+    """
 
-    switch = False
-    byid_disk_map = {}
+    room = "widget"
+    # Seconds between samples.
+    interval = 1
+
+    def __init__(self, *args, **kwargs):
+
+        super(SamplerNamespace, self).__init__(*args, **kwargs)
+        self.subscribers = set()
+        self.sampler = None
 
     def on_connect(self, sid, environ):
 
-        self.byid_disk_map = get_byid_name_map()
-        self.switch = True
-        self.spawn(self.send_top_disks, sid)
+        self.enter_room(sid, self.room)
+        self.subscribers.add(sid)
+        if self.sampler is None or self.sampler.dead:
+            self.sampler = gevent.spawn(self.run_sampler)
 
     def on_disconnect(self, sid):
 
-        self.cleanup(sid)
-        self.switch = False
-
-    def send_top_disks(self):
-        def disk_stats(prev_stats):
-
-            disks_stats = []
-            # invoke body of disk_stats with empty cur_stats
-            stats_file_path = "/proc/diskstats"
-            cur_stats = {}
-            interval = 1
-            # TODO: Consider refactoring the following to use Disk.temp_name or
-            # TODO: building byid_disk_map from the same. Ideally we would have
-            # TODO: performance testing in place prior to this move.
-            # Build a list of our db's disk names, now in by-id type format.
-            disks = [d.name for d in Disk.objects.all()]
-            # /proc/diskstats has lines of the following form:
-            #  8      64 sde 1034 0 9136 702 0 0 0 0 0 548 702
-            #  8      65 sde1 336 0 2688 223 0 0 0 0 0 223 223
-            with open(stats_file_path) as stats_file:
-                for line in stats_file.readlines():
-                    fields = line.split()
-                    # As the /proc/diskstats lines contain transient type names
-                    # we need to convert those to our by-id db names.
-                    byid_name = self.byid_disk_map[fields[2]]
-                    if byid_name not in disks:
-                        # the disk name in this line is not one in our db so
-                        # ignore it and move to the next line.
-                        continue
-                    cur_stats[byid_name] = fields[3:]
-            for disk in cur_stats.keys():
-                if disk in prev_stats:
-                    prev = prev_stats[disk]
-                    cur = cur_stats[disk]
-                    data = []
-                    for i in range(0, len(prev)):
-                        if i == 8:
-                            avg_ios = (float(cur[i]) + float(prev[i])) / 2
-                            data.append(avg_ios)
-                            continue
-                        datum = None
-                        if cur[i] < prev[i]:
-                            datum = float(cur[i]) / interval
-                        else:
-                            datum = (float(cur[i]) - float(prev[i])) / interval
-                        data.append(datum)
-                    disks_stats.append(
-                        {
-                            "name": disk,
-                            "reads_completed": data[0],
-                            "reads_merged": data[1],
-                            "sectors_read": data[2],
-                            "ms_reading": data[3],
-                            "writes_completed": data[4],
-                            "writes_merged": data[5],
-                            "sectors_written": data[6],
-                            "ms_writing": data[7],
-                            "ios_progress": data[8],
-                            "ms_ios": data[9],
-                            "weighted_ios": data[10],
-                            "ts": str(
-                                datetime.utcnow().replace(tzinfo=utc).isoformat()
-                            ),  # noqa E501
-                        }
-                    )
+        self.leave_room(sid, self.room)
+        self.subscribers.discard(sid)
+        if len(self.subscribers) == 0 and self.sampler is not None:
+            self.sampler.kill(block=False)
+            self.sampler = None
 
-            self.emit("top_disks", {"key": "diskWidget:top_disks", "data": disks_stats})
-            return cur_stats
+    def run_sampler(self):
 
-        def get_stats():
-            cur_disk_stats = {}
-            while self.switch:
-                cur_disk_stats = disk_stats(cur_disk_stats)
-                gevent.sleep(1)
+        prev_sample = None
+        while True:
+            try:
+                prev_sample = self.sample(prev_sample)
+            except Exception as e:
+                logger.exception(
+                    "Exception while sampling for ({}): {}".format(self.namespace, e)
+                )
+                prev_sample = None
+            gevent.sleep(self.interval)
 
-        # Kick things off
-        get_stats()
+    def sample(self, prev_sample):
+        """
+        Take and broadcast one sample. By default, nothing is sampled.
+        :param prev_sample: return value of our prior call, None on first.
+        :return: state to be passed to our next call, ie for deltas.
+        """
+        return prev_sample
 
+    def broadcast(self, event, data):
 
-class CPUWidgetNamespace(RockstorIO):
+        self.emit(event, data, room=self.room)
 
-    send_cpu = False
 
-    def on_connect(self, sid, environ):
+class DbNamesSampler(SamplerNamespace):
+    """
+    Sampler keeping a periodically refreshed list of names from the db,
+    rather than querying on every sample.
+    """
 
-        # Switch for emitting cpu data
-        self.send_cpu = True
-        self.spawn(self.send_cpu_data, sid)
+    # Seconds between db re-reads of our names of interest.
+    names_refresh = 30
 
-    def on_disconnect(self, sid):
+    def __init__(self, *args, **kwargs):
 
-        self.cleanup(sid)
-        self.send_cpu = False
-
-    def send_cpu_data(self):
-
-        while self.send_cpu:
-            cpu_stats = {}
-            cpu_stats["results"] = []
-            vals = psutil.cpu_times_percent(percpu=True)
-            ts = datetime.utcnow().replace(tzinfo=utc).isoformat()
-            for i, val in enumerate(vals):
-                name = "cpu%d" % i
-                cpu_stats["results"].append(
-                    {
-                        "name": name,
-                        "umode": val.user,
-                        "umode_nice": val.nice,
-                        "smode": val.system,
-                        "idle": val.idle,
-                        "ts": str(ts),
-                    }
-                )
-            self.emit("cpudata", {"key": "cpuWidget:cpudata", "data": cpu_stats})
-            gevent.sleep(1)
+        super(DbNamesSampler, self).__init__(*args, **kwargs)
+        self._names = None
+        self._names_ts = 0
 
+    def db_names(self):
+        """
+        :return: set of names of interest, ie our db's disk names. By
+        default, none.
+        """
+        return set()
 
-class NetworkWidgetNamespace(RockstorIO):
+    def names(self):
 
-    send = False
+        now = time.time()
+        if self._names is None or now - self._names_ts > self.names_refresh:
+            self._names = self.db_names()
+            self._names_ts = now
+        return self._names
 
-    def on_connect(self, sid, environ):
 
-        self.send = True
-        self.spawn(self.network_stats, sid)
+class DisksWidgetNamespace(DbNamesSampler):
+    def __init__(self, *args, **kwargs):
 
-    def on_disconnect(self, sid):
+        super(DisksWidgetNamespace, self).__init__(*args, **kwargs)
+        self.byid_disk_map = {}
 
-        self.cleanup(sid)
-        self.send = False
+    def db_names(self):
 
-    def network_stats(self):
+        # TODO: Consider refactoring the following to use Disk.temp_name or
+        # TODO: building byid_disk_map from the same. Ideally we would have
+        # TODO: performance testing in place prior to this move.
+        # Refresh our canonical to by-id name map along with our db's disk
+        # names, now in by-id type format.
+        self.byid_disk_map = get_byid_name_map()
+        return set(d.name for d in Disk.objects.all())
 
-        from storageadmin.models import NetworkDevice
+    def sample(self, prev_stats):
 
-        def retrieve_network_stats(prev_stats):
-
-            interfaces = [i.name for i in NetworkDevice.objects.all()]
-            interval = 1
-            cur_stats = {}
-            with open("/proc/net/dev") as sfo:
-                sfo.readline()
-                sfo.readline()
-                for l in sfo.readlines():
-                    fields = l.split()
-                    if fields[0][:-1] not in interfaces:
-                        continue
-                    cur_stats[fields[0][:-1]] = fields[1:]
-            ts = datetime.utcnow().replace(tzinfo=utc).isoformat()
-            if isinstance(prev_stats, dict):
-                results = []
-                for interface in cur_stats.keys():
-                    if interface in prev_stats:
-                        data = map(
-                            lambda x, y: float(x) / interval
-                            if x < y
-                            else (float(x) - float(y)) / interval,
-                            cur_stats[interface],
-                            prev_stats[interface],
-                        )
-                        results.append(
-                            {
-                                "device": interface,
-                                "kb_rx": data[0],
-                                "packets_rx": data[1],
-                                "errs_rx": data[2],
-                                "drop_rx": data[3],
-                                "fifo_rx": data[4],
-                                "frame": data[5],
-                                "compressed_rx": data[6],
-                                "multicast_rx": data[7],
-                                "kb_tx": data[8],
-                                "packets_tx": data[9],
-                                "errs_tx": data[10],
-                                "drop_tx": data[11],
-                                "fifo_tx": data[12],
-                                "colls": data[13],
-                                "carrier": data[14],
-                                "compressed_tx": data[15],
-                                "ts": str(ts),
-                            }
-                        )
-                if len(results) > 0:
-                    self.emit(
-                        "network",
-                        {"key": "networkWidget:network", "data": {"results": results}},
-                    )
+        # names() may refresh byid_disk_map, so must be called first.
+        names = self.names()
+        cur_stats = read_diskstats(self.byid_disk_map, names)
+        if prev_stats is None:
             return cur_stats
+        ts = str(datetime.utcnow().replace(tzinfo=utc).isoformat())
+        disks_stats = []
+        for disk, data in disk_deltas(cur_stats, prev_stats, self.interval).items():
+            data.update({"name": disk, "ts": ts})
+            disks_stats.append(data)
+        self.broadcast(
+            "top_disks", {"key": "diskWidget:top_disks", "data": disks_stats}
+        )
+        return cur_stats
 
-        def send_network_stats():
-
-            cur_stats = {}
-            while self.send:
-                cur_stats = retrieve_network_stats(cur_stats)
-                gevent.sleep(1)
 
-        send_network_stats()
+class CPUWidgetNamespace(SamplerNamespace):
+    def sample(self, prev_sample):
 
+        cpu_stats = {}
+        cpu_stats["results"] = []
+        vals = psutil.cpu_times_percent(percpu=True)
+        ts = datetime.utcnow().replace(tzinfo=utc).isoformat()
+        for i, val in enumerate(vals):
+            name = "cpu%d" % i
+            cpu_stats["results"].append(
+                {
+                    "name": name,
+                    "umode": val.user,
+                    "umode_nice": val.nice,
+                    "smode": val.system,
+                    "idle": val.idle,
+                    "ts": str(ts),
+                }
+            )
+        self.broadcast("cpudata", {"key": "cpuWidget:cpudata", "data": cpu_stats})
 
-class MemoryWidgetNamespace(RockstorIO):
 
-    switch = False
+class NetworkWidgetNamespace(DbNamesSampler):
+    def db_names(self):
 
-    def on_connect(self, sid, environ):
+        from storageadmin.models import NetworkDevice
 
-        self.switch = True
-        self.spawn(self.send_meminfo_data, sid)
+        return set(i.name for i in NetworkDevice.objects.all())
 
-    def on_disconnect(self, sid):
+    def sample(self, prev_stats):
 
-        self.cleanup(sid)
-        self.switch = False
-
-    def send_meminfo_data(self):
-
-        while self.switch:
-            stats_file = "/proc/meminfo"
-            (
-                total,
-                free,
-                buffers,
-                cached,
-                swap_total,
-                swap_free,
-                active,
-                inactive,
-                dirty,
-            ) = (None,) * 9
-            with open(stats_file) as sfo:
-                for l in sfo.readlines():
-                    if re.match("MemTotal:", l) is not None:
-                        total = int(l.split()[1])
-                    elif re.match("MemFree:", l) is not None:
-                        free = int(l.split()[1])
-                    elif re.match("Buffers:", l) is not None:
-                        buffers = int(l.split()[1])
-                    elif re.match("Cached:", l) is not None:
-                        cached = int(l.split()[1])
-                    elif re.match("SwapTotal:", l) is not None:
-                        swap_total = int(l.split()[1])
-                    elif re.match("SwapFree:", l) is not None:
-                        swap_free = int(l.split()[1])
-                    elif re.match("Active:", l) is not None:
-                        active = int(l.split()[1])
-                    elif re.match("Inactive:", l) is not None:
-                        inactive = int(l.split()[1])
-                    elif re.match("Dirty:", l) is not None:
-                        dirty = int(l.split()[1])
-                        break  # no need to look at lines after dirty.
-            ts = datetime.utcnow().replace(tzinfo=utc).isoformat()
-            self.emit(
-                "memory",
-                {
-                    "key": "memoryWidget:memory",
-                    "data": {
-                        "results": [
-                            {
-                                "total": total,
-                                "free": free,
-                                "buffers": buffers,
-                                "cached": cached,
-                                "swap_total": swap_total,
-                                "swap_free": swap_free,
-                                "active": active,
-                                "inactive": inactive,
-                                "dirty": dirty,
-                                "ts": str(ts),
-                            }
-                        ]
-                    },
-                },
+        cur_stats = read_net_dev(self.names())
+        if prev_stats is None:
+            return cur_stats
+        ts = str(datetime.utcnow().replace(tzinfo=utc).isoformat())
+        results = []
+        for interface, data in net_deltas(cur_stats, prev_stats, self.interval).items():
+            data.update({"device": interface, "ts": ts})
+            results.append(data)
+        if len(results) > 0:
+            self.broadcast(
+                "network",
+                {"key": "networkWidget:network", "data": {"results": results}},
             )
-            gevent.sleep(1)
+        return cur_stats
+
+
+class MemoryWidgetNamespace(SamplerNamespace):
+    def sample(self, prev_sample):
+
+        meminfo = read_meminfo()
+        meminfo["ts"] = str(datetime.utcnow().replace(tzinfo=utc).isoformat())
+        self.broadcast(
+            "memory", {"key": "memoryWidget:memory", "data": {"results": [meminfo]}}
+        )
 
 
 class ServicesNamespace(RockstorIO):
@@ -860,6 +849,7 @@ class ServicesNamespace(RockstorIO):
         while self.start:
 
             data = {}
+            probes = []
             for service in Service.objects.all():
                 config = None
                 if service.config is not None:
@@ -870,9 +860,13 @@ class ServicesNamespace(RockstorIO):
                             "Exception while loading config of "
                             "Service(%s): %s" % (service.name, e.__str__())
                         )
-                data[service.name] = {}
-                output, error, return_code = service_status(service.name, config=config)
-                data[service.name]["running"] = return_code
+                probes.append((service.name, config))
+            # Concurrent, and shared with any other connected client's loop.
+            for name, status in service_statuses(probes).items():
+                if status is None:
+                    # Unknown for now, leave the client's last known status.
+                    continue
+                data[name] = {"running": status[2]}
 
             self.emit("get_services", {"data": data, "key": "services:get_services"})
             gevent.sleep(15)
@@ -882,6 +876,9 @@ class SysinfoNamespace(RockstorIO):
 
     start = False
     os_distro_name = settings.OS_DISTRO_NAME
+    # Outlives client connections, see monitor_block_devices().
+    block_devices = BlockDeviceTable()
+    udev_monitor = None
 
     # This function is run once on every connection
     def on_connect(self, sid, environ):
@@ -889,6 +886,8 @@ class SysinfoNamespace(RockstorIO):
         self.aw = APIWrapper()
         self.emit("connected", {"key": "sysinfo:connected", "data": "connected"})
         self.start = True
+        if self.udev_monitor is None or self.udev_monitor.dead:
+            SysinfoNamespace.udev_monitor = gevent.spawn(self.monitor_block_devices)
         self.spawn(self.update_storage_state, sid)
         self.spawn(self.update_check, sid)
         self.spawn(self.yum_updates, sid)
@@ -938,16 +937,48 @@ class SysinfoNamespace(RockstorIO):
         except Exception as e:
             logger.error("Exception while gathering kernel info: %s" % e.__str__())
 
+    def monitor_block_devices(self):
+        # Keep our block device table current from udev events, for the life
+        # of the data collector. Should this fail update_storage_state() falls
+        # back to full disk scans.
+        try:
+            monitor = Popen(UDEV_MONITOR_CMD, bufsize=1, stdout=PIPE)
+            self.block_devices.monitoring = True
+            for event in read_udev_events(iter(monitor.stdout.readline, "")):
+                self.block_devices.apply(event)
+            logger.error("udev monitor exited with rc ({}).".format(monitor.wait()))
+        except Exception as e:
+            logger.error("udev monitor failed. exception: {}".format(e.__str__()))
+        finally:
+            self.block_devices.monitoring = False
+
+    def disk_scan_data(self, last_full_scan):
+        """
+        Decide on our next disks/scan: full if due or if our udev monitor is
+        not running, otherwise limited to devices changed since the last scan.
+        :param last_full_scan: time of our last full scan, or None.
+        :return: disks/scan post data ({} for full), or None for no scan.
+        """
+        changed = self.block_devices.pop_changed()
+        if (
+            not self.block_devices.monitoring
+            or last_full_scan is None
+            or time.time() - last_full_scan > DISK_FULL_SCAN_INTERVAL
+        ):
+            return {}
+        if len(changed) > 0:
+            return {"changed": sorted(changed)}
+        return None
+
     def update_storage_state(self):
         # update storage state once a minute as long as
         # there is a client connected.
+        last_full_scan = None
         while self.start:
+            disk_scan_data = self.disk_scan_data(last_full_scan)
+            if disk_scan_data == {}:
+                last_full_scan = time.time()
             resources = [
-                {
-                    "url": "disks/scan",
-                    "success": "Disk state updated successfully",
-                    "error": "Failed to update disk state.",
-                },
                 {
                     "url": "commands/refresh-pool-state",
                     "success": "Pool state updated successfully",
@@ -964,10 +995,27 @@ class SysinfoNamespace(RockstorIO):
                     "error": "Failed to update snapshot state.",
                 },
             ]
+            if disk_scan_data is not None:
+                resources.insert(
+                    0,
+                    {
+                        "url": "disks/scan",
+                        "data": disk_scan_data,
+                        "success": "Disk state updated successfully",
+                        "error": "Failed to update disk state.",
+                    },
+                )
             for r in resources:
+                headers = None
+                if "data" in r:
+                    headers = {"content-type": "application/json"}
                 try:
                     self.aw.api_call(
-                        r["url"], data=None, calltype="post", save_error=False
+                        r["url"],
+                        data=r.get("data"),
+                        calltype="post",
+                        headers=headers,
+                        save_error=False,
                     )
                 except Exception as e:
                     logger.error("%s. exception: %s" % (r["error"], e.__str__()))
@@ -1104,6 +1152,9 @@ def main():
         LogManagerNamespace("/logmanager"),
         PincardManagerNamespace("/pincardmanager"),
     ]
+    # Persists our metrics regardless of connected clients.
+    gevent.spawn(MetricsRecorder().run)
+    gevent.spawn(ScrubMonitor(scheduler=MaintenanceScheduler()).run)
     sio_server = socketio.Server(async_mode="gevent")
     for namespace in sio_namespaces:
         sio_server.register_namespace(namespace)
@@ -0,0 +1,262 @@
+"""
+Copyright (c) 2012-2020 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import time
+import logging
+
+from fs.btrfs import (
+    balance_pause,
+    balance_status,
+    mount_root,
+    resume_balance,
+    scrub_pause,
+    scrub_resume,
+)
+from scripts.scheduled_tasks.crontabwindow import crontab_range
+from smart_manager.metrics import read_diskstats
+from smart_manager.models import TaskDefinition
+from smart_manager.scrub_monitor import ACTIVE_SCRUB_STATES
+from storageadmin.models import Pool, PoolBalance, PoolScrub
+from system.osi import get_byid_name_map
+
+logger = logging.getLogger(__name__)
+
+# Fraction of a policy's max_latency below which latency paused maintenance
+# is resumed: as our own I/O is absent while paused.
+LATENCY_RESUME_RATIO = 0.5
+# Minimum seconds for which latency paused maintenance stays paused.
+LATENCY_MIN_PAUSE = 300
+# ionice(1) class, only served when no other I/O is pending.
+IOPRIO_IDLE = 3
+# PoolBalance message of balances paused by us, and only by us.
+POLICY_PAUSE_MSG = "Paused by maintenance policy."
+ACTIVE_BALANCE_STATES = ("started", "running")
+
+
+def pool_policies():
+    """
+    Maintenance policies, by pool id, as configured on each pool's enabled
+    scheduled scrub tasks. These json_meta options are honoured, the first
+    task of a pool with any of them set providing that pool's policy:
+    window_pause: true to pause the pool's scrubs and balances while outside
+    the task's execution window (crontabwindow).
+    max_latency: mean I/O latency, in ms, across the pool's disks above which
+    its scrubs and balances are paused. 0 (default) to disable.
+    low_priority: true to scrub at idle I/O priority.
+    :return: dict of policy dicts indexed by pool id.
+    """
+    policies = {}
+    for td in TaskDefinition.objects.filter(task_type="scrub", enabled=True).order_by(
+        "id"
+    ):
+        try:
+            meta = json.loads(td.json_meta)
+            pool_id = int(meta["pool"])
+            policy = {
+                "window": td.crontabwindow or "*-*-*-*-*-*",
+                "window_pause": meta.get("window_pause") is True,
+                "max_latency": int(meta.get("max_latency") or 0),
+                "low_priority": meta.get("low_priority") is True,
+            }
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(
+                "Ignoring invalid scrub task ({}) meta: {}".format(td.name, e.__str__())
+            )
+            continue
+        if pool_id in policies:
+            continue
+        if (
+            policy["window_pause"]
+            or policy["max_latency"] > 0
+            or policy["low_priority"]
+        ):
+            policies[pool_id] = policy
+    return policies
+
+
+def scrub_ioprio_class(pool):
+    """
+    :param pool: Pool object.
+    :return: ionice class for the pool's scrubs, or None for the default.
+    """
+    policy = pool_policies().get(pool.id)
+    if policy is not None and policy["low_priority"]:
+        return IOPRIO_IDLE
+    return None
+
+
+def disk_latency(cur_stats, prev_stats, disks):
+    """
+    Mean ms per completed read or write across the given disks between two
+    read_diskstats() samples.
+    :return: float, or None if no I/O completed.
+    """
+    ios = 0
+    ms = 0
+    for disk in disks:
+        if disk not in cur_stats or disk not in prev_stats:
+            continue
+        cur = [int(c) for c in cur_stats[disk]]
+        prev = [int(p) for p in prev_stats[disk]]
+        # As per metrics.DISK_FIELDS
+        ios += (cur[0] - prev[0]) + (cur[4] - prev[4])
+        ms += (cur[3] - prev[3]) + (cur[7] - prev[7])
+    if ios <= 0:
+        return None
+    return float(ms) / ios
+
+
+def pause_reason(policy, latency, paused, now=None):
+    """
+    :param policy: dict as per pool_policies().
+    :param latency: current latency of the pool's disks, see disk_latency().
+    :param paused: True if the pool's maintenance is currently paused by us.
+    :param now: datetime (local time) for the window check, defaults to now.
+    :return: "window" or "latency" if maintenance should be paused, else None.
+    """
+    if policy["window_pause"] and not crontab_range(policy["window"], now):
+        return "window"
+    max_latency = policy["max_latency"]
+    if max_latency > 0 and latency is not None:
+        if paused:
+            max_latency *= LATENCY_RESUME_RATIO
+        if latency > max_latency:
+            return "latency"
+    return None
+
+
+class MaintenanceScheduler(object):
+    """
+    Pauses, and later resumes, the scrubs and balances of pools with a
+    maintenance policy (see pool_policies()) as their execution window and
+    disk latency dictate. Scrubs are paused by cancelling, their status then
+    being recorded as "paused", and resumed via 'btrfs scrub resume'.
+    Balances use 'btrfs balance pause/resume'. Internal balances, ie of a
+    device removal, are left alone.
+    """
+
+    def __init__(self):
+
+        self.prev_stats = None
+        # Time of latency triggered pause by pool id.
+        self.latency_paused = {}
+
+    def latencies(self, pools):
+        """
+        :return: dict of disk latencies since our prior call, by pool id.
+        """
+        pool_disks = {pool.id: [d.name for d in pool.disk_set.all()] for pool in pools}
+        disks = set()
+        for names in pool_disks.values():
+            disks.update(names)
+        cur_stats = read_diskstats(get_byid_name_map(), disks)
+        prev_stats, self.prev_stats = self.prev_stats, cur_stats
+        if prev_stats is None:
+            return {}
+        return {
+            pid: disk_latency(cur_stats, prev_stats, names)
+            for pid, names in pool_disks.items()
+        }
+
+    def apply(self):
+
+        policies = pool_policies()
+        pools = list(Pool.objects.filter(id__in=list(policies.keys())))
+        latency_pools = [p for p in pools if policies[p.id]["max_latency"] > 0]
+        if len(latency_pools) > 0:
+            latencies = self.latencies(latency_pools)
+        else:
+            latencies = {}
+            self.prev_stats = None
+        for pool in pools:
+            try:
+                self.apply_policy(pool, policies[pool.id], latencies.get(pool.id))
+            except Exception as e:
+                logger.exception(
+                    "Exception while applying maintenance policy of pool ({}): "
+                    "{}".format(pool.name, e)
+                )
+
+    def apply_policy(self, pool, policy, latency):
+
+        scrub = PoolScrub.objects.filter(pool=pool).order_by("-id").first()
+        balance = PoolBalance.objects.filter(pool=pool).order_by("-id").first()
+        scrub_active = scrub is not None and scrub.status in ACTIVE_SCRUB_STATES
+        scrub_paused = scrub is not None and scrub.status == "paused"
+        balance_active = (
+            balance is not None
+            and not balance.internal
+            and balance.status in ACTIVE_BALANCE_STATES
+        )
+        balance_paused = (
+            balance is not None
+            and balance.status == "paused"
+            and balance.message == POLICY_PAUSE_MSG
+        )
+        if not (scrub_active or scrub_paused or balance_active or balance_paused):
+            self.latency_paused.pop(pool.id, None)
+            return
+        paused = scrub_paused or balance_paused
+        now = time.time()
+        reason = pause_reason(policy, latency, paused)
+        if reason == "latency" and not paused:
+            self.latency_paused[pool.id] = now
+        elif (
+            reason is None
+            and paused
+            and now - self.latency_paused.get(pool.id, 0) < LATENCY_MIN_PAUSE
+        ):
+            return
+        if reason is not None:
+            if scrub_active:
+                logger.info(
+                    "Pausing scrub of pool ({}), reason ({}).".format(pool.name, reason)
+                )
+                # Recorded first so our scrub monitor does not take the
+                # cancelled scrub as such.
+                PoolScrub.objects.filter(id=scrub.id).update(status="paused")
+                try:
+                    scrub_pause(pool)
+                except Exception:
+                    PoolScrub.objects.filter(id=scrub.id).update(status=scrub.status)
+                    raise
+            if balance_active and balance_status(pool)["status"] == "running":
+                logger.info(
+                    "Pausing balance of pool ({}), reason ({}).".format(
+                        pool.name, reason
+                    )
+                )
+                balance_pause(pool)
+                PoolBalance.objects.filter(id=balance.id).update(
+                    status="paused", message=POLICY_PAUSE_MSG
+                )
+            return
+        self.latency_paused.pop(pool.id, None)
+        if scrub_paused:
+            logger.info("Resuming scrub of pool ({}).".format(pool.name))
+            pid = scrub_resume(
+                pool, ioprio_class=IOPRIO_IDLE if policy["low_priority"] else None
+            )
+            PoolScrub.objects.filter(id=scrub.id).update(status="running", pid=pid)
+        if balance_paused:
+            logger.info("Resuming balance of pool ({}).".format(pool.name))
+            resume_balance.async(mount_root(pool))
+            PoolBalance.objects.filter(id=balance.id).update(
+                status="running", message=None
+            )
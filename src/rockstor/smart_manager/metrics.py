@@ -0,0 +1,557 @@
+"""
+Copyright (c) 2012-2020 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from datetime import datetime, timedelta
+import time
+import logging
+
+import psutil
+from django.conf import settings
+from django.db.models import Avg, BigIntegerField, Case, Value, When
+from django.utils.timezone import utc
+
+from smart_manager.models import (
+    CPUMetric,
+    DiskStat,
+    LoadAvg,
+    MemInfo,
+    NetStat,
+    PoolUsage,
+    ShareUsage,
+)
+from system.osi import get_byid_name_map
+
+logger = logging.getLogger(__name__)
+
+# Roll-up tiers as (period, retention) in seconds, finest first. Samples are
+# recorded with the first tier's period and averaged into each coarser tier
+# once that tier's period has elapsed. Rows older than their tier's
+# retention are deleted.
+TIERS = ((1, 3600), (60, 7 * 86400), (3600, 365 * 86400))
+# Seconds of samples buffered between bulk inserts.
+FLUSH_INTERVAL = 10
+# Seconds between pool usage samples, recorded directly into the 60s tier.
+POOL_USAGE_PERIOD = 60
+# Seconds between db re-reads of our disk and network device names.
+NAMES_REFRESH = 30
+# Preferred upper bound on the samples per name returned for a time range.
+MAX_RANGE_POINTS = 1000
+
+DISK_FIELDS = (
+    "reads_completed",
+    "reads_merged",
+    "sectors_read",
+    "ms_reading",
+    "writes_completed",
+    "writes_merged",
+    "sectors_written",
+    "ms_writing",
+    "ios_progress",
+    "ms_ios",
+    "weighted_ios",
+)
+NET_FIELDS = (
+    "kb_rx",
+    "packets_rx",
+    "errs_rx",
+    "drop_rx",
+    "fifo_rx",
+    "frame",
+    "compressed_rx",
+    "multicast_rx",
+    "kb_tx",
+    "packets_tx",
+    "errs_tx",
+    "drop_tx",
+    "fifo_tx",
+    "colls",
+    "carrier",
+    "compressed_tx",
+)
+MEM_FIELDS = (
+    "total",
+    "free",
+    "buffers",
+    "cached",
+    "swap_total",
+    "swap_free",
+    "active",
+    "inactive",
+    "dirty",
+)
+CPU_FIELDS = ("umode", "umode_nice", "smode", "idle")
+LOAD_FIELDS = (
+    "load_1",
+    "load_5",
+    "load_15",
+    "active_threads",
+    "total_threads",
+    "latest_pid",
+    "idle_seconds",
+)
+# Per model: the field identifying a series (if any), and the fields averaged
+# on roll-up.
+ROLLUPS = (
+    (DiskStat, "name", DISK_FIELDS),
+    (CPUMetric, "name", CPU_FIELDS),
+    (MemInfo, None, MEM_FIELDS),
+    (NetStat, "device", NET_FIELDS),
+    (LoadAvg, None, LOAD_FIELDS),
+    (PoolUsage, "pool", ("free", "reclaimable")),
+)
+# Sample periods of the ROLLUPS models not sampled every TIERS[0] period:
+# their finer tiers are never populated.
+SAMPLE_PERIODS = {PoolUsage: POOL_USAGE_PERIOD}
+
+
+def utcnow():
+    return datetime.utcnow().replace(tzinfo=utc)
+
+
+def rates(cur, prev, interval):
+    """
+    Per second rates from two samples of cumulative counters. A counter
+    found to have reset (wrapped) contributes its current value.
+    """
+    return [
+        float(c) / interval if float(c) < float(p) else (float(c) - float(p)) / interval
+        for c, p in zip(cur, prev)
+    ]
+
+
+def read_diskstats(byid_disk_map, disks):
+    """
+    /proc/diskstats has lines of the following form:
+     8      64 sde 1034 0 9136 702 0 0 0 0 0 548 702
+     8      65 sde1 336 0 2688 223 0 0 0 0 0 223 223
+    As these contain transient type names we convert those to our by-id db
+    names, ignoring any not in disks.
+    :return: dict of counter lists, as per DISK_FIELDS, indexed by by-id name.
+    """
+    counters = {}
+    with open("/proc/diskstats") as stats_file:
+        for line in stats_file.readlines():
+            fields = line.split()
+            byid_name = byid_disk_map.get(fields[2])
+            if byid_name not in disks:
+                continue
+            counters[byid_name] = fields[3:14]
+    return counters
+
+
+def disk_deltas(cur_stats, prev_stats, interval):
+    """
+    :return: dict of per second rates, as dicts indexed by DISK_FIELDS,
+    indexed by disk name for those disks found in both samples.
+    """
+    deltas = {}
+    for disk, cur in cur_stats.items():
+        if disk not in prev_stats:
+            continue
+        prev = prev_stats[disk]
+        data = rates(cur, prev, interval)
+        # ios in progress is a gauge, not a counter.
+        data[8] = (float(cur[8]) + float(prev[8])) / 2
+        deltas[disk] = dict(zip(DISK_FIELDS, data))
+    return deltas
+
+
+def read_net_dev(interfaces):
+    """
+    :return: dict of /proc/net/dev counter lists, as per NET_FIELDS, indexed
+    by interface name, ignoring any not in interfaces.
+    """
+    counters = {}
+    with open("/proc/net/dev") as sfo:
+        sfo.readline()
+        sfo.readline()
+        for l in sfo.readlines():
+            fields = l.split()
+            if fields[0][:-1] not in interfaces:
+                continue
+            counters[fields[0][:-1]] = fields[1:17]
+    return counters
+
+
+def net_deltas(cur_stats, prev_stats, interval):
+    deltas = {}
+    for interface, cur in cur_stats.items():
+        if interface in prev_stats:
+            data = rates(cur, prev_stats[interface], interval)
+            deltas[interface] = dict(zip(NET_FIELDS, data))
+    return deltas
+
+
+def read_meminfo():
+    """
+    :return: dict indexed by MEM_FIELDS of /proc/meminfo values in kB.
+    """
+    labels = {
+        "MemTotal:": "total",
+        "MemFree:": "free",
+        "Buffers:": "buffers",
+        "Cached:": "cached",
+        "SwapTotal:": "swap_total",
+        "SwapFree:": "swap_free",
+        "Active:": "active",
+        "Inactive:": "inactive",
+        "Dirty:": "dirty",
+    }
+    meminfo = dict.fromkeys(MEM_FIELDS)
+    with open("/proc/meminfo") as sfo:
+        for l in sfo.readlines():
+            fields = l.split()
+            if fields[0] in labels:
+                meminfo[labels[fields[0]]] = int(fields[1])
+                if fields[0] == "Dirty:":
+                    break  # no need to look at lines after dirty.
+    return meminfo
+
+
+def read_loadavg():
+    """
+    /proc/loadavg is of the form: 0.00 0.01 0.05 1/123 4567
+    :return: dict indexed by LOAD_FIELDS.
+    """
+    with open("/proc/loadavg") as lfo:
+        fields = lfo.readline().split()
+    with open("/proc/uptime") as ufo:
+        idle_seconds = int(float(ufo.readline().split()[1]))
+    active_threads, total_threads = fields[3].split("/")
+    return {
+        "load_1": float(fields[0]),
+        "load_5": float(fields[1]),
+        "load_15": float(fields[2]),
+        "active_threads": int(active_threads),
+        "total_threads": int(total_threads),
+        "latest_pid": int(fields[4]),
+        "idle_seconds": idle_seconds,
+    }
+
+
+def model_tiers(model):
+    """
+    :return: the TIERS holding model's samples: those no finer than the
+    period it is sampled at, see SAMPLE_PERIODS.
+    """
+    finest = SAMPLE_PERIODS.get(model, TIERS[0][0])
+    return tuple(tier for tier in TIERS if tier[0] >= finest)
+
+
+def tier_for_range(t1, t2, now=None, tiers=TIERS):
+    """
+    Pick the finest roll-up tier still holding samples back to t1 and giving
+    no more than MAX_RANGE_POINTS samples (per name) over t1 to t2.
+    :param t1: aware datetime, start of range.
+    :param t2: aware datetime, end of range.
+    :param tiers: tiers to pick from, see model_tiers().
+    :return: period of the chosen tier.
+    """
+    if now is None:
+        now = utcnow()
+    span = (t2 - t1).total_seconds()
+    age = (now - t1).total_seconds()
+    for period, retention in tiers:
+        if age <= retention and span / period <= MAX_RANGE_POINTS:
+            return period
+    return tiers[-1][0]
+
+
+def roll_up(model, key, fields, src_period, dst_period, end):
+    """
+    Average the src_period samples of model within the dst_period ending at
+    end into new dst_period samples, one per series.
+    :return: number of dst_period samples created.
+    """
+    qs = model.objects.filter(
+        period=src_period, ts__gt=end - timedelta(seconds=dst_period), ts__lte=end
+    )
+    # Aggregates may not share a name with a model field.
+    averages = {"avg_" + f: Avg(f) for f in fields}
+    if key is None:
+        rows = [qs.aggregate(**averages)]
+        if rows[0]["avg_" + fields[0]] is None:
+            # No samples in this period.
+            return 0
+    else:
+        rows = qs.values(key).annotate(**averages)
+    samples = []
+    for row in rows:
+        values = {f: row["avg_" + f] for f in fields}
+        if key is not None:
+            values[key] = row[key]
+        samples.append(model(ts=end, period=dst_period, **values))
+    model.objects.bulk_create(samples)
+    return len(samples)
+
+
+def prune(now):
+    """
+    Delete all samples older than their tier's retention.
+    """
+    for model, key, fields in ROLLUPS:
+        for period, retention in TIERS:
+            model.objects.filter(
+                period=period, ts__lt=now - timedelta(seconds=retention)
+            ).delete()
+
+
+def _delete_ids(model, ids, chunk_size=500):
+    for i in range(0, len(ids), chunk_size):
+        model.objects.filter(id__in=ids[i : i + chunk_size]).delete()
+
+
+def _day_start(ts):
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _update_counts(model, counts, chunk_size=500):
+    """
+    Set the count of each model row in counts, a dict by id, in one UPDATE
+    per chunk_size rows.
+    """
+    ids = list(counts.keys())
+    for i in range(0, len(ids), chunk_size):
+        chunk = ids[i : i + chunk_size]
+        model.objects.filter(id__in=chunk).update(
+            count=Case(
+                *[When(id=su_id, then=Value(counts[su_id])) for su_id in chunk],
+                output_field=BigIntegerField()
+            )
+        )
+
+
+def roll_up_share_usage(now, start=None):
+    """
+    Delete ShareUsage entries older than SHARE_USAGE retention_days and reduce
+    those older than rollup_days to the latest entry per name per (UTC) day,
+    keeping the sum of their counts. Made a day at a time, yielding between
+    days: our first pass may cover the whole of retention_days.
+    :param now: aware datetime.
+    :param start: aware datetime, the return value of our prior call; to
+    consider only entries which have aged past rollup_days since then.
+    :return: aware datetime, the rolled up entries' age limit, for our next
+    call.
+    """
+    config = settings.SHARE_USAGE
+    ShareUsage.objects.filter(
+        ts__lt=now - timedelta(days=config["retention_days"])
+    ).delete()
+    end = now - timedelta(days=config["rollup_days"])
+    qs = ShareUsage.objects.filter(ts__lt=end)
+    if start is not None:
+        # Include the earlier part of start's day.
+        qs = qs.filter(ts__gte=_day_start(start))
+    days = qs.order_by("ts").values_list("ts", flat=True)
+    first = days.first()
+    while first is not None:
+        day_end = _day_start(first) + timedelta(days=1)
+        kept = {}
+        merged = set()
+        dropped = []
+        entries = (
+            qs.filter(ts__gte=first, ts__lt=day_end)
+            .order_by("id")
+            .values_list("id", "name", "count")
+        )
+        for su_id, name, count in entries.iterator():
+            if name in kept:
+                dropped.append(kept[name][0])
+                kept[name] = (su_id, kept[name][1] + count)
+                merged.add(name)
+            else:
+                kept[name] = (su_id, count)
+        _delete_ids(ShareUsage, dropped)
+        _update_counts(ShareUsage, dict(kept[name] for name in merged))
+        # Within data_collector time.sleep() is gevent's: let others run.
+        time.sleep(0)
+        first = days.filter(ts__gte=day_end).first()
+    return end
+
+
+class MetricsRecorder(object):
+    """
+    Records disk, cpu, memory, network and load samples every TIERS[0] period
+    (and pool usage every POOL_USAGE_PERIOD) in buffered bulk inserts,
+    rolling these up into each coarser tier and pruning each tier by its
+    retention. Long running: see run().
+    """
+
+    def __init__(self):
+
+        self.interval = TIERS[0][0]
+        self.samples = []
+        self.last_flush = time.time()
+        self.last_pool_usage = 0
+        self.names_ts = 0
+        self.byid_disk_map = {}
+        self.disks = set()
+        self.interfaces = set()
+        self.prev_disk_stats = None
+        self.prev_net_stats = None
+        # Only periods completed after our start are rolled up, a restart may
+        # therefore leave a gap of one period in each coarser tier.
+        now = time.time()
+        self.rolled_up = {tier[0]: now - now % tier[0] for tier in TIERS[1:]}
+        # See roll_up_share_usage(), a full pass is made on our first call.
+        self.share_usage_rolled_up = None
+
+    def refresh_names(self):
+
+        from storageadmin.models import Disk, NetworkDevice
+
+        self.byid_disk_map = get_byid_name_map()
+        self.disks = set(d.name for d in Disk.objects.all())
+        self.interfaces = set(i.name for i in NetworkDevice.objects.all())
+        self.names_ts = time.time()
+
+    def sample(self, ts):
+
+        if time.time() - self.names_ts > NAMES_REFRESH:
+            self.refresh_names()
+        disk_stats = read_diskstats(self.byid_disk_map, self.disks)
+        if self.prev_disk_stats is not None:
+            deltas = disk_deltas(disk_stats, self.prev_disk_stats, self.interval)
+            for disk, data in deltas.items():
+                self.samples.append(DiskStat(name=disk, ts=ts, **data))
+        self.prev_disk_stats = disk_stats
+        net_stats = read_net_dev(self.interfaces)
+        if self.prev_net_stats is not None:
+            deltas = net_deltas(net_stats, self.prev_net_stats, self.interval)
+            for interface, data in deltas.items():
+                self.samples.append(NetStat(device=interface, ts=ts, **data))
+        self.prev_net_stats = net_stats
+        for i, val in enumerate(psutil.cpu_times_percent(percpu=True)):
+            self.samples.append(
+                CPUMetric(
+                    name="cpu%d" % i,
+                    umode=val.user,
+                    umode_nice=val.nice,
+                    smode=val.system,
+                    idle=val.idle,
+                    ts=ts,
+                )
+            )
+        self.samples.append(MemInfo(ts=ts, **read_meminfo()))
+        self.samples.append(LoadAvg(ts=ts, **read_loadavg()))
+
+    def sample_pool_usage(self, ts):
+
+        from storageadmin.models import Pool
+
+        for pool in Pool.objects.all():
+            if not pool.is_mounted:
+                continue
+            self.samples.append(
+                PoolUsage(
+                    pool=pool.name,
+                    free=pool.free,
+                    reclaimable=pool.reclaimable,
+                    ts=ts,
+                    period=POOL_USAGE_PERIOD,
+                )
+            )
+
+    def flush(self):
+
+        by_model = {}
+        for sample in self.samples:
+            by_model.setdefault(type(sample), []).append(sample)
+        for model, samples in by_model.items():
+            model.objects.bulk_create(samples)
+        self.samples = []
+        self.last_flush = time.time()
+
+    def roll_up(self, now):
+        """
+        Roll up each coarser tier whose period has completed since we last
+        looked, and on doing so prune all tiers.
+        """
+        rolled = []
+        for src_tier, dst_tier in zip(TIERS, TIERS[1:]):
+            src_period, dst_period = src_tier[0], dst_tier[0]
+            end = now - now % dst_period
+            if end <= self.rolled_up[dst_period]:
+                continue
+            end_ts = datetime.utcfromtimestamp(end).replace(tzinfo=utc)
+            for model, key, fields in ROLLUPS:
+                if src_tier not in model_tiers(model):
+                    continue
+                roll_up(model, key, fields, src_period, dst_period, end_ts)
+            self.rolled_up[dst_period] = end
+            rolled.append(dst_period)
+        if len(rolled) > 0:
+            prune(utcnow())
+        if TIERS[-1][0] in rolled:
+            # Share usage history is reduced along with our coarsest tier.
+            self.share_usage_rolled_up = roll_up_share_usage(
+                utcnow(), self.share_usage_rolled_up
+            )
+
+    def record(self):
+
+        now = time.time()
+        ts = utcnow()
+        self.sample(ts)
+        if now - self.last_pool_usage >= POOL_USAGE_PERIOD:
+            self.sample_pool_usage(ts)
+            self.last_pool_usage = now
+        if now - self.last_flush >= FLUSH_INTERVAL:
+            # Roll ups only follow a flush so as to see all prior samples.
+            self.flush()
+            self.roll_up(now)
+
+    def run(self):
+
+        while True:
+            started = time.time()
+            try:
+                self.record()
+            except Exception as e:
+                logger.exception("Exception while recording metrics: {}".format(e))
+                self.samples = []
+            time.sleep(max(0, self.interval - (time.time() - started)))
+
+
+def share_usage_history(name, t1, t2, resolution):
+    """
+    Usage history of a share or snapshot, downsampled to the latest entry per
+    resolution seconds.
+    :param name: share/snapshot (subvol) name.
+    :param t1: aware datetime, start of range (exclusive).
+    :param t2: aware datetime, end of range (inclusive).
+    :param resolution: seconds.
+    :return: list, in time order, of dicts of ts, r_usage and e_usage (KB).
+    """
+    history = []
+    entries = (
+        ShareUsage.objects.filter(name=name, ts__gt=t1, ts__lte=t2)
+        .order_by("id")
+        .values_list("ts", "r_usage", "e_usage")
+    )
+    epoch = datetime(1970, 1, 1, tzinfo=utc)
+    last_bucket = None
+    for ts, r_usage, e_usage in entries.iterator():
+        bucket = int((ts - epoch).total_seconds()) // resolution
+        entry = {"ts": ts, "r_usage": r_usage, "e_usage": e_usage}
+        if bucket == last_bucket:
+            history[-1] = entry
+        else:
+            history.append(entry)
+            last_bucket = bucket
+    return history
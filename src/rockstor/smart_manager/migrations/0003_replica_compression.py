@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_manager', '0002_auto_20170216_1212'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='replica',
+            name='compression',
+            field=models.CharField(default=b'none', max_length=16, choices=[(b'none', b'none'), (b'zlib', b'zlib')]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_manager', '0003_replica_compression'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receivetrail',
+            name='resume_offset',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_manager', '0004_receivetrail_resume_offset'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cpumetric',
+            name='period',
+            field=models.IntegerField(default=1, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='diskstat',
+            name='period',
+            field=models.IntegerField(default=1, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='loadavg',
+            name='period',
+            field=models.IntegerField(default=1, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='meminfo',
+            name='period',
+            field=models.IntegerField(default=1, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='netstat',
+            name='period',
+            field=models.IntegerField(default=1, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='poolusage',
+            name='period',
+            field=models.IntegerField(default=1, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='cpumetric',
+            name='ts',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='loadavg',
+            name='ts',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='meminfo',
+            name='ts',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='poolusage',
+            name='ts',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
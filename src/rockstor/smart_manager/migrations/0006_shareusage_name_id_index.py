@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_manager', '0005_metric_period'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='shareusage',
+            index_together=set([('name', 'id')]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_manager', '0006_shareusage_name_id_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='taskdefinition',
+            name='task_type',
+            field=models.CharField(max_length=100, choices=[(b'scrub', b'scrub'), (b'snapshot', b'snapshot'), (b'reboot', b'reboot'), (b'shutdown', b'shutdown'), (b'suspend', b'suspend'), (b'smart', b'smart'), (b'custom', b'custom')]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_manager', '0007_taskdefinition_smart'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='replica',
+            name='resume',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -26,7 +26,9 @@ class CPUMetric(models.Model):
     umode_nice = models.IntegerField()
     smode = models.IntegerField()
     idle = models.IntegerField()
-    ts = models.DateTimeField(auto_now=True, db_index=True)
+    ts = models.DateTimeField(db_index=True)
+    # Seconds averaged by this sample, see smart_manager.metrics.TIERS
+    period = models.IntegerField(default=1, db_index=True)
 
     class Meta:
         app_label = "smart_manager"
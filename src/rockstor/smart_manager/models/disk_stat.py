@@ -34,6 +34,8 @@ class DiskStat(models.Model):
     ms_ios = models.FloatField()
     weighted_ios = models.FloatField()
     ts = models.DateTimeField(db_index=True)
+    # Seconds averaged by this sample, see smart_manager.metrics.TIERS
+    period = models.IntegerField(default=1, db_index=True)
 
     class Meta:
         app_label = "smart_manager"
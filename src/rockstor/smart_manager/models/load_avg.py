@@ -28,7 +28,9 @@ class LoadAvg(models.Model):
     total_threads = models.IntegerField()
     latest_pid = models.IntegerField()
     idle_seconds = models.IntegerField()
-    ts = models.DateTimeField(auto_now=True, db_index=True)
+    ts = models.DateTimeField(db_index=True)
+    # Seconds averaged by this sample, see smart_manager.metrics.TIERS
+    period = models.IntegerField(default=1, db_index=True)
 
     @property
     def uptime(self, *args, **kwargs):
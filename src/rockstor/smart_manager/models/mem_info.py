@@ -32,7 +32,9 @@ class MemInfo(models.Model):
     active = models.BigIntegerField(default=0)
     inactive = models.BigIntegerField(default=0)
     dirty = models.BigIntegerField(default=0)
-    ts = models.DateTimeField(auto_now=True, db_index=True)
+    ts = models.DateTimeField(db_index=True)
+    # Seconds averaged by this sample, see smart_manager.metrics.TIERS
+    period = models.IntegerField(default=1, db_index=True)
 
     class Meta:
         app_label = "smart_manager"
@@ -40,6 +40,8 @@ class NetStat(models.Model):
     carrier = models.BigIntegerField(default=0)
     compressed_tx = models.BigIntegerField(default=0)
     ts = models.DateTimeField(db_index=True)
+    # Seconds averaged by this sample, see smart_manager.metrics.TIERS
+    period = models.IntegerField(default=1, db_index=True)
 
     class Meta:
         app_label = "smart_manager"
@@ -25,7 +25,9 @@ class PoolUsage(models.Model):
     pool = models.CharField(max_length=4096)
     free = models.BigIntegerField(default=0)
     reclaimable = models.BigIntegerField(default=0)
-    ts = models.DateTimeField(auto_now=True, db_index=True)
+    ts = models.DateTimeField(db_index=True)
+    # Seconds averaged by this sample, see smart_manager.metrics.TIERS
+    period = models.IntegerField(default=1, db_index=True)
     count = models.BigIntegerField(default=1)
 
     class Meta:
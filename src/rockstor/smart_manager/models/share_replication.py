@@ -35,6 +35,19 @@ class Replica(models.Model):
     ts = models.DateTimeField(null=True, db_index=True)
     crontab = models.CharField(max_length=64, null=True)
     replication_ip = models.CharField(max_length=4096, null=True)
+    NONE = "none"
+    ZLIB = "zlib"
+    COMPRESSION_CHOICES = (
+        (NONE, "none"),
+        (ZLIB, "zlib"),
+    )
+    """on the wire compression of the send stream, negotiated with Receiver"""
+    compression = models.CharField(
+        max_length=16, choices=COMPRESSION_CHOICES, default=NONE
+    )
+    """resume failed sends, in bytes sent over the network only: btrfs send
+    is re-run from the start and the Receiver replays its spool to catch up"""
+    resume = models.BooleanField(default=False)
 
     class Meta:
         app_label = "smart_manager"
@@ -95,6 +108,8 @@ class ReceiveTrail(models.Model):
     rshare = models.ForeignKey(ReplicaShare)
     snap_name = models.CharField(max_length=1024)
     kb_received = models.BigIntegerField(default=0)
+    """bytes of the send stream durably spooled, a resumed transfer starts here"""
+    resume_offset = models.BigIntegerField(default=0)
     receive_pending = models.DateTimeField(null=True)
     receive_succeeded = models.DateTimeField(null=True)
     receive_failed = models.DateTimeField(null=True)
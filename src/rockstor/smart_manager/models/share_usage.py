@@ -32,3 +32,5 @@ class ShareUsage(models.Model):
 
     class Meta:
         app_label = "smart_manager"
+        # For latest("id") and history lookups by name.
+        index_together = [("name", "id")]
@@ -30,6 +30,7 @@ class TaskDefinition(models.Model):
         ("reboot",) * 2,
         ("shutdown",) * 2,
         ("suspend",) * 2,
+        ("smart",) * 2,
         ("custom",) * 2,
     ]
     task_type = models.CharField(max_length=100, choices=TASK_TYPES)
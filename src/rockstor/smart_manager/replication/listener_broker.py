@@ -17,6 +17,7 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
 from multiprocessing import Process
+import collections
 import zmq
 import os
 import json
@@ -26,12 +27,19 @@ from smart_manager.models import ReplicaTrail, ReplicaShare, Replica, Service
 from django.conf import settings
 from sender import Sender
 from receiver import Receiver
-from util import ReplicationMixin
+from util import ReplicationMixin, TokenBucket
 from cli import APIWrapper
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Defaults for the Sender scheduling caps in settings.REPLICATION.
+MAX_SENDERS = 4
+MAX_SENDERS_PER_APPLIANCE = 2
+# Default for settings.REPLICATION "max_queued": new-sends beyond this many
+# awaiting a Sender slot are refused, to be retried by their next schedule.
+MAX_QUEUED = 64
+
 
 class ReplicaScheduler(ReplicationMixin, Process):
     def __init__(self):
@@ -39,6 +47,16 @@ class ReplicaScheduler(ReplicationMixin, Process):
         self.senders = {}  # Active Sender(outgoing) process map.
         self.receivers = {}  # Active Receiver process map.
         self.remote_senders = {}  # Active incoming/remote Sender/client map.
+        # Replica ids awaiting a free Sender slot, in arrival order.
+        self.send_queue = collections.OrderedDict()
+        self.max_queued = settings.REPLICATION.get("max_queued", MAX_QUEUED)
+        self.max_senders = settings.REPLICATION.get("max_senders", MAX_SENDERS)
+        self.max_senders_per_appliance = settings.REPLICATION.get(
+            "max_senders_per_appliance", MAX_SENDERS_PER_APPLIANCE
+        )
+        # KiB/s shared by all Senders, 0 for no limit.
+        self.bandwidth_limit = settings.REPLICATION.get("bandwidth_limit", 0)
+        self.bucket = None
         self.MAX_ATTEMPTS = settings.REPLICATION.get("max_send_attempts")
         self.uuid = self.listener_interface = self.listener_port = None
         self.trail_prune_time = None
@@ -120,10 +138,14 @@ class ReplicaScheduler(ReplicationMixin, Process):
         last_rt = rt_qs[0] if (len(rt_qs) > 0) else None
         if last_rt is None:
             logger.debug("Starting a new Sender(%s)." % sender_key)
-            self.senders[sender_key] = Sender(self.uuid, receiver_ip, replica)
+            self.senders[sender_key] = Sender(
+                self.uuid, receiver_ip, replica, bucket=self.bucket
+            )
         elif last_rt.status == "succeeded":
             logger.debug("Starting a new Sender(%s)" % sender_key)
-            self.senders[sender_key] = Sender(self.uuid, receiver_ip, replica, last_rt)
+            self.senders[sender_key] = Sender(
+                self.uuid, receiver_ip, replica, last_rt, bucket=self.bucket
+            )
         elif last_rt.status == "pending":
             msg = (
                 "Replica trail shows a pending Sender(%s), but it is not "
@@ -174,7 +196,7 @@ class ReplicaScheduler(ReplicationMixin, Process):
                 )
                 last_success_rt = None
             self.senders[sender_key] = Sender(
-                self.uuid, receiver_ip, replica, last_success_rt
+                self.uuid, receiver_ip, replica, last_success_rt, bucket=self.bucket
             )
         else:
             msg = (
@@ -187,6 +209,98 @@ class ReplicaScheduler(ReplicationMixin, Process):
         self.senders[sender_key].daemon = True
         self.senders[sender_key].start()
 
+    def _queue_send(self, replica):
+        sender_key = "%s_%s" % (self.uuid, replica.id)
+        if replica.id in self.send_queue:
+            raise Exception(
+                "Sender(%s) is already queued at position %d. Will not queue "
+                "it again." % (sender_key, self._queue_position(replica.id))
+            )
+        if sender_key in self.senders and self.senders[sender_key].exitcode is None:
+            raise Exception(
+                "There is live sender for(%s). Will not start "
+                "a new one." % sender_key
+            )
+        if len(self.send_queue) >= self.max_queued:
+            raise Exception(
+                "Sender queue is full (%d queued). Will not queue Sender(%s)."
+                % (len(self.send_queue), sender_key)
+            )
+        self.send_queue[replica.id] = {
+            "share": replica.share,
+            "appliance": replica.appliance,
+            "ts": time.time(),
+        }
+
+    def _queue_position(self, rid):
+        return self.send_queue.keys().index(rid) + 1
+
+    def _live_senders(self):
+        return [s for s in self.senders.values() if s.exitcode is None]
+
+    def _dispatch_sends(self):
+        """
+        Start queued Senders in arrival order, as long as we are within the
+        global and per destination appliance concurrency caps. A replica whose
+        destination is at its cap is skipped over, not waited on.
+        :return: dict of error messages for replica ids that failed to start.
+        """
+        errors = {}
+        live = self._live_senders()
+        num_live = len(live)
+        per_appliance = collections.Counter([s.replica.appliance for s in live])
+        for rid, qd in self.send_queue.items():
+            if num_live >= self.max_senders:
+                break
+            if per_appliance[qd["appliance"]] >= self.max_senders_per_appliance:
+                continue
+            del self.send_queue[rid]
+            try:
+                replica = Replica.objects.get(id=rid)
+                if not replica.enabled:
+                    raise Exception("Replication Task(%d) is disabled." % rid)
+                self._process_send(replica)
+            except Exception as e:
+                errors[rid] = e.__str__()
+                logger.error(
+                    "Failed to start a queued Sender for Replication "
+                    "Task(%d). Exception: %s" % (rid, errors[rid])
+                )
+                continue
+            num_live += 1
+            per_appliance[qd["appliance"]] += 1
+        return errors
+
+    def _queue_status(self):
+        active = []
+        for s in self._live_senders():
+            active.append(
+                {
+                    "replica": s.replica.id,
+                    "share": s.replica.share,
+                    "appliance": s.replica.appliance,
+                }
+            )
+        queued = []
+        for position, (rid, qd) in enumerate(self.send_queue.items(), start=1):
+            queued.append(
+                {
+                    "position": position,
+                    "replica": rid,
+                    "share": qd["share"],
+                    "appliance": qd["appliance"],
+                    "queued_since": qd["ts"],
+                }
+            )
+        return {
+            "max_senders": self.max_senders,
+            "max_senders_per_appliance": self.max_senders_per_appliance,
+            "max_queued": self.max_queued,
+            "bandwidth_limit": self.bandwidth_limit,
+            "active": active,
+            "queued": queued,
+        }
+
     def run(self):
         self.law = APIWrapper()
 
@@ -214,6 +328,12 @@ class ReplicaScheduler(ReplicationMixin, Process):
             )
             return logger.error(msg)
 
+        if self.bandwidth_limit > 0:
+            # Created before any Sender is forked, so all of them share it.
+            rate = self.bandwidth_limit * 1024
+            chunk_size = settings.REPLICATION.get("chunk_size", 1024 * 1024)
+            self.bucket = TokenBucket(rate, max(rate, chunk_size))
+
         ctx = zmq.Context()
         frontend = ctx.socket(zmq.ROUTER)
         frontend.set_hwm(10)
@@ -234,6 +354,8 @@ class ReplicaScheduler(ReplicationMixin, Process):
             # This loop may still continue even if replication service
             # is terminated, as long as data is coming in.
             socks = dict(poller.poll(timeout=poll_interval))
+            if len(self.send_queue) > 0:
+                self._dispatch_sends()
             if frontend in socks and socks[frontend] == zmq.POLLIN:
                 address, command, msg = frontend.recv_multipart()
                 if address not in self.remote_senders:
@@ -304,11 +426,21 @@ class ReplicaScheduler(ReplicationMixin, Process):
                     try:
                         replica = Replica.objects.get(id=rid)
                         if replica.enabled:
-                            self._process_send(replica)
-                            msg = (
-                                "A new Sender started successfully for "
-                                "Replication Task(%d)." % rid
-                            )
+                            self._queue_send(replica)
+                            errors = self._dispatch_sends()
+                            if rid in errors:
+                                raise Exception(errors[rid])
+                            if rid in self.send_queue:
+                                msg = (
+                                    "Replication Task(%d) queued at position "
+                                    "%d, waiting for a free Sender slot."
+                                    % (rid, self._queue_position(rid))
+                                )
+                            else:
+                                msg = (
+                                    "A new Sender started successfully for "
+                                    "Replication Task(%d)." % rid
+                                )
                             rcommand = "SUCCESS"
                         else:
                             msg = (
@@ -324,6 +456,10 @@ class ReplicaScheduler(ReplicationMixin, Process):
                         logger.error(msg)
                     finally:
                         backend.send_multipart([address, rcommand, str(msg)])
+                elif command == "queue-status":
+                    backend.send_multipart(
+                        [address, "SUCCESS", json.dumps(self._queue_status())]
+                    )
                 elif address in self.remote_senders:
                     if command in (
                         "receiver-ready",
@@ -23,6 +23,7 @@ import zmq
 import subprocess
 import json
 import time
+import zlib
 from django.conf import settings
 from django import db
 from contextlib import contextmanager
@@ -30,7 +31,7 @@ from util import ReplicationMixin
 from fs.btrfs import get_oldest_snap, remove_share, set_property, is_subvol, mount_share
 from system.osi import run_command
 from storageadmin.models import Pool, Share, Appliance
-from smart_manager.models import ReplicaShare, ReceiveTrail
+from smart_manager.models import ReplicaShare, ReceiveTrail, Replica
 import shutil
 from cli import APIWrapper
 import logging
@@ -49,6 +50,15 @@ class Receiver(ReplicationMixin, Process):
         self.incremental = self.meta["incremental"]
         self.snap_name = self.meta["snap"]
         self.sender_id = self.meta["uuid"]
+        # Senders predating compression negotiation omit this field.
+        self.compression = self.meta.get("compression", None)
+        if self.compression is not None and self.compression not in [
+            c[0] for c in Replica.COMPRESSION_CHOICES
+        ]:
+            self.compression = Replica.NONE
+        self.decompressor = None
+        if self.compression == Replica.ZLIB:
+            self.decompressor = zlib.decompressobj()
         self.sname = "%s_%s" % (self.sender_id, self.src_share)
         self.snap_dir = "%s%s/.snapshots/%s" % (
             settings.MNT_PT,
@@ -67,6 +77,17 @@ class Receiver(ReplicationMixin, Process):
         self.raw = None
         self.ack = False
         self.total_bytes_received = 0
+        # Durable copy of the received stream, allowing a failed transfer of
+        # the same snapshot to resume from its last checkpointed offset. As
+        # this doubles the writes to our pool it is opt-in, per Replica via
+        # the Sender's greeting, and capped by _spool_cap(): streams exceeding
+        # it are not spooled, and so not resumable. A resume only saves
+        # network bytes: the Sender re-runs btrfs send from the start and we
+        # replay the spool through a new btrfs receive.
+        self.spool_path = "%s/.%s.stream" % (self.snap_dir, self.snap_name)
+        self.spool = None
+        self.spool_max = 0
+        self.resume = self.meta.get("resume", False) is True
         # close all db connections prior to fork.
         db.close_old_connections()
         super(Receiver, self).__init__()
@@ -98,6 +119,7 @@ class Receiver(ReplicationMixin, Process):
                     data = {
                         "status": "failed",
                         "error": self.msg,
+                        "resume_offset": self._checkpoint_spool(),
                     }
                     self.update_receive_trail(self.rtid, data)
                 except Exception as e:
@@ -143,6 +165,132 @@ class Receiver(ReplicationMixin, Process):
             if self.delete_snapshot(share_name, oldest_snap):
                 return self._delete_old_snaps(share_name, share_path, num_retain)
 
+    def _checkpoint_spool(self):
+        """
+        Flush and fsync our stream spool so that all bytes received so far
+        are durable, and can be replayed on a resumed transfer.
+        :return: durable offset, i.e. bytes received, or 0 if not spooling.
+        """
+        if self.spool is None or self.spool.closed:
+            return 0
+        self.spool.flush()
+        os.fsync(self.spool.fileno())
+        return self.total_bytes_received
+
+    def _discard_spool(self):
+        if self.spool is not None and not self.spool.closed:
+            self.spool.close()
+        self.spool = None
+        if os.path.isfile(self.spool_path):
+            os.remove(self.spool_path)
+
+    def _spool_cap(self):
+        """
+        Bytes of the received stream we may spool: resume_spool_fraction of
+        our destination pool's free space, counting that held by an existing
+        spool, and no more than resume_spool_max where that is set.
+        :return: spool cap in bytes, 0 if the stream is not to be spooled.
+        """
+        fraction = settings.REPLICATION.get("resume_spool_fraction", 0)
+        free = Pool.objects.get(name=self.dest_pool).free * 1024
+        if os.path.isfile(self.spool_path):
+            free += os.path.getsize(self.spool_path)
+        spool_max = int(free * fraction)
+        cap = settings.REPLICATION.get("resume_spool_max")
+        if cap:
+            spool_max = min(spool_max, cap)
+        return max(spool_max, 0)
+
+    def _resume_offset(self):
+        """
+        A transfer of our snapshot can resume if its Replica has resume
+        enabled and the last failed receive trail for it checkpointed an
+        offset that our spool still covers, and that is within spool_max.
+        :return: byte offset to resume from, 0 for a transfer from the start.
+        """
+        if not self.resume or not os.path.isfile(self.spool_path):
+            return 0
+        try:
+            rto = (
+                ReceiveTrail.objects.filter(
+                    rshare__id=self.rid, snap_name=self.snap_name, status="failed"
+                )
+                .exclude(id=self.rtid)
+                .latest("id")
+            )
+        except ReceiveTrail.DoesNotExist:
+            return 0
+        if rto.resume_offset > self.spool_max:
+            return 0
+        if os.path.getsize(self.spool_path) < rto.resume_offset:
+            return 0
+        return rto.resume_offset
+
+    def _spool_write(self, message):
+        """
+        Append message, the next bytes of the stream, to our spool: which is
+        discarded, so ending spooling, once the stream exceeds spool_max.
+        """
+        if self.spool is None:
+            return
+        if self.total_bytes_received + len(message) > self.spool_max:
+            logger.debug(
+                "Id: %s. Stream exceeds the resume spool cap"
+                "(%d), no longer spooling." % (self.identity, self.spool_max)
+            )
+            self._discard_spool()
+        else:
+            self.spool.write(message)
+
+    def _replay_spool(self, offset):
+        """
+        Feed the first offset bytes of our spool, from a prior failed
+        transfer, to the current btrfs-recv process and leave the spool open
+        for appending the remainder of the stream.
+        :param offset: checkpointed resume offset.
+        """
+        with open(self.spool_path, "r+b") as sfo:
+            sfo.truncate(offset)
+            replayed = 0
+            while replayed < offset:
+                data = sfo.read(min(1024 * 1024, offset - replayed))
+                if len(data) == 0:
+                    raise Exception("Spool shorter than resume offset(%d)" % offset)
+                self.rp.stdin.write(data)
+                replayed += len(data)
+        self.rp.stdin.flush()
+        self.spool = open(self.spool_path, "ab")
+        self.total_bytes_received = offset
+
+    def _write_fsdata(self, message):
+        """
+        Write a chunk of fsdata to btrfs-recv, and to our spool, then grant
+        the Sender's window credit by acknowledging with the cumulative bytes
+        written: releasing all chunks up to and including this one.
+        """
+        if self.decompressor is not None:
+            message = self.decompressor.decompress(message)
+        self.rp.stdin.write(message)
+        self.rp.stdin.flush()
+        self._spool_write(message)
+        self.total_bytes_received += len(message)
+        self.dealer.send_multipart([b"send-more", b"%d" % self.total_bytes_received])
+
+    def _flush_fsdata(self):
+        """
+        Write to btrfs-recv, and to our spool, whatever of a compressed stream
+        our decompressor still holds once the Sender has finished.
+        """
+        if self.decompressor is None:
+            return
+        message = self.decompressor.flush()
+        if len(message) == 0:
+            return
+        self.rp.stdin.write(message)
+        self.rp.stdin.flush()
+        self._spool_write(message)
+        self.total_bytes_received += len(message)
+
     def _send_recv(self, command, msg=""):
         rcommand = rmsg = None
         self.dealer.send_multipart([command, msg])
@@ -252,6 +400,27 @@ class Receiver(ReplicationMixin, Process):
             run_command(["/usr/bin/mkdir", "-p", self.snap_dir])
             snap_fp = "%s/%s" % (self.snap_dir, self.snap_name)
 
+            if self.resume:
+                self.msg = "Failed to establish the resume spool cap."
+                self.spool_max = self._spool_cap()
+                self.resume = self.spool_max > 0
+
+            self.msg = "Failed to establish resume offset from prior transfer."
+            resume_offset = self._resume_offset()
+            if resume_offset > 0:
+                # The partially received subvol is re-created by replaying
+                # our spool through a new btrfs-recv process.
+                logger.debug(
+                    "Id: %s. Resuming transfer of %s at offset %d."
+                    % (self.identity, snap_fp, resume_offset)
+                )
+                if is_subvol(snap_fp):
+                    self.msg = "Failed to delete partially received %s" % snap_fp
+                    run_command([BTRFS, "subvolume", "delete", snap_fp])
+            elif os.path.isfile(self.spool_path):
+                self.msg = "Failed to remove stale stream spool."
+                self._discard_spool()
+
             # If the snapshot already exists, presumably from the previous
             # attempt and the sender tries to send the same, reply back with
             # snap_exists and do not start the btrfs-receive
@@ -277,8 +446,34 @@ class Receiver(ReplicationMixin, Process):
                 stderr=subprocess.PIPE,
             )
 
+            if resume_offset > 0:
+                self.msg = "Failed to replay stream spool to btrfs receive."
+                self._replay_spool(resume_offset)
+                self.update_receive_trail(
+                    self.rtid,
+                    {
+                        "status": "pending",
+                        "kb_received": resume_offset / 1024,
+                        "resume_offset": resume_offset,
+                    },
+                )
+            elif self.resume:
+                self.msg = "Failed to create stream spool: %s" % self.spool_path
+                self.spool = open(self.spool_path, "wb")
+
             self.msg = "Failed to send receiver-ready"
-            rcommand, rmsg = self._send_recv("receiver-ready", latest_snap or "")
+            ready_msg = latest_snap or ""
+            if self.compression is not None:
+                # Sender understands a json reply carrying our agreed compression
+                # and, if resuming, the stream offset to continue from.
+                ready_msg = json.dumps(
+                    {
+                        "snap": ready_msg,
+                        "compression": self.compression,
+                        "offset": resume_offset,
+                    }
+                )
+            rcommand, rmsg = self._send_recv("receiver-ready", ready_msg)
             if rcommand is None:
                 logger.error(
                     "Id: %s. No response from the broker for "
@@ -307,6 +502,8 @@ class Receiver(ReplicationMixin, Process):
                         # btrfs-recev process should be
                         # terminated(.communicate).
                         if self.rp.poll() is None:
+                            self.msg = "Failed to flush fsdata to btrfs-recv"
+                            self._flush_fsdata()
                             self.msg = "Failed to terminate btrfs-recv command"
                             out, err = self.rp.communicate()
                             out = out.split("\n")
@@ -321,6 +518,7 @@ class Receiver(ReplicationMixin, Process):
                                 "btrfs-recv exited with unexpected "
                                 "exitcode(%s). " % self.rp.returncode
                             )
+                            self._discard_spool()
                             raise Exception(self.msg)
                         data = {
                             "status": "succeeded",
@@ -330,6 +528,7 @@ class Receiver(ReplicationMixin, Process):
                             "Failed to update receive trail for rtid: %d" % self.rtid
                         )
                         self.update_receive_trail(self.rtid, data)
+                        self._discard_spool()
 
                         self._send_recv("btrfs-recv-finished")
                         self.refresh_share_state()
@@ -351,17 +550,14 @@ class Receiver(ReplicationMixin, Process):
                         raise Exception(self.msg)
 
                     if self.rp.poll() is None:
-                        self.rp.stdin.write(message)
-                        self.rp.stdin.flush()
-                        # @todo: implement advanced credit request system.
-                        self.dealer.send_multipart([b"send-more", ""])
+                        self._write_fsdata(message)
                         num_msgs += 1
-                        self.total_bytes_received += len(message)
                         if num_msgs == 1000:
                             num_msgs = 0
                             data = {
                                 "status": "pending",
                                 "kb_received": self.total_bytes_received / 1024,
+                                "resume_offset": self._checkpoint_spool(),
                             }
                             self.update_receive_trail(self.rtid, data)
 
@@ -395,6 +591,8 @@ class Receiver(ReplicationMixin, Process):
                             "rtid: %d." % self.rtid
                         )
                         self.update_receive_trail(self.rtid, data)
+                        # Our stream is suspect, a retry starts from scratch.
+                        self._discard_spool()
                         self.msg = msg
                         raise Exception(self.msg)
                 else:
@@ -17,13 +17,15 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
 from multiprocessing import Process
+import collections
 import os
 import sys
 import zmq
 import subprocess
-import fcntl
+import tempfile
 import json
 import time
+import zlib
 from django.conf import settings
 from contextlib import contextmanager
 from util import ReplicationMixin
@@ -36,10 +38,18 @@ import logging
 logger = logging.getLogger(__name__)
 
 BTRFS = "/sbin/btrfs"
+# Defaults for settings.REPLICATION "chunk_size" and "send_window": the fsdata
+# message size in bytes, and the number of such messages allowed in flight,
+# i.e. sent but not yet acknowledged by the Receiver. N.B. the broker's
+# backend ROUTER drops messages beyond its (default 1000) high water mark.
+CHUNK_SIZE = 1024 * 1024
+SEND_WINDOW = 16
+# Favour throughput over ratio, the stream is compressed on the fly.
+ZLIB_LEVEL = 1
 
 
 class Sender(ReplicationMixin, Process):
-    def __init__(self, uuid, receiver_ip, replica, rt=None):
+    def __init__(self, uuid, receiver_ip, replica, rt=None, bucket=None):
         self.uuid = uuid
         self.receiver_ip = receiver_ip
         self.receiver_port = replica.data_port
@@ -54,12 +64,27 @@ class Sender(ReplicationMixin, Process):
         self.rid = replica.id
         self.identity = u"%s-%s" % (self.uuid, self.rid)
         self.sp = None
+        # Temporary file of btrfs send stderr, see _start_send().
+        self.sp_err = None
         # Latest snapshot per Receiver(comes along with receiver-ready)
         self.rlatest_snap = None
         self.ctx = zmq.Context()
         self.msg = ""
         self.update_trail = False
         self.total_bytes_sent = 0
+        # Bytes put on the wire, differs from total_bytes_sent if compressed.
+        self.total_bytes_wire = 0
+        # Compression agreed with the Receiver via the receiver-ready reply.
+        self.compression = "none"
+        self.compressor = None
+        # Cumulative bytes acknowledged as written by the Receiver.
+        self.total_bytes_acked = 0
+        # Stream offset the Receiver already holds from a prior failed attempt.
+        self.resume_offset = 0
+        self.chunk_size = settings.REPLICATION.get("chunk_size", CHUNK_SIZE)
+        self.send_window = settings.REPLICATION.get("send_window", SEND_WINDOW)
+        # Broker wide TokenBucket bandwidth cap, shared with all other Senders.
+        self.bucket = bucket
         self.ppid = os.getpid()
         self.max_snap_retain = settings.REPLICATION.get("max_snap_retain")
         db.close_old_connections()
@@ -103,6 +128,8 @@ class Sender(ReplicationMixin, Process):
             "snap": self.snap_name,
             "incremental": self.rt is not None,
             "uuid": self.uuid,
+            "compression": self.replica.compression,
+            "resume": self.replica.resume,
         }
         msg_str = json.dumps(msg)
         self.send_req.send_multipart(["sender-ready", b"%s" % msg_str])
@@ -137,6 +164,145 @@ class Sender(ReplicationMixin, Process):
             )
         return rcommand, rmsg
 
+    def _parse_receiver_ready(self, reply):
+        """
+        A Receiver that understood the compression field of our sender-ready
+        greeting replies with a json object of the latest snapshot it holds and
+        the compression it agreed to, along with the stream offset to resume
+        from. Older Receivers reply with just the latest snapshot name (or an
+        empty string) and no compression.
+        :param reply: message accompanying the receiver-ready command.
+        :return: latest snapshot name on the Receiver, or empty string.
+        """
+        try:
+            reply_d = json.loads(reply)
+        except ValueError:
+            reply_d = None
+        if not isinstance(reply_d, dict):
+            return reply
+        self.compression = reply_d.get("compression", "none")
+        if self.compression == "zlib":
+            self.compressor = zlib.compressobj(ZLIB_LEVEL)
+        self.resume_offset = int(reply_d.get("offset", 0))
+        return str(reply_d.get("snap", ""))
+
+    def _compression_report(self, t0):
+        if self.compressor is None:
+            return ""
+        wsize, wrate = self.size_report(self.total_bytes_wire, t0)
+        ratio = float(self.total_bytes_sent) / max(self.total_bytes_wire, 1)
+        return " Compression(%s) ratio: %.2f. On the wire: %s. Wire rate: %s/sec." % (
+            self.compression,
+            ratio,
+            wsize,
+            wrate,
+        )
+
+    def _recv_ack(self, in_flight):
+        """
+        Wait, for up to 60 seconds, on the next fsdata acknowledgement from the
+        Receiver and release the window credit of all chunks it covers.
+        Acknowledgements are send-more messages carrying the cumulative bytes
+        written to btrfs-recv, so a lost or coalesced ack is covered by the next.
+        An empty send-more (pre windowing Receiver) acknowledges a single chunk.
+        :param in_flight: deque of the sizes of un-acknowledged chunks, in
+        send order. Acknowledged entries are removed.
+        """
+        command = message = None
+        socks = dict(self.poll.poll(60000))  # 60 seconds.
+        if socks.get(self.send_req) == zmq.POLLIN:
+            command, message = self.send_req.recv_multipart()
+        if command != "send-more":
+            # command is None when the remote side vanishes.
+            self.msg = (
+                "Got null or error command(%s) message(%s) "
+                "from the Receiver while"
+                " transmitting fsdata. Aborting." % (command, message)
+            )
+            raise Exception(message)
+        if len(message) == 0:
+            self.total_bytes_acked += in_flight.popleft()
+            return
+        acked = int(message)
+        while len(in_flight) > 0 and self.total_bytes_acked + in_flight[0] <= acked:
+            self.total_bytes_acked += in_flight.popleft()
+
+    def _send_chunk(self, fs_data, in_flight, final=False):
+        """
+        Send a chunk of fsdata once the window has credit for it, i.e. fewer
+        than send_window chunks are un-acknowledged, waiting on
+        acknowledgements (_recv_ack()) meanwhile.
+        :param fs_data: next chunk of our btrfs send stream.
+        :param in_flight: deque of the sizes of un-acknowledged chunks, in
+        send order, to which fs_data's is appended.
+        :param final: end our compressed stream with this chunk.
+        """
+        while len(in_flight) >= self.send_window:
+            self._recv_ack(in_flight)
+        # Window accounting is in stream (uncompressed) bytes.
+        in_flight.append(len(fs_data))
+        self.total_bytes_sent += len(fs_data)
+        if self.compressor is not None:
+            # Sync flush so each message decompresses on arrival.
+            mode = zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH
+            fs_data = self.compressor.compress(fs_data) + self.compressor.flush(mode)
+        self.total_bytes_wire += len(fs_data)
+        if self.bucket is not None:
+            self.bucket.consume(len(fs_data))
+        self.send_req.send_multipart(["", fs_data], copy=False)
+
+    def _skip_stream(self, offset):
+        """
+        Read and discard the first offset bytes of our btrfs send stream. The
+        Receiver has replayed these from its spool of a prior failed attempt,
+        btrfs send being deterministic for a given snapshot (and parent). So
+        a resume saves only network bytes: btrfs send is still re-run from the
+        start here, as is btrfs receive over the Receiver's replayed spool.
+        :param offset: stream offset the Receiver resumes from.
+        """
+        skipped = 0
+        while skipped < offset:
+            data = self.sp.stdout.read(min(self.chunk_size, offset - skipped))
+            if len(data) == 0:
+                self._send_recv("btrfs-send-unexpected-termination-error")
+                raise Exception(
+                    "btrfs send stream ended at %d, before the resume "
+                    "offset(%d)." % (skipped, offset)
+                )
+            skipped += len(data)
+        self.total_bytes_sent = self.total_bytes_acked = offset
+        logger.info(
+            "Id: %s. Resuming btrfs send stream at offset %d." % (self.identity, offset)
+        )
+
+    def _start_send(self, cmd):
+        """
+        Start btrfs send with its stdout piped to us, in chunk_size blocking
+        reads, and its stderr to a temporary file: which unlike a pipe cannot
+        fill, and so block btrfs send, while we only read its stdout.
+        :param cmd: btrfs send command.
+        """
+        self.sp_err = tempfile.TemporaryFile()
+        # Blocking pipe: reads return a full chunk, or less only at EOF.
+        self.sp = subprocess.Popen(
+            cmd,
+            shell=False,
+            stdout=subprocess.PIPE,
+            stderr=self.sp_err,
+            bufsize=self.chunk_size,
+        )
+
+    def _wait_send(self):
+        """
+        Wait on btrfs send, its stdout having been read to EOF, to exit.
+        :return: stderr of btrfs send.
+        """
+        self.sp.wait()
+        self.sp_err.seek(0)
+        err = self.sp_err.read()
+        self.sp_err.close()
+        return err
+
     def _delete_old_snaps(self, share_path):
         oldest_snap = get_oldest_snap(
             share_path, self.max_snap_retain, regex="_replication_"
@@ -279,6 +445,7 @@ class Sender(ReplicationMixin, Process):
                     retries_left = settings.REPLICATION.get("max_send_attempts")
                     command, reply = self.send_req.recv_multipart()
                     if command == "receiver-ready":
+                        reply = self._parse_receiver_ready(reply)
                         if self.rt is not None:
                             self.rlatest_snap = reply
                             self.rt = self._refresh_rt()
@@ -358,83 +525,66 @@ class Sender(ReplicationMixin, Process):
                 )
 
             try:
-                self.sp = subprocess.Popen(
-                    cmd, shell=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-                )
-                fcntl.fcntl(self.sp.stdout.fileno(), fcntl.F_SETFL, os.O_NONBLOCK)
+                self._start_send(cmd)
             except Exception as e:
                 self.msg = (
                     "Failed to start the low level btrfs send "
-                    "command(%s). Aborting. Exception: " % (cmd, e.__str__())
+                    "command(%s). Aborting. Exception: %s" % (cmd, e.__str__())
                 )
                 logger.error("Id: %s. %s" % (self.identity, self.msg))
                 self._send_recv("btrfs-send-init-error")
                 self._sys_exit(3)
 
-            alive = True
+            if self.resume_offset > 0:
+                self.msg = (
+                    "Failed to skip %d bytes of btrfs send data already held "
+                    "by the receiver for %s." % (self.resume_offset, self.snap_id)
+                )
+                self._skip_stream(self.resume_offset)
+
+            # Windowed transfer: up to send_window chunks of fsdata may be
+            # un-acknowledged at any one time. The Receiver acknowledges with
+            # a send-more carrying the cumulative bytes it has written to
+            # btrfs-recv, which releases credit for further chunks.
+            in_flight = collections.deque()  # sizes of un-acknowledged chunks.
             num_msgs = 0
             t0 = time.time()
-            while alive:
+            self.update_trail = True
+            while True:
                 try:
-                    if self.sp.poll() is not None:
-                        logger.debug(
-                            "Id: %s. send process finished "
-                            "for %s. rc: %d. stderr: %s"
-                            % (
-                                self.identity,
-                                self.snap_id,
-                                self.sp.returncode,
-                                self.sp.stderr.read(),
-                            )
-                        )
-                        alive = False
-                    fs_data = self.sp.stdout.read()
-                except IOError:
-                    continue
+                    fs_data = self.sp.stdout.read(self.chunk_size)
                 except Exception as e:
                     self.msg = (
                         "Exception occurred while reading low "
                         "level btrfs "
                         "send data for %s. Aborting." % self.snap_id
                     )
-                    if alive:
+                    logger.error(
+                        "Id: %s. %s Exception: %s"
+                        % (self.identity, self.msg, e.__str__())
+                    )
+                    if self.sp.poll() is None:
                         self.sp.terminate()
-                    self.update_trail = True
                     self._send_recv("btrfs-send-unexpected-termination-error")
                     self._sys_exit(3)
+                if len(fs_data) == 0:
+                    # EOF, btrfs send has closed its stdout.
+                    break
 
                 self.msg = (
                     "Failed to send fsdata to the receiver for %s. "
                     "Aborting." % (self.snap_id)
                 )
-                self.update_trail = True
-                command, message = self._send_recv("", fs_data)
-                self.total_bytes_sent += len(fs_data)
+                self._send_chunk(fs_data, in_flight)
                 num_msgs += 1
                 if num_msgs == 1000:
                     num_msgs = 0
                     dsize, drate = self.size_report(self.total_bytes_sent, t0)
                     logger.debug(
                         "Id: %s Sender alive. Data transferred: "
-                        "%s. Rate: %s/sec." % (self.identity, dsize, drate)
-                    )
-                if command is None or command == "receiver-error":
-                    # command is None when the remote side vanishes.
-                    self.msg = (
-                        "Got null or error command(%s) message(%s) "
-                        "from the Receiver while"
-                        " transmitting fsdata. Aborting." % (command, message)
+                        "%s. Rate: %s/sec.%s"
+                        % (self.identity, dsize, drate, self._compression_report(t0))
                     )
-                    raise Exception(message)
-
-                if not alive:
-                    if self.sp.returncode != 0:
-                        # do we mark failed?
-                        command, message = self._send_recv(
-                            "btrfs-send-nonzero-termination-error"
-                        )
-                    else:
-                        command, message = self._send_recv("btrfs-send-stream-finished")
 
                 if os.getppid() != self.ppid:
                     logger.error(
@@ -444,6 +594,34 @@ class Sender(ReplicationMixin, Process):
                     )
                     self._sys_exit(3)
 
+            if self.compressor is not None:
+                # Terminate the zlib stream: a chunk of no stream bytes.
+                self._send_chunk(b"", in_flight, final=True)
+            # Ensure all fsdata is written on the Receiver before concluding.
+            while len(in_flight) > 0:
+                self._recv_ack(in_flight)
+            err = self._wait_send()
+            logger.debug(
+                "Id: %s. send process finished "
+                "for %s. rc: %d. stderr: %s"
+                % (self.identity, self.snap_id, self.sp.returncode, err)
+            )
+            if self.sp.returncode != 0:
+                self._send_recv("btrfs-send-nonzero-termination-error")
+                self.msg = (
+                    "btrfs send exited with unexpected exitcode(%s) for %s. "
+                    "stderr: %s" % (self.sp.returncode, self.snap_id, err)
+                )
+                raise Exception(self.msg)
+            command, message = self._send_recv("btrfs-send-stream-finished")
+            if command != "btrfs-recv-finished":
+                self.msg = (
+                    "Unexpected reply command(%s) message(%s) from the "
+                    "Receiver to btrfs-send-stream-finished. "
+                    "Aborting." % (command, message)
+                )
+                raise Exception(self.msg)
+
             data = {
                 "status": "succeeded",
                 "kb_sent": self.total_bytes_sent / 1024,
@@ -456,6 +634,7 @@ class Sender(ReplicationMixin, Process):
             dsize, drate = self.size_report(self.total_bytes_sent, t0)
             logger.debug(
                 "Id: %s. Send complete. Total data transferred: %s."
-                " Rate: %s/sec." % (self.identity, dsize, drate)
+                " Rate: %s/sec.%s"
+                % (self.identity, dsize, drate, self._compression_report(t0))
             )
             self._sys_exit(0)
@@ -17,6 +17,7 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
 import time
+from multiprocessing import Lock, RawValue
 from storageadmin.exceptions import RockStorAPIException
 from storageadmin.models import Appliance, Share
 from cli import APIWrapper
@@ -25,6 +26,33 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+class TokenBucket(object):
+    """
+    Bandwidth cap shared by all Sender processes forked from the
+    ReplicaScheduler. Tokens are bytes, refilled at rate bytes per second up
+    to burst. A consumer may overdraw the bucket and then sleeps off the debt,
+    so a chunk larger than burst is never starved.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.lock = Lock()
+        self.tokens = RawValue("d", self.burst)
+        self.ts = RawValue("d", time.time())
+
+    def consume(self, num_bytes):
+        with self.lock:
+            now = time.time()
+            elapsed = max(now - self.ts.value, 0)
+            self.tokens.value = min(self.burst, self.tokens.value + elapsed * self.rate)
+            self.ts.value = now
+            self.tokens.value -= num_bytes
+            wait = -self.tokens.value / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+
 class ReplicationMixin(object):
     def validate_src_share(self, sender_uuid, sname):
         url = "https://"
@@ -0,0 +1,176 @@
+"""
+Copyright (c) 2012-2020 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from datetime import datetime, timedelta
+import time
+import logging
+
+from django.utils.timezone import utc
+
+from fs.btrfs import btrfs_progs_version, scrub_status
+from storageadmin.models import PoolScrub, PoolScrubSample
+
+logger = logging.getLogger(__name__)
+
+# Seconds between status reads of each running scrub.
+SCRUB_POLL_INTERVAL = 30
+# Seconds after which the record of a running scrub is considered unattended,
+# ie data-collector is not running, and is refreshed by its readers instead.
+SCRUB_STALE = 3 * SCRUB_POLL_INTERVAL
+# Number of most recent scrubs per pool whose samples are retained.
+SCRUB_SAMPLES_KEPT = 10
+# PoolScrub states of a scrub still in progress.
+ACTIVE_SCRUB_STATES = ("started", "running")
+# PoolScrub states with a scrub_status() provided duration.
+TIMED_SCRUB_STATES = ("finished", "halted", "cancelled")
+ERROR_FIELDS = (
+    "read_errors",
+    "csum_errors",
+    "verify_errors",
+    "super_errors",
+    "malloc_errors",
+    "uncorrectable_errors",
+    "unverified_errors",
+)
+
+
+def utcnow():
+    return datetime.utcnow().replace(tzinfo=utc)
+
+
+def record_scrub_status(ps, cur_status, ts=None):
+    """
+    Update a PoolScrub from the output of scrub_status(), adding a progress
+    sample where bytes scrubbed were reported.
+    :param ps: PoolScrub object.
+    :param cur_status: dictionary as returned by scrub_status().
+    :param ts: datetime of the status read, defaults to utcnow.
+    :return: the scrub's status.
+    """
+    if ts is None:
+        ts = utcnow()
+    fields = dict(cur_status)
+    if fields["status"] in TIMED_SCRUB_STATES:
+        duration = int(fields.pop("duration"))
+        fields["end_time"] = ps.start_time + timedelta(seconds=duration)
+    PoolScrub.objects.filter(id=ps.id).update(**fields)
+    if "kb_scrubbed" in fields:
+        kb_rate = 0
+        prior = PoolScrubSample.objects.filter(scrub=ps).order_by("-ts").first()
+        if prior is not None:
+            elapsed = (ts - prior.ts).total_seconds()
+            if elapsed > 0:
+                kb_rate = max(fields["kb_scrubbed"] - prior.kb_scrubbed, 0) / elapsed
+        PoolScrubSample.objects.create(
+            scrub=ps,
+            ts=ts,
+            kb_scrubbed=fields["kb_scrubbed"],
+            kb_rate=int(kb_rate),
+            errors=sum(fields.get(f, 0) for f in ERROR_FIELDS),
+        )
+    if fields["status"] not in ACTIVE_SCRUB_STATES:
+        prune_samples(ps.pool_id)
+    return fields["status"]
+
+
+def prune_samples(pool_id):
+    """
+    Delete the samples of all but the SCRUB_SAMPLES_KEPT most recent scrubs of
+    a pool.
+    """
+    kept = PoolScrub.objects.filter(pool_id=pool_id).order_by("-id")[
+        SCRUB_SAMPLES_KEPT - 1 : SCRUB_SAMPLES_KEPT
+    ]
+    if len(kept) > 0:
+        PoolScrubSample.objects.filter(
+            scrub__pool_id=pool_id, scrub_id__lt=kept[0].id
+        ).delete()
+
+
+def scrub_is_stale(ps, now=None):
+    """
+    :param ps: PoolScrub object.
+    :param now: datetime, defaults to utcnow.
+    :return: True if ps has not been updated by our monitor within
+    SCRUB_STALE seconds.
+    """
+    if now is None:
+        now = utcnow()
+    latest = (
+        PoolScrubSample.objects.filter(scrub=ps)
+        .order_by("-ts")
+        .values_list("ts", flat=True)[:1]
+    )
+    last = latest[0] if len(latest) > 0 else ps.start_time
+    return (now - last).total_seconds() > SCRUB_STALE
+
+
+class ScrubMonitor(object):
+    """
+    Follows all running scrubs, reading each one's status once every
+    SCRUB_POLL_INTERVAL and recording it into PoolScrub, so that the Web-UI and
+    our scheduled scrub tasks need only read the database. Long running: see
+    run().
+    """
+
+    def __init__(self, interval=SCRUB_POLL_INTERVAL, scheduler=None):
+
+        self.interval = interval
+        # Applied ahead of each poll, from our thread so that the scrub states
+        # it sets, ie "paused", are not raced by our own status updates. See
+        # maintenance.MaintenanceScheduler.
+        self.scheduler = scheduler
+
+    def poll(self):
+
+        seen = set()
+        for ps in (
+            PoolScrub.objects.filter(status__in=ACTIVE_SCRUB_STATES)
+            .select_related("pool")
+            .order_by("-id")
+        ):
+            # Only the latest scrub of a pool can be running.
+            if ps.pool_id in seen:
+                continue
+            seen.add(ps.pool_id)
+            try:
+                record_scrub_status(ps, scrub_status(ps.pool))
+            except Exception as e:
+                logger.exception(
+                    "Exception while reading scrub status of pool ({}): {}".format(
+                        ps.pool.name, e
+                    )
+                )
+
+    def run(self):
+
+        try:
+            logger.debug("btrfs-progs version ({}).".format(btrfs_progs_version()))
+        except Exception as e:
+            logger.exception(
+                "Exception while reading btrfs-progs version: {}".format(e)
+            )
+        while True:
+            started = time.time()
+            try:
+                if self.scheduler is not None:
+                    self.scheduler.apply()
+                self.poll()
+            except Exception as e:
+                logger.exception("Exception while monitoring scrubs: {}".format(e))
+            time.sleep(max(0, self.interval - (time.time() - started)))
@@ -0,0 +1,112 @@
+"""
+Copyright (c) 2012-2021 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import unittest
+
+from mock import MagicMock, patch
+
+# data_collector monkey patches on import, which is not for our test process.
+with patch("gevent.monkey.patch_all"):
+    from smart_manager.data_collector import (
+        DbNamesSampler,
+        DisksWidgetNamespace,
+        SamplerNamespace,
+    )
+
+
+class SamplerNamespaceTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor-dev>
+    ./bin/test --settings=test-settings -v 3 -p test_data_collector*
+    """
+
+    def setUp(self):
+        self.mock_gevent = patch("smart_manager.data_collector.gevent").start()
+        self.mock_gevent.spawn.side_effect = lambda func: MagicMock(dead=False)
+
+    def tearDown(self):
+        patch.stopall()
+
+    def namespace(self, cls=SamplerNamespace):
+        namespace = cls("/widget")
+        patch.object(namespace, "enter_room").start()
+        patch.object(namespace, "leave_room").start()
+        return namespace
+
+    def test_shared_sampler(self):
+        """
+        One sampler, started by the first subscriber, serves all those that
+        follow and is killed on the last disconnection.
+        """
+        namespace = self.namespace()
+        namespace.on_connect("sid1", {})
+        self.mock_gevent.spawn.assert_called_once_with(namespace.run_sampler)
+        sampler = namespace.sampler
+        namespace.on_connect("sid2", {})
+        self.assertEqual(self.mock_gevent.spawn.call_count, 1)
+        self.assertIs(namespace.sampler, sampler)
+        namespace.enter_room.assert_called_with("sid2", namespace.room)
+        namespace.on_disconnect("sid1")
+        self.assertFalse(sampler.kill.called)
+        self.assertIs(namespace.sampler, sampler)
+        namespace.on_disconnect("sid2")
+        sampler.kill.assert_called_once_with(block=False)
+        self.assertIsNone(namespace.sampler)
+        namespace.leave_room.assert_called_with("sid2", namespace.room)
+        # The next subscriber starts a new sampler.
+        namespace.on_connect("sid3", {})
+        self.assertEqual(self.mock_gevent.spawn.call_count, 2)
+        self.assertIsNot(namespace.sampler, sampler)
+
+    def test_dead_sampler_restarted(self):
+        namespace = self.namespace()
+        namespace.on_connect("sid1", {})
+        namespace.sampler.dead = True
+        namespace.on_connect("sid2", {})
+        self.assertEqual(self.mock_gevent.spawn.call_count, 2)
+        self.assertFalse(namespace.sampler.dead)
+
+    def test_sampler_defaults(self):
+        """
+        Base samplers sample, and broadcast, nothing.
+        """
+        namespace = self.namespace()
+        with patch.object(namespace, "emit") as mock_emit:
+            self.assertEqual(namespace.sample("prev"), "prev")
+        self.assertFalse(mock_emit.called)
+        self.assertEqual(self.namespace(DbNamesSampler).names(), set())
+
+    @patch("smart_manager.data_collector.read_diskstats")
+    @patch("smart_manager.data_collector.Disk")
+    @patch("smart_manager.data_collector.get_byid_name_map")
+    def test_disks_sample_refreshed_map(
+        self, mock_byid_name_map, mock_disk, mock_read_diskstats
+    ):
+        """
+        Disk stats are keyed by the by-id map refreshed along with our names.
+        """
+        disk = MagicMock()
+        disk.name = "ata-QEMU_HARDDISK_QM00005"
+        mock_disk.objects.all.return_value = [disk]
+        byid_disk_map = {"sda": "ata-QEMU_HARDDISK_QM00005"}
+        mock_byid_name_map.return_value = byid_disk_map
+        namespace = self.namespace(DisksWidgetNamespace)
+        namespace.sample(None)
+        mock_read_diskstats.assert_called_once_with(
+            byid_disk_map, {"ata-QEMU_HARDDISK_QM00005"}
+        )
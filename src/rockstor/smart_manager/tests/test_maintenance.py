@@ -0,0 +1,168 @@
+"""
+Copyright (c) 2012-2020 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import json
+from datetime import datetime
+
+from django.test import TestCase
+from mock import patch
+
+from smart_manager.maintenance import (
+    IOPRIO_IDLE,
+    POLICY_PAUSE_MSG,
+    MaintenanceScheduler,
+    disk_latency,
+    pause_reason,
+    pool_policies,
+    scrub_ioprio_class,
+)
+from smart_manager.models import TaskDefinition
+from storageadmin.models import Pool, PoolBalance, PoolScrub
+
+
+class MaintenanceTests(TestCase):
+    multi_db = True
+
+    def setUp(self):
+        self.pool = Pool(name="rock-pool", raid="raid1")
+        self.pool.save()
+        # Weekdays, 19:00 to 06:59
+        self.window = "19-00-06-59-0-4"
+        self.policy = {
+            "window": self.window,
+            "window_pause": True,
+            "max_latency": 0,
+            "low_priority": False,
+        }
+
+    def add_task(self, name, enabled=True, **meta):
+        meta["pool"] = str(self.pool.id)
+        TaskDefinition.objects.create(
+            name=name,
+            task_type="scrub",
+            crontab="0 19 * * 1",
+            crontabwindow=self.window,
+            json_meta=json.dumps(meta),
+            enabled=enabled,
+        )
+
+    def test_pool_policies(self):
+        self.add_task("no-policy")
+        self.assertEqual(pool_policies(), {})
+        self.assertIsNone(scrub_ioprio_class(self.pool))
+        self.add_task("disabled", enabled=False, low_priority=True)
+        self.add_task("policy", window_pause=True, low_priority=True)
+        self.add_task("later", max_latency=50)
+        policy = dict(self.policy, low_priority=True)
+        self.assertEqual(pool_policies(), {self.pool.id: policy})
+        self.assertEqual(scrub_ioprio_class(self.pool), IOPRIO_IDLE)
+
+    def test_disk_latency(self):
+        # As per read_diskstats(): reads, ms_reading at 0, 3; writes,
+        # ms_writing at 4, 7.
+        prev = {"disk1": [10, 0, 0, 100, 10, 0, 0, 100, 0, 0, 0]}
+        cur = {"disk1": [20, 0, 0, 300, 30, 0, 0, 400, 0, 0, 0]}
+        cur["disk2"] = prev["disk2"] = [5, 0, 0, 5, 5, 0, 0, 5, 0, 0, 0]
+        self.assertEqual(disk_latency(cur, prev, ["disk1", "disk2"]), 500.0 / 30)
+        self.assertIsNone(disk_latency(cur, prev, ["disk2", "disk3"]))
+
+    def test_pause_reason(self):
+        # Monday morning, and evening.
+        morning = datetime(2021, 10, 18, 9, 0)
+        evening = datetime(2021, 10, 18, 21, 0)
+        self.assertEqual(pause_reason(self.policy, None, False, morning), "window")
+        self.assertIsNone(pause_reason(self.policy, None, True, evening))
+        policy = dict(self.policy, max_latency=40)
+        self.assertEqual(pause_reason(policy, 50.0, False, evening), "latency")
+        self.assertIsNone(pause_reason(policy, 30.0, False, evening))
+        # Resumption requires latency well below our threshold.
+        self.assertEqual(pause_reason(policy, 30.0, True, evening), "latency")
+        self.assertIsNone(pause_reason(policy, 10.0, True, evening))
+        self.assertIsNone(pause_reason(policy, None, True, evening))
+
+    @patch("smart_manager.maintenance.scrub_resume")
+    @patch("smart_manager.maintenance.scrub_pause")
+    @patch("smart_manager.maintenance.pause_reason")
+    def test_scrub_pause_resume(self, mock_reason, mock_pause, mock_resume):
+        ps = PoolScrub.objects.create(pool=self.pool, pid=1234, status="running")
+        scheduler = MaintenanceScheduler()
+        mock_reason.return_value = "window"
+        scheduler.apply_policy(self.pool, self.policy, None)
+        mock_pause.assert_called_once_with(self.pool)
+        self.assertEqual(PoolScrub.objects.get(id=ps.id).status, "paused")
+        mock_reason.return_value = None
+        mock_resume.return_value = 5678
+        scheduler.apply_policy(self.pool, self.policy, None)
+        mock_resume.assert_called_once_with(self.pool, ioprio_class=None)
+        ps = PoolScrub.objects.get(id=ps.id)
+        self.assertEqual((ps.status, ps.pid), ("running", 5678))
+        # A failed pause leaves the scrub to our monitor.
+        mock_reason.return_value = "window"
+        mock_pause.side_effect = Exception("not running")
+        with self.assertRaises(Exception):
+            scheduler.apply_policy(self.pool, self.policy, None)
+        self.assertEqual(PoolScrub.objects.get(id=ps.id).status, "running")
+
+    @patch("smart_manager.maintenance.scrub_resume")
+    @patch("smart_manager.maintenance.scrub_pause")
+    @patch("smart_manager.maintenance.time")
+    def test_latency_min_pause(self, mock_time, mock_pause, mock_resume):
+        ps = PoolScrub.objects.create(pool=self.pool, pid=1234, status="running")
+        policy = dict(self.policy, window_pause=False, max_latency=40)
+        scheduler = MaintenanceScheduler()
+        mock_resume.return_value = 5678
+        mock_time.time.return_value = 1000
+        scheduler.apply_policy(self.pool, policy, 80.0)
+        self.assertEqual(PoolScrub.objects.get(id=ps.id).status, "paused")
+        mock_time.time.return_value = 1100
+        scheduler.apply_policy(self.pool, policy, 5.0)
+        self.assertFalse(mock_resume.called)
+        mock_time.time.return_value = 1400
+        scheduler.apply_policy(self.pool, policy, 5.0)
+        self.assertEqual(PoolScrub.objects.get(id=ps.id).status, "running")
+
+    @patch("smart_manager.maintenance.mount_root")
+    @patch("smart_manager.maintenance.resume_balance")
+    @patch("smart_manager.maintenance.balance_pause")
+    @patch("smart_manager.maintenance.balance_status")
+    @patch("smart_manager.maintenance.pause_reason")
+    def test_balance_pause_resume(
+        self, mock_reason, mock_status, mock_pause, mock_resume, mock_mount_root
+    ):
+        pb = PoolBalance.objects.create(pool=self.pool, status="running")
+        mock_status.return_value = {"status": "running", "percent_done": 10}
+        mock_mount_root.return_value = "/mnt2/rock-pool"
+        scheduler = MaintenanceScheduler()
+        mock_reason.return_value = "window"
+        scheduler.apply_policy(self.pool, self.policy, None)
+        mock_pause.assert_called_once_with(self.pool)
+        pb = PoolBalance.objects.get(id=pb.id)
+        self.assertEqual((pb.status, pb.message), ("paused", POLICY_PAUSE_MSG))
+        mock_reason.return_value = None
+        scheduler.apply_policy(self.pool, self.policy, None)
+        getattr(mock_resume, "async").assert_called_once_with("/mnt2/rock-pool")
+        self.assertEqual(PoolBalance.objects.get(id=pb.id).status, "running")
+        # Balances paused by others, and internal balances, are left alone.
+        PoolBalance.objects.filter(id=pb.id).update(status="paused", message=None)
+        PoolBalance.objects.create(pool=self.pool, status="running", internal=True)
+        mock_pause.reset_mock()
+        mock_reason.return_value = "window"
+        scheduler.apply_policy(self.pool, self.policy, None)
+        mock_reason.return_value = None
+        scheduler.apply_policy(self.pool, self.policy, None)
+        self.assertFalse(mock_pause.called)
+        self.assertEqual(getattr(mock_resume, "async").call_count, 1)
@@ -0,0 +1,157 @@
+"""
+Copyright (c) 2012-2020 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+from django.utils.timezone import utc
+
+from smart_manager.metrics import (
+    CPU_FIELDS,
+    MEM_FIELDS,
+    disk_deltas,
+    model_tiers,
+    prune,
+    roll_up,
+    roll_up_share_usage,
+    share_usage_history,
+    tier_for_range,
+)
+from smart_manager.models import CPUMetric, MemInfo, PoolUsage, ShareUsage
+from storageadmin.views.share_helpers import ShareUsageBatch
+
+
+class MetricsTests(TestCase):
+    multi_db = True
+
+    def setUp(self):
+        self.end = datetime(2020, 6, 1, 12, 1, tzinfo=utc)
+
+    def test_disk_deltas(self):
+        prev = {"sda": ["10", "0", "80", "5", "4", "0", "32", "2", "2", "7", "7"]}
+        cur = {
+            "sda": ["20", "0", "160", "9", "4", "0", "32", "2", "0", "9", "9"],
+            "sdb": ["1", "0", "8", "1", "0", "0", "0", "0", "0", "1", "1"],
+        }
+        deltas = disk_deltas(cur, prev, 2)
+        self.assertEqual(list(deltas.keys()), ["sda"])
+        self.assertEqual(deltas["sda"]["reads_completed"], 5.0)
+        self.assertEqual(deltas["sda"]["sectors_read"], 40.0)
+        # A gauge, so averaged rather than differenced.
+        self.assertEqual(deltas["sda"]["ios_progress"], 1.0)
+
+    def test_tier_for_range(self):
+        now = self.end
+        self.assertEqual(tier_for_range(now - timedelta(minutes=10), now, now), 1)
+        # Older than the raw tier's retention.
+        t1 = now - timedelta(hours=2)
+        self.assertEqual(tier_for_range(t1, t1 + timedelta(minutes=1), now), 60)
+        self.assertEqual(tier_for_range(now - timedelta(days=7), now, now), 3600)
+        self.assertEqual(tier_for_range(now - timedelta(days=30), now, now), 3600)
+        # Pool usage is only sampled into the 60s tier and up.
+        tiers = model_tiers(PoolUsage)
+        self.assertEqual(tiers[0][0], 60)
+        t1 = now - timedelta(minutes=10)
+        self.assertEqual(tier_for_range(t1, now, now, tiers), 60)
+        self.assertEqual(model_tiers(CPUMetric)[0][0], 1)
+
+    def test_roll_up_and_prune(self):
+        for s in range(60):
+            ts = self.end - timedelta(seconds=s)
+            for name in ("cpu0", "cpu1"):
+                CPUMetric.objects.create(
+                    name=name, umode=s % 2 * 10, umode_nice=0, smode=4, idle=90, ts=ts
+                )
+            MemInfo.objects.create(total=100, free=s, ts=ts)
+        self.assertEqual(roll_up(CPUMetric, "name", CPU_FIELDS, 1, 60, self.end), 2)
+        rolled = CPUMetric.objects.filter(period=60)
+        self.assertEqual(set(rolled.values_list("name", flat=True)), {"cpu0", "cpu1"})
+        self.assertEqual([c.umode for c in rolled], [5, 5])
+        self.assertTrue(all(c.ts == self.end for c in rolled))
+        self.assertEqual(roll_up(MemInfo, None, MEM_FIELDS, 1, 60, self.end), 1)
+        self.assertEqual(MemInfo.objects.get(period=60).free, 29)
+        # No samples, no roll up.
+        later = self.end + timedelta(minutes=5)
+        self.assertEqual(roll_up(MemInfo, None, MEM_FIELDS, 1, 60, later), 0)
+        # Raw samples age out after an hour, roll ups are retained.
+        prune(self.end + timedelta(minutes=30))
+        self.assertEqual(CPUMetric.objects.filter(period=1).count(), 120)
+        prune(self.end + timedelta(hours=2))
+        self.assertEqual(CPUMetric.objects.filter(period=1).count(), 0)
+        self.assertEqual(CPUMetric.objects.filter(period=60).count(), 2)
+
+    def _share_usage(self, name, ts, r_usage=10, count=1):
+        su = ShareUsage.objects.create(
+            name=name, r_usage=r_usage, e_usage=1, count=count
+        )
+        # ts is auto_now on save.
+        ShareUsage.objects.filter(id=su.id).update(ts=ts)
+        return su.id
+
+    def test_share_usage_batch(self):
+        self._share_usage("share1", self.end)
+        with ShareUsageBatch() as usage:
+            usage.add("share1", 10, 1, new_entry=False)
+            usage.add("share2", 20, 2, new_entry=False)
+            usage.add("snap1", 30, 3)
+            # Nothing is written until we exit.
+            self.assertEqual(ShareUsage.objects.count(), 1)
+        self.assertEqual(ShareUsage.objects.count(), 3)
+        share1 = ShareUsage.objects.get(name="share1")
+        self.assertEqual(share1.count, 2)
+        self.assertGreater(share1.ts, self.end)
+        self.assertEqual(ShareUsage.objects.get(name="share2").r_usage, 20)
+
+    def test_roll_up_share_usage(self):
+        now = self.end
+        day = now - timedelta(days=10)
+        self._share_usage("share1", now - timedelta(days=400))
+        ids = [
+            self._share_usage("share1", day + timedelta(hours=h), r_usage=h, count=2)
+            for h in range(3)
+        ]
+        self._share_usage("share2", day)
+        self._share_usage("share2", day + timedelta(hours=1), count=3)
+        self._share_usage("share1", day + timedelta(days=1))
+        # Within the same day, but only just within rollup_days.
+        edge = now - timedelta(days=7)
+        edge_ids = [
+            self._share_usage("share1", edge + timedelta(minutes=m)) for m in (5, 10)
+        ]
+        start = roll_up_share_usage(now)
+        self.assertEqual(start, edge)
+        remaining = ShareUsage.objects.filter(name="share1").order_by("id")
+        # The latest of day's entries is kept with the sum of their counts.
+        self.assertEqual(len(remaining), 4)
+        self.assertEqual(remaining[0].id, ids[-1])
+        self.assertEqual(remaining[0].count, 6)
+        self.assertEqual([su.id for su in remaining[2:]], edge_ids)
+        self.assertEqual(ShareUsage.objects.get(name="share2").count, 4)
+        # Incremental from our prior call, once the edge entries have aged.
+        roll_up_share_usage(now + timedelta(hours=1), start)
+        remaining = ShareUsage.objects.filter(name="share1").order_by("id")
+        self.assertEqual([su.id for su in remaining[2:]], edge_ids[1:])
+        self.assertEqual(remaining[2].count, 2)
+
+    def test_share_usage_history(self):
+        for m in range(0, 120, 10):
+            self._share_usage("share1", self.end + timedelta(minutes=m), r_usage=m)
+        history = share_usage_history(
+            "share1", self.end, self.end + timedelta(hours=2), 3600
+        )
+        # The first entry is outside our (t1, t2] range.
+        self.assertEqual([h["r_usage"] for h in history], [50, 110])
@@ -0,0 +1,465 @@
+"""
+Copyright (c) 2012-2021 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import collections
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import zmq
+from django.conf import settings
+from django.test import TestCase
+from mock import MagicMock, call, patch
+
+from smart_manager.models import ReceiveTrail, Replica, ReplicaShare
+from smart_manager.replication.listener_broker import ReplicaScheduler
+from smart_manager.replication.receiver import Receiver
+from smart_manager.replication.sender import Sender
+from smart_manager.replication.util import TokenBucket
+from smart_manager.views.replication import ReplicaMixin
+
+
+class ReplicationTests(TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor-dev>
+    ./bin/test --settings=test-settings -v 3 -p test_replication*
+    """
+
+    multi_db = True
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        patch.dict(
+            settings.REPLICATION,
+            {"resume_spool_fraction": 0.1, "resume_spool_max": None},
+        ).start()
+        self.rso = ReplicaShare.objects.create(
+            share="uuid1_share1", pool="pool1", appliance="10.0.0.1"
+        )
+        self.replica = Replica(
+            id=1, share="share1", pool="pool1", appliance="10.0.0.2", dpool="pool2"
+        )
+
+    def tearDown(self):
+        patch.stopall()
+        shutil.rmtree(self.tmp_dir)
+
+    def receiver(self, resume=True, compression="none"):
+        meta = {
+            "pool": "pool2",
+            "share": "share1",
+            "snap": "share1_1_replication_2",
+            "incremental": True,
+            "uuid": "uuid1",
+            "compression": compression,
+            "resume": resume,
+        }
+        # Our TestCase transaction is not for closing.
+        with patch("smart_manager.replication.receiver.db"):
+            receiver = Receiver("uuid1-1", json.dumps(meta))
+        self.addCleanup(receiver.ctx.destroy, linger=0)
+        receiver.spool_path = os.path.join(self.tmp_dir, "stream")
+        receiver.spool_max = 1000
+        receiver.rid = self.rso.id
+        return receiver
+
+    def sender(self):
+        with patch("smart_manager.replication.sender.db"):
+            sender = Sender("uuid1", "10.0.0.2", self.replica)
+        self.addCleanup(sender.ctx.destroy, linger=0)
+        return sender
+
+    def trail(self, status, resume_offset=0):
+        return ReceiveTrail.objects.create(
+            rshare=self.rso,
+            snap_name="share1_1_replication_2",
+            status=status,
+            resume_offset=resume_offset,
+        ).id
+
+    def test_resume_offset(self):
+        """
+        A transfer resumes from the last failed trail's checkpoint only while
+        our spool covers it, and it is within our spool cap.
+        """
+        receiver = self.receiver()
+        # No spool.
+        self.trail("failed", 600)
+        self.assertEqual(receiver._resume_offset(), 0)
+        with open(receiver.spool_path, "wb") as sfo:
+            sfo.write(b"x" * 800)
+        self.assertEqual(receiver._resume_offset(), 600)
+        # Our own, current, trail is not a prior attempt.
+        receiver.rtid = self.trail("failed", 700)
+        self.assertEqual(receiver._resume_offset(), 600)
+        # Spool shorter than the checkpoint.
+        self.trail("failed", 900)
+        self.assertEqual(receiver._resume_offset(), 0)
+        # Checkpoint beyond the spool cap.
+        self.trail("failed", 600)
+        receiver.spool_max = 500
+        self.assertEqual(receiver._resume_offset(), 0)
+        # Replica without resume enabled, or a Sender without resume support.
+        self.assertEqual(self.receiver(resume=False)._resume_offset(), 0)
+
+    def test_resume_offset_no_failed_trail(self):
+        receiver = self.receiver()
+        with open(receiver.spool_path, "wb") as sfo:
+            sfo.write(b"x" * 800)
+        self.trail("succeeded", 600)
+        self.trail("pending", 600)
+        self.assertEqual(receiver._resume_offset(), 0)
+
+    def test_spool_cap(self):
+        """
+        A stream exceeding our spool cap is no longer spooled, and so
+        checkpoints, and resumes, at 0.
+        """
+        receiver = self.receiver()
+        receiver.spool = open(receiver.spool_path, "wb")
+        for num in range(3):
+            receiver._spool_write(b"x" * 400)
+            receiver.total_bytes_received += 400
+            if num == 0:
+                self.assertEqual(receiver._checkpoint_spool(), 400)
+                self.assertEqual(os.path.getsize(receiver.spool_path), 400)
+        self.assertIsNone(receiver.spool)
+        self.assertFalse(os.path.exists(receiver.spool_path))
+        self.assertEqual(receiver._checkpoint_spool(), 0)
+        self.assertEqual(receiver._resume_offset(), 0)
+
+    @patch("smart_manager.replication.receiver.Pool")
+    def test_spool_cap_free_space(self, mock_pool):
+        """
+        The spool is capped at resume_spool_fraction of our destination
+        pool's free space, which includes that of an existing spool, and at
+        resume_spool_max where that is set.
+        """
+        mock_pool.objects.get.return_value.free = 50  # KB
+        receiver = self.receiver()
+        self.assertEqual(receiver._spool_cap(), 5120)
+        mock_pool.objects.get.assert_called_with(name="pool2")
+        with open(receiver.spool_path, "wb") as sfo:
+            sfo.write(b"x" * 800)
+        self.assertEqual(receiver._spool_cap(), 5200)
+        settings.REPLICATION["resume_spool_max"] = 1000
+        self.assertEqual(receiver._spool_cap(), 1000)
+        settings.REPLICATION["resume_spool_fraction"] = 0
+        self.assertEqual(receiver._spool_cap(), 0)
+
+    def test_replay_spool(self):
+        """
+        The spool is replayed up to the resume offset, and truncated there
+        for the remainder of the stream to be appended.
+        """
+        receiver = self.receiver()
+        with open(receiver.spool_path, "wb") as sfo:
+            sfo.write(b"a" * 600 + b"b" * 200)
+        receiver.rp = MagicMock()
+        receiver.rp.stdin = io.BytesIO()
+        receiver._replay_spool(600)
+        self.assertEqual(receiver.rp.stdin.getvalue(), b"a" * 600)
+        self.assertEqual(receiver.total_bytes_received, 600)
+        receiver._spool_write(b"c" * 10)
+        receiver.spool.close()
+        with open(receiver.spool_path, "rb") as sfo:
+            self.assertEqual(sfo.read(), b"a" * 600 + b"c" * 10)
+
+    def test_skip_stream(self):
+        """
+        The Sender discards the stream prefix the Receiver already holds.
+        """
+        sender = self.sender()
+        sender.chunk_size = 16
+        sender.sp = MagicMock()
+        sender.sp.stdout = io.BytesIO(b"a" * 40 + b"b" * 60)
+        sender._skip_stream(40)
+        self.assertEqual(sender.total_bytes_sent, 40)
+        self.assertEqual(sender.total_bytes_acked, 40)
+        self.assertEqual(sender.sp.stdout.read(16), b"b" * 16)
+        # A stream ending short of the resume offset aborts.
+        sender.sp.stdout = io.BytesIO(b"a" * 30)
+        with patch.object(sender, "_send_recv") as mock_send_recv:
+            self.assertRaises(Exception, sender._skip_stream, 40)
+        mock_send_recv.assert_called_once_with(
+            "btrfs-send-unexpected-termination-error"
+        )
+
+    def test_send_stderr(self):
+        """
+        btrfs send stderr, beyond a pipe buffer of it, does not block the
+        Sender's reads of its stdout, and is reported once it exits.
+        """
+        sender = self.sender()
+        sender.chunk_size = 16
+        sender._start_send(
+            ["sh", "-c", "head -c 1048576 /dev/zero >&2; printf %s data"]
+        )
+        data = b""
+        while True:
+            fs_data = sender.sp.stdout.read(sender.chunk_size)
+            if len(fs_data) == 0:
+                break
+            data += fs_data
+        self.assertEqual(data, b"data")
+        self.assertEqual(len(sender._wait_send()), 1048576)
+        self.assertEqual(sender.sp.returncode, 0)
+
+    def window_sender(self, acks):
+        """
+        :param acks: send-more acknowledgement messages the Receiver replies
+        with, in order, after which the Receiver goes quiet.
+        """
+        sender = self.sender()
+        sender.send_window = 2
+        sender.send_req = MagicMock()
+        sender.poll = MagicMock()
+        replies = [("send-more", ack) for ack in acks]
+        sender.poll.poll.side_effect = lambda timeout: (
+            {sender.send_req: zmq.POLLIN} if len(replies) > 0 else {}
+        )
+        sender.send_req.recv_multipart.side_effect = lambda: replies.pop(0)
+        return sender
+
+    def test_send_window(self):
+        """
+        Chunks are sent while the window has credit, each consuming one. At
+        zero credit the Sender stalls on acknowledgements, cumulative byte
+        offsets, each releasing all the chunks they cover.
+        """
+        sender = self.window_sender(["10", "40"])
+        in_flight = collections.deque()
+        for data in (b"a" * 10, b"b" * 20):
+            sender._send_chunk(data, in_flight)
+        self.assertEqual(sender.poll.poll.call_count, 0)
+        self.assertEqual(list(in_flight), [10, 20])
+        # Zero credit: the first ack releases one chunk.
+        sender._send_chunk(b"c" * 10, in_flight)
+        self.assertEqual(sender.poll.poll.call_count, 1)
+        self.assertEqual(sender.total_bytes_acked, 10)
+        self.assertEqual(list(in_flight), [20, 10])
+        # The next, cumulative, ack covers both chunks in flight.
+        sender._send_chunk(b"d" * 10, in_flight)
+        self.assertEqual(sender.total_bytes_acked, 40)
+        self.assertEqual(list(in_flight), [10])
+        self.assertEqual(
+            sender.send_req.send_multipart.call_args_list,
+            [
+                call(["", data], copy=False)
+                for data in (b"a" * 10, b"b" * 20, b"c" * 10, b"d" * 10)
+            ],
+        )
+        self.assertEqual(sender.total_bytes_sent, 50)
+
+    def test_send_window_stalled(self):
+        """
+        A Sender at zero credit does not send, and aborts if no ack arrives.
+        """
+        sender = self.window_sender([])
+        in_flight = collections.deque([10, 10])
+        self.assertRaises(Exception, sender._send_chunk, b"a" * 10, in_flight)
+        self.assertFalse(sender.send_req.send_multipart.called)
+        self.assertEqual(list(in_flight), [10, 10])
+
+    def test_send_window_legacy_ack(self):
+        """
+        An empty send-more, from a pre windowing Receiver, releases a single
+        chunk.
+        """
+        sender = self.window_sender([""])
+        in_flight = collections.deque([10, 20])
+        sender._send_chunk(b"a" * 5, in_flight)
+        self.assertEqual(list(in_flight), [20, 5])
+        self.assertEqual(sender.total_bytes_acked, 10)
+
+    def test_receiver_credit(self):
+        """
+        The Receiver grants credit for each chunk written to btrfs-recv with
+        the cumulative bytes written.
+        """
+        receiver = self.receiver()
+        receiver.rp = MagicMock()
+        receiver.rp.stdin = io.BytesIO()
+        receiver.dealer = MagicMock()
+        receiver._write_fsdata(b"a" * 10)
+        receiver._write_fsdata(b"b" * 20)
+        self.assertEqual(receiver.rp.stdin.getvalue(), b"a" * 10 + b"b" * 20)
+        self.assertEqual(
+            receiver.dealer.send_multipart.call_args_list,
+            [call([b"send-more", b"10"]), call([b"send-more", b"30"])],
+        )
+
+    def test_parse_receiver_ready(self):
+        """
+        A json receiver-ready reply carries the agreed compression and resume
+        offset, a legacy reply just the Receiver's latest snapshot.
+        """
+        sender = self.sender()
+        reply = json.dumps(
+            {"snap": "share1_1_replication_1", "compression": "zlib", "offset": 40}
+        )
+        self.assertEqual(sender._parse_receiver_ready(reply), "share1_1_replication_1")
+        self.assertEqual(sender.compression, "zlib")
+        self.assertIsNotNone(sender.compressor)
+        self.assertEqual(sender.resume_offset, 40)
+        for reply in ("share1_1_replication_1", ""):
+            sender = self.sender()
+            self.assertEqual(sender._parse_receiver_ready(reply), reply)
+            self.assertEqual(sender.compression, "none")
+            self.assertIsNone(sender.compressor)
+            self.assertEqual(sender.resume_offset, 0)
+
+    def test_compressed_round_trip(self):
+        """
+        Each zlib compressed chunk is sync flushed, so decompresses in full on
+        arrival, and the stream is finished by a final chunk of no stream
+        bytes. The window, and acks, count stream bytes not wire bytes.
+        """
+        sender = self.window_sender([])
+        sender.send_window = 16
+        sender._parse_receiver_ready(json.dumps({"snap": "", "compression": "zlib"}))
+        receiver = self.receiver(compression="zlib")
+        receiver.rp = MagicMock()
+        receiver.rp.stdin = io.BytesIO()
+        receiver.dealer = MagicMock()
+        chunks = [b"a" * 1000, os.urandom(100), b"b" * 2000 + os.urandom(10)]
+        in_flight = collections.deque()
+        stream = b""
+        for data in chunks:
+            sender._send_chunk(data, in_flight)
+            wire = sender.send_req.send_multipart.call_args[0][0][1]
+            receiver._write_fsdata(wire)
+            stream += data
+            self.assertEqual(receiver.rp.stdin.getvalue(), stream)
+        self.assertEqual(sender.total_bytes_sent, len(stream))
+        self.assertLess(sender.total_bytes_wire, sender.total_bytes_sent)
+        sender._send_chunk(b"", in_flight, final=True)
+        wire = sender.send_req.send_multipart.call_args[0][0][1]
+        self.assertGreater(len(wire), 0)
+        receiver._write_fsdata(wire)
+        receiver._flush_fsdata()
+        self.assertEqual(receiver.rp.stdin.getvalue(), stream)
+        self.assertEqual(receiver.decompressor.unused_data, b"")
+        self.assertEqual(list(in_flight), [len(data) for data in chunks] + [0])
+        self.assertEqual(receiver.total_bytes_received, len(stream))
+        self.assertEqual(
+            receiver.dealer.send_multipart.call_args,
+            call([b"send-more", b"%d" % len(stream)]),
+        )
+
+    def test_unknown_compression(self):
+        """
+        An unknown, or invalid, compression replicates uncompressed.
+        """
+        self.assertEqual(ReplicaMixin._validate_compression("zlib"), "zlib")
+        for compression in ("none", "lz4", "", None, 1):
+            self.assertEqual(ReplicaMixin._validate_compression(compression), "none")
+        self.assertIsNone(self.receiver(compression="lz4").decompressor)
+
+    def scheduler(self, **caps):
+        """
+        :return: ReplicaScheduler whose Senders, once started, stay live.
+        """
+        patch.dict(settings.REPLICATION, caps).start()
+        scheduler = ReplicaScheduler()
+        scheduler.uuid = "uuid1"
+
+        def process_send(replica):
+            sender = MagicMock(exitcode=None, replica=replica)
+            scheduler.senders["uuid1_%d" % replica.id] = sender
+
+        patch.object(scheduler, "_process_send", side_effect=process_send).start()
+        return scheduler
+
+    def replicas(self, appliances):
+        return [
+            Replica.objects.create(
+                task_name="task%d" % num,
+                share="share%d" % num,
+                pool="pool1",
+                appliance=appliance,
+                dpool="pool2",
+                enabled=True,
+            )
+            for num, appliance in enumerate(appliances)
+        ]
+
+    def test_send_queue_bound(self):
+        """
+        new-sends beyond max_queued, or for a replica already queued, are
+        refused rather than growing the queue.
+        """
+        scheduler = self.scheduler(max_senders=0, max_queued=3)
+        replicas = self.replicas(["10.0.0.2"] * 4)
+        for replica in replicas[:3]:
+            scheduler._queue_send(replica)
+        self.assertEqual(scheduler._dispatch_sends(), {})
+        self.assertEqual(len(scheduler.send_queue), 3)
+        with self.assertRaisesRegexp(Exception, "queue is full"):
+            scheduler._queue_send(replicas[3])
+        with self.assertRaisesRegexp(Exception, "already queued at position 1"):
+            scheduler._queue_send(replicas[0])
+        self.assertEqual(list(scheduler.send_queue), [r.id for r in replicas[:3]])
+        # Room is made as queued Senders start.
+        scheduler.max_senders = 1
+        scheduler._dispatch_sends()
+        self.assertEqual(len(scheduler.send_queue), 2)
+        scheduler._queue_send(replicas[3])
+        status = scheduler._queue_status()
+        self.assertEqual(status["max_queued"], 3)
+        self.assertEqual([q["position"] for q in status["queued"]], [1, 2, 3])
+        self.assertEqual(len(status["active"]), 1)
+
+    def test_dispatch_sends(self):
+        """
+        Queued Senders start in arrival order within the global and per
+        appliance caps, a replica at its appliance's cap not holding up
+        those behind it.
+        """
+        scheduler = self.scheduler(max_senders=3, max_senders_per_appliance=1)
+        replicas = self.replicas(["10.0.0.2", "10.0.0.2", "10.0.0.3", "10.0.0.4"])
+        for replica in replicas:
+            scheduler._queue_send(replica)
+        scheduler._dispatch_sends()
+        started = [c[0][0].id for c in scheduler._process_send.call_args_list]
+        self.assertEqual(started, [replicas[0].id, replicas[2].id, replicas[3].id])
+        self.assertEqual(list(scheduler.send_queue), [replicas[1].id])
+        # Still waiting while its appliance's Sender is live.
+        scheduler._dispatch_sends()
+        self.assertEqual(list(scheduler.send_queue), [replicas[1].id])
+        scheduler.senders["uuid1_%d" % replicas[0].id].exitcode = 0
+        scheduler._dispatch_sends()
+        self.assertEqual(len(scheduler.send_queue), 0)
+
+    @patch("smart_manager.replication.util.time")
+    def test_token_bucket(self, mock_time):
+        """
+        Consumers overdrawing the bucket sleep off the debt at its rate.
+        """
+        mock_time.time.return_value = 1000.0
+        bucket = TokenBucket(100, 200)
+        bucket.consume(150)
+        self.assertFalse(mock_time.sleep.called)
+        bucket.consume(150)
+        mock_time.sleep.assert_called_once_with(1.0)
+        # Refilled at rate, to no more than burst.
+        mock_time.time.return_value = 1100.0
+        bucket.consume(200)
+        self.assertEqual(mock_time.sleep.call_count, 1)
@@ -0,0 +1,107 @@
+"""
+Copyright (c) 2012-2020 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+from datetime import timedelta
+
+from django.test import TestCase
+from mock import patch
+
+from smart_manager.scrub_monitor import (
+    SCRUB_SAMPLES_KEPT,
+    ScrubMonitor,
+    record_scrub_status,
+    scrub_is_stale,
+    utcnow,
+)
+from storageadmin.models import Pool, PoolScrub, PoolScrubSample
+
+
+class ScrubMonitorTests(TestCase):
+    multi_db = True
+
+    def setUp(self):
+        self.pool = Pool(name="rock-pool", raid="raid1")
+        self.pool.save()
+        self.ps = PoolScrub(pool=self.pool, pid=1234)
+        self.ps.save()
+        self.now = utcnow()
+
+    @staticmethod
+    def status(status, kb_scrubbed, **kwargs):
+        # As per fs.btrfs.scrub_status()
+        stats = {"status": status, "kb_scrubbed": kb_scrubbed, "csum_errors": 0}
+        stats.update(kwargs)
+        return stats
+
+    def test_record_scrub_status(self):
+        record_scrub_status(self.ps, self.status("running", 1024), self.now)
+        ts = self.now + timedelta(seconds=30)
+        status = self.status("running", 1024 + 30 * 2048, csum_errors=2)
+        self.assertEqual(record_scrub_status(self.ps, status, ts), "running")
+        samples = PoolScrubSample.objects.filter(scrub=self.ps).order_by("ts")
+        self.assertEqual([s.kb_rate for s in samples], [0, 2048])
+        self.assertEqual(samples[1].errors, 2)
+        ps = PoolScrub.objects.get(id=self.ps.id)
+        self.assertEqual(
+            (ps.status, ps.kb_scrubbed, ps.csum_errors), ("running", 62464, 2)
+        )
+        status = self.status("finished", 100000, duration=60)
+        self.assertEqual(record_scrub_status(self.ps, status, ts), "finished")
+        ps = PoolScrub.objects.get(id=self.ps.id)
+        self.assertEqual(ps.end_time, self.ps.start_time + timedelta(seconds=60))
+        # No sample, nor update of bytes scrubbed, without stats.
+        record_scrub_status(self.ps, {"status": "conn-reset"}, ts)
+        self.assertEqual(PoolScrubSample.objects.count(), 3)
+        self.assertEqual(PoolScrub.objects.get(id=self.ps.id).kb_scrubbed, 100000)
+
+    def test_prune_samples(self):
+        scrubs = [self.ps]
+        for i in range(SCRUB_SAMPLES_KEPT):
+            scrubs.append(PoolScrub.objects.create(pool=self.pool, pid=i))
+        for ps in scrubs:
+            record_scrub_status(ps, self.status("running", 1024), self.now)
+        self.assertEqual(PoolScrubSample.objects.count(), SCRUB_SAMPLES_KEPT + 1)
+        # Finishing a scrub drops the samples of all but the latest few.
+        record_scrub_status(scrubs[-1], self.status("finished", 2048, duration=1))
+        self.assertEqual(PoolScrubSample.objects.count(), SCRUB_SAMPLES_KEPT + 1)
+        self.assertFalse(PoolScrubSample.objects.filter(scrub=self.ps).exists())
+
+    def test_scrub_is_stale(self):
+        start = self.ps.start_time
+        self.assertFalse(scrub_is_stale(self.ps, start + timedelta(seconds=10)))
+        self.assertTrue(scrub_is_stale(self.ps, start + timedelta(seconds=600)))
+        ts = start + timedelta(seconds=590)
+        record_scrub_status(self.ps, self.status("running", 1024), ts)
+        self.assertFalse(scrub_is_stale(self.ps, start + timedelta(seconds=600)))
+
+    @patch("smart_manager.scrub_monitor.scrub_status")
+    def test_poll(self, mock_scrub_status):
+        # An earlier, unfinished record of this pool's scrubs is ignored.
+        latest = PoolScrub.objects.create(pool=self.pool, pid=5678)
+        mock_scrub_status.return_value = self.status("running", 4096)
+        ScrubMonitor().poll()
+        self.assertEqual(mock_scrub_status.call_count, 1)
+        self.assertEqual(PoolScrub.objects.get(id=latest.id).status, "running")
+        self.assertEqual(PoolScrub.objects.get(id=self.ps.id).status, "started")
+        mock_scrub_status.return_value = self.status("finished", 8192, duration=9)
+        ScrubMonitor().poll()
+        self.assertEqual(PoolScrub.objects.get(id=latest.id).status, "finished")
+        # An exception for one pool is logged and does not stop our poll.
+        mock_scrub_status.reset_mock()
+        mock_scrub_status.side_effect = Exception("mount_root failed")
+        ScrubMonitor().poll()
+        self.assertEqual(mock_scrub_status.call_count, 1)
@@ -28,6 +28,7 @@ from smart_manager.views import (
     NISServiceView,
     NTPServiceView,
     NUTServiceView,
+    ReplicationQueueView,
     ReplicationServiceView,
     RockstorServiceView,
     SFTPServiceView,
@@ -64,6 +65,7 @@ urlpatterns = patterns(
     url(r"^sftp$", SFTPServiceView.as_view()),
     url(r"^sftp/(?P<command>%s)$" % command_regex, SFTPServiceView.as_view()),
     url(r"^replication$", ReplicationServiceView.as_view()),
+    url(r"^replication/queue$", ReplicationQueueView.as_view()),
     url(
         r"^replication/(?P<command>%s)$" % command_regex,
         ReplicationServiceView.as_view(),
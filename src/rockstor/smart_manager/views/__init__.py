@@ -33,7 +33,7 @@ from samba_service import SambaServiceView  # noqa E501
 from nfs_service import NFSServiceView  # noqa E501
 from replication import ReplicaListView, ReplicaDetailView  # noqa E501
 from replica_trail import ReplicaTrailListView, ReplicaTrailDetailView  # noqa E501
-from replication_service import ReplicationServiceView  # noqa E501
+from replication_service import ReplicationServiceView, ReplicationQueueView  # noqa
 from ntp_service import NTPServiceView  # noqa E501
 from ldap_service import LdapServiceView  # noqa E501
 from sftp_service import SFTPServiceView  # noqa E501
@@ -22,7 +22,7 @@ from smart_manager.serializers import ServiceStatusSerializer
 import json
 import rest_framework_custom as rfc
 from rest_framework.response import Response
-from system.services import service_status
+from system.services import service_statuses
 from django.db import transaction
 from django.utils.timezone import utc
 from datetime import datetime
@@ -42,37 +42,56 @@ class ServiceMixin(object):
     def _get_config(self, service):
         return json.loads(service.config)
 
-    def _get_or_create_sso(self, service):
-        ts = datetime.utcnow().replace(tzinfo=utc)
-        so = None
-        if ServiceStatus.objects.filter(service=service).exists():
-            so = ServiceStatus.objects.filter(service=service).order_by("-ts")[0]
-        else:
+    def _get_or_create_sso(self, service, statuses=None):
+        """
+        Latest ServiceStatus of the given service. Its row is only written on
+        a change of status, or if the service has none as yet.
+        :param service: Service object.
+        :param statuses: as returned by _get_statuses(), None to query.
+        :return: ServiceStatus object.
+        """
+        if statuses is None:
+            statuses = self._get_statuses([service])
+        status = statuses[service.name]
+        so = ServiceStatus.objects.filter(service=service).order_by("-ts").first()
+        if so is not None and (status is None or so.status == status):
+            return so
+        if so is None:
             so = ServiceStatus(service=service, count=0)
-        so.status = self._get_status(service)
+        so.status = status is True
         so.count += 1
-        so.ts = ts
+        so.ts = datetime.utcnow().replace(tzinfo=utc)
         so.save()
         return so
 
+    def _get_statuses(self, services):
+        """
+        Concurrent and briefly cached status query of multiple services.
+        :param services: iterable of Service objects.
+        :return: dict indexed by service name of True if running, False if
+        not, or None if the status could not be established in time.
+        """
+        probes = []
+        statuses = {}
+        for service in services:
+            try:
+                config = None
+                if service.config is not None:
+                    config = self._get_config(service)
+                probes.append((service.name, config))
+            except Exception as e:
+                msg = "Exception while loading config of service(%s): %s" % (
+                    service.name,
+                    e.__str__(),
+                )
+                logger.error(msg)
+                statuses[service.name] = False
+        for name, status in service_statuses(probes).items():
+            statuses[name] = None if status is None else status[2] == 0
+        return statuses
+
     def _get_status(self, service):
-        try:
-            config = None
-            if service.config is not None:
-                config = self._get_config(service)
-
-            o, e, rc = service_status(service.name, config)
-            if rc == 0:
-                return True
-            return False
-        except Exception as e:
-            msg = "Exception while querying status of service(%s): %s" % (
-                service.name,
-                e.__str__(),
-            )
-            logger.error(msg)
-            logger.exception(e)
-            return False
+        return self._get_statuses([service])[service.name]
 
 
 class BaseServiceView(ServiceMixin, rfc.GenericView):
@@ -87,9 +106,9 @@ class BaseServiceView(ServiceMixin, rfc.GenericView):
             limit = int(limit)
             url_fields = self.request.path.strip("/").split("/")
             if len(url_fields) < 4:
-                sos = []
-                for s in Service.objects.all():
-                    sos.append(self._get_or_create_sso(s))
+                services = list(Service.objects.all())
+                statuses = self._get_statuses(services)
+                sos = [self._get_or_create_sso(s, statuses) for s in services]
                 return sorted(
                     sos, cmp=lambda x, y: cmp(x.display_name, y.display_name)
                 )  # noqa
@@ -18,12 +18,27 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 from django.conf import settings
 from django.db.models import Count
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware, utc
 import rest_framework_custom as rfc
+from smart_manager.metrics import model_tiers, tier_for_range
 
 
 class GenericSProbeView(rfc.GenericView):
     content_negotiation_class = rfc.IgnoreClient
 
+    def _tier(self, period=None):
+        """
+        Restrict a time series model with roll-up tiers to the given period,
+        defaulting to the finest holding its samples, see model_tiers().
+        """
+        objects = self.model_obj.objects
+        if "period" not in [f.name for f in self.model_obj._meta.fields]:
+            return objects.all()
+        if period is None:
+            period = model_tiers(self.model_obj)[0][0]
+        return objects.filter(period=period)
+
     def get_queryset(self):
         limit = self.request.query_params.get(
             "limit", settings.REST_FRAMEWORK["MAX_LIMIT"]
@@ -34,19 +49,30 @@ class GenericSProbeView(rfc.GenericView):
         group_field = self.request.query_params.get("group", None)
         if group_field is not None:
             qs = []
-            distinct_fields = self.model_obj.objects.values(group_field).annotate(
-                c=Count(group_field)
+            distinct_fields = (
+                self._tier().values(group_field).annotate(c=Count(group_field))
             )
             filter_field = "%s__exact" % group_field
             for d in distinct_fields:
                 qs.extend(
-                    self.model_obj.objects.filter(
-                        **{filter_field: d[group_field]}
-                    ).order_by("-ts")[0:limit]
+                    self._tier()
+                    .filter(**{filter_field: d[group_field]})
+                    .order_by("-ts")[0:limit]
                 )
             return qs
         if t1 is not None and t2 is not None:
-            return self.model_obj.objects.filter(ts__gt=t1, ts__lte=t2)
+            period = None
+            t1_dt, t2_dt = parse_datetime(t1), parse_datetime(t2)
+            if t1_dt is not None and t2_dt is not None:
+                if is_naive(t1_dt):
+                    t1_dt = make_aware(t1_dt, utc)
+                if is_naive(t2_dt):
+                    t2_dt = make_aware(t2_dt, utc)
+                # Longer and older ranges are served from coarser roll-ups.
+                period = tier_for_range(
+                    t1_dt, t2_dt, tiers=model_tiers(self.model_obj)
+                )
+            return self._tier(period).filter(ts__gt=t1, ts__lte=t2)
 
         sort_col = self.request.query_params.get("sortby", None)
         if sort_col is not None:
@@ -56,4 +82,4 @@ class GenericSProbeView(rfc.GenericView):
             else:
                 reverse = False
             return self._sorted_results(sort_col, reverse)
-        return self.model_obj.objects.all().order_by("-ts")[0:limit]
+        return self._tier().order_by("-ts")[0:limit]
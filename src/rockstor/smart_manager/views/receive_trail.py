@@ -86,6 +86,7 @@ class ReceiveTrailDetailView(rfc.GenericView):
             rt.status = request.data.get("status", rt.status)
             rt.error = request.data.get("error", rt.error)
             rt.kb_received = request.data.get("kb_received", rt.kb_received)
+            rt.resume_offset = request.data.get("resume_offset", rt.resume_offset)
             if rt.status in ("succeeded", "failed",):
                 rt.end_ts = ts
                 rt.receive_succeeded = ts
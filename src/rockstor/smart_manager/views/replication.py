@@ -69,6 +69,18 @@ class ReplicaMixin(object):
             handle_exception(Exception(e_msg), request)
         return port
 
+    @staticmethod
+    def _validate_compression(compression):
+        # As with the Receiver, an unknown compression replicates uncompressed.
+        valid_choices = [c[0] for c in Replica.COMPRESSION_CHOICES]
+        if compression not in valid_choices:
+            logger.error(
+                "Unsupported compression(%s). Valid choices are: %s. "
+                "Using %s." % (compression, ", ".join(valid_choices), Replica.NONE)
+            )
+            return Replica.NONE
+        return compression
+
 
 class ReplicaListView(ReplicaMixin, rfc.GenericView):
     def get_queryset(self, *args, **kwargs):
@@ -103,6 +115,13 @@ class ReplicaListView(ReplicaMixin, rfc.GenericView):
             replication_ip = request.data.get("listener_ip", None)
             if replication_ip is not None and len(replication_ip.strip()) == 0:
                 replication_ip = None
+            compression = self._validate_compression(
+                request.data.get("compression", Replica.NONE)
+            )
+            resume = request.data.get("resume", False)
+            if type(resume) != bool:
+                e_msg = "resume switch must be a boolean, not %s" % type(resume)
+                handle_exception(Exception(e_msg), request)
             ts = datetime.utcnow().replace(tzinfo=utc)
             r = Replica(
                 task_name=task_name,
@@ -115,6 +134,8 @@ class ReplicaListView(ReplicaMixin, rfc.GenericView):
                 data_port=data_port,
                 ts=ts,
                 replication_ip=replication_ip,
+                compression=compression,
+                resume=resume,
             )
             r.save()
             self._refresh_crontab()
@@ -169,6 +190,14 @@ class ReplicaDetailView(ReplicaMixin, rfc.GenericView):
             r.data_port = self._validate_port(
                 request.data.get("listener_port", r.data_port), request
             )
+            r.compression = self._validate_compression(
+                request.data.get("compression", r.compression)
+            )
+            resume = request.data.get("resume", r.resume)
+            if type(resume) != bool:
+                e_msg = "resume switch must be a boolean, not %s" % type(resume)
+                handle_exception(Exception(e_msg), request)
+            r.resume = resume
             ts = datetime.utcnow().replace(tzinfo=utc)
             r.ts = ts
             r.save()
@@ -19,10 +19,14 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 from rest_framework.response import Response
 from storageadmin.util import handle_exception
 from system.services import superctl
+from django.conf import settings
 from django.db import transaction
 from base_service import BaseServiceDetailView
 from smart_manager.models import Service
 from storageadmin.models import NetworkConnection
+import rest_framework_custom as rfc
+import json
+import zmq
 
 import logging
 
@@ -87,3 +91,30 @@ class ReplicationServiceView(BaseServiceDetailView):
                 e.__str__(),
             )
             handle_exception(Exception(e_msg), request)
+
+
+class ReplicationQueueView(rfc.GenericView):
+    def get(self, request, *args, **kwargs):
+        """
+        Active Senders and queued replicas, with their queue position, as
+        reported by the ReplicaScheduler over its ipc socket.
+        """
+        with self._handle_exception(request):
+            ctx = zmq.Context()
+            try:
+                req = ctx.socket(zmq.DEALER)
+                req.connect("ipc://%s" % settings.REPLICATION.get("ipc_socket"))
+                req.send_multipart(["queue-status", b""])
+                poll = zmq.Poller()
+                poll.register(req, zmq.POLLIN)
+                socks = dict(poll.poll(5000))
+                if socks.get(req) != zmq.POLLIN:
+                    e_msg = (
+                        "No response from Replication service. Check that it "
+                        "is running properly and try again."
+                    )
+                    handle_exception(Exception(e_msg), request)
+                rcommand, reply = req.recv_multipart()
+            finally:
+                ctx.destroy(linger=0)
+            return Response(json.loads(reply))
@@ -33,7 +33,15 @@ logger = logging.getLogger(__name__)
 
 
 class TaskSchedulerMixin(object):
-    valid_tasks = ("snapshot", "scrub", "reboot", "shutdown", "suspend", "custom")
+    valid_tasks = (
+        "snapshot",
+        "scrub",
+        "reboot",
+        "shutdown",
+        "suspend",
+        "smart",
+        "custom",
+    )
 
     @staticmethod
     def _validate_input(request):
@@ -63,6 +71,15 @@ class TaskSchedulerMixin(object):
                 raise Exception(
                     "Non-existent Share id (%s) in meta. %s" % (meta["pool"], meta)
                 )
+        if "max_latency" in meta:
+            try:
+                meta["max_latency"] = int(meta["max_latency"] or 0)
+            except ValueError:
+                raise Exception(
+                    "Non-integer max_latency ({}) in meta {}".format(
+                        meta["max_latency"], meta
+                    )
+                )
         if "rtc_hour" in meta:
             meta["rtc_hour"] = int(meta["rtc_hour"])
             meta["rtc_minute"] = int(meta["rtc_minute"])
@@ -118,6 +135,12 @@ class TaskSchedulerMixin(object):
                             settings.ROOT_DIR,
                             td.id,
                         )
+                    elif td.task_type == "smart":
+                        tab = "%s %s/bin/st-smart-sample %d" % (
+                            tab,
+                            settings.ROOT_DIR,
+                            td.id,
+                        )
                     else:
                         logger.error("ignoring unknown task_type: %s" % td.task_type)
                         continue
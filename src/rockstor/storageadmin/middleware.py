@@ -16,8 +16,7 @@ You should have received a copy of the GNU General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
-from system.osi import run_command
-from django.conf import settings
+from system.diagbundle import request_bundle
 
 import logging
 
@@ -32,13 +31,5 @@ class ProdExceptionMiddleware(object):
         ).format(request.path, request.method)
         logger.error(e_msg)
         logger.exception(exception)
-        run_command(
-            [
-                "/usr/bin/tar",
-                "-c",
-                "-z",
-                "-f",
-                settings.ROOT_DIR + "src/rockstor/logs/error.tgz",
-                settings.ROOT_DIR + "var/log",
-            ]
-        )
+        # Log bundle built in the background, once per burst of exceptions.
+        request_bundle()
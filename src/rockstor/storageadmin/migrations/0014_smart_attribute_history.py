@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storageadmin', '0013_auto_20200815_2004'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SMARTAttributeHistory',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('aid', models.IntegerField()),
+                ('name', models.CharField(max_length=256)),
+                ('normed_value', models.IntegerField(default=0)),
+                ('raw_value', models.BigIntegerField(default=0)),
+                ('ts', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='disk',
+            name='smart_risk',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='smartattributehistory',
+            name='disk',
+            field=models.ForeignKey(to='storageadmin.Disk'),
+        ),
+        migrations.AlterIndexTogether(
+            name='smartattributehistory',
+            index_together=set([('disk', 'aid', 'ts')]),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storageadmin', '0014_smart_attribute_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PoolScrubSample',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('ts', models.DateTimeField(db_index=True)),
+                ('kb_scrubbed', models.BigIntegerField(default=0)),
+                ('kb_rate', models.BigIntegerField(default=0)),
+                ('errors', models.IntegerField(default=0)),
+                ('scrub', models.ForeignKey(to='storageadmin.PoolScrub')),
+            ],
+        ),
+    ]
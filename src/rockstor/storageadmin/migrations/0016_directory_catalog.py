@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storageadmin', '0015_pool_scrub_sample'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirectoryGroup',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('groupname', models.CharField(unique=True, max_length=1024)),
+                ('sort_name', models.CharField(max_length=1024, db_index=True)),
+                ('gid', models.IntegerField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DirectorySync',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(unique=True, max_length=64)),
+                ('synced', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DirectoryUser',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('username', models.CharField(unique=True, max_length=4096)),
+                ('sort_name', models.CharField(max_length=4096, db_index=True)),
+                ('uid', models.IntegerField(db_index=True)),
+                ('gid', models.IntegerField()),
+                ('shell', models.CharField(max_length=1024, null=True)),
+                ('groupname', models.CharField(max_length=1024, null=True)),
+            ],
+        ),
+    ]
@@ -35,7 +35,7 @@ from user import User  # noqa E501
 from samba_share import SambaShare  # noqa E501
 from samba_custom import SambaCustomConfig  # noqa E501
 from posix_acls import PosixACLs  # noqa E501
-from scrub import PoolScrub  # noqa E501
+from scrub import PoolScrub, PoolScrubSample  # noqa E501
 from setup import Setup  # noqa E501
 from sftp import SFTP  # noqa E501
 from plugin import Plugin  # noqa E501
@@ -49,9 +49,11 @@ from rockon import (RockOn, DImage, DContainer, DPort, DVolume,  # noqa E501
                     DContainerLabel, DContainerNetwork)  # noqa E501
 from smart import (SMARTAttribute, SMARTCapability, SMARTErrorLog,  # noqa E501
                    SMARTErrorLogSummary, SMARTTestLog, SMARTTestLogDetail,  # noqa E501
-                   SMARTIdentity, SMARTInfo)  # noqa E501
+                   SMARTIdentity, SMARTInfo,  # noqa E501
+                   SMARTAttributeHistory)  # noqa E501
 from config_backup import ConfigBackup  # noqa E501
 from email import EmailClient  # noqa E501
 from update_subscription import UpdateSubscription  # noqa E501
 from pincard import Pincard  # noqa E501
 from installed_plugin import InstalledPlugin  # noqa E501
+from directory import DirectoryUser, DirectoryGroup, DirectorySync  # noqa E501
@@ -0,0 +1,66 @@
+"""
+Copyright (c) 2012-2021 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from django.db import models
+
+
+class DirectoryUser(models.Model):
+    """
+    Catalog entry of a system (passwd) user, including directory service
+    (AD/LDAP) users, or of a Rockstor managed User. Refreshed in the
+    background from getent: see storageadmin.views.ug_helpers.sync_users().
+    """
+
+    username = models.CharField(max_length=4096, unique=True)
+    # Lower case username, for case insensitive ordering and prefix search.
+    sort_name = models.CharField(max_length=4096, db_index=True)
+    uid = models.IntegerField(db_index=True)
+    gid = models.IntegerField()
+    shell = models.CharField(max_length=1024, null=True)
+    # Name of the primary group (gid), if known.
+    groupname = models.CharField(max_length=1024, null=True)
+
+    class Meta:
+        app_label = "storageadmin"
+
+
+class DirectoryGroup(models.Model):
+    """
+    Catalog entry of a system (group) group, or of a Rockstor managed Group:
+    see storageadmin.views.ug_helpers.sync_groups().
+    """
+
+    groupname = models.CharField(max_length=1024, unique=True)
+    sort_name = models.CharField(max_length=1024, db_index=True)
+    gid = models.IntegerField(db_index=True)
+
+    class Meta:
+        app_label = "storageadmin"
+
+
+class DirectorySync(models.Model):
+    """
+    Time of the last completed catalog refresh, by catalog: "users" or
+    "groups".
+    """
+
+    name = models.CharField(max_length=64, unique=True)
+    synced = models.DateTimeField()
+
+    class Meta:
+        app_label = "storageadmin"
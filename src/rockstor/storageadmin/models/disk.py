@@ -75,6 +75,9 @@ class Disk(models.Model):
     eg "-d usbjmicron,p" or "-s on -d 3ware,0".
     """
     smart_options = models.CharField(max_length=64, null=True)
+    """S.M.A.R.T attribute based failure risk score, 0 (none) to 100, as of
+    the last S.M.A.R.T collection. Null if never assessed."""
+    smart_risk = models.IntegerField(null=True)
     """role is json formatted aux info to flag special use disks
     ie "import" or "backup" flags for temp external drive connection.
     Also flags mdraid status eg {"mdraid": "isw_raid_member"} or
@@ -87,6 +90,14 @@ class Disk(models.Model):
     attached = AttachedManager()  # Only return attached Disk objects.
     objects = models.Manager()  # Ensure Object manager is still accessible.
 
+    def __init__(self, *args, **kwargs):
+        super(Disk, self).__init__(*args, **kwargs)
+        # Property values established in bulk for many instances prior to
+        # serialization, indexed by property name. Any property found here is
+        # returned as is, avoiding a per instance subprocess. See
+        # storageadmin.views.disk.resolve_disk_props().
+        self.resolved_props = {}
+
     @property
     def pool_name(self, *args, **kwargs):
         try:
@@ -96,6 +107,8 @@ class Disk(models.Model):
 
     @property
     def power_state(self, *args, **kwargs):
+        if "power_state" in self.resolved_props:
+            return self.resolved_props["power_state"]
         try:
             return get_disk_power_status(str(self.name))
         except:
@@ -103,6 +116,8 @@ class Disk(models.Model):
 
     @property
     def hdparm_setting(self, *args, **kwargs):
+        if "hdparm_setting" in self.resolved_props:
+            return self.resolved_props["hdparm_setting"]
         try:
             return read_hdparm_setting(str(self.name))
         except:
@@ -110,6 +125,8 @@ class Disk(models.Model):
 
     @property
     def apm_level(self, *args, **kwargs):
+        if "apm_level" in self.resolved_props:
+            return self.resolved_props["apm_level"]
         try:
             return get_disk_APM_level(str(self.name))
         except:
@@ -118,6 +135,8 @@ class Disk(models.Model):
     @property
     def io_error_stats(self, *args, **kwargs):
         # json charfield format
+        if "io_error_stats" in self.resolved_props:
+            return self.resolved_props["io_error_stats"]
         try:
             return get_dev_io_error_stats(str(self.target_name))
         except:
@@ -125,6 +144,8 @@ class Disk(models.Model):
 
     @property
     def temp_name(self, *args, **kwargs):
+        if "temp_name" in self.resolved_props:
+            return self.resolved_props["temp_name"]
         try:
             return get_dev_temp_name(str(self.target_name))
         except:
@@ -18,14 +18,7 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 from django.db import models
 from django.conf import settings
-from fs.btrfs import (
-    pool_usage,
-    usage_bound,
-    are_quotas_enabled,
-    is_pool_missing_dev,
-    dev_stats_zero,
-    default_subvol,
-)
+from fs.btrfs import usage_bound, btrfs_state
 from system.osi import mount_status
 
 RETURN_BOOLEAN = True
@@ -55,8 +48,10 @@ class Pool(models.Model):
         # Establish an instance variable to track missing device status.
         # Currently Boolean and may be updated during instance life by
         # calling this method again or directly setting the field.
+        # Served from the process-wide btrfs_state snapshot so that building
+        # many Pool instances costs at most one 'btrfs fi show' per TTL.
         try:
-            self.missing_dev = is_pool_missing_dev(self.name)
+            self.missing_dev = btrfs_state.missing_dev(self.name)
         except:
             self.missing_dev = False
 
@@ -69,7 +64,7 @@ class Pool(models.Model):
         # this serves as a mechanism by which we can 'special case' our ROOT/system
         # pool and avoid mounting it again at the usual /mnt2/pool-name as it is already
         # mounted (or it's boot to snapshot instance) at "/".
-        if self.role == "root" and not default_subvol().boot_to_snap:
+        if self.role == "root" and not btrfs_state.default_subvol().boot_to_snap:
             self.mnt_pt_var = "/"
         else:
             self.mnt_pt_var = "{}{}".format(settings.MNT_PT, self.name)
@@ -84,7 +79,7 @@ class Pool(models.Model):
         # calling this method again or directly setting the field.
         try:
             if self.is_mounted:
-                self.dev_stats_zero = dev_stats_zero(self.mnt_pt_var)
+                self.dev_stats_zero = btrfs_state.dev_stats_zero(self.mnt_pt_var)
             else:
                 self.dev_stats_zero = True
         except:
@@ -101,7 +96,7 @@ class Pool(models.Model):
         # less code. For share usage, this type of logic could slow things
         # down quite a bit because there can be 100's of Shares, but number
         # of Pools even on a large instance is usually no more than a few.
-        return self.size - pool_usage(self.mnt_pt_var)
+        return self.size - btrfs_state.pool_usage(self.mnt_pt_var)
 
     @property
     def reclaimable(self, *args, **kwargs):
@@ -134,7 +129,7 @@ class Pool(models.Model):
     def quotas_enabled(self, *args, **kwargs):
         # Calls are_quotas_enabled for boolean response
         try:
-            return are_quotas_enabled(self.mnt_pt_var)
+            return btrfs_state.quotas_enabled(self.mnt_pt_var)
         except:
             return False
 
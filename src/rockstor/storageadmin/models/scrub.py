@@ -50,3 +50,21 @@ class PoolScrub(models.Model):
 
     class Meta:
         app_label = "storageadmin"
+
+
+class PoolScrubSample(models.Model):
+    """
+    Progress of a running scrub as sampled by the scrub monitor, giving a
+    per scrub throughput history.
+    """
+
+    scrub = models.ForeignKey(PoolScrub)
+    ts = models.DateTimeField(db_index=True)
+    kb_scrubbed = models.BigIntegerField(default=0)
+    # KiB/s since the prior sample.
+    kb_rate = models.BigIntegerField(default=0)
+    # Sum of all error counts.
+    errors = models.IntegerField(default=0)
+
+    class Meta:
+        app_label = "storageadmin"
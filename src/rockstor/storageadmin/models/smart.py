@@ -128,6 +128,22 @@ class SMARTIdentity(models.Model):
         app_label = "storageadmin"
 
 
+class SMARTAttributeHistory(models.Model):
+    """Time series of a disk's failure indicative SMART attributes: a new
+    entry is only added on a change of value."""
+
+    disk = models.ForeignKey(Disk)
+    aid = models.IntegerField()
+    name = models.CharField(max_length=256)
+    normed_value = models.IntegerField(default=0)
+    raw_value = models.BigIntegerField(default=0)
+    ts = models.DateTimeField(db_index=True)
+
+    class Meta:
+        app_label = "storageadmin"
+        index_together = [("disk", "aid", "ts")]
+
+
 class SMARTInfo(models.Model):
     disk = models.ForeignKey(Disk)
     toc = models.DateTimeField(auto_now=True)
@@ -45,6 +45,10 @@ class User(models.Model):
     def groupname(self, *args, **kwargs):
         if self.group is not None:
             return self.group.groupname
+        # As set on unmanaged users from the user catalog, see ug_helpers.
+        primary_groupname = getattr(self, "primary_groupname", None)
+        if primary_groupname is not None:
+            return primary_groupname
         if self.gid is not None:
             groupname = grp.getgrgid(self.gid).gr_name
             charset = chardet.detect(groupname)
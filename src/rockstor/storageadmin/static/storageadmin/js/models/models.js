@@ -583,6 +583,24 @@ var TaskDef = Backbone.Model.extend({
         }
         return 0;
     },
+    window_pause: function () {
+        if (this.get('json_meta') != null) {
+            return JSON.parse(this.get('json_meta')).window_pause;
+        }
+        return false;
+    },
+    low_priority: function () {
+        if (this.get('json_meta') != null) {
+            return JSON.parse(this.get('json_meta')).low_priority;
+        }
+        return false;
+    },
+    max_latency: function () {
+        if (this.get('json_meta') != null) {
+            return JSON.parse(this.get('json_meta')).max_latency;
+        }
+        return 0;
+    },
     ping_scan: function () {
         if (this.get('json_meta') != null) {
             return JSON.parse(this.get('json_meta')).ping_scan;
@@ -51,7 +51,8 @@ AddScheduledTaskView = RockstorLayoutView.extend({
             {name: 'snapshot', description: 'Btrfs Snapshot'},
             {name: 'reboot', description: 'System Reboot'},
             {name: 'shutdown', description: 'System Shutdown'},
-            {name: 'suspend', description: 'System Suspend'}
+            {name: 'suspend', description: 'System Suspend'},
+            {name: 'smart', description: 'S.M.A.R.T Sampling'}
             //{name: 'custom', description: 'User Custom Task'}
         ];
         if (!_.isUndefined(this.taskDefId) && !_.isNull(this.taskDefId)) {
@@ -87,7 +88,10 @@ AddScheduledTaskView = RockstorLayoutView.extend({
                 enabled: this.taskDef.get('enabled'),
                 wakeup: this.taskDef.wakeup(),
                 rtcHour: this.taskDef.rtc_hour(),
-                rtcMinute: this.taskDef.rtc_minute()
+                rtcMinute: this.taskDef.rtc_minute(),
+                windowPause: this.taskDef.window_pause(),
+                lowPriority: this.taskDef.low_priority(),
+                maxLatency: this.taskDef.max_latency()
             };
         // Hacking Handlebars registerPartial normal usage
         // Handlebars has registerPartial to help with nested templates
@@ -102,7 +106,7 @@ AddScheduledTaskView = RockstorLayoutView.extend({
 
         // Define taskObj fields having booleans (html checked checkboxes)
         // requiring conversion to string value checked
-            var bool_fields = ['visible', 'writable', 'enabled', 'wakeup', 'ping_scan'];
+            var bool_fields = ['visible', 'writable', 'enabled', 'wakeup', 'ping_scan', 'windowPause', 'lowPriority'];
 
         // Loop over taskObj and build Partials like taskObj.key so
         // we just have to move fro {{taskObj.field_name}} to
@@ -171,6 +175,10 @@ AddScheduledTaskView = RockstorLayoutView.extend({
                         }
                     }
                 },
+                'meta.max_latency': {
+                    number: true,
+                    min: 0
+                },
                 'meta.max_count': {
                     number: true,
                     min: 1,
@@ -307,6 +307,10 @@ ReplicationView = RockstorLayoutView.extend({
     },
 
     serviceStatusSync: function(data) {
+        // Services whose status is as yet unknown are omitted.
+        if (_.isUndefined(data.replication)) {
+            return;
+        }
         if (data.replication.running > 0) {
             this.current_status = false;
             this.$('#replication-warning').show();
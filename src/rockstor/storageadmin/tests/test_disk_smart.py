@@ -34,25 +34,15 @@ class DiskSmartTests(APITestMixin, APITestCase):
         super(DiskSmartTests, cls).setUpClass()
 
         # post mocks
-        cls.patch_extended_info = patch(
-            'storageadmin.views.disk_smart.extended_info')
-        cls.mock_extended_info = cls.patch_extended_info.start()
-
-        cls.patch_capabilities = patch(
-            'storageadmin.views.disk_smart.capabilities')
-        cls.mock_capabilities = cls.patch_capabilities.start()
-
-        cls.patch_info = patch('storageadmin.views.disk_smart.info')
-        cls.mock_info = cls.patch_info.start()
-
-        cls.patch_error_logs = patch(
-            'storageadmin.views.disk_smart.error_logs')
-        cls.mock_error_logs = cls.patch_error_logs.start()
-        cls.mock_error_logs.return_value = {}, []
-
-        cls.patch_test_logs = patch('storageadmin.views.disk_smart.test_logs')
-        cls.mock_test_logs = cls.patch_test_logs.start()
-        cls.mock_test_logs.return_value = {}, []
+        cls.patch_collect = patch('storageadmin.views.disk_smart.collect')
+        cls.mock_collect = cls.patch_collect.start()
+        cls.mock_collect.return_value = {
+            'info': [''] * 16,
+            'extended_info': {},
+            'capabilities': {},
+            'error_logs': ({}, []),
+            'test_logs': ({}, []),
+        }
 
         cls.patch_run_test = patch('storageadmin.views.disk_smart.run_test')
         cls.mock_run_test = cls.patch_run_test.start()
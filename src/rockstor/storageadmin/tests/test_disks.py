@@ -15,6 +15,8 @@ General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
+import unittest
+
 import mock
 from rest_framework import status
 from rest_framework.test import APITestCase
@@ -22,6 +24,7 @@ from mock import patch
 
 from storageadmin.models import Disk
 from storageadmin.tests.test_api import APITestMixin
+from storageadmin.views.disk import live_props_requested, resolve_disk_props
 
 
 class DiskTests(APITestMixin, APITestCase):
@@ -204,3 +207,167 @@ class DiskTests(APITestMixin, APITestCase):
             self.temp_disk.name
         )
         self.assertEqual(response.data[0], e_msg)
+
+    @mock.patch("storageadmin.views.disk.get_pool_io_error_stats")
+    @mock.patch("storageadmin.views.disk.get_disks_power_info")
+    def test_disk_list_live_props(self, mock_power_info, mock_io_stats):
+        """
+        Disk lists query devices unless live=no is requested.
+        """
+        mock_power_info.return_value = {}
+        response = self.client.get(self.BASE_URL, {"live": "no"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(mock_power_info.called)
+        response = self.client.get(self.BASE_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Detached disks have no device to query.
+        devices = mock_power_info.call_args[0][0]
+        self.assertIn("ata-QEMU_HARDDISK_serial-1", devices)
+        self.assertFalse([d for d in devices if d.startswith("detached-")])
+
+
+class ResolveDiskPropsTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_disks*
+    """
+
+    def setUp(self):
+        self.mock_temp_name_map = patch(
+            "storageadmin.views.disk.get_byid_temp_name_map"
+        ).start()
+        self.mock_temp_name_map.return_value = {
+            "ata-disk-1": "sda",
+            "ata-disk-2": "sdb",
+            "ata-disk-3": "sdc",
+        }
+        self.mock_hdparm_settings = patch(
+            "storageadmin.views.disk.read_hdparm_settings"
+        ).start()
+        self.mock_hdparm_settings.return_value = {"ata-disk-1": "20 minutes"}
+        self.mock_power_info = patch(
+            "storageadmin.views.disk.get_disks_power_info"
+        ).start()
+        self.mock_power_info.return_value = {
+            "ata-disk-1": ("active/idle", 127),
+            "ata-disk-2": (None, None),
+            "ata-disk-3": ("standby", 254),
+        }
+        self.mock_io_stats = patch(
+            "storageadmin.views.disk.get_pool_io_error_stats"
+        ).start()
+        self.mock_io_stats.return_value = {
+            "/dev/disk/by-id/ata-disk-1": {"write_io_errs": 0},
+            "/dev/disk/by-id/ata-disk-2": {"write_io_errs": 3},
+        }
+        self.mock_dev_io_stats = patch(
+            "storageadmin.views.disk.get_dev_io_error_stats"
+        ).start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    @staticmethod
+    def pool(pool_id, mounted):
+        pool = mock.Mock(id=pool_id, mnt_pt="/mnt2/pool%d" % pool_id)
+        type(pool).is_mounted = mock.PropertyMock(return_value=mounted)
+        return pool
+
+    @staticmethod
+    def disk(name, pool=None):
+        disk = mock.Mock(target_name=name, pool=pool, resolved_props={})
+        # Mock reserves the name keyword.
+        disk.name = name
+        return disk
+
+    def disks(self):
+        # As from select_related("pool"), each disk has its own Pool instance.
+        self.pools = [self.pool(1, True), self.pool(1, True), self.pool(2, False)]
+        return [
+            self.disk("ata-disk-1", self.pools[0]),
+            self.disk("ata-disk-2", self.pools[1]),
+            self.disk("ata-disk-3", self.pools[2]),
+            self.disk("detached-97e451e7f51a4adf9ee303808644286b"),
+        ]
+
+    def test_resolve_disk_props(self):
+        disks = resolve_disk_props(self.disks())
+        self.mock_power_info.assert_called_once_with(
+            ["ata-disk-1", "ata-disk-2", "ata-disk-3"]
+        )
+        # One mount check and stats call per mounted pool, not per disk.
+        self.mock_io_stats.assert_called_once_with("/mnt2/pool1")
+        mount_reads = [type(p).is_mounted.call_count for p in self.pools]
+        self.assertEqual(mount_reads, [1, 0, 1])
+        self.assertFalse(self.mock_dev_io_stats.called)
+        self.assertEqual(
+            disks[0].resolved_props,
+            {
+                "temp_name": "sda",
+                "hdparm_setting": "20 minutes",
+                "power_state": "active/idle",
+                "apm_level": 127,
+                "io_error_stats": '{"write_io_errs": 0}',
+            },
+        )
+        # A device whose power queries failed.
+        self.assertIsNone(disks[1].resolved_props["power_state"])
+        self.assertEqual(
+            disks[1].resolved_props["io_error_stats"], '{"write_io_errs": 3}'
+        )
+        # Unmounted pool member.
+        self.assertIsNone(disks[2].resolved_props["io_error_stats"])
+        self.assertEqual(
+            disks[3].resolved_props,
+            {
+                "temp_name": "detached-97e451e7f51a4adf9ee303808644286b",
+                "hdparm_setting": None,
+                "power_state": "unknown",
+                "apm_level": 0,
+                "io_error_stats": None,
+            },
+        )
+
+    def test_resolve_disk_props_missing_member(self):
+        """
+        A mounted pool member absent from its pool's stats, ie failing to
+        report on a degraded pool, has its own stats queried.
+        """
+        del self.mock_io_stats.return_value["/dev/disk/by-id/ata-disk-2"]
+        self.mock_dev_io_stats.return_value = '{"write_io_errs": "5"}'
+        disks = resolve_disk_props(self.disks())
+        self.mock_dev_io_stats.assert_called_once_with("ata-disk-2")
+        self.assertEqual(
+            disks[1].resolved_props["io_error_stats"], '{"write_io_errs": "5"}'
+        )
+        self.assertEqual(
+            disks[0].resolved_props["io_error_stats"], '{"write_io_errs": 0}'
+        )
+        # Members of unmounted pools have no stats to query.
+        self.assertIsNone(disks[2].resolved_props["io_error_stats"])
+
+    def test_resolve_disk_props_not_live(self):
+        disks = resolve_disk_props(self.disks(), live=False)
+        self.assertFalse(self.mock_power_info.called)
+        self.assertFalse(self.mock_io_stats.called)
+        self.assertFalse([p for p in self.pools if type(p).is_mounted.called])
+        self.assertEqual(
+            disks[0].resolved_props,
+            {
+                "temp_name": "sda",
+                "hdparm_setting": "20 minutes",
+                "power_state": None,
+                "apm_level": None,
+                "io_error_stats": None,
+            },
+        )
+
+    def test_live_props_requested(self):
+        for query_params, live in (
+            ({}, True),
+            ({"live": "yes"}, True),
+            ({"live": "no"}, False),
+        ):
+            request = mock.Mock(query_params=query_params)
+            self.assertEqual(live_props_requested(request), live)
@@ -21,7 +21,7 @@ from rest_framework.test import APITestCase
 import mock
 from mock import patch
 from storageadmin.tests.test_api import APITestMixin
-from storageadmin.models import Pool
+from storageadmin.models import Pool, PoolBalance
 
 
 class PoolBalanceTests(APITestMixin, APITestCase):
@@ -127,3 +127,32 @@ class PoolBalanceTests(APITestMixin, APITestCase):
                              data=data)
         self.assertEqual(r.status_code,
                          status.HTTP_200_OK, msg=r.data)
+
+    def test_post_paused(self):
+
+        # A balance paused, ie by our maintenance policy, is in progress.
+        pool = Pool.objects.create(name='rock-pool', raid='raid1', size=88025459)
+        PoolBalance(pool=pool, status='paused', percent_done=40).save()
+        self.mock_balance_status.return_value = {'status': 'paused',
+                                                 'percent_done': '40'}
+        try:
+            r = self.client.post('{}/{}/balance'.format(self.BASE_URL,
+                                                        pool.id), data={})
+            self.assertEqual(r.status_code,
+                             status.HTTP_500_INTERNAL_SERVER_ERROR,
+                             msg=r.data)
+            e_msg = ('A Balance process is already running for pool '
+                     '(rock-pool).')
+            self.assertEqual(r.data[0], e_msg)
+
+            # Replaced only when forced.
+            r = self.client.post('{}/{}/balance'.format(self.BASE_URL,
+                                                        pool.id),
+                                 data={'force': 'true'})
+            self.assertEqual(r.status_code,
+                             status.HTTP_200_OK, msg=r.data)
+            self.assertTrue(PoolBalance.objects.filter(
+                pool=pool, status='terminated').exists())
+        finally:
+            self.mock_balance_status.return_value = {'status': 'finished',
+                                                     'percent_done': '100'}
@@ -71,7 +71,7 @@ class PoolTests(APITestMixin, APITestCase):
         cls.mock_remount.return_value = True
 
         # mock Pool models fs/btrfs.py pool_usage() so @property 'free' works.
-        cls.patch_pool_usage = patch('storageadmin.models.pool.pool_usage')
+        cls.patch_pool_usage = patch('fs.btrfs.pool_usage')
         cls.mock_pool_usage = cls.patch_pool_usage.start()
         cls.mock_pool_usage.return_value = 0
 
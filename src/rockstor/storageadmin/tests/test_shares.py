@@ -91,7 +91,7 @@ class ShareTests(APITestMixin, APITestCase):
         cls.mock_remove_share.return_value = True
 
         # mock Pool models fs/btrfs.py pool_usage() so @property 'free' works.
-        cls.patch_pool_usage = patch('storageadmin.models.pool.pool_usage')
+        cls.patch_pool_usage = patch('fs.btrfs.pool_usage')
         cls.mock_pool_usage = cls.patch_pool_usage.start()
         cls.mock_pool_usage.return_value = 0
 
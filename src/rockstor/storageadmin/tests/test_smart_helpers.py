@@ -0,0 +1,183 @@
+"""
+Copyright (c) 2012-2021 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+from django.utils.timezone import utc
+from mock import patch
+
+from storageadmin.models import Disk, SMARTAttribute, SMARTAttributeHistory, SMARTInfo
+from storageadmin.views.smart_helpers import (
+    record_smart_history,
+    SMART_INFO_RETAIN,
+    smart_risk,
+    sample_smart_history,
+    save_smart_info,
+    smart_info_available,
+    RISK_MAX,
+)
+
+
+class SMARTHelpersTests(TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor-dev>
+    ./bin/test --settings=test-settings -v 3 -p test_smart_helpers*
+    """
+
+    multi_db = True
+
+    def setUp(self):
+        self.disk = Disk(
+            name="ata-WDC_WD40EFRX-68N32N0_WD-WCC7K1234567", size=1, parted=False
+        )
+        self.disk.save()
+        self.now = datetime(2021, 10, 18, tzinfo=utc)
+
+    @staticmethod
+    def attributes(reallocated, pending, temperature="40 (Min/Max 18/46)"):
+        # As per smart.extended_info()
+        return {
+            "Reallocated_Sector_Ct": [
+                "5",
+                "Reallocated_Sector_Ct",
+                "0x0033",
+                "200",
+                "200",
+                "140",
+                "Pre-fail",
+                "Always",
+                "-",
+                str(reallocated),
+            ],  # noqa E501
+            "Current_Pending_Sector": [
+                "197",
+                "Current_Pending_Sector",
+                "0x0032",
+                "200",
+                "200",
+                "000",
+                "Old_age",
+                "Always",
+                "-",
+                str(pending),
+            ],  # noqa E501
+            "Temperature_Celsius": [
+                "194",
+                "Temperature_Celsius",
+                "0x0022",
+                "112",
+                "100",
+                "000",
+                "Old_age",
+                "Always",
+                "-",
+                temperature,
+            ],  # noqa E501
+        }
+
+    def test_record_smart_history(self):
+        record_smart_history(self.disk, self.attributes(0, 0), self.now)
+        # Only our risk attributes are recorded.
+        self.assertEqual(SMARTAttributeHistory.objects.count(), 2)
+        # And only on change.
+        ts = self.now + timedelta(days=1)
+        record_smart_history(self.disk, self.attributes(0, 0, "41"), ts)
+        self.assertEqual(SMARTAttributeHistory.objects.count(), 2)
+        record_smart_history(self.disk, self.attributes(8, 0), ts)
+        self.assertEqual(SMARTAttributeHistory.objects.count(), 3)
+        h = SMARTAttributeHistory.objects.filter(aid=5).order_by("-ts")[0]
+        self.assertEqual((h.raw_value, h.ts), (8, ts))
+
+    def test_smart_risk(self):
+        self.assertEqual(smart_risk(self.disk, now=self.now), (None, {}))
+        record_smart_history(self.disk, self.attributes(0, 0), self.now)
+        self.assertEqual(smart_risk(self.disk, now=self.now)[0], 0)
+        self.assertEqual(smart_risk(self.disk, failing=True, now=self.now)[0], RISK_MAX)
+        # 3 reallocated sectors: 4 * (log2(4) + 2 * log2(4)) = 24
+        ts = self.now + timedelta(days=10)
+        record_smart_history(self.disk, self.attributes(3, 0), ts)
+        score, details = smart_risk(self.disk, now=ts)
+        self.assertEqual(score, 24)
+        self.assertEqual(details["Reallocated_Sector_Ct"]["growth"], 3)
+        # Static since, so growth no longer counts once out of our window.
+        ts = self.now + timedelta(days=60)
+        score, details = smart_risk(self.disk, now=ts)
+        self.assertEqual(score, 8)
+        self.assertEqual(details["Reallocated_Sector_Ct"]["growth"], 0)
+        # A degrading drive: 10 more reallocated and 20 pending sectors.
+        for day in range(61, 71):
+            ts = self.now + timedelta(days=day)
+            record_smart_history(
+                self.disk, self.attributes(3 + day - 60, 2 * (day - 60)), ts
+            )
+        self.assertEqual(smart_risk(self.disk, now=ts)[0], 96)
+
+    def test_save_smart_info(self):
+        smart_data = {
+            "info": [""] * 12
+            + [
+                "Available - device has SMART capability.",
+                "Enabled",
+                "7.0",
+                "PASSED",
+            ],  # noqa E501
+            "extended_info": self.attributes(1, 0),
+            "capabilities": {},
+            "error_logs": ({}, []),
+            "test_logs": (
+                {"1": ["Short offline", "Completed without error", 100, "21200", "-"]},
+                [],
+            ),  # noqa E501
+        }
+        si = save_smart_info(self.disk, smart_data)
+        self.assertEqual(si.attributes().count(), 3)
+        self.assertEqual(smart_info_available(si), (True, True))
+        # No growth in a first sample: 4 * log2(2)
+        self.assertEqual(Disk.objects.get(id=self.disk.id).smart_risk, 4)
+        smart_data["info"][15] = "FAILED!"
+        save_smart_info(self.disk, smart_data)
+        self.assertEqual(Disk.objects.get(id=self.disk.id).smart_risk, RISK_MAX)
+        # Only the latest snapshots are kept.
+        for i in range(SMART_INFO_RETAIN + 1):
+            latest = save_smart_info(self.disk, smart_data)
+        infos = SMARTInfo.objects.filter(disk=self.disk)
+        self.assertEqual(infos.count(), SMART_INFO_RETAIN)
+        self.assertTrue(infos.filter(id=latest.id).exists())
+        self.assertEqual(
+            SMARTAttribute.objects.filter(info__disk=self.disk).count(),
+            3 * SMART_INFO_RETAIN,
+        )
+
+    @patch("storageadmin.views.smart_helpers._collect")
+    def test_sample_smart_history(self, mock_collect):
+        """
+        Scheduled samples extend the attribute history and risk score alone.
+        """
+        mock_collect.return_value = {
+            "info": [""] * 15 + ["PASSED"],
+            "extended_info": self.attributes(2, 1),
+        }
+        self.assertEqual(sample_smart_history([self.disk]), [self.disk])
+        self.assertEqual(SMARTInfo.objects.filter(disk=self.disk).count(), 0)
+        self.assertEqual(
+            SMARTAttributeHistory.objects.filter(disk=self.disk).count(), 2
+        )
+        self.assertTrue(Disk.objects.get(id=self.disk.id).smart_risk > 0)
+        mock_collect.return_value = None
+        self.assertEqual(sample_smart_history([self.disk]), [])
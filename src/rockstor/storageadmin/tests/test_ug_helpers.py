@@ -0,0 +1,158 @@
+"""
+Copyright (c) 2012-2021 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import tempfile
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+from django.utils.timezone import utc
+from mock import patch
+
+from storageadmin.models import DirectorySync, DirectoryUser, Group, User
+from storageadmin.views import ug_helpers
+from storageadmin.views.ug_helpers import (
+    CATALOG_TTL,
+    combined_groups,
+    combined_users,
+    ensure_catalog,
+    sync_catalog,
+    sync_groups,
+    sync_users,
+)
+
+
+class UGHelpersTests(TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor-dev>
+    ./bin/test --settings=test-settings -v 3 -p test_ug_helpers*
+    """
+
+    def setUp(self):
+        self.sys_groups = {u"users": 100, u"Domain Users": 10513, u"wheel": 10}
+        self.sys_users = {
+            u"root": (0, 0, "/bin/bash"),
+            u"alice": (1000, 100, "/bin/bash"),
+            u"Bob": (10501, 10513, "/bin/bash"),
+            u"bill": (10502, 10513, "/bin/sh"),
+        }
+        # Whether the system user enumeration completes.
+        self.complete = True
+        self.patch_get_users = patch("storageadmin.views.ug_helpers.enumerate_users")
+        self.mock_get_users = self.patch_get_users.start()
+        self.mock_get_users.side_effect = lambda: (dict(self.sys_users), self.complete)
+        self.patch_get_groups = patch("storageadmin.views.ug_helpers.get_groups")
+        self.mock_get_groups = self.patch_get_groups.start()
+        self.mock_get_groups.side_effect = lambda *gids: dict(self.sys_groups)
+        self.lock = tempfile.NamedTemporaryFile()
+        patch("storageadmin.views.ug_helpers.CATALOG_LOCK", self.lock.name).start()
+
+    def tearDown(self):
+        patch.stopall()
+        self.lock.close()
+
+    def test_sync(self):
+        """
+        Only catalog changes are written, and managed users and groups are
+        kept in line with the system.
+        """
+        group = Group(groupname="users", gid=99, admin=True)
+        group.save()
+        User(username="alice", uid=1000, gid=99, shell="/bin/bash", group=group).save()
+        User(username="carol", uid=1001, gid=99, shell="/bin/bash").save()
+        self.assertEqual(sync_groups(), (3, 0, 0))
+        self.assertEqual(Group.objects.get(groupname="users").gid, 100)
+        self.assertEqual(sync_users(), (5, 0, 0))
+        alice = User.objects.get(username="alice")
+        self.assertEqual((alice.gid, alice.group.gid), (100, 100))
+        self.assertEqual(DirectoryUser.objects.get(username="Bob").sort_name, "bob")
+        self.assertEqual(
+            DirectoryUser.objects.get(username="Bob").groupname, "Domain Users"
+        )
+        # The managed only user is retained.
+        self.assertTrue(DirectoryUser.objects.filter(username="carol").exists())
+
+        self.assertEqual(sync_users(), (0, 0, 0))
+        del self.sys_users[u"bill"]
+        self.sys_users[u"Bob"] = (10501, 10513, "/bin/zsh")
+        self.sys_users[u"dave"] = (10503, 10513, "/bin/bash")
+        self.assertEqual(sync_users(), (1, 1, 1))
+        self.assertEqual(DirectoryUser.objects.get(username="Bob").shell, "/bin/zsh")
+        self.assertFalse(DirectoryUser.objects.filter(username="bill").exists())
+
+    def test_sync_incomplete(self):
+        """
+        Users missing from an incomplete enumeration are not removed.
+        """
+        sync_groups()
+        sync_users()
+        del self.sys_users[u"bill"]
+        self.sys_users[u"dave"] = (10503, 10513, "/bin/bash")
+        self.complete = False
+        self.assertEqual(sync_users(), (1, 0, 0))
+        self.assertTrue(DirectoryUser.objects.filter(username="bill").exists())
+        self.complete = True
+        self.assertEqual(sync_users(), (0, 0, 1))
+
+    def test_paging(self):
+        """
+        Users are listed in case insensitive order, optionally by name
+        prefix, and are built a page at a time.
+        """
+        User(username="alice", uid=1000, gid=100, shell="/bin/bash").save()
+        self.assertTrue(sync_catalog())
+        users = combined_users()
+        self.assertEqual(users.count(), 4)
+        self.assertEqual([u.username for u in users[0:3]], ["alice", "bill", "Bob"])
+        page = users[0:2]
+        self.assertTrue(page[0].managed_user)
+        self.assertFalse(page[1].managed_user)
+        self.assertEqual(page[1].groupname, "Domain Users")
+        self.assertEqual(
+            [u.username for u in combined_users(prefix="B")], ["bill", "Bob"]
+        )
+        self.assertEqual(len(combined_users(prefix="x")), 0)
+        groups = combined_groups(prefix="do")
+        self.assertEqual([g.groupname for g in groups], ["Domain Users"])
+        self.assertEqual(self.mock_get_users.call_count, 1)
+
+    @patch("storageadmin.views.ug_helpers.refresh_catalog")
+    def test_ensure_catalog(self, mock_refresh):
+        """
+        The catalog is refreshed in the background if it never has been, or
+        once stale: in place only if never refreshed and waited on.
+        """
+        ug_helpers._last_request[0] = 0
+        ensure_catalog()
+        ensure_catalog()
+        self.assertEqual(mock_refresh.async.call_count, 1)
+        self.assertEqual(self.mock_get_users.call_count, 0)
+        ensure_catalog(wait=True)
+        self.assertEqual(self.mock_get_users.call_count, 1)
+        ensure_catalog(wait=True)
+        self.assertFalse(sync_catalog())
+        self.assertEqual(self.mock_get_users.call_count, 1)
+        self.assertEqual(mock_refresh.async.call_count, 1)
+        stale = datetime.utcnow().replace(tzinfo=utc) - timedelta(
+            seconds=CATALOG_TTL + 1
+        )
+        DirectorySync.objects.filter(name="users").update(synced=stale)
+        ug_helpers._last_request[0] = 0
+        ensure_catalog()
+        ensure_catalog()
+        self.assertEqual(mock_refresh.async.call_count, 2)
+        self.assertEqual(self.mock_get_users.call_count, 1)
@@ -23,6 +23,7 @@ from storageadmin.views import (
     ShareACLView,
     SnapshotView,
     ShareCommandView,
+    ShareUsageView,
 )
 
 from django.conf import settings
@@ -51,5 +52,6 @@ urlpatterns = patterns(
         SnapshotView.as_view(),
     ),
     url(r"^/(?P<sid>\d+)/acl$", ShareACLView.as_view(), name="acl-view"),
+    url(r"^/(?P<sid>\d+)/usage$", ShareUsageView.as_view(), name="usage-view"),
     url(r"^/(?P<sid>\d+)/(?P<command>%s)$" % share_command, ShareCommandView.as_view()),
 )
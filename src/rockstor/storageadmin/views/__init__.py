@@ -42,6 +42,7 @@ from nfs_exports import (
     AdvancedNFSExportView,
 )  # noqa F401
 from share_command import ShareCommandView  # noqa F401
+from share_usage import ShareUsageView  # noqa F401
 from samba import SambaListView, SambaDetailView  # noqa F401
 from sftp import SFTPListView, SFTPDetailView  # noqa F401
 from oauth_app import OauthAppView  # noqa F401
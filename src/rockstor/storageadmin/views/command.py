@@ -23,9 +23,19 @@ from storageadmin.auth import DigestAuthentication
 from rest_framework.permissions import IsAuthenticated
 from storageadmin.views import DiskMixin
 from system.osi import uptime, kernel_info, get_device_mapper_map
-from fs.btrfs import mount_share, mount_root, get_dev_pool_info, pool_raid, mount_snap
+from fs.btrfs import (
+    mount_share,
+    mount_root,
+    get_dev_pool_info,
+    pool_raid,
+    mount_snap,
+    btrfs_state,
+    qgroup_clean,
+    qgroup_maxout_limits,
+)
 from system.ssh import sftp_mount_map, sftp_mount
 from system.services import systemctl
+from system.taskgraph import TaskGraph
 from system.osi import (
     system_shutdown,
     system_reboot,
@@ -45,8 +55,14 @@ from storageadmin.util import handle_exception
 from datetime import datetime
 from django.utils.timezone import utc
 from django.conf import settings
-from django.db import transaction
-from share_helpers import sftp_snap_toggle, import_shares, import_snapshots
+from django.db import connections, transaction
+from share_helpers import (
+    sftp_snap_toggle,
+    import_shares,
+    import_snapshots,
+    ShareUsageBatch,
+    pool_inventory,
+)
 from rest_framework_custom.oauth_wrapper import RockstorOAuth2Authentication
 from system.pkg_mgmt import (
     auto_update,
@@ -56,10 +72,15 @@ from system.pkg_mgmt import (
     auto_update_status,
 )
 from nfs_exports import NFSExportMixin
+from ug_helpers import refresh_catalog
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Concurrent bootstrap tasks, ie pool and share mounts.
+BOOTSTRAP_MAX_WORKERS = 8
+
 
 class CommandView(DiskMixin, NFSExportMixin, APIView):
     authentication_classes = (
@@ -71,165 +92,251 @@ class CommandView(DiskMixin, NFSExportMixin, APIView):
     permission_classes = (IsAuthenticated,)
 
     @staticmethod
-    @transaction.atomic
-    def _refresh_pool_state():
+    def _pool_state_info():
+        """
+        :return: tuple of device mapper map and dev pool info, as used by
+        _refresh_pool().
+        """
+        # Ensure our Pool instances reflect current btrfs state, not a prior snapshot.
+        btrfs_state.invalidate()
         # Get map of dm-0 to /dev/mapper members ie luks-.. devices.
         mapped_devs = get_device_mapper_map()
         # Get temp_names (kernel names) to btrfs pool info for attached devs.
         dev_pool_info = get_dev_pool_info()
-        for p in Pool.objects.all():
-            # If our pool has no disks, detached included, then delete it.
-            # We leave pools with all detached members in place intentionally.
-            if p.disk_set.count() == 0:
-                p.delete()
-                continue
-            # Log if no attached members are found, ie all devs are detached.
-            if p.disk_set.attached().count() == 0:
-                logger.error(
-                    "Skipping Pool ({}) mount as there "
-                    "are no attached devices. Moving on.".format(p.name)
+        return mapped_devs, dev_pool_info
+
+    @staticmethod
+    def _refresh_pool(p, mapped_devs, dev_pool_info):
+        """
+        Refresh, and mount, a pool as per its current btrfs state.
+        :param p: Pool object.
+        :param mapped_devs: as per _pool_state_info()
+        :param dev_pool_info: as per _pool_state_info()
+        """
+        # If our pool has no disks, detached included, then delete it.
+        # We leave pools with all detached members in place intentionally.
+        if p.disk_set.count() == 0:
+            p.delete()
+            return
+        # Log if no attached members are found, ie all devs are detached.
+        if p.disk_set.attached().count() == 0:
+            logger.error(
+                "Skipping Pool ({}) mount as there "
+                "are no attached devices. Moving on.".format(p.name)
+            )
+            return
+        # If pool has no missing remove all detached disk pool associations.
+        # Accounts for 'end of run' clean-up in removing a detached disk and for cli
+        # maintenance re pool returned to no missing dev status. Also re-establishes
+        # pool info as source of truth re missing.
+        if not p.has_missing_dev:
+            for disk in p.disk_set.filter(name__startswith="detached-"):
+                logger.info(
+                    "Removing detached disk from Pool {}: no missing "
+                    "devices found.".format(p.name)
                 )
-                continue
-            # If pool has no missing remove all detached disk pool associations.
-            # Accounts for 'end of run' clean-up in removing a detached disk and for cli
-            # maintenance re pool returned to no missing dev status. Also re-establishes
-            # pool info as source of truth re missing.
-            if not p.has_missing_dev:
-                for disk in p.disk_set.filter(name__startswith="detached-"):
-                    logger.info(
-                        "Removing detached disk from Pool {}: no missing "
-                        "devices found.".format(p.name)
-                    )
-                    disk.pool = None
-                    disk.save()
-            try:
-                # Get and save what info we can prior to mount.
-                first_dev = p.disk_set.attached().first()
-                # Use target_name to account for redirect role.
-                if first_dev.target_name == first_dev.temp_name:
-                    logger.error(
-                        "Skipping pool ({}) mount as attached disk "
-                        "({}) has no by-id name (no serial # ?)".format(
-                            p.name, first_dev.target_name
-                        )
-                    )
-                    continue
-                if first_dev.temp_name in mapped_devs:
-                    dev_tmp_name = "/dev/mapper/{}".format(
-                        mapped_devs[first_dev.temp_name]
-                    )
-                else:
-                    dev_tmp_name = "/dev/{}".format(first_dev.temp_name)
-                # For now we call get_dev_pool_info() once for each pool.
-                pool_info = dev_pool_info[dev_tmp_name]
-                p.name = pool_info.label
-                p.uuid = pool_info.uuid
-                p.save()
-                mount_root(p)
-                p.raid = pool_raid(p.mnt_pt)["data"]
-                p.size = p.usage_bound()
-                # Consider using mount_status() parse to update root pool db on
-                # active (fstab initiated) compression setting.
-                p.save()
-            except Exception as e:
+                disk.pool = None
+                disk.save()
+        try:
+            # Get and save what info we can prior to mount.
+            first_dev = p.disk_set.attached().first()
+            # Use target_name to account for redirect role.
+            if first_dev.target_name == first_dev.temp_name:
                 logger.error(
-                    "Exception while refreshing state for "
-                    "Pool({}). Moving on: {}".format(p.name, e.__str__())
+                    "Skipping pool ({}) mount as attached disk "
+                    "({}) has no by-id name (no serial # ?)".format(
+                        p.name, first_dev.target_name
+                    )
                 )
-                logger.exception(e)
+                return
+            if first_dev.temp_name in mapped_devs:
+                dev_tmp_name = "/dev/mapper/{}".format(mapped_devs[first_dev.temp_name])
+            else:
+                dev_tmp_name = "/dev/{}".format(first_dev.temp_name)
+            # For now we call get_dev_pool_info() once for each pool.
+            pool_info = dev_pool_info[dev_tmp_name]
+            p.name = pool_info.label
+            p.uuid = pool_info.uuid
+            p.save()
+            mount_root(p)
+            p.raid = pool_raid(p.mnt_pt)["data"]
+            p.size = p.usage_bound()
+            # Consider using mount_status() parse to update root pool db on
+            # active (fstab initiated) compression setting.
+            p.save()
+        except Exception as e:
+            logger.error(
+                "Exception while refreshing state for "
+                "Pool({}). Moving on: {}".format(p.name, e.__str__())
+            )
+            logger.exception(e)
 
+    @staticmethod
     @transaction.atomic
-    def post(self, request, command, rtcepoch=None):
-        if command == "bootstrap":
-            self._update_disk_state()
-            self._refresh_pool_state()
+    def _refresh_pool_state():
+        mapped_devs, dev_pool_info = CommandView._pool_state_info()
+        for p in Pool.objects.all():
+            CommandView._refresh_pool(p, mapped_devs, dev_pool_info)
+
+    def _bootstrap(self, request):
+        """
+        Disk, pool, share, snapshot, SFTP, and NFS state as a graph of tasks
+        (see system.taskgraph): pools are mounted concurrently, as are the
+        shares within each, and each share's snapshots and exports follow as
+        soon as it is mounted, rather than once all shares are.
+        :return: timing report as per TaskGraph.report().
+        """
+        graph = TaskGraph(
+            max_workers=BOOTSTRAP_MAX_WORKERS, worker_exit=connections.close_all
+        )
+        # SubvolInventory by pool id, see pool_inventory().
+        inventories = {}
+        share_tasks = []
+
+        def refresh_pools():
+            mapped_devs, dev_pool_info = self._pool_state_info()
+            mnt_map = sftp_mount_map(settings.SFTP_MNT_ROOT)
             for p in Pool.objects.all():
-                if p.disk_set.attached().count() == 0:
-                    continue
-                if not p.is_mounted:
-                    # Prior _refresh_pool_state() should have ensure a mount.
-                    logger.error(
-                        "Skipping import/update of prior known "
-                        "shares for pool ({}) as it is not mounted. "
-                        "(see previous errors)"
-                        ".".format(p.name)
-                    )
-                    continue
-                # Import / update db shares counterpart for managed pool.
-                import_shares(p, request)
-
-            for share in Share.objects.all():
-                if share.pool.disk_set.attached().count() == 0:
-                    continue
-                if not share.pool.is_mounted:
-                    logger.error(
-                        "Skipping mount of share ({}) as pool () is "
-                        "not mounted (see previous errors)"
-                        ".".format(share.name, share.pool.name)
+                pool_task = "pool:{}".format(p.id)
+                graph.add(
+                    pool_task,
+                    mount_pool,
+                    (p, mapped_devs, dev_pool_info),
+                    deps=("pools",),
+                    phase="mount-pool",
+                )
+                graph.add(
+                    "shares:{}".format(p.id),
+                    add_shares,
+                    (p, mnt_map),
+                    deps=(pool_task,),
+                    phase="import-shares",
+                )
+            # NFS is refreshed as a whole, once all exported shares are mounted:
+            # as known once every pool's shares are imported.
+            graph.add(
+                "exports",
+                add_nfs,
+                after=tuple(t for t in graph.tasks.keys() if t.startswith("shares:")),
+                phase="nfs",
+            )
+
+        def mount_pool(p, mapped_devs, dev_pool_info):
+            self._refresh_pool(p, mapped_devs, dev_pool_info)
+            if p.disk_set.attached().count() == 0:
+                # Pool deleted or with no attached members, as logged.
+                return
+            if not p.is_mounted:
+                raise Exception(
+                    "Pool ({}) is not mounted (see previous errors).".format(p.name)
+                )
+
+        def add_shares(p, mnt_map):
+            if p.disk_set.attached().count() == 0:
+                return
+            # Import / update db shares counterpart for managed pool.
+            import_shares(p, request)
+            # Shared by the snapshot imports, and qgroup clean-up, of our pool.
+            pool_inventory(p, inventories)
+            sftp_shares = set(SFTP.objects.values_list("share_id", flat=True))
+            qgroup_after = []
+            for share in Share.objects.filter(pool=p):
+                share_task = "share:{}".format(share.id)
+                snaps_task = "snapshots:{}".format(share.id)
+                graph.add(share_task, mount, (share,), phase="mount-share")
+                graph.add(
+                    snaps_task,
+                    add_snapshots,
+                    (share, share_task),
+                    after=(share_task,),
+                    phase="import-snapshots",
+                )
+                share_tasks.append(share_task)
+                qgroup_after.append(snaps_task)
+                if share.id in sftp_shares:
+                    graph.add(
+                        "sftp:{}".format(share.id),
+                        export_sftp,
+                        (share, mnt_map),
+                        deps=(share_task,),
+                        after=(snaps_task,),
+                        phase="sftp",
                     )
-                    continue
-                try:
-                    if not share.is_mounted:
-                        # System mounted shares i.e. home will already be mounted.
-                        mnt_pt = "{}{}".format(settings.MNT_PT, share.name)
-                        mount_share(share, mnt_pt)
-                except Exception as e:
-                    e_msg = (
-                        "Exception while mounting a share ({}) during "
-                        "bootstrap: ({})."
-                    ).format(share.name, e.__str__())
-                    logger.error(e_msg)
-                    logger.exception(e)
+            graph.add(
+                "qgroups:{}".format(p.id),
+                clean_qgroups,
+                (p,),
+                after=tuple(qgroup_after),
+                phase="qgroups",
+            )
+
+        def mount(share):
+            if not share.is_mounted:
+                # System mounted shares i.e. home will already be mounted.
+                mnt_pt = "{}{}".format(settings.MNT_PT, share.name)
+                mount_share(share, mnt_pt)
+
+        def add_snapshots(share, share_task):
+            import_snapshots(share, inventories[share.pool.id])
+            for snap in Snapshot.objects.filter(share=share, uvisible=True):
+                graph.add(
+                    "snap:{}".format(snap.id),
+                    mount_snap,
+                    (snap.share, snap.real_name, snap.qgroup),
+                    deps=(share_task,),
+                    phase="mount-snapshot",
+                )
 
-                try:
-                    import_snapshots(share)
-                except Exception as e:
-                    e_msg = (
-                        "Exception while importing snapshots of share ({}): ({})."
-                    ).format(share.name, e.__str__())
-                    logger.error(e_msg)
-                    logger.exception(e)
-
-            for snap in Snapshot.objects.all():
-                if snap.uvisible:
-                    try:
-                        mount_snap(snap.share, snap.real_name, snap.qgroup)
-                    except Exception as e:
-                        e_msg = (
-                            "Failed to make the snapshot ({}) visible. "
-                            "Exception: ({})."
-                        ).format(snap.real_name, e.__str__())
-                        logger.error(e_msg)
+        def export_sftp(share, mnt_map):
+            # The following may be buggy when used with system mounted (fstab) /home
+            # but we currently don't allow /home to be exported.
+            sftpo = SFTP.objects.get(share=share)
+            sftp_mount(
+                share, settings.MNT_PT, settings.SFTP_MNT_ROOT, mnt_map, sftpo.editable
+            )
+            sftp_snap_toggle(share)
+
+        def clean_qgroups(p):
+            # Formerly run by bootstrap.py across all pools.
+            qgroup_clean(p.mnt_pt, inventories[p.id])
+            qgroup_maxout_limits(p.mnt_pt)
+
+        def add_nfs():
+            exported = set(
+                "share:{}".format(sid)
+                for sid in NFSExport.objects.values_list("share_id", flat=True)
+            )
+            graph.add(
+                "nfs",
+                export_nfs,
+                after=tuple(t for t in share_tasks if t in exported),
+                phase="nfs",
+            )
+
+        def export_nfs():
+            adv_entries = [a.export_str for a in AdvancedNFSExport.objects.all()]
+            exports_d = self.create_adv_nfs_export_input(adv_entries, request)
+            exports = self.create_nfs_export_input(NFSExport.objects.all())
+            exports.update(exports_d)
+            self.refresh_wrapper(exports, request, logger)
+
+        graph.add("disks", self._update_disk_state, (False,))
+        graph.add("pools", refresh_pools, deps=("disks",))
+        report = graph.run()
+        logger.info("Bootstrap timing: {}".format(json.dumps(report)))
+        return report
 
-            mnt_map = sftp_mount_map(settings.SFTP_MNT_ROOT)
-            for sftpo in SFTP.objects.all():
-                # The following may be buggy when used with system mounted (fstab) /home
-                # but we currently don't allow /home to be exported.
-                try:
-                    sftp_mount(
-                        sftpo.share,
-                        settings.MNT_PT,
-                        settings.SFTP_MNT_ROOT,
-                        mnt_map,
-                        sftpo.editable,
-                    )
-                    sftp_snap_toggle(sftpo.share)
-                except Exception as e:
-                    e_msg = (
-                        "Exception while exporting a SFTP share during "
-                        "bootstrap: ({})."
-                    ).format(e.__str__())
-                    logger.error(e_msg)
+    def post(self, request, command, rtcepoch=None):
+        if command == "bootstrap":
+            # Not a single transaction: our tasks run on their own threads.
+            report = self._bootstrap(request)
 
+            # Seed, or refresh, the user and group catalogs in the background:
+            # so sparing the first Users or Groups page view its enumeration.
             try:
-                adv_entries = [a.export_str for a in AdvancedNFSExport.objects.all()]
-                exports_d = self.create_adv_nfs_export_input(adv_entries, request)
-                exports = self.create_nfs_export_input(NFSExport.objects.all())
-                exports.update(exports_d)
-                self.refresh_wrapper(exports, request, logger)
+                refresh_catalog.async()
             except Exception as e:
-                e_msg = ("Exception while bootstrapping NFS: ({}).").format(e.__str__())
-                logger.error(e_msg)
+                logger.error("Failed to queue catalog refresh: {}".format(e.__str__()))
 
             #  bootstrap services
             try:
@@ -248,8 +355,12 @@ class CommandView(DiskMixin, NFSExportMixin, APIView):
                 handle_exception(Exception(e_msg), request)
 
             logger.debug("Bootstrap operations completed")
-            return Response()
+            return Response(report)
+        # All other commands are, as ever, a single transaction.
+        with transaction.atomic():
+            return self._command(request, command, rtcepoch)
 
+    def _command(self, request, command, rtcepoch=None):
         if command == "utcnow":
             return Response(datetime.utcnow().replace(tzinfo=utc))
 
@@ -398,7 +509,7 @@ class CommandView(DiskMixin, NFSExportMixin, APIView):
                 handle_exception(Exception(msg), request)
 
         if command == "refresh-disk-state":
-            self._update_disk_state()
+            self._update_disk_state(live=False)
             return Response()
 
         if command == "refresh-pool-state":
@@ -406,11 +517,21 @@ class CommandView(DiskMixin, NFSExportMixin, APIView):
             return Response()
 
         if command == "refresh-share-state":
-            for p in Pool.objects.all():
-                import_shares(p, request)
+            # Incremental: pools and shares unchanged since our last import,
+            # by btrfs generation and usage, are skipped.
+            with ShareUsageBatch() as usage:
+                for p in Pool.objects.all():
+                    import_shares(p, request, incremental=True, usage=usage)
             return Response()
 
         if command == "refresh-snapshot-state":
-            for share in Share.objects.all():
-                import_snapshots(share)
+            inventories = {}
+            with ShareUsageBatch() as usage:
+                for share in Share.objects.select_related("pool"):
+                    import_snapshots(
+                        share,
+                        pool_inventory(share.pool, inventories),
+                        incremental=True,
+                        usage=usage,
+                    )
             return Response()
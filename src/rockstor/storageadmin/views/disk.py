@@ -28,10 +28,14 @@ from fs.btrfs import (
     get_dev_pool_info,
     set_pool_label,
     get_devid_usage,
+    get_pool_io_error_stats,
+    get_dev_io_error_stats,
+    SubvolInventory,
 )
 from storageadmin.serializers import DiskInfoSerializer
 from storageadmin.util import handle_exception
 from share_helpers import import_shares, import_snapshots
+from smart_helpers import refresh_smart_info, smart_info_available
 from django.conf import settings
 import rest_framework_custom as rfc
 from system import smart
@@ -55,6 +59,10 @@ from system.osi import (
     get_byid_name_map,
     trigger_systemd_update,
     systemd_name_escape,
+    get_byid_temp_name_map,
+    read_hdparm_settings,
+    get_disks_power_info,
+    get_device_path,
 )
 from system.services import systemctl
 from copy import deepcopy
@@ -82,12 +90,80 @@ SCAN_DISKS_KNOWN_ROLES = [
 WHOLE_DISK_FORMAT_ROLES = ["LUKS", "bcache", "bcachecdev", "LVM2member"]
 
 
+def live_props_requested(request):
+    """
+    Disk list responses include properties read live from each device (power
+    state, APM level, and btrfs io error stats). Clients can opt out of these,
+    and their associated device queries, via the "live=no" query parameter.
+    :param request: rest framework request object.
+    :return: False if live=no was requested, True otherwise.
+    """
+    return request.query_params.get("live", "yes") != "no"
+
+
+def resolve_disk_props(disks, live=True):
+    """
+    Bulk establish the per device properties of the given Disk instances
+    and attach them to each via Disk.resolved_props, prior to serialization.
+    Equivalent to each instance calling its own property methods but with:
+    - by-id to temp_name links read in a single directory walk;
+    - hdparm settings read from one pass of the systemd service file;
+    - one 'btrfs device stats' per mounted pool, not one per device, bar
+      those members missing from their pool's output;
+    - hdparm power/APM queries run concurrently within a bounded worker pool.
+    :param disks: list of Disk instances, ideally with pool select_related.
+    :param live: If False, skip device queries and report power_state,
+    apm_level, and io_error_stats as None.
+    :return: disks, with resolved_props populated.
+    """
+    temp_name_map = get_byid_temp_name_map()
+    hdparm_settings = read_hdparm_settings()
+    power_info = {}
+    io_stats = {}
+    if live:
+        # Detached disks have no device to query, see get_disk_power_status().
+        power_info = get_disks_power_info(
+            [str(d.name) for d in disks if not re.match("detached-", d.name)]
+        )
+        # Pool.is_mounted reads the mount table: once per pool, not per disk.
+        pools = {}
+        for d in disks:
+            if d.pool is not None:
+                pools[d.pool.id] = d.pool
+        mounted_pool_ids = set()
+        for pool_id, pool in pools.items():
+            if pool.is_mounted:
+                mounted_pool_ids.add(pool_id)
+                io_stats.update(get_pool_io_error_stats(pool.mnt_pt))
+    for d in disks:
+        target_name = str(d.target_name)
+        d.resolved_props["temp_name"] = temp_name_map.get(target_name, target_name)
+        d.resolved_props["hdparm_setting"] = hdparm_settings.get(str(d.name))
+        if not live:
+            d.resolved_props["power_state"] = None
+            d.resolved_props["apm_level"] = None
+            d.resolved_props["io_error_stats"] = None
+            continue
+        power_state, apm_level = power_info.get(str(d.name), ("unknown", 0))
+        d.resolved_props["power_state"] = power_state
+        d.resolved_props["apm_level"] = apm_level
+        dev_stats = io_stats.get(os.path.realpath(get_device_path(target_name)))
+        if dev_stats is not None:
+            d.resolved_props["io_error_stats"] = json.dumps(dev_stats)
+        elif d.pool is not None and d.pool.id in mounted_pool_ids:
+            # Mounted pool member absent from its pool's stats: ask directly.
+            d.resolved_props["io_error_stats"] = get_dev_io_error_stats(target_name)
+        else:
+            d.resolved_props["io_error_stats"] = None
+    return disks
+
+
 class DiskMixin(object):
     serializer_class = DiskInfoSerializer
 
     @staticmethod
     @transaction.atomic
-    def _update_disk_state():
+    def _update_disk_state(live=True, changed=None):
         """
         A db atomic method to update the database of attached disks / drives.
         Works only on device serial numbers for drive identification.
@@ -99,10 +175,26 @@ class DiskMixin(object):
         marked as offline. All offline drives have their SMART availability and
         activation status removed and all attached drives have their SMART
         availability assessed and activated if available.
+        When passed the device names changed since a prior scan, ie as
+        flagged by udev events, only those devices and any no longer attached
+        are reconciled: saving db writes and SMART probes of unchanged drives.
+        :param live: passed to resolve_disk_props() for the returned disks.
+        :param changed: list of scan_disks() device names, ie '/dev/sdb', to
+        reconcile, or None for all devices.
         :return: serialized models of attached and missing disks via serial num
         """
         # Acquire a list (namedtupil collection) of attached drives > min size
         disks = scan_disks(settings.MIN_DISK_SIZE)
+        scanned_serials = [d.serial for d in disks]
+        if changed is not None:
+            # Fake serials are re-generated on each scan so always reconciled.
+            disks = [
+                d
+                for d in disks
+                if d.name in changed or re.match("fake-serial-", d.serial) is not None
+            ]
+        # Serials of db entries to be reconciled in this scan.
+        reconciled_serials = set(d.serial for d in disks)
         # Acquire a list of uuid's for currently unlocked LUKS containers.
         # Although we could tally these as we go by noting fstype crypt_LUKS
         # and then loop through our db Disks again updating all matching
@@ -144,9 +236,17 @@ class DiskMixin(object):
             # first encounter of this serial in the db so stash it for
             # reference
             serial_numbers_seen.append(deepcopy(do.serial))
+            if (
+                changed is not None
+                and do.serial not in reconciled_serials
+                and (do.offline or do.serial in scanned_serials)
+            ):
+                # Unchanged attached drive, or one already known as detached.
+                continue
+            reconciled_serials.add(do.serial)
             # Look for devices (by serial number) that are in the db but not in
             # our disk scan, ie offline / missing.
-            if do.serial not in [d.serial for d in disks]:
+            if do.serial not in scanned_serials:
                 # update the db entry as offline
                 do.offline = True
                 # disable S.M.A.R.T available and enabled flags.
@@ -423,7 +523,10 @@ class DiskMixin(object):
             # save our updated db disk object
             dob.save()
         # Update online db entries with S.M.A.R.T availability and status.
+        smart_disks = []
         for do in Disk.objects.all():
+            if do.serial not in reconciled_serials:
+                continue
             # find all the not offline db entries
             if not do.offline:
                 # We have an attached disk db entry.
@@ -445,21 +548,14 @@ class DiskMixin(object):
                     # Virtio disks (named virtio-*), md devices (named md-*),
                     # and an sdcard reader that provides devs named mmc-* have
                     # no smart capability so avoid cluttering logs with
-                    # exceptions on probing these with smart.available.
+                    # exceptions on probing these for S.M.A.R.T data.
                     # nvme not yet supported by CentOS 7 smartmontools:
                     # https://www.smartmontools.org/ticket/657
                     # Thanks to @snafu in rockstor forum post 1567 for this.
                     do.smart_available = do.smart_enabled = False
                     continue
-                # try to establish smart availability and status and update db
-                try:
-                    # for non ata/sata drives
-                    do.smart_available, do.smart_enabled = smart.available(
-                        do.name, do.smart_options
-                    )
-                except Exception as e:
-                    logger.exception(e)
-                    do.smart_available = do.smart_enabled = False
+                # smart availability and status are established below
+                smart_disks.append(do)
             else:  # We have offline / detached Disk db entries.
                 # Update detached disks previously know to a pool i.e. missing.
                 # After a reboot device name is lost and replaced by 'missing'
@@ -485,7 +581,18 @@ class DiskMixin(object):
                         do.devid = 0  # db default and int flag for None.
                         do.allocated = 0  # No devid_usage = no allocation.
             do.save()
-        ds = DiskInfoSerializer(Disk.objects.all().order_by("name"), many=True)
+        # Establish smart availability and status from each device's recent
+        # SMARTInfo: collected, concurrently, for those without.
+        smart_infos = refresh_smart_info(smart_disks)
+        for do in smart_disks:
+            do.smart_available, do.smart_enabled = smart_info_available(
+                smart_infos.get(do.id)
+            )
+            do.save()
+        disks = resolve_disk_props(
+            list(Disk.objects.select_related("pool").order_by("name")), live=live
+        )
+        ds = DiskInfoSerializer(disks, many=True)
         return Response(ds.data)
 
 
@@ -494,12 +601,27 @@ class DiskListView(DiskMixin, rfc.GenericView):
 
     def get_queryset(self, *args, **kwargs):
         with self._handle_exception(self.request):
-            return Disk.objects.all().order_by("name")
+            return Disk.objects.select_related("pool").order_by("name")
+
+    def get_serializer(self, *args, **kwargs):
+        # Resolve per device properties in bulk for the (paginated) list only.
+        if kwargs.get("many", False) and len(args) > 0:
+            args = (
+                resolve_disk_props(
+                    list(args[0]), live=live_props_requested(self.request)
+                ),
+            ) + args[1:]
+        return super(DiskListView, self).get_serializer(*args, **kwargs)
 
     def post(self, request, command, did=None):
         with self._handle_exception(request):
             if command == "scan":
-                return self._update_disk_state()
+                changed = None
+                if request.data is not None:
+                    changed = request.data.get("changed")
+                return self._update_disk_state(
+                    live=live_props_requested(request), changed=changed
+                )
 
         e_msg = "Unsupported command ({}).".format(command)
         handle_exception(Exception(e_msg), request)
@@ -800,6 +922,10 @@ class DiskDetailView(rfc.GenericView):
         custom_smart_options = str(request.data.get("smartcustom_options", ""))
         # strip leading and trailing white space chars before entry in db
         disk.smart_options = custom_smart_options.strip()
+        # Our cached SMARTInfo was collected with the prior options.
+        disk.smart_available, disk.smart_enabled = smart_info_available(
+            refresh_smart_info([disk], max_age=0).get(disk.id)
+        )
         disk.save()
         return Response(DiskInfoSerializer(disk).data)
 
@@ -854,8 +980,9 @@ class DiskDetailView(rfc.GenericView):
             po.save()
             enable_quota(po)
             import_shares(po, request)
+            inventory = SubvolInventory(po.mnt_pt)
             for share in Share.objects.filter(pool=po):
-                import_snapshots(share)
+                import_snapshots(share, inventory)
             return Response(DiskInfoSerializer(disk).data)
         except Exception as e:
             e_msg = (
@@ -1202,6 +1329,8 @@ class DiskDetailView(rfc.GenericView):
         smart.toggle_smart(disk.name, disk.smart_options, enable)
         disk.smart_enabled = enable
         disk.save()
+        # Our cached SMARTInfo predates this change.
+        refresh_smart_info([disk], max_age=0)
         return Response(DiskInfoSerializer(disk).data)
 
     @classmethod
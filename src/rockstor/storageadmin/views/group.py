@@ -25,7 +25,12 @@ from storageadmin.models import Group
 import rest_framework_custom as rfc
 from system.users import groupadd, groupdel
 import grp
-from ug_helpers import combined_groups
+from ug_helpers import (
+    catalog_delete_group,
+    catalog_group,
+    catalog_save_group,
+    combined_groups,
+)
 import logging
 from django.conf import settings
 
@@ -37,7 +42,7 @@ class GroupListView(rfc.GenericView):
 
     def get_queryset(self, *args, **kwargs):
         with self._handle_exception(self.request):
-            return combined_groups()
+            return combined_groups(prefix=self.request.query_params.get("prefix", None))
 
     @transaction.atomic
     def post(self, request):
@@ -59,23 +64,21 @@ class GroupListView(rfc.GenericView):
                 e_msg = "Groupname cannot be more than 30 characters long."
                 handle_exception(Exception(e_msg), request, status_code=400)
 
-            for g in combined_groups():
-                if g.groupname == groupname:
-                    e_msg = (
-                        "Group ({}) already exists. Choose a different one."
-                    ).format(g.groupname)
-                    handle_exception(Exception(e_msg), request, status_code=400)
-                if g.gid == gid:
-                    e_msg = ("GID ({}) already exists. Choose a different one.").format(
-                        gid
-                    )
-                    handle_exception(Exception(e_msg), request, status_code=400)
+            if catalog_group(groupname=groupname) is not None:
+                e_msg = ("Group ({}) already exists. Choose a different one.").format(
+                    groupname
+                )
+                handle_exception(Exception(e_msg), request, status_code=400)
+            if gid is not None and catalog_group(gid=gid) is not None:
+                e_msg = ("GID ({}) already exists. Choose a different one.").format(gid)
+                handle_exception(Exception(e_msg), request, status_code=400)
 
             groupadd(groupname, gid)
             grp_entries = grp.getgrnam(groupname)
             gid = grp_entries[2]
             group = Group(gid=gid, groupname=groupname, admin=admin)
             group.save()
+            catalog_save_group(groupname, gid)
 
             return Response(GroupSerializer(group).data)
 
@@ -157,19 +160,14 @@ class GroupDetailView(rfc.GenericView):
             if Group.objects.filter(groupname=groupname).exists():
                 g = Group.objects.get(groupname=groupname)
                 g.delete()
-            else:
-                found = False
-                for g in combined_groups():
-                    if g.groupname == groupname:
-                        found = True
-                        break
-                if found is False:
-                    e_msg = "Group ({}) does not exist.".format(groupname)
-                    handle_exception(Exception(e_msg), request)
+            elif catalog_group(groupname=groupname) is None:
+                e_msg = "Group ({}) does not exist.".format(groupname)
+                handle_exception(Exception(e_msg), request)
 
             try:
                 groupdel(groupname)
             except Exception as e:
                 handle_exception(e, request)
+            catalog_delete_group(groupname)
 
             return Response()
@@ -107,11 +107,11 @@ class PoolBalanceView(PoolMixin, rfc.GenericView):
                 return Response(PoolBalanceSerializer(ps).data)
             force = request.data.get("force", False)
             if PoolBalance.objects.filter(
-                pool=pool, status__regex=r"(started|running)"
+                pool=pool, status__regex=r"(started|running|paused)"
             ).exists():
                 if force:
                     p = PoolBalance.objects.filter(
-                        pool=pool, status__regex=r"(started|running)"
+                        pool=pool, status__regex=r"(started|running|paused)"
                     ).order_by("-id")[0]
                     p.status = "terminated"
                     p.save()
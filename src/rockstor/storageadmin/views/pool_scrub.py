@@ -23,7 +23,12 @@ from storageadmin.serializers import PoolScrubSerializer
 from storageadmin.models import Pool, PoolScrub
 import rest_framework_custom as rfc
 from fs.btrfs import scrub_start, scrub_status
-from datetime import timedelta
+from smart_manager.maintenance import scrub_ioprio_class
+from smart_manager.scrub_monitor import (
+    ACTIVE_SCRUB_STATES,
+    record_scrub_status,
+    scrub_is_stale,
+)
 
 import logging
 
@@ -52,17 +57,11 @@ class PoolScrubView(rfc.GenericView):
             ps = PoolScrub.objects.filter(pool=pool).order_by("-id")[0]
         except:
             return Response()
-        if ps.status == "started" or ps.status == "running":
-            cur_status = scrub_status(pool)
-            if (
-                cur_status["status"] == "finished"
-                or cur_status["status"] == "halted"
-                or cur_status["status"] == "cancelled"
-            ):
-                duration = int(cur_status["duration"])
-                cur_status["end_time"] = ps.start_time + timedelta(seconds=duration)
-                del cur_status["duration"]
-            PoolScrub.objects.filter(id=ps.id).update(**cur_status)
+        # Running scrubs are followed by data-collector's ScrubMonitor. We only
+        # read their status ourselves when it has not done so of late.
+        if ps.status in ACTIVE_SCRUB_STATES and scrub_is_stale(ps):
+            record_scrub_status(ps, scrub_status(pool))
+            ps = PoolScrub.objects.get(id=ps.id)
         return ps
 
     @transaction.atomic
@@ -78,11 +77,11 @@ class PoolScrubView(rfc.GenericView):
                 return Response(PoolScrubSerializer(ps).data)
             force = request.data.get("force", False)
             if PoolScrub.objects.filter(
-                pool=pool, status__regex=r"(started|running)"
+                pool=pool, status__regex=r"(started|running|paused)"
             ).exists():
                 if force:
                     p = PoolScrub.objects.filter(
-                        pool=pool, status__regex=r"(started|running)"
+                        pool=pool, status__regex=r"(started|running|paused)"
                     ).order_by("-id")[0]
                     p.status = "terminated"
                     p.save()
@@ -95,7 +94,9 @@ class PoolScrubView(rfc.GenericView):
                     ).format(pool.name)
                     handle_exception(Exception(e_msg), request)
 
-            scrub_pid = scrub_start(pool, force=force)
+            scrub_pid = scrub_start(
+                pool, force=force, ioprio_class=scrub_ioprio_class(pool)
+            )
             ps = PoolScrub(pool=pool, pid=scrub_pid)
             ps.save()
             return Response(PoolScrubSerializer(ps).data)
@@ -55,10 +55,25 @@ class SambaMixin(object):
     BOOL_OPTS = ("yes", "no")
 
     @staticmethod
-    def _restart_samba():
+    def _smb_exports():
+        # All our exports, with what their config requires.
+        return list(
+            SambaShare.objects.select_related("share").prefetch_related(
+                "admin_users", "sambacustomconfig_set"
+            )
+        )
+
+    @classmethod
+    def _refresh_samba(cls):
+        exports = cls._smb_exports()
+        changed = refresh_smb_config(exports)
+        refresh_smb_discovery(exports)
+        if len(changed) == 0:
+            return
         out = status()
         if out[2] == 0:
-            restart_samba(hard=True)
+            # Share changes only: no need to drop connected clients.
+            restart_samba(hard=False)
 
     @classmethod
     def _validate_input(cls, rdata, smbo=None):
@@ -151,9 +166,7 @@ class SambaListView(SambaMixin, ShareMixin, rfc.GenericView):
                 smb_share = self.create_samba_share(se)
         else:
             smb_share = self.create_samba_share(request.data)
-        refresh_smb_config(list(SambaShare.objects.all()))
-        refresh_smb_discovery(list(SambaShare.objects.all()))
-        self._restart_samba()
+        self._refresh_samba()
         return Response(SambaShareSerializer(smb_share).data)
 
     def create_samba_share(self, rdata):
@@ -212,9 +225,7 @@ class SambaDetailView(SambaMixin, rfc.GenericView):
             handle_exception(Exception(e_msg), request)
 
         with self._handle_exception(request):
-            refresh_smb_config(list(SambaShare.objects.all()))
-            refresh_smb_discovery(list(SambaShare.objects.all()))
-            self._restart_samba()
+            self._refresh_samba()
             return Response()
 
     @transaction.atomic
@@ -260,7 +271,5 @@ class SambaDetailView(SambaMixin, rfc.GenericView):
                             ).format(smb_o.share.name)
                             handle_exception(Exception(e_msg), request)
 
-            refresh_smb_config(list(SambaShare.objects.all()))
-            refresh_smb_discovery(list(SambaShare.objects.all()))
-            self._restart_samba()
+            self._refresh_samba()
             return Response(SambaShareSerializer(smbo).data)
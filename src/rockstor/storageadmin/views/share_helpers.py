@@ -16,9 +16,11 @@ You should have received a copy of the GNU General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 import re
+import time
 from datetime import datetime
 from django.utils.timezone import utc
 from django.conf import settings
+from django.db.models import F, Max
 from storageadmin.models import Share, Snapshot, SFTP
 from smart_manager.models import ShareUsage
 from fs.btrfs import (
@@ -29,6 +31,8 @@ from fs.btrfs import (
     shares_info,
     volume_usage,
     snaps_info,
+    subvol_inventory,
+    SubvolInventory,
     qgroup_create,
     update_quota,
     share_pqgroup_assign,
@@ -46,6 +50,92 @@ UPDATE_TS = False
 # The following model/db default setting is also used when quotas are disabled
 # or when a Read-only state prevents creation of a new pqgroup.
 PQGROUP_DEFAULT = settings.MODEL_DEFS["pqgroup"]
+# Seconds after which an incremental import redoes unchanged pools and subvols
+# regardless, to repair any db drift not caused by changes on disk.
+FULL_IMPORT_INTERVAL = 600
+
+
+class ImportGenerations(object):
+    """
+    Pool and subvol state (see SubvolInventory.fingerprint() and
+    subvol_state()) as of our last import of each. Lets an incremental import
+    skip pools, shares and snapshots whose btrfs generation and usage have not
+    moved on since. Held per process, another process simply redoes the work.
+    """
+
+    def __init__(self):
+        self.seen = {}
+
+    def unchanged(self, key, state):
+        seen = self.seen.get(key)
+        return (
+            seen is not None
+            and seen[1] == state
+            and time.time() - seen[0] < FULL_IMPORT_INTERVAL
+        )
+
+    def record(self, key, state):
+        self.seen[key] = (time.time(), state)
+
+
+import_generations = ImportGenerations()
+
+
+class ShareUsageBatch(object):
+    """
+    Collects the ShareUsage entries of a refresh, see update_shareusage_db(),
+    for writing as a single bulk insert and a single bulk update. Flushed on
+    exiting its context, ie:
+    with ShareUsageBatch() as usage:
+        import_shares(pool, request, usage=usage)
+    """
+
+    # Max names per query, within sqlite's 999 parameter limit.
+    chunk_size = 500
+
+    def __init__(self):
+        self.new_entries = []
+        self.ts_updates = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+    def add(self, subvol_name, rusage, eusage, new_entry=True):
+        if new_entry:
+            self.new_entries.append((subvol_name, rusage, eusage))
+        else:
+            self.ts_updates[subvol_name] = (rusage, eusage)
+
+    def flush(self):
+        ts = datetime.utcnow().replace(tzinfo=utc)
+        names = list(self.ts_updates)
+        for i in range(0, len(names), self.chunk_size):
+            latest = (
+                ShareUsage.objects.filter(name__in=names[i : i + self.chunk_size])
+                .values("name")
+                .annotate(latest_id=Max("id"))
+            )
+            latest_ids = {}
+            for entry in latest:
+                latest_ids[entry["name"]] = entry["latest_id"]
+                del self.ts_updates[entry["name"]]
+            ShareUsage.objects.filter(id__in=latest_ids.values()).update(
+                ts=ts, count=F("count") + 1
+            )
+        # Those with no prior entry to update get a new one.
+        for subvol_name, (rusage, eusage) in self.ts_updates.items():
+            self.new_entries.append((subvol_name, rusage, eusage))
+        ShareUsage.objects.bulk_create(
+            [
+                ShareUsage(name=subvol_name, r_usage=rusage, e_usage=eusage, ts=ts)
+                for subvol_name, rusage, eusage in self.new_entries
+            ]
+        )
+        self.new_entries = []
+        self.ts_updates = {}
 
 
 def helper_mount_share(share, mnt_pt=None):
@@ -88,12 +178,26 @@ def toggle_sftp_visibility(share, snap_name, snap_qgroup, on=True):
         umount_root(mnt_pt)
 
 
-def import_shares(pool, request):
+def import_shares(pool, request, incremental=False, usage=None):
+    if usage is None:
+        # Our own single bulk write of share usage.
+        with ShareUsageBatch() as usage:
+            return import_shares(pool, request, incremental, usage)
+    # Single pass inventory of the pool's subvols, qgroups and ro properties.
+    inventory = subvol_inventory(pool)
+    pool_key = ("shares", pool.id)
+    if (
+        incremental
+        and inventory is not None
+        and import_generations.unchanged(pool_key, inventory.fingerprint())
+    ):
+        logger.debug("Pool ({}) unchanged, skipping share import.".format(pool.name))
+        return
     # Establish known shares/subvols within our db for the given pool:
     shares_in_pool_db = [s.name for s in Share.objects.filter(pool=pool)]
     # Find the actual/current shares/subvols within the given pool:
     # Limited to Rockstor relevant subvols ie shares and clones.
-    shares_in_pool = shares_info(pool)
+    shares_in_pool = {} if inventory is None else shares_info(pool, inventory)
     # List of pool's share.pqgroups so we can remove inadvertent duplication.
     # All pqgroups are removed when quotas are disabled, combined with a part
     # refresh we could have duplicates within the db.
@@ -113,6 +217,15 @@ def import_shares(pool, request):
             logger.debug("Updating pre-existing same pool db share entry.")
             # We have a pool db share counterpart so retrieve and update it.
             share = Share.objects.get(name=s_in_pool, pool=pool)
+            subvol_key = ("subvol", pool.id, shares_in_pool[s_in_pool])
+            if incremental and import_generations.unchanged(
+                subvol_key,
+                inventory.subvol_state(shares_in_pool[s_in_pool], share.pqgroup),
+            ):
+                # Neither written to nor changed in usage since our last import.
+                if share.pool.quotas_enabled:
+                    share_pqgroups_used.append(deepcopy(share.pqgroup))
+                continue
             # Initially default our pqgroup value to db default of '-1/-1'
             # This way, unless quotas are enabled, all pqgroups will be
             # returned to db default.
@@ -144,7 +257,7 @@ def import_shares(pool, request):
                 share.save()
             share.qgroup = shares_in_pool[s_in_pool]
             rusage, eusage, pqgroup_rusage, pqgroup_eusage = volume_usage(
-                pool, share.qgroup, pqgroup
+                pool, share.qgroup, pqgroup, inventory
             )
             if (
                 rusage != share.rusage
@@ -156,10 +269,13 @@ def import_shares(pool, request):
                 share.eusage = eusage
                 share.pqgroup_rusage = pqgroup_rusage
                 share.pqgroup_eusage = pqgroup_eusage
-                update_shareusage_db(s_in_pool, rusage, eusage)
+                update_shareusage_db(s_in_pool, rusage, eusage, usage=usage)
             else:
-                update_shareusage_db(s_in_pool, rusage, eusage, UPDATE_TS)
+                update_shareusage_db(s_in_pool, rusage, eusage, UPDATE_TS, usage)
             share.save()
+            import_generations.record(
+                subvol_key, inventory.subvol_state(share.qgroup, share.pqgroup)
+            )
             continue
         try:
             logger.debug("No prior entries in scanned pool trying all pools.")
@@ -194,9 +310,11 @@ def import_shares(pool, request):
                     cshare.eusage,
                     cshare.pqgroup_rusage,
                     cshare.pqgroup_eusage,
-                ) = volume_usage(pool, cshare.qgroup, cshare.pqgroup)
+                ) = volume_usage(pool, cshare.qgroup, cshare.pqgroup, inventory)
                 cshare.save()
-                update_shareusage_db(s_in_pool, cshare.rusage, cshare.eusage)
+                update_shareusage_db(
+                    s_in_pool, cshare.rusage, cshare.eusage, usage=usage
+                )
         except Share.DoesNotExist:
             logger.debug("Db share entry does not exist - creating.")
             # We have a share on disk that has no db counterpart so create one.
@@ -219,7 +337,7 @@ def import_shares(pool, request):
                 update_quota(pool, pqid, pool.size * 1024)
                 qgroup_assign(qid, pqid, pool.mnt_pt)
             rusage, eusage, pqgroup_rusage, pqgroup_eusage = volume_usage(
-                pool, qid, pqid
+                pool, qid, pqid, inventory
             )
             nso = Share(
                 pool=pool,
@@ -235,12 +353,43 @@ def import_shares(pool, request):
                 replica=replica,
             )
             nso.save()
-            update_shareusage_db(s_in_pool, rusage, eusage)
+            update_shareusage_db(s_in_pool, rusage, eusage, usage=usage)
             mount_share(nso, "{}{}".format(settings.MNT_PT, s_in_pool))
+    if inventory is not None:
+        import_generations.record(pool_key, inventory.fingerprint())
 
 
-def import_snapshots(share):
-    snaps_d = snaps_info(share.pool.mnt_pt, share.name)
+def pool_inventory(pool, inventories):
+    """
+    Returns the SubvolInventory of pool from inventories, a dict indexed by
+    pool id, taking and adding one on first use. Allows the snapshots of all
+    shares in a pool to be imported from a single inventory.
+    """
+    if pool.id not in inventories:
+        inventories[pool.id] = SubvolInventory(pool.mnt_pt)
+    return inventories[pool.id]
+
+
+def import_snapshots(share, inventory=None, incremental=False, usage=None):
+    """
+    Update our db Snapshot entries for share to match those on disk.
+    :param share: Share object
+    :param inventory: SubvolInventory of share.pool, pass one when importing
+    the snapshots of several shares in the same pool.
+    :param incremental: skip the import if share.pool is unchanged since our
+    last import, and skip db updates of snapshots that are unchanged.
+    :param usage: ShareUsageBatch, pass one when importing the snapshots of
+    several shares.
+    """
+    if usage is None:
+        with ShareUsageBatch() as usage:
+            return import_snapshots(share, inventory, incremental, usage)
+    if inventory is None:
+        inventory = SubvolInventory(share.pool.mnt_pt)
+    share_key = ("snapshots", share.id)
+    if incremental and import_generations.unchanged(share_key, inventory.fingerprint()):
+        return
+    snaps_d = snaps_info(share.pool.mnt_pt, share.name, inventory)
     snaps = [s.name for s in Snapshot.objects.filter(share=share)]
     for s in snaps:
         if s not in snaps_d:
@@ -250,7 +399,11 @@ def import_snapshots(share):
             )
             Snapshot.objects.get(share=share, name=s).delete()
     for s in snaps_d:
+        subvol_key = ("subvol", share.pool.id, snaps_d[s][0])
+        subvol_state = inventory.subvol_state(snaps_d[s][0])
         if s in snaps:
+            if incremental and import_generations.unchanged(subvol_key, subvol_state):
+                continue
             so = Snapshot.objects.get(share=share, name=s)
         else:
             logger.debug(
@@ -264,17 +417,19 @@ def import_snapshots(share):
                 writable=snaps_d[s][1],
                 qgroup=snaps_d[s][0],
             )
-        rusage, eusage = volume_usage(share.pool, snaps_d[s][0])
+        rusage, eusage = volume_usage(share.pool, snaps_d[s][0], inventory=inventory)
         if rusage != so.rusage or eusage != so.eusage:
             so.rusage = rusage
             so.eusage = eusage
-            update_shareusage_db(s, rusage, eusage)
+            update_shareusage_db(s, rusage, eusage, usage=usage)
         else:
-            update_shareusage_db(s, rusage, eusage, UPDATE_TS)
+            update_shareusage_db(s, rusage, eusage, UPDATE_TS, usage)
         so.save()
+        import_generations.record(subvol_key, subvol_state)
+    import_generations.record(share_key, inventory.fingerprint())
 
 
-def update_shareusage_db(subvol_name, rusage, eusage, new_entry=True):
+def update_shareusage_db(subvol_name, rusage, eusage, new_entry=True, usage=None):
     """
     Creates a new share/subvol db usage entry, or updates an existing one with
     a new time stamp and count increment.
@@ -284,17 +439,11 @@ def update_shareusage_db(subvol_name, rusage, eusage, new_entry=True):
     :param eusage: Exclusive usage
     :param new_entry: If True create a new entry with the passed params,
     otherwise attempt to update the latest (by id) entry with time and count.
+    :param usage: ShareUsageBatch to defer our db write to, otherwise we
+    write immediately.
     """
-    ts = datetime.utcnow().replace(tzinfo=utc)
-    if new_entry:
-        su = ShareUsage(name=subvol_name, r_usage=rusage, e_usage=eusage, ts=ts)
-        su.save()
-    else:
-        try:
-            su = ShareUsage.objects.filter(name=subvol_name).latest("id")
-            su.ts = ts
-            su.count += 1
-        except ShareUsage.DoesNotExist:
-            su = ShareUsage(name=subvol_name, r_usage=rusage, e_usage=eusage, ts=ts)
-        finally:
-            su.save()
+    if usage is not None:
+        usage.add(subvol_name, rusage, eusage, new_entry)
+        return
+    with ShareUsageBatch() as usage:
+        usage.add(subvol_name, rusage, eusage, new_entry)
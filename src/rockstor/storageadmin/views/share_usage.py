@@ -0,0 +1,79 @@
+"""
+Copyright (c) 2012-2020 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from datetime import datetime, timedelta
+
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware, utc
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+import rest_framework_custom as rfc
+from smart_manager.metrics import share_usage_history
+from storageadmin.models import Share
+from storageadmin.util import handle_exception
+
+# Default history, in seconds, when t1 is not given.
+DEFAULT_RANGE = 7 * 86400
+DEFAULT_RESOLUTION = 3600
+
+
+class ShareUsageView(rfc.GenericView):
+    def _param_datetime(self, request, param, default):
+        value = request.query_params.get(param, None)
+        if value is None:
+            return default
+        dt = parse_datetime(value)
+        if dt is None:
+            e_msg = "Invalid {} ({}), an ISO 8601 date/time is expected.".format(
+                param, value
+            )
+            handle_exception(Exception(e_msg), request)
+        if is_naive(dt):
+            dt = make_aware(dt, utc)
+        return dt
+
+    def get(self, request, sid, *args, **kwargs):
+        """
+        Usage history of a share, downsampled to one entry per 'resolution'
+        seconds over t1 to t2 (ISO 8601), defaulting to hourly for the last
+        week.
+        """
+        with self._handle_exception(request):
+            try:
+                share = Share.objects.get(id=sid)
+            except Share.DoesNotExist:
+                raise NotFound(detail=None)
+            t2 = self._param_datetime(
+                request, "t2", datetime.utcnow().replace(tzinfo=utc)
+            )
+            t1 = self._param_datetime(
+                request, "t1", t2 - timedelta(seconds=DEFAULT_RANGE)
+            )
+            resolution = request.query_params.get("resolution", DEFAULT_RESOLUTION)
+            try:
+                resolution = int(resolution)
+                if resolution < 1:
+                    raise ValueError()
+            except ValueError:
+                e_msg = (
+                    "Invalid resolution ({}), a positive number of seconds "
+                    "is expected."
+                ).format(resolution)
+                handle_exception(Exception(e_msg), request)
+            return Response(share_usage_history(share.subvol_name, t1, t2, resolution))
@@ -0,0 +1,376 @@
+"""
+Copyright (c) 2012-2021 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import math
+import re
+from datetime import datetime, timedelta
+from multiprocessing.pool import ThreadPool
+from django.utils.timezone import utc
+from storageadmin.models import (
+    Disk,
+    SMARTAttributeHistory,
+    SMARTInfo,
+    SMARTAttribute,
+    SMARTCapability,
+    SMARTErrorLog,
+    SMARTErrorLogSummary,
+    SMARTTestLog,
+    SMARTTestLogDetail,
+    SMARTIdentity,
+)
+from system.smart import collect
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds for which a disk's latest SMARTInfo stands in for a fresh
+# collection, ie when establishing SMART availability on each disk scan.
+SMART_INFO_TTL = 6 * 3600
+# SMARTInfo snapshots kept per disk, the oldest being deleted as each is saved.
+SMART_INFO_RETAIN = 3
+# Concurrent smartctl invocations: bounded so as not to saturate an HBA.
+SMART_MAX_WORKERS = 8
+# Failure indicative SMART attributes, by id, with their risk score weight.
+# After the attributes most correlated with drive failure in Backblaze's
+# published drive statistics.
+RISK_ATTRIBUTES = {
+    5: 4,  # Reallocated_Sector_Ct
+    10: 2,  # Spin_Retry_Count
+    187: 4,  # Reported_Uncorrect
+    188: 1,  # Command_Timeout
+    196: 2,  # Reallocated_Event_Count
+    197: 4,  # Current_Pending_Sector
+    198: 4,  # Offline_Uncorrectable
+    199: 1,  # UDMA_CRC_Error_Count
+}
+# Days over which the growth of an attribute's raw value is assessed.
+RISK_WINDOW_DAYS = 30
+RISK_MAX = 100
+
+
+def save_smart_info(disk, smart_data):
+    """
+    Store the SMART data of a disk, as returned by system.smart.collect(), as
+    a new SMARTInfo with its related SMARTAttribute etc entries. Only the
+    latest SMART_INFO_RETAIN SMARTInfo of the disk are kept.
+    :param disk: Disk object.
+    :param smart_data: dictionary as returned by collect().
+    :return: SMARTInfo object.
+    """
+    attributes = smart_data["extended_info"]
+    cap = smart_data["capabilities"]
+    e_summary, e_lines = smart_data["error_logs"]
+    smartid = smart_data["info"]
+    test_d, log_lines = smart_data["test_logs"]
+    ts = datetime.utcnow().replace(tzinfo=utc)
+    si = SMARTInfo(disk=disk, toc=ts)
+    si.save()
+    SMARTAttribute.objects.bulk_create(
+        [
+            SMARTAttribute(
+                info=si,
+                aid=t[0],
+                name=t[1],
+                flag=t[2],
+                normed_value=t[3],
+                worst=t[4],
+                threshold=t[5],
+                atype=t[6],
+                updated=t[7],
+                failed=t[8],
+                raw_value=t[9],
+            )
+            for t in [attributes[k] for k in sorted(attributes.keys(), reverse=True)]
+        ]
+    )
+    SMARTCapability.objects.bulk_create(
+        [
+            SMARTCapability(info=si, name=c, flag=cap[c][0], capabilities=cap[c][1])
+            for c in sorted(cap.keys(), reverse=True)
+        ]
+    )
+    SMARTErrorLogSummary.objects.bulk_create(
+        [
+            SMARTErrorLogSummary(
+                info=si,
+                error_num=enum,
+                lifetime_hours=e_summary[enum][0],
+                state=e_summary[enum][1],
+                etype=e_summary[enum][2],
+                details=e_summary[enum][3],
+            )
+            for enum in sorted(e_summary.keys(), key=int, reverse=True)
+        ]
+    )
+    SMARTErrorLog.objects.bulk_create([SMARTErrorLog(info=si, line=l) for l in e_lines])
+    test_logs = []
+    for tnum in sorted(test_d.keys()):
+        t = test_d[tnum]
+        tlen = len(t)
+        if tlen < 5:
+            [t.append("") for i in range(tlen, 5)]
+        for i in range(2, 4):
+            try:
+                t[i] = int(t[i])
+            except:
+                t[i] = -1
+        test_logs.append(
+            SMARTTestLog(
+                info=si,
+                test_num=tnum,
+                description=t[0],
+                status=t[1],
+                pct_completed=t[2],
+                lifetime_hours=t[3],
+                lba_of_first_error=t[4],
+            )
+        )
+    SMARTTestLog.objects.bulk_create(test_logs)
+    SMARTTestLogDetail.objects.bulk_create(
+        [SMARTTestLogDetail(info=si, line=l) for l in log_lines]
+    )
+    update_smart_risk(disk, smart_data, ts)
+    SMARTIdentity(
+        info=si,
+        model_family=smartid[0],
+        device_model=smartid[1],
+        serial_number=smartid[2],
+        world_wide_name=smartid[3],
+        firmware_version=smartid[4],
+        capacity=smartid[5],
+        sector_size=smartid[6],
+        rotation_rate=smartid[7],
+        in_smartdb=smartid[8],
+        ata_version=smartid[9],
+        sata_version=smartid[10],
+        scanned_on=smartid[11],
+        supported=smartid[12],
+        enabled=smartid[13],
+        version=smartid[14],
+        assessment=smartid[15],
+    ).save()
+    prune_smart_info(disk)
+    return si
+
+
+def prune_smart_info(disk, retain=SMART_INFO_RETAIN):
+    """
+    Delete all but the latest retain SMARTInfo of a disk, and their related
+    SMARTAttribute etc entries.
+    """
+    stale = SMARTInfo.objects.filter(disk=disk).order_by("-toc", "-id")
+    stale = list(stale.values_list("id", flat=True)[retain:])
+    for i in range(0, len(stale), 500):
+        SMARTInfo.objects.filter(id__in=stale[i : i + 500]).delete()
+
+
+def update_smart_risk(disk, smart_data, ts):
+    """
+    Extend the attribute history of a disk with its SMART data, as returned
+    by system.smart.collect(), and update its smart_risk score accordingly.
+    :param disk: Disk object.
+    :param smart_data: dictionary as returned by collect().
+    :param ts: datetime of the collection.
+    """
+    attributes = smart_data["extended_info"]
+    failing = "FAILED" in smart_data["info"][15] or any(
+        t[8] == "FAILING_NOW" for t in attributes.values()
+    )
+    record_smart_history(disk, attributes, ts)
+    disk.smart_risk = smart_risk(disk, failing=failing, now=ts)[0]
+    Disk.objects.filter(id=disk.id).update(smart_risk=disk.smart_risk)
+
+
+def _raw_value(raw_value):
+    # ie "0", "12", or "40 (Min/Max 18/46)"
+    match = re.match(r"\d+", raw_value)
+    if match is None:
+        return 0
+    return int(match.group())
+
+
+def record_smart_history(disk, attributes, ts):
+    """
+    Add the RISK_ATTRIBUTES of the given SMART attributes to their history
+    where changed since their last entry.
+    :param disk: Disk object.
+    :param attributes: dictionary as returned by smart.extended_info().
+    :param ts: datetime of the attribute's collection.
+    """
+    last = {}
+    for h in SMARTAttributeHistory.objects.filter(
+        disk=disk, aid__in=list(RISK_ATTRIBUTES.keys())
+    ).order_by("ts"):
+        last[h.aid] = h
+    entries = []
+    for t in attributes.values():
+        try:
+            aid = int(t[0])
+            normed_value = int(t[3])
+        except ValueError:
+            continue
+        if aid not in RISK_ATTRIBUTES:
+            continue
+        raw_value = _raw_value(t[9])
+        prior = last.get(aid)
+        if (
+            prior is not None
+            and prior.raw_value == raw_value
+            and prior.normed_value == normed_value
+        ):
+            continue
+        entries.append(
+            SMARTAttributeHistory(
+                disk=disk,
+                aid=aid,
+                name=t[1],
+                normed_value=normed_value,
+                raw_value=raw_value,
+                ts=ts,
+            )
+        )
+    SMARTAttributeHistory.objects.bulk_create(entries)
+
+
+def smart_risk(disk, failing=False, now=None):
+    """
+    Failure risk score of a disk from the level, and growth over the last
+    RISK_WINDOW_DAYS, of the raw values of its RISK_ATTRIBUTES. Each scores
+    weight * (log2(1 + raw value) + 2 * log2(1 + growth)), capped in sum at
+    RISK_MAX. Growth is weighted over level as a steadily rising count of
+    ie pending sectors is a stronger predictor than a static one.
+    :param disk: Disk object.
+    :param failing: True if the disk currently fails its overall health
+    assessment, or an attribute is failing now: scoring RISK_MAX.
+    :param now: datetime, defaults to utcnow.
+    :return: tuple of score (None if the disk has no attribute history) and
+    dictionary, indexed by attribute name, of dictionaries of raw_value,
+    growth, and since (datetime from which growth is assessed).
+    """
+    if now is None:
+        now = datetime.utcnow().replace(tzinfo=utc)
+    window_start = now - timedelta(days=RISK_WINDOW_DAYS)
+    current = {}
+    baseline = {}
+    for h in SMARTAttributeHistory.objects.filter(
+        disk=disk, ts__lte=now, aid__in=list(RISK_ATTRIBUTES.keys())
+    ).order_by("ts"):
+        # Value as at window start, or our earliest if later.
+        if h.aid not in baseline or h.ts <= window_start:
+            baseline[h.aid] = h
+        current[h.aid] = h
+    if len(current) == 0:
+        return (RISK_MAX if failing else None), {}
+    score = 0.0
+    details = {}
+    for aid, h in current.items():
+        growth = max(h.raw_value - baseline[aid].raw_value, 0)
+        score += RISK_ATTRIBUTES[aid] * (
+            math.log(1 + h.raw_value, 2) + 2 * math.log(1 + growth, 2)
+        )
+        details[h.name] = {
+            "raw_value": h.raw_value,
+            "growth": growth,
+            "since": max(baseline[aid].ts, window_start),
+        }
+    if failing:
+        score = RISK_MAX
+    return int(round(min(score, RISK_MAX))), details
+
+
+def _collect(disk):
+    try:
+        return collect(disk.name, disk.smart_options, notify=False)
+    except Exception as e:
+        logger.error(
+            "Exception while collecting S.M.A.R.T data of disk ({}): {}".format(
+                disk.name, e.__str__()
+            )
+        )
+        return None
+
+
+def _collect_all(disks, max_workers):
+    """
+    :return: list of the _collect() results of disks, in order.
+    """
+    if len(disks) == 0:
+        return []
+    pool = ThreadPool(min(max_workers, len(disks)))
+    try:
+        return pool.map(_collect, disks)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def refresh_smart_info(disks, max_age=SMART_INFO_TTL, max_workers=SMART_MAX_WORKERS):
+    """
+    Latest SMARTInfo of each of the given disks: collecting, concurrently,
+    for those with none younger than max_age seconds.
+    :param disks: list of Disk objects.
+    :param max_age: seconds, 0 to collect afresh for all disks.
+    :param max_workers: upper limit on concurrent smartctl invocations.
+    :return: dictionary of SMARTInfo objects indexed by disk id. Disks whose
+    SMART data could not be collected are absent.
+    """
+    infos = {}
+    if max_age > 0:
+        since = datetime.utcnow().replace(tzinfo=utc) - timedelta(seconds=max_age)
+        for si in SMARTInfo.objects.filter(disk__in=disks, toc__gte=since).order_by(
+            "toc"
+        ):
+            infos[si.disk_id] = si
+    stale = [d for d in disks if d.id not in infos]
+    # Db writes are left to our own thread.
+    for disk, data in zip(stale, _collect_all(stale, max_workers)):
+        if data is not None:
+            infos[disk.id] = save_smart_info(disk, data)
+    return infos
+
+
+def sample_smart_history(disks, max_workers=SMART_MAX_WORKERS):
+    """
+    Collect, concurrently, the SMART data of the given disks to extend their
+    attribute history and update their smart_risk: see update_smart_risk().
+    Unlike refresh_smart_info() no SMARTInfo is saved.
+    :param disks: list of Disk objects.
+    :param max_workers: upper limit on concurrent smartctl invocations.
+    :return: list of the disks sampled.
+    """
+    ts = datetime.utcnow().replace(tzinfo=utc)
+    sampled = []
+    for disk, data in zip(disks, _collect_all(disks, max_workers)):
+        if data is not None:
+            update_smart_risk(disk, data, ts)
+            sampled.append(disk)
+    return sampled
+
+
+def smart_info_available(si):
+    """
+    SMART availability and status from a SMARTInfo, as per smart.available().
+    :param si: SMARTInfo object or None.
+    :return: available (boolean), enabled (boolean)
+    """
+    if si is None:
+        return False, False
+    identity = si.identity()
+    if identity is None:
+        return False, False
+    return identity.supported != "", identity.enabled != ""
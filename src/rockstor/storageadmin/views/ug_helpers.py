@@ -1,5 +1,5 @@
 """
-Copyright (c) 2012-2020 RockStor, Inc. <http://rockstor.com>
+Copyright (c) 2012-2021 RockStor, Inc. <http://rockstor.com>
 This file is part of RockStor.
 
 RockStor is free software; you can redistribute it and/or modify
@@ -16,93 +16,412 @@ You should have received a copy of the GNU General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
+import fcntl
+import threading
+import time
+from datetime import datetime
+from django.db import transaction
+from django.utils.timezone import utc
+from django_ztask.decorators import task
 from storageadmin.models import (
     User,
     Group,
+    DirectoryUser,
+    DirectoryGroup,
+    DirectorySync,
 )
-from system.users import get_users, get_groups
-from system.pinmanager import pincard_states
+from system.users import enumerate_users, get_groups
+from system.pinmanager import pincard_holders, pincard_states
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Seconds after which the user and group catalogs are refreshed, in the
+# background, from the system (passwd/group) and directory service databases.
+CATALOG_TTL = 300
+# Seconds between queued refreshes of a catalog never yet refreshed.
+CATALOG_SEED_INTERVAL = 30
+# Serializes catalog refreshes across processes, see sync_catalog().
+CATALOG_LOCK = "/var/run/rockstor-ug-catalog.lock"
+# Rows per catalog bulk insert or delete, and per page lookup query.
+CATALOG_BATCH = 500
+USER_FIELDS = ("sort_name", "uid", "gid", "shell", "groupname")
+GROUP_FIELDS = ("sort_name", "gid")
 
-def combined_users():
-    users = []
-    sys_users = get_users()
-    uname_list = sys_users.keys()
-    for u in uname_list:
-        try:
-            uo = User.objects.get(username=u)
-            uo.uid = sys_users[u][0]
-            uo.gid = sys_users[u][1]
-            uo.shell = sys_users[u][2]
-            gname = get_groups(uo.gid).keys()[0]
-            create = True
-            if uo.group is not None:
-                if uo.group.gid == uo.gid or uo.group.groupname == gname:
-                    uo.group.groupname = gname
-                    uo.group.gid = uo.gid
-                    uo.group.save()
-                    create = False
-            if create:
+_last_request = [0]
+_request_lock = threading.Lock()
+
+
+def _chunks(items, size=CATALOG_BATCH):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def _sync_catalog(model, key, fields, wanted, complete=True):
+    """
+    Bring a catalog table in line with wanted, writing only what differs.
+    :param model: DirectoryUser or DirectoryGroup.
+    :param key: name of model's unique name field.
+    :param fields: names of the remaining fields, bar id.
+    :param wanted: dict of fields value tuples by key value.
+    :param complete: False if wanted may be missing entries, ie from an
+    abandoned enumeration: entries not in wanted are then kept.
+    :return: (created, updated, deleted) counts.
+    """
+    stale = []
+    changed = []
+    for row in model.objects.values_list("id", key, *fields).iterator():
+        values = wanted.pop(row[1], None)
+        if values is None:
+            if complete:
+                stale.append(row[0])
+        elif tuple(values) != tuple(row[2:]):
+            changed.append((row[0], values))
+    for pk, values in changed:
+        model.objects.filter(id=pk).update(**dict(zip(fields, values)))
+    for ids in _chunks(stale):
+        model.objects.filter(id__in=ids).delete()
+    # What remains is new.
+    model.objects.bulk_create(
+        [
+            model(**dict(zip((key,) + fields, (k,) + tuple(v))))
+            for k, v in wanted.items()
+        ],
+        batch_size=CATALOG_BATCH,
+    )
+    return len(wanted), len(changed), len(stale)
+
+
+def _mark_synced(name):
+    DirectorySync.objects.update_or_create(
+        name=name, defaults={"synced": datetime.utcnow().replace(tzinfo=utc)}
+    )
+
+
+def _update_user(uo, uid, gid, shell, gname):
+    """
+    Bring a managed User, and its primary Group, in line with the system.
+    :param gname: name of the group gid, or None if unknown.
+    """
+    if (uo.uid, uo.gid, uo.shell) == (uid, gid, shell) and (
+        gname is None
+        or (uo.group is not None and (uo.group.gid, uo.group.groupname) == (gid, gname))
+    ):
+        return
+    uo.uid = uid
+    uo.gid = gid
+    uo.shell = shell
+    if gname is not None:
+        create = True
+        if uo.group is not None:
+            if uo.group.gid == uo.gid or uo.group.groupname == gname:
+                uo.group.groupname = gname
+                uo.group.gid = uo.gid
+                uo.group.save()
+                create = False
+        if create:
+            try:
+                go = Group.objects.get(groupname=gname)
+                go.gid = uo.gid
+                go.save()
+                uo.group = go
+            except Group.DoesNotExist:
                 try:
-                    go = Group.objects.get(groupname=gname)
-                    go.gid = uo.gid
+                    go = Group.objects.get(gid=uo.gid)
+                    go.groupname = gname
                     go.save()
                     uo.group = go
                 except Group.DoesNotExist:
-                    try:
-                        go = Group.objects.get(gid=uo.gid)
-                        go.groupname = gname
-                        go.save()
-                        uo.group = go
-                    except Group.DoesNotExist:
-                        go = Group(groupname=gname, gid=uo.gid)
-                        go.save()
-                        uo.group = go
-            uo.save()
-            uo.pincard_allowed, uo.has_pincard = pincard_states(uo)
-            users.append(uo)
+                    go = Group(groupname=gname, gid=uo.gid)
+                    go.save()
+                    uo.group = go
+    uo.save()
 
-        except User.DoesNotExist:
-            temp_uo = User(
-                username=u,
-                uid=sys_users[u][0],
-                gid=sys_users[u][1],
-                shell=sys_users[u][2],
-                admin=False,
-            )
-            temp_uo.managed_user = False
-            temp_uo.pincard_allowed, temp_uo.has_pincard = pincard_states(
-                temp_uo
-            )  # noqa E501
-            users.append(temp_uo)
-
-    for u in User.objects.all():
-        if u.username not in uname_list:
-            users.append(u)
-    return sorted(
-        users, cmp=lambda x, y: cmp(x.username.lower(), y.username.lower())  # noqa F821
-    )
 
+@transaction.atomic
+def sync_groups(sys_groups=None):
+    """
+    Refresh the group catalog from the system groups, updating the gid of
+    our managed Groups as we go. Managed Groups unknown to the system are
+    retained.
+    :param sys_groups: get_groups() result, fetched if None.
+    :return: (created, updated, deleted) catalog entry counts.
+    """
+    if sys_groups is None:
+        sys_groups = get_groups()
+    wanted = {g: (g.lower(), gid) for g, gid in sys_groups.items()}
+    for go in Group.objects.all():
+        if go.groupname in sys_groups:
+            if go.gid != sys_groups[go.groupname]:
+                go.gid = sys_groups[go.groupname]
+                go.save()
+        elif go.groupname is not None:
+            wanted[go.groupname] = (go.groupname.lower(), go.gid)
+    counts = _sync_catalog(DirectoryGroup, "groupname", GROUP_FIELDS, wanted)
+    _mark_synced("groups")
+    return counts
+
+
+@transaction.atomic
+def sync_users(sys_users=None, sys_groups=None):
+    """
+    Refresh the user catalog from the system users, updating the uid, gid,
+    shell, and primary Group of our managed Users as we go. Managed Users
+    unknown to the system are retained.
+    Should enumeration of the system users be incomplete, ie time out with a
+    slow directory service, no catalog entries are deleted.
+    :param sys_users: enumerate_users() result, fetched if None.
+    :param sys_groups: get_groups() result, fetched if None.
+    :return: (created, updated, deleted) catalog entry counts.
+    """
+    if sys_users is None:
+        sys_users = enumerate_users()
+    sys_users, complete = sys_users
+    if sys_groups is None:
+        sys_groups = get_groups()
+    gnames = {gid: g for g, gid in sys_groups.items()}
+    wanted = {}
+    for uo in User.objects.select_related("group"):
+        if uo.username in sys_users:
+            uid, gid, shell = sys_users[uo.username]
+            gname = gnames.get(gid)
+            if gname is None:
+                # Not enumerated, ie a directory service group.
+                try:
+                    gname = get_groups(gid).keys()[0]
+                    gnames[gid] = gname
+                except KeyError:
+                    pass
+            _update_user(uo, uid, gid, shell, gname)
+        else:
+            gname = None if uo.group is None else uo.group.groupname
+            wanted[uo.username] = (uo.username.lower(), uo.uid, uo.gid, uo.shell, gname)
+    for u, (uid, gid, shell) in sys_users.items():
+        wanted[u] = (u.lower(), uid, gid, shell, gnames.get(gid))
+    counts = _sync_catalog(DirectoryUser, "username", USER_FIELDS, wanted, complete)
+    _mark_synced("users")
+    return counts
+
+
+def sync_catalog():
+    """
+    Refresh both catalogs unless refreshed within CATALOG_TTL. Serialized
+    across processes, waiting on any refresh in progress, as concurrent
+    refreshes would each insert the same new entries.
+    :return: True if refreshed.
+    """
+    with open(CATALOG_LOCK, "w") as lfo:
+        fcntl.flock(lfo, fcntl.LOCK_EX)
+        age = _catalog_age()
+        if age is not None and age < CATALOG_TTL:
+            return False
+        sys_groups = get_groups()
+        sync_groups(sys_groups)
+        sync_users(sys_groups=sys_groups)
+        return True
+
+
+def _catalog_age():
+    """
+    :return: seconds since the least recent catalog refresh, or None if a
+    catalog has never been refreshed.
+    """
+    synced = DirectorySync.objects.filter(name__in=("users", "groups"))
+    synced = list(synced.values_list("synced", flat=True))
+    if len(synced) < 2:
+        return None
+    age = datetime.utcnow().replace(tzinfo=utc) - min(synced)
+    return age.total_seconds()
+
+
+@task()
+def refresh_catalog():
+    # Queued by each web server process: skipped if already refreshed since.
+    sync_catalog()
+
+
+def ensure_catalog(wait=False):
+    """
+    Queue a background refresh (refresh_catalog()) of catalogs older than
+    CATALOG_TTL: at most once per CATALOG_TTL per process, or per
+    CATALOG_SEED_INTERVAL if never refreshed, as is the case after install
+    until the refresh queued by bootstrap completes.
+    :param wait: refresh here and now if never refreshed: for lookups that
+    must not miss existing users or groups, ie checks for duplicates.
+    """
+    age = _catalog_age()
+    if age is None and wait:
+        sync_catalog()
+        return
+    if age is not None and age < CATALOG_TTL:
+        return
+    interval = CATALOG_TTL if age is not None else CATALOG_SEED_INTERVAL
+    with _request_lock:
+        now = time.time()
+        if now - _last_request[0] < interval:
+            return
+        _last_request[0] = now
+    try:
+        refresh_catalog.async()
+    except Exception as e:
+        logger.error("Failed to queue catalog refresh: {}".format(e.__str__()))
+
+
+class CatalogList(object):
+    """
+    Sequence over a catalog queryset, each slice taken being built into its
+    User or Group instances by build(). Allows pagination of the catalog
+    without building, or even fetching, more than the requested page.
+    """
+
+    def __init__(self, qs, build):
+        self.qs = qs
+        self.build = build
 
-def combined_groups():
+    def count(self):
+        return self.qs.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return self.build(list(self.qs[k]))
+        return self.build([self.qs[k]])[0]
+
+    def __iter__(self):
+        for entries in _chunks(self.qs.iterator()):
+            for o in self.build(entries):
+                yield o
+
+
+def _build_users(entries):
+    """
+    Our managed User for each catalog entry if there is one, else a
+    transient, unmanaged, User.
+    """
+    users = []
+    for chunk in _chunks(entries):
+        managed = {
+            uo.username: uo
+            for uo in User.objects.filter(
+                username__in=[e.username for e in chunk]
+            ).select_related("group")
+        }
+        holders = pincard_holders([e.uid for e in chunk])
+        for e in chunk:
+            uo = managed.get(e.username)
+            if uo is None:
+                uo = User(
+                    username=e.username,
+                    uid=e.uid,
+                    gid=e.gid,
+                    shell=e.shell,
+                    admin=False,
+                )
+                uo.managed_user = False
+                uo.primary_groupname = e.groupname
+            uo.pincard_allowed, uo.has_pincard = pincard_states(uo, holders)
+            users.append(uo)
+    return users
+
+
+def _build_groups(entries):
     groups = []
-    sys_groups = get_groups()
-    gname_list = sys_groups.keys()
-    for g in gname_list:
-        try:
-            go = Group.objects.get(groupname=g)
-            go.gid = sys_groups[g]
-            go.save()
+    for chunk in _chunks(entries):
+        managed = {
+            go.groupname: go
+            for go in Group.objects.filter(groupname__in=[e.groupname for e in chunk])
+        }
+        for e in chunk:
+            go = managed.get(e.groupname)
+            if go is None:
+                go = Group(groupname=e.groupname, gid=e.gid)
             groups.append(go)
-        except Group.DoesNotExist:
-            groups.append(Group(groupname=g, gid=sys_groups[g]))
-    for g in Group.objects.all():
-        if g.groupname not in gname_list:
-            groups.append(g)
-    return sorted(
-        groups,
-        cmp=lambda x, y: cmp(x.groupname.lower(), y.groupname.lower()),  # noqa F821
+    return groups
+
+
+def combined_users(prefix=None):
+    """
+    System, including directory service, users and our managed Users, in
+    case insensitive name order: as at the last catalog refresh, any due
+    refresh being left to the background.
+    :param prefix: optional case insensitive username prefix filter.
+    :return: CatalogList of User instances.
+    """
+    ensure_catalog()
+    qs = DirectoryUser.objects.all()
+    if prefix:
+        qs = qs.filter(sort_name__startswith=prefix.lower())
+    return CatalogList(qs.order_by("sort_name", "username"), _build_users)
+
+
+def combined_groups(prefix=None):
+    """
+    As per combined_users() but for groups.
+    :return: CatalogList of Group instances.
+    """
+    ensure_catalog()
+    qs = DirectoryGroup.objects.all()
+    if prefix:
+        qs = qs.filter(sort_name__startswith=prefix.lower())
+    return CatalogList(qs.order_by("sort_name", "groupname"), _build_groups)
+
+
+def catalog_user(username=None, uid=None):
+    """
+    :return: the DirectoryUser entry by username, else by uid, or None.
+    """
+    ensure_catalog(wait=True)
+    if username is not None:
+        return DirectoryUser.objects.filter(username=username).first()
+    return DirectoryUser.objects.filter(uid=uid).first()
+
+
+def catalog_group(groupname=None, gid=None):
+    """
+    :return: the DirectoryGroup entry by groupname, else by gid, or None.
+    """
+    ensure_catalog(wait=True)
+    if groupname is not None:
+        return DirectoryGroup.objects.filter(groupname=groupname).first()
+    return DirectoryGroup.objects.filter(gid=gid).first()
+
+
+def combined_user(username):
+    """
+    :return: User instance, as per combined_users(), for username or None.
+    """
+    entry = catalog_user(username=username)
+    if entry is None:
+        return None
+    return _build_users([entry])[0]
+
+
+def catalog_save_user(username, uid, gid, shell, groupname):
+    # Reflect a user add or edit ahead of the next catalog refresh.
+    DirectoryUser.objects.update_or_create(
+        username=username,
+        defaults={
+            "sort_name": username.lower(),
+            "uid": uid,
+            "gid": gid,
+            "shell": shell,
+            "groupname": groupname,
+        },
     )
+
+
+def catalog_save_group(groupname, gid):
+    DirectoryGroup.objects.update_or_create(
+        groupname=groupname, defaults={"sort_name": groupname.lower(), "gid": gid}
+    )
+
+
+def catalog_delete_user(username):
+    DirectoryUser.objects.filter(username=username).delete()
+
+
+def catalog_delete_group(groupname):
+    DirectoryGroup.objects.filter(groupname=groupname).delete()
@@ -29,7 +29,16 @@ from system.users import useradd, usermod, userdel, smbpasswd, add_ssh_key, upda
 import pwd
 from system.pinmanager import username_to_uid, flush_pincard
 from system.ssh import is_pub_key
-from ug_helpers import combined_users, combined_groups
+from ug_helpers import (
+    catalog_delete_group,
+    catalog_delete_user,
+    catalog_group,
+    catalog_save_group,
+    catalog_save_user,
+    catalog_user,
+    combined_user,
+    combined_users,
+)
 import logging
 import re
 
@@ -131,7 +140,7 @@ class UserMixin(object):
 class UserListView(UserMixin, rfc.GenericView):
     def get_queryset(self, *args, **kwargs):
         with self._handle_exception(self.request):
-            return combined_users()
+            return combined_users(prefix=self.request.query_params.get("prefix", None))
 
     @transaction.atomic
     def post(self, request):
@@ -148,32 +157,29 @@ class UserListView(UserMixin, rfc.GenericView):
             ):
 
                 handle_exception(Exception(e_msg), request, status_code=400)
-            users = combined_users()
-            groups = combined_groups()
             # As we have not yet established a pre-existing group, set to None.
             admin_group = None
             if invar["group"] is not None:
                 # We have a group setting so search for existing group name
                 # match. Matching by group name has precedence over gid.
-                for g in groups:
-                    if g.groupname == invar["group"]:
-                        # We have an existing group name match in invar
-                        # so overwrite requested gid to match existing gid.
-                        invar["gid"] = g.gid
-                        # Set the admin_group to our existing group object.
-                        admin_group = g
-                        admin_group.save()
-                        invar["group"] = g  # exchange name for db group item.
-                        break
+                g = catalog_group(groupname=invar["group"])
+                if g is not None:
+                    # We have an existing group name match in invar
+                    # so overwrite requested gid to match existing gid.
+                    invar["gid"] = g.gid
+                    # Set the admin_group to our existing group object.
+                    admin_group = Group.objects.get_or_create(
+                        groupname=g.groupname, defaults={"gid": g.gid}
+                    )[0]
+                    invar["group"] = admin_group  # exchange name for db group item.
 
-            for u in users:
-                if u.username == invar["username"]:
-                    handle_exception(Exception(e_msg), request, status_code=400)
-                elif u.uid == invar["uid"]:
-                    e_msg = (
-                        "UID ({}) already exists. Please choose a different one."
-                    ).format(invar["uid"])
-                    handle_exception(Exception(e_msg), request)
+            if catalog_user(username=invar["username"]) is not None:
+                handle_exception(Exception(e_msg), request, status_code=400)
+            if invar["uid"] is not None and catalog_user(uid=invar["uid"]) is not None:
+                e_msg = (
+                    "UID ({}) already exists. Please choose a different one."
+                ).format(invar["uid"])
+                handle_exception(Exception(e_msg), request)
 
             if invar["admin"]:
                 # Create Django user
@@ -220,6 +226,10 @@ class UserListView(UserMixin, rfc.GenericView):
             # validate and save our suser object.
             suser.full_clean()
             suser.save()
+            catalog_save_group(admin_group.groupname, admin_group.gid)
+            catalog_save_user(
+                suser.username, suser.uid, suser.gid, suser.shell, admin_group.groupname
+            )
             return Response(SUserSerializer(suser).data)
 
 
@@ -283,21 +293,20 @@ class UserDetailView(UserMixin, rfc.GenericView):
                 u.full_clean()
                 u.save()
 
-            sysusers = combined_users()
-            suser = None
-            for u in sysusers:
-                if u.username == username:
-                    suser = u
-                    if new_pw is not None:
-                        usermod(username, new_pw)
-                        smbpasswd(username, new_pw)
-                    if shell is not None:
-                        update_shell(username, shell)
-                    add_ssh_key(username, public_key, cur_public_key)
-                    break
+            suser = combined_user(username)
             if suser is None:
                 e_msg = "User ({}) does not exist.".format(username)
                 handle_exception(Exception(e_msg), request)
+            if new_pw is not None:
+                usermod(username, new_pw)
+                smbpasswd(username, new_pw)
+            if shell is not None:
+                update_shell(username, shell)
+                suser.shell = shell
+                catalog_save_user(
+                    username, suser.uid, suser.gid, shell, suser.groupname
+                )
+            add_ssh_key(username, public_key, cur_public_key)
 
             return Response(SUserSerializer(suser).data)
 
@@ -321,23 +330,13 @@ class UserDetailView(UserMixin, rfc.GenericView):
                     u.user.delete()
                 gid = u.gid
                 u.delete()
-            else:
-                sysusers = combined_users()
-                found = False
-                for u in sysusers:
-                    if u.username == username:
-                        found = True
-                        break
-                if found is False:
-                    e_msg = "User ({}) does not exist.".format(username)
-                    handle_exception(Exception(e_msg), request)
+            elif catalog_user(username=username) is None:
+                e_msg = "User ({}) does not exist.".format(username)
+                handle_exception(Exception(e_msg), request)
 
-            for g in combined_groups():
-                if (
-                    g.gid == gid
-                    and g.admin
-                    and not User.objects.filter(gid=gid).exists()
-                ):
+            if gid is not None and not User.objects.filter(gid=gid).exists():
+                for g in Group.objects.filter(gid=gid, admin=True):
+                    catalog_delete_group(g.groupname)
                     g.delete()
 
             # When user deleted destroy all Pincard entries
@@ -351,5 +350,6 @@ class UserDetailView(UserMixin, rfc.GenericView):
                     "A low level error occurred while deleting the user ({})."
                 ).format(username)
                 handle_exception(Exception(e_msg), request)
+            catalog_delete_user(username)
 
             return Response()
@@ -0,0 +1,166 @@
+"""
+Copyright (c) 2012-2021 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import stat
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Native, ie no subprocess, readers of the udev maintained /dev links and of
+# udev's own device database. Used by the device naming helpers in osi.py
+# in place of 'ls' and 'udevadm info' command output parsing.
+DEV_DIR = "/dev"
+UDEV_DATA_DIR = "/run/udev/data"
+# Upper bound on the life of a cached read. A changed mtime always
+# invalidates earlier; this guards against coarse timestamp granularity.
+CACHE_TTL = 5
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _memoize(path, reader):
+    """
+    Return reader(path), re-using the prior result while path's mtime is
+    unchanged and the prior read is younger than CACHE_TTL seconds.
+    :param path: file or directory whose mtime governs the cached read.
+    :param reader: callable taking path.
+    :return: result of reader(path) or None if path could not be stat'ed.
+    """
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    now = time.time()
+    with _cache_lock:
+        entry = _cache.get(path)
+    if entry is not None and entry[0] == mtime and now - entry[1] < CACHE_TTL:
+        return entry[2]
+    value = reader(path)
+    with _cache_lock:
+        _cache[path] = (mtime, now, value)
+    return value
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def _read_links(dir_path):
+    links = {}
+    try:
+        entries = os.listdir(dir_path)
+    except OSError:
+        return None
+    for entry in entries:
+        try:
+            links[entry] = os.readlink(os.path.join(dir_path, entry))
+        except OSError:
+            # Not a link (eg a subdirectory or the mapper control node), or
+            # removed since listdir.
+            continue
+    return links
+
+
+def dir_links(dir_path):
+    """
+    Equivalent of 'ls -l dir_path' restricted to symlink entries.
+    :param dir_path: eg /dev/disk/by-id
+    :return: dict indexed by entry name with the link target's last path
+    element as value, ie {'ata-QEMU_HARDDISK_QM00005': 'sda'}, or None if
+    dir_path could not be read.
+    """
+    links = _memoize(dir_path, _read_links)
+    if links is None:
+        return None
+    return {name: target.split("/")[-1] for name, target in links.items()}
+
+
+def _device_path(device_name):
+    if device_name.startswith("/"):
+        return device_name
+    return os.path.join(DEV_DIR, device_name)
+
+
+def _device_number(dev_path):
+    """
+    :param dev_path: /dev/sda, or any /dev link to a block device.
+    :return: 'major:minor' string, or None if not a present block device.
+    """
+    try:
+        st = os.stat(dev_path)
+    except OSError:
+        return None
+    if not stat.S_ISBLK(st.st_mode):
+        return None
+    return "{}:{}".format(os.major(st.st_rdev), os.minor(st.st_rdev))
+
+
+def _read_udev_data(path):
+    """
+    Parse a udev database entry, ie /run/udev/data/b8:0, of the form:
+    S:disk/by-id/ata-QEMU_HARDDISK_QM00005
+    S:disk/by-path/pci-0000:00:05.0-ata-1.0
+    I:1234567
+    E:ID_ATA=1
+    E:ID_SERIAL=QEMU_HARDDISK_QM00005
+    G:systemd
+    :return: tuple of (devlinks list, properties dict) or None.
+    """
+    devlinks = []
+    properties = {}
+    try:
+        with open(path) as data:
+            for line in data:
+                line = line.rstrip("\n")
+                if line.startswith("S:"):
+                    devlinks.append(os.path.join(DEV_DIR, line[2:]))
+                elif line.startswith("E:"):
+                    fields = line[2:].split("=", 1)
+                    if len(fields) == 2:
+                        properties[fields[0]] = fields[1]
+    except IOError:
+        return None
+    return devlinks, properties
+
+
+def udev_properties(device_name):
+    """
+    Native equivalent of 'udevadm info --query=property --name device_name'
+    sourced from udev's database. Only the DEVNAME, DEVLINKS and udev rule
+    assigned (ID_*, DM_* etc) properties are provided.
+    :param device_name: sda, /dev/sda, or full path by-id name.
+    :return: list of 'KEY=value' lines, as per udevadm's output, or None if
+    the device or its udev database entry was not found.
+    """
+    dev_path = _device_path(str(device_name))
+    dev_number = _device_number(dev_path)
+    if dev_number is None:
+        return None
+    data = _memoize(os.path.join(UDEV_DATA_DIR, "b" + dev_number), _read_udev_data)
+    if data is None:
+        return None
+    devlinks, properties = data
+    lines = ["DEVNAME={}".format(os.path.realpath(dev_path))]
+    if len(devlinks) > 0:
+        lines.append("DEVLINKS={}".format(" ".join(devlinks)))
+    lines += ["{}={}".format(k, v) for k, v in sorted(properties.items())]
+    return lines
@@ -0,0 +1,246 @@
+"""
+Copyright (c) 2012-2021 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import fcntl
+import io
+import json
+import math
+import os
+import tarfile
+import threading
+import time
+import logging
+
+from django.conf import settings
+from django_ztask.decorators import task
+
+logger = logging.getLogger(__name__)
+
+# Diagnostic bundle of our logs, as linked to by our 404/500 pages.
+BUNDLE = os.path.join(settings.ROOT_DIR, "src/rockstor/logs/error.tgz")
+# Log size, and mtime, of each log as at the last bundle, see build_bundle().
+BUNDLE_STATE = BUNDLE + ".json"
+LOG_DIR = os.path.join(settings.ROOT_DIR, "var/log")
+# Minimum seconds between bundles: exceptions in bursts share a bundle.
+BUNDLE_MIN_INTERVAL = 60
+# Cap on the uncompressed log bytes per bundle, newest retained.
+BUNDLE_MAX_BYTES = 64 * 1024 * 1024
+# Bytes of each changed log included regardless of what earlier bundles held:
+# so each bundle has the context of its errors on its own.
+BUNDLE_MIN_TAIL = 256 * 1024
+# Logs only included whole, as their tail alone is of no use.
+COMPRESSED_SUFFIXES = (".gz", ".xz", ".bz2", ".zip", ".tgz")
+
+# Time at which the bundle last queued by this process is due to be built.
+_next_build = [0]
+_request_lock = threading.Lock()
+
+
+def request_bundle():
+    """
+    Ensure a bundle is built (capture_bundle()) after now: coalesced with the
+    one we last queued if that is still to be built, else queued to be built
+    once BUNDLE_MIN_INTERVAL has passed since the last bundle. Never raises:
+    for use while handling an exception.
+    :return: True if queued or coalesced.
+    """
+    try:
+        with _request_lock:
+            now = time.time()
+            if now < _next_build[0]:
+                return True
+            due = max(now, _next_build[0] + BUNDLE_MIN_INTERVAL)
+            due = max(due, now + bundle_delay(BUNDLE_STATE, now=now))
+            _next_build[0] = due
+        _queue_capture(due - now)
+        return True
+    except Exception as e:
+        _next_build[0] = 0
+        logger.error("Failed to queue diagnostic bundle: {}".format(e.__str__()))
+        return False
+
+
+def _queue_capture(delay):
+    if delay > 0:
+        capture_bundle.after(int(math.ceil(delay)))
+    else:
+        capture_bundle.async()
+
+
+@task()
+def capture_bundle():
+    if build_bundle(LOG_DIR, BUNDLE, BUNDLE_STATE) is None:
+        # Within BUNDLE_MIN_INTERVAL of a bundle built since we were queued,
+        # possibly before the error we were queued for was logged: retry.
+        delay = bundle_delay(BUNDLE_STATE)
+        if delay > 0:
+            _queue_capture(delay)
+
+
+def _read_state(state_file):
+    state = {"time": 0, "files": {}}
+    if os.path.isfile(state_file):
+        try:
+            with open(state_file) as sfo:
+                state = json.load(sfo)
+        except ValueError:
+            logger.error("Ignoring invalid bundle state ({}).".format(state_file))
+    return state
+
+
+def bundle_delay(state_file, min_interval=BUNDLE_MIN_INTERVAL, now=None):
+    """
+    :return: seconds until min_interval has passed since the last bundle.
+    """
+    if now is None:
+        now = time.time()
+    return max(0, _read_state(state_file)["time"] + min_interval - now)
+
+
+def _log_files(log_dir):
+    files = {}
+    for root, dirs, names in os.walk(log_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                # Rotated away since listed.
+                continue
+            files[os.path.relpath(path, log_dir)] = {
+                "ino": st.st_ino,
+                "size": st.st_size,
+                "mtime": st.st_mtime,
+            }
+    return files
+
+
+def log_segments(files, prior, max_bytes=BUNDLE_MAX_BYTES, min_tail=BUNDLE_MIN_TAIL):
+    """
+    Log segments new since a prior bundle, extended back to at least the last
+    min_tail bytes of each, capped in sum at max_bytes with the most recently
+    modified logs, and the end of each log, taking precedence.
+    :param files: dict of ino, size, and mtime dicts by log file path.
+    :param prior: as per files, as at the prior bundle.
+    :param max_bytes: cap on the sum of the segment lengths.
+    :param min_tail: bytes of each changed, uncompressed, log always included.
+    :return: list of (path, start, end) tuples in order of path, and list of
+    (path, bytes) tuples of the logs, or log parts, dropped by max_bytes.
+    """
+    segments = []
+    dropped = []
+    budget = max_bytes
+    for path in sorted(files, key=lambda p: files[p]["mtime"], reverse=True):
+        cur = files[path]
+        last = prior.get(path)
+        start = 0
+        if last is not None and last["ino"] == cur["ino"]:
+            if last["size"] == cur["size"] and last["mtime"] == cur["mtime"]:
+                continue
+            if last["size"] <= cur["size"]:
+                start = last["size"]
+        if not path.endswith(COMPRESSED_SUFFIXES):
+            start = min(start, max(0, cur["size"] - min_tail))
+        length = cur["size"] - start
+        if length == 0:
+            continue
+        if path.endswith(COMPRESSED_SUFFIXES) and (start > 0 or length > budget):
+            # Compressed logs are never appended to, only ever bundled whole.
+            dropped.append((path, length))
+            continue
+        if length > budget:
+            dropped.append((path, length - budget))
+            start = cur["size"] - budget
+        if start == cur["size"]:
+            continue
+        segments.append((path, start, cur["size"]))
+        budget -= cur["size"] - start
+    return sorted(segments), sorted(dropped)
+
+
+def build_bundle(
+    log_dir,
+    bundle,
+    state_file,
+    max_bytes=BUNDLE_MAX_BYTES,
+    min_interval=BUNDLE_MIN_INTERVAL,
+    now=None,
+    min_tail=BUNDLE_MIN_TAIL,
+):
+    """
+    Replace bundle with a tar.gz of the parts of the logs under log_dir that
+    are new, or changed, since our last bundle, along with the last min_tail
+    bytes of each changed log: at most max_bytes in all, see log_segments().
+    A MANIFEST member lists the byte range of each log included, and what was
+    dropped. Waits on any other build in progress. Skipped if our last was
+    within min_interval seconds, or if no log has changed since.
+    :return: list of (path, start, end) tuples bundled, or None if skipped.
+    """
+    if now is None:
+        now = time.time()
+    if not os.path.isdir(os.path.dirname(bundle)):
+        os.makedirs(os.path.dirname(bundle))
+    with open(state_file + ".lock", "w") as lfo:
+        fcntl.flock(lfo, fcntl.LOCK_EX)
+        state = _read_state(state_file)
+        if now - state["time"] < min_interval:
+            return None
+        files = _log_files(log_dir)
+        segments, dropped = log_segments(files, state["files"], max_bytes, min_tail)
+        if len(segments) == 0:
+            logger.debug("No log changes since the last diagnostic bundle.")
+            return None
+        since = "their start"
+        if state["time"] > 0:
+            since = time.ctime(state["time"])
+        manifest = ["Logs of {} since {}".format(log_dir, since)]
+        manifest.extend(
+            "{} bytes {}-{}".format(path, start, end) for path, start, end in segments
+        )
+        manifest.extend(
+            "{} dropped {} bytes (bundle size cap)".format(path, length)
+            for path, length in dropped
+        )
+        # Built aside so the prior bundle remains available meanwhile.
+        tmp_bundle = bundle + ".tmp"
+        try:
+            with tarfile.open(tmp_bundle, "w:gz") as tar:
+                data = ("\n".join(manifest) + "\n").encode("utf-8")
+                info = tarfile.TarInfo("MANIFEST")
+                info.size = len(data)
+                info.mtime = now
+                tar.addfile(info, io.BytesIO(data))
+                for path, start, end in segments:
+                    with open(os.path.join(log_dir, path), "rb") as fo:
+                        fo.seek(start)
+                        info = tarfile.TarInfo(os.path.join("log", path))
+                        info.size = end - start
+                        info.mtime = files[path]["mtime"]
+                        tar.addfile(info, fo)
+        except Exception:
+            # ie a log truncated, by rotation, while being read.
+            if os.path.exists(tmp_bundle):
+                os.remove(tmp_bundle)
+            raise
+        os.rename(tmp_bundle, bundle)
+        state = {"time": now, "files": files}
+        with open(state_file, "w") as sfo:
+            json.dump(state, sfo)
+        logger.debug(
+            "Diagnostic bundle ({}) of {} log segments.".format(bundle, len(segments))
+        )
+        return segments
@@ -0,0 +1,520 @@
+"""
+Copyright (c) 2012-2021 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import ctypes
+import ctypes.util
+import gzip
+import io
+import os
+import re
+import select
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Paged, and followed, reading of log files without loading them whole.
+# A sparse line index holds the byte offset of every INDEX_STRIDE'th line so
+# any page is served by a seek and at most INDEX_STRIDE line skips.
+INDEX_STRIDE = 1000
+READ_BLOCK = 1024 * 1024
+# Number of files whose line index is kept, least recently used dropped.
+MAX_INDEXES = 32
+# Seconds between checks for rotation/truncation of a followed file, and the
+# poll interval used where inotify is not available.
+FOLLOW_TIMEOUT = 1
+
+# From sys/inotify.h
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVE_SELF = 0x00000800
+IN_DELETE_SELF = 0x00000400
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+FOLLOW_MASK = IN_MODIFY | IN_ATTRIB | IN_MOVE_SELF | IN_DELETE_SELF
+
+# Cap on the matches held for any one search, and the number of searches
+# whose results are kept. Results are re-used while the log is unchanged.
+SEARCH_MAX_MATCHES = 10000
+SEARCH_CACHE_SIZE = 16
+# Lines scanned between checks of a search's cancelled callable.
+SEARCH_CHECK_LINES = 10000
+
+# Leading timestamps of our logs, with their strptime format, ie:
+# rockstor.log: [18/Oct/2021 19:00:00] ERROR ...
+# nginx: 127.0.0.1 - - [18/Oct/2021:19:00:00 +0100] "GET ...
+# samba: [2021/10/18 19:00:00.123456,  0] ...
+# supervisord/gunicorn: 2021-10-18 19:00:00,123 INFO ...
+LOG_TIME_FORMATS = (
+    (re.compile(br"\[(\d{2}/\w{3}/\d{4})[ :](\d{2}:\d{2}:\d{2})"), "%d/%b/%Y %H:%M:%S"),
+    (re.compile(br"^\[(\d{4}/\d{2}/\d{2}) (\d{2}:\d{2}:\d{2})"), "%Y/%m/%d %H:%M:%S"),
+    (re.compile(br"^(\d{4}-\d{2}-\d{2})[ T](\d{2}:\d{2}:\d{2})"), "%Y-%m-%d %H:%M:%S"),
+)
+# Accepted formats of search time range arguments.
+QUERY_TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M")
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+_searches = OrderedDict()
+_searches_lock = threading.Lock()
+
+
+class LineIndex(object):
+    """
+    Sparse line-offset index of a file. Extended incrementally as the file
+    grows and rebuilt when its inode changes or it shrinks, ie on rotation
+    or truncation.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, inode):
+        self.inode = inode
+        # Bytes scanned so far.
+        self.size = 0
+        # Byte offset of line number (n * INDEX_STRIDE), 0 based.
+        self.offsets = [0]
+        # Newlines seen, and offset following the last of them.
+        self.newlines = 0
+        self.last_newline_end = 0
+
+    def _scan(self, fo, end):
+        fo.seek(self.size)
+        while self.size < end:
+            block = fo.read(min(READ_BLOCK, end - self.size))
+            if not block:
+                break
+            pos = 0
+            while True:
+                to_next = INDEX_STRIDE - self.newlines % INDEX_STRIDE
+                found = block.count(b"\n", pos)
+                if found < to_next:
+                    self.newlines += found
+                    break
+                for _ in range(to_next):
+                    pos = block.index(b"\n", pos) + 1
+                self.newlines += to_next
+                self.offsets.append(self.size + pos)
+            last = block.rfind(b"\n")
+            if last != -1:
+                self.last_newline_end = self.size + last + 1
+            self.size += len(block)
+
+    def update(self):
+        """
+        Bring the index up to date with the file's current content.
+        :return: os.stat result of the file.
+        """
+        st = os.stat(self.path)
+        if st.st_ino != self.inode or st.st_size < self.size:
+            self._reset(st.st_ino)
+        if st.st_size > self.size:
+            with open(self.path, "rb") as fo:
+                self._scan(fo, st.st_size)
+        return st
+
+    @property
+    def total_lines(self):
+        if self.size > self.last_newline_end:
+            # Unterminated last line.
+            return self.newlines + 1
+        return self.newlines
+
+    def read(self, start, count):
+        """
+        :param start: 0 based line number of the first line to return.
+        :param count: maximum number of lines to return.
+        :return: list of lines, with line endings.
+        """
+        lines = []
+        if count <= 0 or start >= self.total_lines:
+            return lines
+        with open(self.path, "rb") as fo:
+            fo.seek(self.offsets[start // INDEX_STRIDE])
+            for _ in range(start % INDEX_STRIDE):
+                fo.readline()
+            while len(lines) < count and fo.tell() < self.size:
+                line = fo.readline()
+                if not line:
+                    break
+                lines.append(line)
+        return lines
+
+
+def line_index(path):
+    """
+    Cached, and brought up to date, LineIndex of the given file.
+    :param path: log file path.
+    :return: LineIndex object, whose lock callers hold while using it.
+    """
+    with _indexes_lock:
+        index = _indexes.pop(path, None)
+        if index is None:
+            index = LineIndex(path)
+        _indexes[path] = index
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def read_page(path, start, count):
+    """
+    Page of lines from a file, by line number, via its cached line index.
+    Only the page is read; the first call on a file, or on its new content,
+    scans it once in READ_BLOCK sized blocks.
+    :param path: log file path.
+    :param start: 0 based first line number, negative counts from the end.
+    :param count: maximum number of lines.
+    :return: tuple of (start, lines, total_lines) where start is the
+    resolved first line number.
+    """
+    index = line_index(path)
+    with index.lock:
+        index.update()
+        total_lines = index.total_lines
+        if start < 0:
+            start = max(total_lines + start, 0)
+        return start, index.read(start, count), total_lines
+
+
+def tail_lines(path, count):
+    """
+    Last count lines of a file, ie 'tail -n count', read backwards from the
+    end of the file so independent of its size.
+    :param path: log file path.
+    :param count: number of lines.
+    :return: list of lines, with line endings.
+    """
+    if count <= 0:
+        return []
+    with open(path, "rb") as fo:
+        fo.seek(0, os.SEEK_END)
+        pos = fo.tell()
+        data = b""
+        # A terminating newline does not start a further line.
+        while pos > 0 and data.count(b"\n", 0, len(data) - 1) < count:
+            step = min(READ_BLOCK, pos)
+            pos -= step
+            fo.seek(pos)
+            data = fo.read(step) + data
+    return data.splitlines(True)[-count:]
+
+
+class FileWatch(object):
+    """
+    Waits on modification of a file via inotify, falling back to a plain
+    timed sleep where inotify is unavailable. Blocking calls are select()
+    and time.sleep() so are cooperative under gevent's monkey patching.
+    """
+
+    _libc = None
+
+    def __init__(self, path):
+        self.fd = None
+        self.wd = None
+        libc = self.libc()
+        if libc is None:
+            return
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            logger.error(
+                "inotify_init1 failed: {}".format(os.strerror(ctypes.get_errno()))
+            )
+            return
+        self.fd = fd
+        self.watch(path)
+
+    @classmethod
+    def libc(cls):
+        if cls._libc is None:
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+                libc.inotify_init1
+                cls._libc = libc
+            except (OSError, AttributeError):
+                cls._libc = False
+        return cls._libc or None
+
+    def watch(self, path):
+        """
+        Watch path, in place of any prior watched path.
+        """
+        if self.fd is None:
+            return
+        if self.wd is not None:
+            self.libc().inotify_rm_watch(self.fd, self.wd)
+            self.wd = None
+        if not isinstance(path, bytes):
+            path = path.encode()
+        wd = self.libc().inotify_add_watch(self.fd, path, FOLLOW_MASK)
+        if wd >= 0:
+            self.wd = wd
+
+    def wait(self, timeout):
+        """
+        Return on a watched event or after timeout seconds.
+        """
+        if self.wd is None:
+            time.sleep(timeout)
+            return
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            # We only care that something happened, drain the events.
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except OSError:
+                pass
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+            self.wd = None
+
+
+def follow(path, timeout=FOLLOW_TIMEOUT):
+    """
+    Native equivalent of 'tail -f path'. Also follows a rotated or truncated
+    file by reading its replacement from the start.
+    :param path: log file path.
+    :param timeout: max seconds between yields.
+    :return: generator of lists of complete lines appended since the prior
+    yield. An empty list is yielded on timeout so the caller can stop between
+    waits by closing the generator.
+    """
+    watcher = FileWatch(path)
+    # Not open(): a Python 2 file object does not read past a prior EOF.
+    fo = io.open(path, "rb")
+    fo.seek(0, os.SEEK_END)
+    inode = os.fstat(fo.fileno()).st_ino
+    partial = b""
+    try:
+        while True:
+            data = fo.read(READ_BLOCK)
+            if not data:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    st = None
+                if st is not None and (st.st_ino != inode or st.st_size < fo.tell()):
+                    fo.close()
+                    fo = io.open(path, "rb")
+                    inode = os.fstat(fo.fileno()).st_ino
+                    watcher.watch(path)
+                    partial = b""
+                    continue
+                yield []
+                watcher.wait(timeout)
+                continue
+            lines = (partial + data).splitlines(True)
+            partial = b""
+            if not lines[-1].endswith(b"\n") and len(lines[-1]) < READ_BLOCK:
+                partial = lines.pop()
+            yield lines
+    finally:
+        fo.close()
+        watcher.close()
+
+
+class SearchCancelled(Exception):
+    pass
+
+
+def open_log(path):
+    """
+    Open a log for binary reading, rotated .gz logs being decompressed as
+    they are read.
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return io.open(path, "rb")
+
+
+def iter_lines(fo):
+    """
+    Lines of an open log, read in READ_BLOCK sized blocks.
+    :param fo: file object opened in binary mode.
+    :return: generator of (offset, line) tuples, offset being that of the
+    line's first byte in the, decompressed, log.
+    """
+    offset = 0
+    partial = b""
+    while True:
+        block = fo.read(READ_BLOCK)
+        if not block:
+            break
+        lines = (partial + block).splitlines(True)
+        partial = b""
+        if not lines[-1].endswith(b"\n"):
+            partial = lines.pop()
+        for line in lines:
+            yield offset, line
+            offset += len(line)
+    if partial:
+        yield offset, partial
+
+
+def line_time(line):
+    """
+    :param line: log line.
+    :return: datetime of the line's timestamp, or None if it has none of
+    LOG_TIME_FORMATS.
+    """
+    for pattern, time_format in LOG_TIME_FORMATS:
+        match = pattern.search(line[:128])
+        if match is not None:
+            try:
+                return datetime.strptime(
+                    " ".join(g.decode("ascii") for g in match.groups()), time_format
+                )
+            except ValueError:
+                return None
+    return None
+
+
+def parse_time(value):
+    """
+    :param value: time range argument string ie "2021-10-18 19:00:00".
+    :return: datetime, or None if value is empty.
+    """
+    if not value:
+        return None
+    for time_format in QUERY_TIME_FORMATS:
+        try:
+            return datetime.strptime(value, time_format)
+        except ValueError:
+            continue
+    raise ValueError(
+        "Time ({}) is not in any of the formats: {}.".format(
+            value, ", ".join(QUERY_TIME_FORMATS)
+        )
+    )
+
+
+def _matcher(pattern, regex, ignore_case):
+    if not isinstance(pattern, bytes):
+        pattern = pattern.encode("utf-8")
+    if regex:
+        return re.compile(pattern, re.IGNORECASE if ignore_case else 0).search
+    if ignore_case:
+        pattern = pattern.lower()
+        return lambda line: pattern in line.lower()
+    return lambda line: pattern in line
+
+
+def _scan_log(path, match, since, until, cancelled):
+    matches = []
+    truncated = False
+    # Lines without a timestamp, ie continuation lines, take their
+    # predecessor's.
+    current_time = None
+    timed = since is not None or until is not None
+    with open_log(path) as fo:
+        for line_number, (offset, line) in enumerate(iter_lines(fo)):
+            if (
+                cancelled is not None
+                and line_number % SEARCH_CHECK_LINES == 0
+                and cancelled()
+            ):
+                raise SearchCancelled()
+            if timed:
+                current_time = line_time(line) or current_time
+                if current_time is None or (since is not None and current_time < since):
+                    continue
+                if until is not None and current_time > until:
+                    # Our logs are written in time order.
+                    break
+            if not match(line):
+                continue
+            if len(matches) == SEARCH_MAX_MATCHES:
+                truncated = True
+                break
+            matches.append(
+                {
+                    "line_number": line_number + 1,
+                    "offset": offset,
+                    "line": line.decode("utf-8", "replace"),
+                }
+            )
+    return matches, truncated
+
+
+def search_log(
+    path,
+    pattern,
+    regex=False,
+    ignore_case=False,
+    since=None,
+    until=None,
+    start=0,
+    count=100,
+    cancelled=None,
+):
+    """
+    Lines of a log matching a substring or regular expression, optionally
+    within a time range. The log is scanned in READ_BLOCK sized blocks and
+    the, up to SEARCH_MAX_MATCHES, matches cached against the log's
+    generation (inode, size and mtime) so that further pages of the same
+    search, or its repeat on an unchanged log, do not re-scan it.
+    :param path: log file path, .gz logs are decompressed as read.
+    :param pattern: substring, or regular expression if regex is True.
+    :param regex: boolean.
+    :param ignore_case: boolean.
+    :param since: datetime, lines before this time are skipped.
+    :param until: datetime, lines after this time are skipped.
+    :param start: index of the first match to return.
+    :param count: maximum number of matches to return.
+    :param cancelled: optional callable, polled during a scan, returning
+    True to abandon it. SearchCancelled is then raised.
+    :return: dict with 'matches' (list of dicts of line_number, offset and
+    line), 'total' (matches found), and 'truncated' (True if the scan
+    stopped at SEARCH_MAX_MATCHES).
+    """
+    st = os.stat(path)
+    key = (
+        path,
+        (st.st_ino, st.st_size, st.st_mtime),
+        pattern,
+        regex,
+        ignore_case,
+        since,
+        until,
+    )
+    with _searches_lock:
+        result = _searches.pop(key, None)
+        if result is not None:
+            _searches[key] = result
+    if result is None:
+        match = _matcher(pattern, regex, ignore_case)
+        result = _scan_log(path, match, since, until, cancelled)
+        with _searches_lock:
+            _searches[key] = result
+            while len(_searches) > SEARCH_CACHE_SIZE:
+                _searches.popitem(last=False)
+    matches, truncated = result
+    return {
+        "matches": matches[start : start + count],
+        "total": len(matches),
+        "truncated": truncated,
+    }
@@ -28,12 +28,15 @@ import shutil
 import signal
 import stat
 import subprocess  # TODO: consider drop in replacement of subprocess32 module
+import threading
 import time
 import uuid
+from multiprocessing.pool import ThreadPool
 
 from django.conf import settings
 
 from exceptions import CommandException, NonBTRFSRootException
+from system.devfs import dir_links, udev_properties
 
 logger = logging.getLogger(__name__)
 
@@ -42,14 +45,33 @@ CHATTR = "/usr/bin/chattr"
 DD = "/usr/bin/dd"
 DEFAULT_MNT_DIR = "/mnt2/"
 EXPORTFS = "/usr/sbin/exportfs"
+# Client:export arguments per exportfs invocation.
+EXPORTFS_BATCH = 200
+# exportfs flags and their opposite, the first of each being the default.
+EXPORTFS_FLAG_PAIRS = (
+    ("ro", "rw"),
+    ("sync", "async"),
+    ("secure", "insecure"),
+    ("wdelay", "no_wdelay"),
+    ("hide", "nohide"),
+    ("no_subtree_check", "subtree_check"),
+    ("root_squash", "no_root_squash"),
+    ("no_all_squash", "all_squash"),
+)
 GRUBBY = "/usr/sbin/grubby"
 HDPARM = "/usr/sbin/hdparm"
+# Upper bound on concurrent hdparm queries, see get_disks_power_info().
+HDPARM_MAX_WORKERS = 8
+# hdparm settings systemd service, see read_hdparm_settings().
+HDPARM_SERVICE = "/etc/systemd/system/rockstor-hdparm.service"
 HOSTID = "/usr/bin/hostid"
 HOSTNAMECTL = "/usr/bin/hostnamectl"
 LS = "/usr/bin/ls"
 LSBLK = "/usr/bin/lsblk"
 MKDIR = "/usr/bin/mkdir"
 MOUNT = "/usr/bin/mount"
+NFS_ETAB = "/var/lib/nfs/etab"
+NFS_EXPORTS = "/etc/exports"
 NMCLI = "/usr/bin/nmcli"
 RMDIR = "/usr/bin/rmdir"
 SHUTDOWN = settings.SHUTDOWN
@@ -167,7 +189,22 @@ def run_command(
     throw=True,
     log=False,
     input=None,
+    timeout=None,
 ):
+    """
+    :param timeout: seconds after which the command is killed, and an
+    Exception raised regardless of throw. None to wait indefinitely.
+    """
+    timed_out = []
+
+    def kill(p):
+        timed_out.append(True)
+        try:
+            p.kill()
+        except OSError:
+            # Already exited.
+            pass
+
     try:
         # We force run_command to always use en_US
         # to avoid issues on date and number formats
@@ -180,13 +217,26 @@ def run_command(
         p = subprocess.Popen(
             cmd, shell=shell, stdout=stdout, stderr=stderr, stdin=stdin, env=fake_env
         )
-        out, err = p.communicate(input=input)
+        timer = None
+        if timeout is not None:
+            timer = threading.Timer(timeout, kill, (p,))
+            timer.start()
+        try:
+            out, err = p.communicate(input=input)
+        finally:
+            if timer is not None:
+                timer.cancel()
         out = out.split("\n")
         err = err.split("\n")
         rc = p.returncode
     except Exception as e:
         raise Exception("Exception while running command({}): {}".format(cmd, e))
 
+    # A command exiting just as our timer fired was not killed by it.
+    if len(timed_out) > 0 and rc == -signal.SIGKILL:
+        raise Exception(
+            "Command({}) killed after {} seconds without exiting.".format(cmd, timeout)
+        )
     if rc != 0:
         if log:
             e_msg = (
@@ -652,6 +702,79 @@ def bind_mount(mnt_pt, export_pt):
     return True
 
 
+def nfs_export_table(etab=None):
+    """
+    The kernel's active NFS exports, as maintained by exportfs.
+    :param etab: path of the export table, defaults to NFS_ETAB.
+    :return: dict of option sets indexed by (export point, client) tuples.
+    Empty if there is no table, ie nfs-server has not yet been started.
+    """
+    if etab is None:
+        etab = NFS_ETAB
+    active = {}
+    if not os.path.isfile(etab):
+        return active
+    with open(etab) as efo:
+        for line in efo.readlines():
+            # ie "/export/share\t*(rw,async,wdelay,hide,...)"
+            fields = line.strip().split(None, 1)
+            if len(fields) != 2 or fields[1][-1] != ")":
+                continue
+            client, options = fields[1][:-1].split("(", 1)
+            active[(fields[0], client)] = set(options.split(","))
+    return active
+
+
+def nfs_options_current(option_list, active_options):
+    """
+    Whether an export's active options (nfs_export_table()) are those given.
+    The active table lists every option, defaults included, so each option
+    given must be in force, and each flag of EXPORTFS_FLAG_PAIRS must match
+    that given or, if neither of its pair is given, its default: ie dropping
+    no_root_squash from an export requires root_squash to be in force.
+    :param option_list: exportfs option string, ie "rw,async,insecure".
+    :param active_options: set of options in force.
+    """
+    options = [o for o in option_list.split(",") if o != ""]
+    flags = set()
+    for pair in EXPORTFS_FLAG_PAIRS:
+        flags.update(pair)
+        # As with exportfs, the last given of a pair takes precedence.
+        wanted = ([pair[0]] + [o for o in options if o in pair])[-1]
+        active = [o for o in pair if o in active_options]
+        if active != [wanted] and not (len(active) == 0 and wanted == pair[0]):
+            return False
+    return set(options) - flags <= active_options
+
+
+def _exportfs(args, pairs):
+    """
+    Run exportfs with args over (client, export point) pairs, batched.
+    """
+    for i in range(0, len(pairs), EXPORTFS_BATCH):
+        run_command(
+            [EXPORTFS]
+            + args
+            + ["{}:{}".format(c, e) for c, e in pairs[i : i + EXPORTFS_BATCH]]
+        )
+
+
+def exports_pairs(content):
+    """
+    Parse exports file content, as written by refresh_nfs_exports(), ie:
+    /export/share1 *(ro,async,insecure) host2(rw,async,insecure)
+    :return: set of (export point, client) tuples.
+    """
+    pairs = set()
+    for line in content.splitlines():
+        fields = line.split()
+        if len(fields) < 2 or fields[0].startswith("#"):
+            continue
+        for client in fields[1:]:
+            pairs.add((fields[0], client.split("(")[0]))
+    return pairs
+
+
 def refresh_nfs_exports(exports):
     """
     input format:
@@ -662,55 +785,84 @@ def refresh_nfs_exports(exports):
                        ...}
 
     if 'clients' is an empty list, then unmount and cleanup.
-    """
-    fo, npath = mkstemp()
-    with open(npath, "w") as efo:
-        shares = []
-        for e in exports.keys():
-            if len(exports[e]) == 0:
-                #  do share tear down at the end, only snaps here
-                if len(e.split("/")) == 4:
-                    nfs4_mount_teardown(e)
-                else:
-                    shares.append(e)
-                continue
 
-            if not is_mounted(e):
-                bind_mount(exports[e][0]["mnt_pt"], e)
-            client_str = ""
-            admin_host = None
-            for c in exports[e]:
-                run_command(
-                    [
-                        EXPORTFS,
-                        "-i",
-                        "-o",
-                        c["option_list"],
-                        "{}:{}".format(c["client_str"], e),
-                    ]
-                )
-                client_str = "{}{}({}) ".format(
-                    client_str, c["client_str"], c["option_list"]
-                )
-                if "admin_host" in c:
-                    admin_host = c["admin_host"]
-            if admin_host is not None:
-                run_command(
-                    [
-                        EXPORTFS,
-                        "-i",
-                        "-o",
-                        "rw,no_root_squash",
-                        "{}:{}".format(admin_host, e),
-                    ]
-                )
-                client_str = "{} {}(rw,no_root_squash)".format(client_str, admin_host)
-            export_str = "{} {}\n".format(e, client_str)
-            efo.write(export_str)
-        for s in shares:
-            nfs4_mount_teardown(s)
-    shutil.move(npath, "/etc/exports")
-    return run_command([EXPORTFS, "-ra"])
+    The given exports are the whole of our exports: those of ours active in
+    the kernel (nfs_export_table()) but not given are unexported, and only
+    those new, or with changed options, are exported. Ours being those under
+    NFS_EXPORT_ROOT or in our prior /etc/exports: others, ie from
+    /etc/exports.d, are left be. /etc/exports is rewritten, if changed, for
+    use on nfs-server start.
+    :return: tuple of lists of (client, export point) tuples exported and
+    unexported.
+    """
+    export_lines = []
+    shares = []
+    # Options by (export point, client), as we want them to be.
+    wanted = collections.OrderedDict()
+    for e in sorted(exports.keys()):
+        if len(exports[e]) == 0:
+            #  do share tear down at the end, only snaps here
+            if len(e.split("/")) == 4:
+                nfs4_mount_teardown(e)
+            else:
+                shares.append(e)
+            continue
+
+        if not is_mounted(e):
+            bind_mount(exports[e][0]["mnt_pt"], e)
+        client_str = ""
+        admin_host = None
+        for c in exports[e]:
+            wanted[(e, c["client_str"])] = c["option_list"]
+            client_str = "{}{}({}) ".format(
+                client_str, c["client_str"], c["option_list"]
+            )
+            if "admin_host" in c:
+                admin_host = c["admin_host"]
+        if admin_host is not None:
+            wanted[(e, admin_host)] = "rw,no_root_squash"
+            client_str = "{} {}(rw,no_root_squash)".format(client_str, admin_host)
+        export_lines.append("{} {}\n".format(e, client_str))
+    cur_content = None
+    if os.path.isfile(NFS_EXPORTS):
+        with open(NFS_EXPORTS) as efo:
+            cur_content = efo.read()
+    written = exports_pairs(cur_content or "")
+    active = nfs_export_table()
+    unexport = [
+        (c, e)
+        for (e, c) in sorted(active)
+        if (e, c) not in wanted
+        and (e.startswith(settings.NFS_EXPORT_ROOT) or (e, c) in written)
+    ]
+    export = collections.defaultdict(list)
+    for (e, c), option_list in wanted.items():
+        if (e, c) in active and nfs_options_current(option_list, active[(e, c)]):
+            continue
+        export[option_list].append((c, e))
+    # Unexport first: should a client name be listed other than as we give
+    # it, our export of it is not then undone.
+    _exportfs(["-u"], unexport)
+    for option_list, pairs in export.items():
+        _exportfs(["-i", "-o", option_list], pairs)
+    for s in shares:
+        nfs4_mount_teardown(s)
+    content = "".join(export_lines)
+    if content != cur_content:
+        # Written aside, then renamed, so as never to be seen part written.
+        fo, npath = mkstemp(dir=os.path.dirname(NFS_EXPORTS))
+        with os.fdopen(fo, "w") as efo:
+            efo.write(content)
+        os.chmod(npath, 0o644)
+        os.rename(npath, NFS_EXPORTS)
+    exported = [pair for pairs in export.values() for pair in pairs]
+    if len(exported) > 0 or len(unexport) > 0:
+        logger.debug(
+            "NFS exports: {} exported, {} unexported.".format(
+                len(exported), len(unexport)
+            )
+        )
+    return exported, unexport
 
 
 def config_network_device(
@@ -1529,10 +1681,7 @@ def is_rotational(device_name, test=None):
     # zero. Needs more research on actual drive readings for these 2 values.
     rotational = False  # until we find otherwise
     if test is None:
-        out, err, rc = run_command(
-            [UDEVADM, "info", "--query=property", "--name=" + "{}".format(device_name)],
-            throw=False,
-        )
+        out, err, rc = udev_info_properties(device_name)
     else:
         # test mode so process test instead of udevadmin output
         out = test
@@ -1725,6 +1874,24 @@ def set_disk_spindown(
     return True
 
 
+def udev_info_properties(device_name):
+    """
+    Returns the equivalent of run_command() on:
+    udevadm info --query=property --name device_name
+    but sourced, where possible, directly from udev's database to avoid a
+    subprocess per device. If the device or its database entry is not found
+    we defer to udevadm itself, ie for its error reporting.
+    :param device_name: sda, /dev/sda, or full path by-id name.
+    :return: out, err, rc as per run_command(throw=False).
+    """
+    out = udev_properties(device_name)
+    if out is not None:
+        return out, [""], 0
+    return run_command(
+        [UDEVADM, "info", "--query=property", "--name", str(device_name)], throw=False
+    )
+
+
 def get_dev_byid_name(device_name, remove_path=False):
     """When given a standard dev name eg sda will return the /dev/disk/by-id
     name, or the original device_name and False as the second member of the
@@ -1764,7 +1931,7 @@ def get_dev_byid_name(device_name, remove_path=False):
     devlinks = []  # Doubles as a flag for DEVLINKS line found.
     # Special device name considerations / pre-processing can go here.
     cmd = [UDEVADM, "info", "--query=property", "--name", str(device_name)]
-    out, err, rc = run_command(cmd, throw=False)
+    out, err, rc = udev_info_properties(device_name)
     if len(out) > 0 and rc == 0:
         # The output has at least one line and our udevadm executed OK.
         # Some systemd/udev configs don't have DEVLINKS as the first line.
@@ -1822,13 +1989,43 @@ def get_dev_byid_name(device_name, remove_path=False):
     return return_name, is_byid
 
 
+def dev_dir_links(dir_path):
+    """
+    Lists the symlinks within a udev maintained /dev directory. Read directly
+    via readlink where possible, with results cached while the directory is
+    unchanged, otherwise via 'ls -lr dir_path'. Native reads are ordered as
+    per 'ls -lr' ie reverse lexicographical.
+    :param dir_path: eg /dev/disk/by-id
+    :return: list of (link name, target name) tuples ie:
+    [('ata-QEMU_HARDDISK_QM00005', 'sda')], in listing order.
+    """
+    links = dir_links(dir_path)
+    if links is not None:
+        return sorted(links.items(), reverse=True)
+    links = []
+    out, err, rc = run_command([LS, "-lr", dir_path], throw=True)
+    if rc == 0:
+        for each_line in out:
+            # Assumed cheap exclusion of empty or non link entry lines: e.g. "total 0"
+            # or directory entries such as:
+            # /dev/disk/by-id/scsi-SDELL_PERC_6/i_Adapter_002c1e32094a1ad925...
+            if len(each_line) == 0 or each_line[0] != "l":
+                continue
+            # 'lrwxrwxrwx 1 root root 9 Oct 22 23:40 <name> -> ../../sda'
+            fields = each_line.split(" -> ")
+            if len(fields) != 2 or len(fields[0].split()) < 9:
+                continue
+            links.append((fields[0].split()[-1], fields[1].split("/")[-1]))
+    return links
+
+
 def get_byid_name_map():
-    """Simple wrapper around 'ls -lr /dev/disk/by-id' which returns a current
-    mapping of all attached by-id device names to their sdX counterparts. When
-    multiple by-id names are found for the same sdX device then the longest is
-    preferred, or when equal in length then the first listed is used. Intended
-    as a light weight helper for the Dashboard disk activity widget or other
-    non critical components. For critical components use only:
+    """Returns a current mapping of all attached by-id device names to their
+    sdX counterparts, as found in /dev/disk/by-id. When multiple by-id names
+    are found for the same sdX device then the longest is preferred, or when
+    equal in length then the first listed (by 'ls -lr' order) is used.
+    Intended as a light weight helper for the Dashboard disk activity widget
+    or other non critical components. For critical components use only:
     get_dev_byid_name() and get_devname() as they contain sanity checks and
     validation mechanisms and are intended to have more repeatable behaviour
     but only work on a single device at a time.  A single call to this method
@@ -1839,62 +2036,39 @@ def get_byid_name_map():
     was encountered by run_command or no by-id type names were encountered.
     """
     byid_name_map = {}
-    out, err, rc = run_command([LS, "-lr", "/dev/disk/by-id"], throw=True)
-    if rc == 0:
-        for each_line in out:
-            # Assumed cheap exclusion of empty or non link entry lines: e.g. "total 0"
-            # or directory entries such as:
-            # /dev/disk/by-id/scsi-SDELL_PERC_6/i_Adapter_002c1e32094a1ad925...
-            if len(each_line) == 0 or each_line[0] != "l":
-                continue
-            # Split the line by spaces and '/' chars
-            line_fields = each_line.replace("/", " ").split()
-            # Grab every sda type name from the last field in the line and add
-            # it as a dictionary key with it's value as the by-id type name so
-            # we can index by sda type name and retrieve the by-id. As there
-            # are often multiple by-id type names for a given sda type name we
-            # gain consistency in mapped by-id value by always preferring the
-            # longest by-id for a given sda type name key.
-            if len(line_fields) >= 5:
-                # Ensure we have at least 5 elements to avoid index out of
-                # range and to skip lines such as "total 0"
-                if line_fields[-1] not in byid_name_map.keys():
-                    # We don't yet have a record of this device so take one.
-                    byid_name_map[line_fields[-1]] = line_fields[-5]
-                    # ie {'sda': 'ata-QEMU_HARDDISK_QM00005'}
-                else:
-                    # We already have a record of this device so check if the
-                    # current line's by-id name is longer.
-                    if len(line_fields[-5]) > len(byid_name_map[line_fields[-1]]):
-                        # The current line's by-id name is longer so use it.
-                        byid_name_map[line_fields[-1]] = line_fields[-5]
+    # Grab every sda type name from each link's target and add it as a
+    # dictionary key with it's value as the by-id type name so we can index
+    # by sda type name and retrieve the by-id. As there are often multiple
+    # by-id type names for a given sda type name we gain consistency in mapped
+    # by-id value by always preferring the longest by-id for a given sda type
+    # name key.
+    for byid_name, temp_name in dev_dir_links("/dev/disk/by-id"):
+        if temp_name not in byid_name_map:
+            # We don't yet have a record of this device so take one.
+            byid_name_map[temp_name] = byid_name
+            # ie {'sda': 'ata-QEMU_HARDDISK_QM00005'}
+        elif len(byid_name) > len(byid_name_map[temp_name]):
+            # We already have a record of this device but the current
+            # by-id name is longer so use it.
+            byid_name_map[temp_name] = byid_name
     return byid_name_map
 
 
 def get_device_mapper_map():
     """
-    Simple wrapper around 'ls -lr /dev/mapper' akin to get_byid_name_map() but
-    without the assumption of multiple entries and with differing field count
-    expectations.
+    Akin to get_byid_name_map() but for /dev/mapper and without the
+    assumption of multiple entries.
     :return: dictionary indexed (keyed) by 'dm-0' type names with associated
     /dev/mapper names as the values (path included), or an empty dictionary if
     a non zero return code was encountered by run_command or no /dev/mapper
     names found.
     """
     device_mapper_map = {}
-    out, err, rc = run_command([LS, "-lr", "/dev/mapper"], throw=True)
-    if rc == 0 and len(out) > 3:  # len 3 is only control char dev listed.
-        for each_line in out:
-            if each_line == "":
-                continue
-            # Split the line by spaces and '/' chars
-            line_fields = each_line.replace("/", " ").split()
-            # Grab every dm-0 type name from the last field in the line and add
-            # it as a dictionary key with it's value as the mapped dir entry.
-            # Our full path is added as a convenience to our caller.
-            # {'dm-0': '/dev/mapper/luks-dd6589a6-14aa-4a5a-bcea-fe72e2dec333'}
-            if len(line_fields) == 12:
-                device_mapper_map[line_fields[-1]] = line_fields[-4]
+    # The mapper 'control' character device is not a link so is not listed.
+    # Our full path is added as a convenience to our caller.
+    # {'dm-0': '/dev/mapper/luks-dd6589a6-14aa-4a5a-bcea-fe72e2dec333'}
+    for mapped_name, dm_name in dev_dir_links("/dev/mapper"):
+        device_mapper_map[dm_name] = "/dev/mapper/{}".format(mapped_name)
     return device_mapper_map
 
 
@@ -1946,31 +2120,21 @@ def get_whole_dev_uuid(dev_byid):
 
 def get_uuid_name_map():
     """
-    Simple wrapper around 'ls -l /dev/disk/by-uuid' which returns a current
-    mapping of all attached by-uuid device names to their sdX counterparts.
-    Modeled on the existing get_byid_name_map() but simpler as no duplicate
-    device by different names are expected. Ie one uuid name per device.
+    Returns a current mapping of all attached by-uuid device names to their
+    sdX counterparts, as found in /dev/disk/by-uuid. Modeled on the existing
+    get_byid_name_map() but simpler as no duplicate device by different names
+    are expected. Ie one uuid name per device.
     :return: dictionary indexed (keyed) by sdX type names with associated
     by-uuid type names as the values, or an empty dictionary if a non zero
     return code was encountered by run_command or no by-uuid type names were
     found (unlikely).
     """
     uuid_name_map = {}
-    out, err, rc = run_command([LS, "-l", "/dev/disk/by-uuid"], throw=True)
-    if rc == 0:
-        for each_line in out:
-            # Split the line by spaces and '/' chars
-            line_fields = each_line.replace("/", " ").split()
-            # Grab every sda type name from the last field in the line and add
-            # it as a dictionary key with it's value as the by-uuid name so
-            # we can index by sda type name and retrieve the uuid.
-            if len(line_fields) >= 5:
-                # Ensure we have at least 5 elements to avoid index out of
-                # range and to skip lines such as "total 0"
-                if line_fields[-1] not in uuid_name_map.keys():
-                    # We don't yet have a record of this device so take one.
-                    uuid_name_map[line_fields[-1]] = line_fields[-5]
-                    # ie {'vdd': '82fd9db1-e1c1-488d-9b42-536d0a82caeb'}
+    for uuid_name, temp_name in reversed(dev_dir_links("/dev/disk/by-uuid")):
+        if temp_name not in uuid_name_map:
+            # We don't yet have a record of this device so take one.
+            uuid_name_map[temp_name] = uuid_name
+            # ie {'vdd': '82fd9db1-e1c1-488d-9b42-536d0a82caeb'}
     return uuid_name_map
 
 
@@ -2001,6 +2165,20 @@ def get_dev_temp_name(dev_byid):
         return temp_name
 
 
+def get_byid_temp_name_map():
+    """
+    Single directory walk equivalent of calling get_dev_temp_name() for every
+    entry in /dev/disk/by-id, see dir_links().
+    :return: dictionary indexed by by-id type name (without path) with values
+    of the associated canonical sda type name, or an empty dictionary if the
+    by-id directory could not be read.
+    """
+    temp_name_map = dir_links("/dev/disk/by-id")
+    if temp_name_map is None:
+        return {}
+    return temp_name_map
+
+
 def get_devname_old(device_name):
     """Depricated / prior version of get_devname() Returns the value of DEVNAME
     as reported by udevadm when supplied with a legal device name ie a full
@@ -2244,6 +2422,71 @@ def read_hdparm_setting(dev_byid):
     return None
 
 
+def read_hdparm_settings():
+    """
+    Single pass equivalent of read_hdparm_setting() for all devices found in
+    the rockstor-hdparm systemd service file.
+    :return: dictionary indexed by by-id type device name (without path) of
+    the comment immediately following that devices entry. Devices without an
+    immediately following comment are omitted, as is the case if no systemd
+    file exists.
+    """
+    infile = HDPARM_SERVICE
+    settings_map = {}
+    if not os.path.isfile(infile):
+        return settings_map
+    dev_byid_found = None
+    with open(infile) as ino:
+        for line in ino.readlines():
+            if line == "\n":
+                # skip empty lines
+                continue
+            line_fields = line.split()
+            if dev_byid_found is not None:
+                # Only a non empty comment directly after our device counts.
+                if line_fields[0] == "#" and len(line_fields) >= 2:
+                    settings_map[dev_byid_found] = " ".join(line_fields[1:])
+                dev_byid_found = None
+            if line_fields[0] == "#" or len(line_fields) < 4:
+                continue
+            if re.match("ExecStart", line_fields[0]):
+                # e.g. ExecStart=/usr/sbin/hdparm -q -S240 [...] /dev/disk/by-id/
+                dev_byid_found = line_fields[-1].split("/")[-1]
+    return settings_map
+
+
+def get_disks_power_info(dev_byid_list, max_workers=HDPARM_MAX_WORKERS):
+    """
+    Bulk equivalent of get_disk_power_status() and get_disk_APM_level() for
+    many devices. The underlying hdparm calls are independent per device so
+    are run concurrently, but with no more than max_workers in flight, to
+    avoid serialising a full chassis worth of hdparm executions while also
+    not flooding the controller with simultaneous requests.
+    :param dev_byid_list: list of by-id type device names without path.
+    :param max_workers: upper bound on concurrent hdparm executions.
+    :return: dictionary indexed by dev_byid of (power_state, apm_level)
+    tuples, with (None, None) for any device whose queries raised.
+    """
+
+    def power_info(dev_byid):
+        try:
+            power_state = get_disk_power_status(dev_byid)
+            apm_level = get_disk_APM_level(dev_byid)
+        except Exception as e:
+            logger.debug("Failed to read power info for ({}): {}".format(dev_byid, e))
+            return dev_byid, (None, None)
+        return dev_byid, (power_state, apm_level)
+
+    if len(dev_byid_list) == 0:
+        return {}
+    pool = ThreadPool(min(max_workers, len(dev_byid_list)))
+    try:
+        return dict(pool.map(power_info, dev_byid_list))
+    finally:
+        pool.close()
+        pool.join()
+
+
 def enter_standby(dev_byid):
     """Simple wrapper to execute hdparm -y /dev/disk/by-id/device_name which
     requests that the named device enter 'standby' mode which usually means it
@@ -24,6 +24,7 @@ from storageadmin.models import Pincard, EmailClient, User
 from system.users import smbpasswd, usermod
 from system.email_util import email_root
 from django.contrib.auth.models import User as DjangoUser
+from django.db.models import Count
 
 
 def reset_password(uname, uid, pinlist):
@@ -150,15 +151,32 @@ def has_pincard(user):
     return has_pincard
 
 
-def pincard_states(user):
+def pincard_holders(uids):
+
+    # Subset of uids with a (complete) Pincard, as per has_pincard() but in a
+    # single query for many users.
+    return set(
+        Pincard.objects.filter(user__in=uids)
+        .values("user")
+        .annotate(pins=Count("id"))
+        .filter(pins=24)
+        .values_list("user", flat=True)
+    )
+
+
+def pincard_states(user, holders=None):
 
     # If user has a Pincard that means already allowed to have one, so avoid
     # computing If selected user is a managed one allowed to have a
     # pincard_allowed If user is uid 0 (root) and mail notifications enabled ->
     # ok Pincard Otherwise 'otp' third state : allowed to have a Pincard, but
     # mail notifications required
+    # holders: optional pincard_holders() result, to save a query per user.
     pincard_allowed = "no"
-    pincard_present = has_pincard(user)
+    if holders is None:
+        pincard_present = has_pincard(user)
+    else:
+        pincard_present = int(user.uid) in holders
     if user.managed_user:
         pincard_allowed = "yes"
     else:
@@ -16,6 +16,8 @@ You should have received a copy of the GNU General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
+import hashlib
+import io
 import os
 import re
 import shutil
@@ -25,13 +27,15 @@ from django.conf import settings
 
 from osi import run_command
 from services import service_status, define_avahi_service
-from storageadmin.models import SambaCustomConfig
 
 TESTPARM = "/usr/bin/testparm"
 SMB_CONFIG = "/etc/samba/smb.conf"
 TM_CONFIG = "/etc/avahi/services/timemachine.service"
 SYSTEMCTL = "/usr/bin/systemctl"
 CHMOD = "/usr/bin/chmod"
+SMBCONTROL = "/usr/bin/smbcontrol"
+# Config file of each Samba export, included from our smb.conf section.
+SMB_SHARES_DIR = "/etc/samba/rockstor-shares"
 RS_SHARES_HEADER = "####BEGIN: Rockstor SAMBA CONFIG####"
 RS_SHARES_FOOTER = "####END: Rockstor SAMBA CONFIG####"
 RS_AD_HEADER = "####BEGIN: Rockstor ACTIVE DIRECTORY CONFIG####"
@@ -48,65 +52,162 @@ def test_parm(config="/etc/samba/smb.conf"):
     return True
 
 
-def rockstor_smb_config(fo, exports):
+def share_smb_config(e):
+    """
+    The smb.conf section of a Samba export.
+    :param e: SambaShare object, ideally with its admin_users and
+    sambacustomconfig_set prefetched.
+    :return: string
+    """
     mnt_helper = os.path.join(settings.ROOT_DIR, "bin/mnt-share")
+    admin_users = ""
+    for au in e.admin_users.all():
+        admin_users = "{}{} ".format(admin_users, au.username)
+    lines = [
+        "[{}]".format(e.share.name),
+        '    root preexec = "{} {}"'.format(mnt_helper, e.share.name),
+        "    root preexec close = yes",
+        "    comment = {}".format(e.comment.encode("utf-8")),
+        "    path = {}".format(e.path),
+        "    browseable = {}".format(e.browsable),
+        "    read only = {}".format(e.read_only),
+        "    guest ok = {}".format(e.guest_ok),
+    ]
+    if len(admin_users) > 0:
+        lines.append("    admin users = {}".format(admin_users))
+    if e.shadow_copy:
+        lines.extend(
+            [
+                "    shadow:format = ." + e.snapshot_prefix + "_%Y%m%d%H%M",
+                "    shadow:basedir = {}".format(e.path),
+                "    shadow:snapdir = ./",
+                "    shadow:sort = desc",
+                "    shadow:localtime = yes",
+                "    vfs objects = shadow_copy2",
+                "    veto files = /.{}*/".format(e.snapshot_prefix),
+            ]
+        )
+    elif e.time_machine:
+        lines.extend(
+            [
+                "    vfs objects = catia fruit streams_xattr",
+                "    fruit:timemachine = yes",
+                "    fruit:metadata = stream",
+                "    fruit:veto_appledouble = no",
+                "    fruit:posix_rename = no",
+                "    fruit:wipe_intentionally_left_blank_rfork = yes",
+                "    fruit:delete_empty_adfiles = yes",
+                "    fruit:encoding = private",
+                "    fruit:locking = none",
+                "    fruit:resource = file",
+            ]
+        )
+    for cco in e.sambacustomconfig_set.all():
+        if cco.custom_config.strip():
+            lines.append("    {}".format(cco.custom_config))
+    return "\n".join(lines) + "\n"
+
+
+def share_config_file(share_name):
+    return os.path.join(SMB_SHARES_DIR, "{}.conf".format(share_name))
+
+
+def rockstor_smb_config(fo, exports, config_files=None):
+    """
+    Write our section of smb.conf: an include of each export's own config
+    file, see share_smb_config().
+    :param fo: file object.
+    :param exports: list of SambaShare objects.
+    :param config_files: dict of config file paths, by share name, to include
+    in place of the default, see share_config_file().
+    """
+    if config_files is None:
+        config_files = {}
     fo.write("{}\n".format(RS_SHARES_HEADER))
     for e in exports:
-        admin_users = ""
-        for au in e.admin_users.all():
-            admin_users = "{}{} ".format(admin_users, au.username)
-        fo.write("[{}]\n".format(e.share.name))
-        fo.write('    root preexec = "{} {}"\n'.format(mnt_helper, e.share.name))
-        fo.write("    root preexec close = yes\n")
-        fo.write("    comment = {}\n".format(e.comment.encode("utf-8")))
-        fo.write("    path = {}\n".format(e.path))
-        fo.write("    browseable = {}\n".format(e.browsable))
-        fo.write("    read only = {}\n".format(e.read_only))
-        fo.write("    guest ok = {}\n".format(e.guest_ok))
-        if len(admin_users) > 0:
-            fo.write("    admin users = {}\n".format(admin_users))
-        if e.shadow_copy:
-            fo.write(
-                "    shadow:format = ." + e.snapshot_prefix + "_%Y%m%d%H%M\n"
-            )  # noqa E501
-            fo.write("    shadow:basedir = {}\n".format(e.path))
-            fo.write("    shadow:snapdir = ./\n")
-            fo.write("    shadow:sort = desc\n")
-            fo.write("    shadow:localtime = yes\n")
-            fo.write("    vfs objects = shadow_copy2\n")
-            fo.write("    veto files = /.{}*/\n".format(e.snapshot_prefix))
-        elif e.time_machine:
-            fo.write("    vfs objects = catia fruit streams_xattr\n")
-            fo.write("    fruit:timemachine = yes\n")
-            fo.write("    fruit:metadata = stream\n")
-            fo.write("    fruit:veto_appledouble = no\n")
-            fo.write("    fruit:posix_rename = no\n")
-            fo.write("    fruit:wipe_intentionally_left_blank_rfork = yes\n")
-            fo.write("    fruit:delete_empty_adfiles = yes\n")
-            fo.write("    fruit:encoding = private\n")
-            fo.write("    fruit:locking = none\n")
-            fo.write("    fruit:resource = file\n")
-        for cco in SambaCustomConfig.objects.filter(smb_share=e):
-            if cco.custom_config.strip():
-                fo.write("    {}\n".format(cco.custom_config))
+        config_file = config_files.get(e.share.name, share_config_file(e.share.name))
+        fo.write("include = {}\n".format(config_file))
     fo.write("{}\n".format(RS_SHARES_FOOTER))
 
 
+def _file_hash(path):
+    if not os.path.isfile(path):
+        return None
+    with open(path) as fo:
+        return hashlib.sha1(fo.read()).hexdigest()
+
+
 def refresh_smb_config(exports):
+    """
+    Bring the config of our Samba exports in line with exports: rewriting
+    only the per export config files whose content has changed, and smb.conf
+    only if exports have been added or removed. The result is checked via
+    testparm before any change is put in place.
+    :param exports: list of all SambaShare objects.
+    :return: list of names of the shares whose config was added, changed, or
+    removed. Empty if there was no change, ie nothing to reload.
+    """
+    if not os.path.isdir(SMB_SHARES_DIR):
+        os.makedirs(SMB_SHARES_DIR)
+    # Changed configs by share name, to their temporary file.
+    new_files = {}
+    for e in exports:
+        config = share_smb_config(e)
+        config_file = share_config_file(e.share.name)
+        if hashlib.sha1(config).hexdigest() == _file_hash(config_file):
+            continue
+        fh, npath = mkstemp(dir=SMB_SHARES_DIR, suffix=".new")
+        with os.fdopen(fh, "w") as tfo:
+            tfo.write(config)
+        os.chmod(npath, 0o644)
+        new_files[e.share.name] = npath
+    share_names = set(e.share.name for e in exports)
+    removed = [
+        f
+        for f in os.listdir(SMB_SHARES_DIR)
+        if f.endswith(".conf") and f[: -len(".conf")] not in share_names
+    ]
+    with open(SMB_CONFIG) as sfo:
+        cur_config = sfo.readlines()
+    rockstor_section = []
+    for line in cur_config:
+        if re.match(RS_SHARES_HEADER, line) is not None or len(rockstor_section) > 0:
+            rockstor_section.append(line)
+    section = io.BytesIO()
+    rockstor_smb_config(section, exports)
+    smb_conf_changed = section.getvalue() != "".join(rockstor_section)
+    if len(new_files) == 0 and not smb_conf_changed:
+        return []
+    # Our whole config, as it is to be, with the new per export configs.
     fh, npath = mkstemp()
-    with open(SMB_CONFIG) as sfo, open(npath, "w") as tfo:
-        rockstor_section = False
-        for line in sfo.readlines():
-            if re.match(RS_SHARES_HEADER, line) is not None:
-                rockstor_section = True
-                rockstor_smb_config(tfo, exports)
-                break
-            else:
+    try:
+        with os.fdopen(fh, "w") as tfo:
+            for line in cur_config:
+                if re.match(RS_SHARES_HEADER, line) is not None:
+                    break
                 tfo.write(line)
-        if rockstor_section is False:
-            rockstor_smb_config(tfo, exports)
-    test_parm(npath)
-    shutil.move(npath, SMB_CONFIG)
+            rockstor_smb_config(tfo, exports, new_files)
+        test_parm(npath)
+    except Exception:
+        os.remove(npath)
+        for path in new_files.values():
+            os.remove(path)
+        raise
+    for share_name, path in new_files.items():
+        shutil.move(path, share_config_file(share_name))
+    if smb_conf_changed:
+        with open(npath, "w") as tfo:
+            for line in cur_config:
+                if re.match(RS_SHARES_HEADER, line) is not None:
+                    break
+                tfo.write(line)
+            tfo.write(section.getvalue())
+        shutil.move(npath, SMB_CONFIG)
+    else:
+        os.remove(npath)
+    for f in removed:
+        os.remove(os.path.join(SMB_SHARES_DIR, f))
+    return sorted(set(new_files.keys()) | set(f[: -len(".conf")] for f in removed))
 
 
 # write out new [global] section and re-write the existing rockstor section.
@@ -219,12 +320,14 @@ def get_global_config():
 def restart_samba(hard=False):
     """
     call whenever config is updated
+    :param hard: True to restart smb and nmb, ie for [global] changes. Else
+    smbd only is asked to reload its config: applying share changes without
+    dropping the sessions of connected clients.
     """
-    mode = "reload"
     if hard:
-        mode = "restart"
-    run_command([SYSTEMCTL, mode, "smb"], log=True)
-    return run_command([SYSTEMCTL, mode, "nmb"], log=True)
+        run_command([SYSTEMCTL, "restart", "smb"], log=True)
+        return run_command([SYSTEMCTL, "restart", "nmb"], log=True)
+    return run_command([SMBCONTROL, "smbd", "reload-config"], log=True)
 
 
 def refresh_smb_discovery(exports):
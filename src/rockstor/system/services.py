@@ -16,15 +16,21 @@ You should have received a copy of the GNU General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
+import json
 import os
 import re
 import shutil
 import stat
+import threading
+import time
 from tempfile import mkstemp
 
 from django.conf import settings
 
 from osi import run_command
+import logging
+
+logger = logging.getLogger(__name__)
 
 SSHD_CONFIG = "/etc/ssh/sshd_config"
 SYSTEMCTL_BIN = "/usr/bin/systemctl"
@@ -34,9 +40,21 @@ SSSD_FILE = "/etc/sssd/sssd.conf"
 NET = "/usr/bin/net"
 WBINFO = "/usr/bin/wbinfo"
 REALM = "/usr/sbin/realm"
+# Seconds for which a service_statuses() result is re-used. Status probes fork
+# one or more systemctl/realm/supervisorctl processes per service.
+SERVICE_STATUS_TTL = 5
+# Seconds to wait on any one service's status probe before reporting unknown.
+SERVICE_STATUS_TIMEOUT = 10
+SERVICE_STATUS_MAX_WORKERS = 16
+
+# Per process: {(service_name, config json): (time, (out, err, rc) or None)}
+_status_cache = {}
+# Per process: {(service_name, config json): _StatusProbe} of running probes.
+_status_probes = {}
+_status_cache_lock = threading.Lock()
 
 
-def init_service_op(service_name, command, throw=True):
+def init_service_op(service_name, command, throw=True, timeout=None):
     """
     Wrapper for run_command calling systemctl, hardwired filter on service_name
     and will raise Exception on failed match. Enables run_command exceptions
@@ -44,6 +62,7 @@ def init_service_op(service_name, command, throw=True):
     :param service_name:
     :param command:
     :param throw:
+    :param timeout: passed to run_command.
     :return: out err rc
     """
     supported_services = (
@@ -69,14 +88,18 @@ def init_service_op(service_name, command, throw=True):
     arg_list = [SYSTEMCTL_BIN, command, service_name]
     if command == "status":
         arg_list.append("--lines=0")
+    else:
+        clear_status_cache()
 
-    return run_command(arg_list, throw=throw)
+    return run_command(arg_list, throw=throw, timeout=timeout)
 
 
 def systemctl(service_name, switch):
     arg_list = [SYSTEMCTL_BIN, switch, service_name]
     if switch == "status":
         arg_list.append("--lines=0")
+    else:
+        clear_status_cache()
 
     return run_command(arg_list, log=True)
 
@@ -115,8 +138,10 @@ def set_autostart(service, switch):
     shutil.move(npath, SUPERVISORD_CONF)
 
 
-def superctl(service, switch):
-    out, err, rc = run_command([SUPERCTL_BIN, switch, service])
+def superctl(service, switch, timeout=None):
+    if switch != "status":
+        clear_status_cache()
+    out, err, rc = run_command([SUPERCTL_BIN, switch, service], timeout=timeout)
     set_autostart(service, switch)
     if switch == "status":
         status = out[0].split()[1]
@@ -125,25 +150,31 @@ def superctl(service, switch):
     return out, err, rc
 
 
-def service_status(service_name, config=None):
+def service_status(service_name, config=None, timeout=None):
     """
     Service status of either systemd or supervisord managed services.
     Hardwired to identify controlling system by service name and uses one of
     systemctl, init_service_op, or superctl to assess status accordingly.
     Note some sanity checks for some services.
     :param service_name:
+    :param timeout: seconds after which each underlying command is killed,
+    raising an Exception. None to wait indefinitely.
     :return:
     """
     if service_name == "nis" or service_name == "nfs":
-        out, err, rc = init_service_op("rpcbind", "status", throw=False)
+        out, err, rc = init_service_op(
+            "rpcbind", "status", throw=False, timeout=timeout
+        )
         if rc != 0:
             return out, err, rc
         if service_name == "nis":
-            return init_service_op("ypbind", "status", throw=False)
+            return init_service_op("ypbind", "status", throw=False, timeout=timeout)
         else:
-            return init_service_op("nfs-server", "status", throw=False)
+            return init_service_op(
+                "nfs-server", "status", throw=False, timeout=timeout
+            )
     elif service_name == "ldap":
-        o, e, rc = init_service_op("sssd", "status", throw=False)
+        o, e, rc = init_service_op("sssd", "status", throw=False, timeout=timeout)
         # initial check on sssd status: 0 = OK 3 = stopped
         if rc != 0:
             return o, e, rc
@@ -160,7 +191,9 @@ def service_status(service_name, config=None):
                     return o, e, rc
             return o, e, 1
     elif service_name == "sftp":
-        out, err, rc = init_service_op("sshd", "status", throw=False)
+        out, err, rc = init_service_op(
+            "sshd", "status", throw=False, timeout=timeout
+        )
         # initial check on sshd status: 0 = OK 3 = stopped
         if rc != 0:
             return out, err, rc
@@ -175,28 +208,153 @@ def service_status(service_name, config=None):
             # interprets -1 as enabled, 1 works for disabled.
             return out, err, 1
     elif service_name in ("replication", "data-collector", "ztask-daemon"):
-        return superctl(service_name, "status")
+        return superctl(service_name, "status", timeout=timeout)
     elif service_name == "smb":
-        out, err, rc = run_command([SYSTEMCTL_BIN, "--lines=0", "status", "smb"], throw=False)
+        out, err, rc = run_command(
+            [SYSTEMCTL_BIN, "--lines=0", "status", "smb"], throw=False, timeout=timeout
+        )
         if rc != 0:
             return out, err, rc
-        return run_command([SYSTEMCTL_BIN, "--lines=0", "status", "nmb"], throw=False)
+        return run_command(
+            [SYSTEMCTL_BIN, "--lines=0", "status", "nmb"], throw=False, timeout=timeout
+        )
     elif service_name == "nut":
         # Establish if nut is running by lowest common denominator nut-monitor
         # In netclient mode it is all that is required, however we don't then
         # reflect the state of the other services of nut-server and nut-driver.
-        return run_command([SYSTEMCTL_BIN, "--lines=0", "status", "nut-monitor"], throw=False)
+        return run_command(
+            [SYSTEMCTL_BIN, "--lines=0", "status", "nut-monitor"],
+            throw=False,
+            timeout=timeout,
+        )
     elif service_name == "active-directory":
         if config is not None:
             active_directory_rc = 1
-            o, e, rc = run_command([REALM, "list", "--name-only",])
+            o, e, rc = run_command([REALM, "list", "--name-only",], timeout=timeout)
             if config["domain"] in o:
                 active_directory_rc = 0
             return "", "", active_directory_rc
         # bootstrap switch subsystem interprets -1 as ON so returning 1 instead
         return "", "", 1
 
-    return init_service_op(service_name, "status", throw=False)
+    return init_service_op(service_name, "status", throw=False, timeout=timeout)
+
+
+def clear_status_cache():
+    """
+    Drop all cached service_statuses() results. Called on any service state
+    change made via this module so that a following status query is current.
+    """
+    with _status_cache_lock:
+        _status_cache.clear()
+
+
+def _status_key(service_name, config):
+    return service_name, json.dumps(config, sort_keys=True)
+
+
+class _StatusProbe(threading.Thread):
+    """
+    A single service_status() call run in its own thread, once one of its
+    caller's worker slots is free. On completion, or failure, the result is
+    cached and the probe leaves _status_probes: until then, callers wanting
+    the same status wait on this probe rather than starting another.
+    """
+
+    def __init__(self, key, service_name, config, timeout, slots):
+        super(_StatusProbe, self).__init__()
+        self.daemon = True
+        self.key = key
+        self.service_name = service_name
+        self.config = config
+        self.timeout = timeout
+        self.slots = slots
+        self.started_at = None
+        self.probe_started = threading.Event()
+        self.done = threading.Event()
+        self.status = None
+
+    def run(self):
+        with self.slots:
+            self.started_at = time.time()
+            self.probe_started.set()
+            try:
+                self.status = service_status(
+                    self.service_name, self.config, timeout=self.timeout
+                )
+            except Exception as e:
+                logger.error(
+                    "Exception while querying status of service({}): {}".format(
+                        self.service_name, e.__str__()
+                    )
+                )
+            finally:
+                with _status_cache_lock:
+                    _status_cache[self.key] = (time.time(), self.status)
+                    if _status_probes.get(self.key) is self:
+                        del _status_probes[self.key]
+                self.done.set()
+
+    def wait_status(self):
+        """
+        Wait for our result for no more than timeout seconds from the start
+        of our probe, as opposed to from the start of our wait.
+        :return: service_status() return value, or None if it raised or has
+        not returned by our deadline.
+        """
+        self.probe_started.wait()
+        remaining = self.started_at + self.timeout - time.time()
+        if not self.done.wait(max(remaining, 0)):
+            logger.error(
+                "Timed out querying status of service({}).".format(self.service_name)
+            )
+            return None
+        return self.status
+
+
+def service_statuses(
+    services,
+    ttl=SERVICE_STATUS_TTL,
+    timeout=SERVICE_STATUS_TIMEOUT,
+    max_workers=SERVICE_STATUS_MAX_WORKERS,
+):
+    """
+    Concurrent and cached equivalent of service_status() for multiple
+    services. Results younger than ttl seconds are re-used; the remainder are
+    probed in parallel. The cache is per process, ie it is shared by all
+    requests served by a gunicorn worker, or by all data-collector clients.
+    A service whose probe is still running, ie hung, is not probed again:
+    callers instead share the outstanding probe, and its deadline.
+    :param services: list of (service_name, config) tuples.
+    :param ttl: max age in seconds of a re-used result, 0 to force a probe.
+    :param timeout: seconds to wait on each service's probe from its start,
+    after which its commands are killed.
+    :param max_workers: upper limit on concurrent probes.
+    :return: dict indexed by service_name of service_status() return values,
+    or of None where the status could not be established: ie the probe
+    raised an exception or did not return within timeout seconds. Such
+    results are cached as any other.
+    """
+    now = time.time()
+    statuses = {}
+    probes = []
+    slots = threading.Semaphore(max_workers)
+    with _status_cache_lock:
+        for service_name, config in services:
+            key = _status_key(service_name, config)
+            entry = _status_cache.get(key)
+            if entry is not None and now - entry[0] < ttl:
+                statuses[service_name] = entry[1]
+                continue
+            probe = _status_probes.get(key)
+            if probe is None:
+                probe = _StatusProbe(key, service_name, config, timeout, slots)
+                _status_probes[key] = probe
+                probe.start()
+            probes.append(probe)
+    for probe in probes:
+        statuses[probe.service_name] = probe.wait_status()
+    return statuses
 
 
 def update_nginx(ip, port):
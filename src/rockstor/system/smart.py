@@ -35,6 +35,20 @@ CAT = "/usr/bin/cat"
 # currently hardwired to read from eg:- /root/smartdumps/smart-H--info.out
 # default setting = False
 TESTMODE = False
+# smartctl exit status bits, see "RETURN VALUES" in man smartctl.
+RC_PARSE_ERROR = 1
+RC_OPEN_FAILED = 2
+RC_ERROR_LOG = 64
+RC_SELFTEST_ERRORS = 128
+READ_SECTION = "=== START OF READ SMART DATA SECTION ==="
+# Leading line patterns of the 'smartctl -a' READ_SECTION sub-sections that
+# are otherwise retrieved individually by -c, -l error, and -l selftest.
+SECTION_STARTS = (
+    ("capabilities", "General SMART Values:"),
+    ("attributes", "SMART Attributes Data Structure"),
+    ("error_log", "SMART Error Log|Error counter log"),
+    ("test_log", "SMART Self-test log|SMART Selective self-test log|No self-tests"),
+)
 
 
 def info(device, custom_options="", test_mode=TESTMODE):
@@ -52,6 +66,15 @@ def info(device, custom_options="", test_mode=TESTMODE):
         )
     else:  # we are testing so use a smartctl -H --info file dump instead
         o, e, rc = run_command([CAT, "/root/smartdumps/smart-H--info.out"])
+    return parse_info(o)
+
+
+def parse_info(o):
+    """
+    Parse smartctl -H --info, or -a, output. See info().
+    :param o: list of output lines.
+    :return: list of smart parameters.
+    """
     # List of string matches to look for in smartctrl -H --info output.
     # Note the "|" char allows for defining alternative matches ie A or B
     matches = (
@@ -107,6 +130,15 @@ def extended_info(device, custom_options="", test_mode=TESTMODE):
         )
     else:  # we are testing so use a smartctl -a file dump instead
         o, e, rc = run_command([CAT, "/root/smartdumps/smart-a.out"])
+    return parse_extended_info(o)
+
+
+def parse_extended_info(o):
+    """
+    Parse smartctl -a output. See extended_info().
+    :param o: list of output lines.
+    :return: dictionary of smart attributes.
+    """
     attributes = {}
     for i in range(len(o)):
         if (
@@ -144,6 +176,15 @@ def capabilities(device, custom_options="", test_mode=TESTMODE):
         o, e, rc = run_command([SMART, "-c"] + get_dev_options(device, custom_options))
     else:  # we are testing so use a smartctl -c file dump instead
         o, e, rc = run_command([CAT, "/root/smartdumps/smart-c.out"])
+    return parse_capabilities(o)
+
+
+def parse_capabilities(o):
+    """
+    Parse smartctl -c output. See capabilities().
+    :param o: list of output lines.
+    :return: dictionary of smart capabilities.
+    """
     cap_d = {}
     for i in range(len(o)):
         if re.match("=== START OF READ SMART DATA SECTION ===", o[i]) is not None:
@@ -197,6 +238,15 @@ def error_logs(device, custom_options="", test_mode=TESTMODE):
         "the Error logs tab for this device." % local_base_dev
     )
     screen_return_codes(e_msg, overide_rc, o, e, rc, smart_command)
+    return parse_error_logs(o)
+
+
+def parse_error_logs(o):
+    """
+    Parse smartctl -l error output. See error_logs().
+    :param o: list of output lines.
+    :return: tuple of error summary dictionary and error log lines list.
+    """
     ecode_map = {
         "ABRT": "Command ABoRTed",
         "AMNF": "Address Mark Not Found",
@@ -284,6 +334,15 @@ def test_logs(device, custom_options="", test_mode=TESTMODE):
         % (smart_command, overide_rc)
     )
     screen_return_codes(e_msg, overide_rc, o, e, rc, smart_command)
+    return parse_test_logs(o)
+
+
+def parse_test_logs(o):
+    """
+    Parse smartctl -l selftest -l selective output. See test_logs().
+    :param o: list of output lines.
+    :return: tuple of test summary dictionary and test log lines list.
+    """
     test_d = {}
     log_l = []
     for i in range(len(o)):
@@ -320,6 +379,88 @@ def test_logs(device, custom_options="", test_mode=TESTMODE):
     return (test_d, log_l)
 
 
+def split_sections(o):
+    """
+    Split smartctl -a output into the READ_SECTION sub-sections named in
+    SECTION_STARTS. Each starts on a line, following a blank line, matching
+    its pattern and runs to the start of the next. The selective self-test
+    log is included in test_log as per 'smartctl -l selftest -l selective'.
+    :param o: list of output lines.
+    :return: dictionary of lists of lines indexed by sub-section name.
+    """
+    sections = {}
+    current = None
+    prev_line = ""
+    in_read_section = False
+    for line in o:
+        if re.match(READ_SECTION, line) is not None:
+            in_read_section = True
+        elif in_read_section:
+            if prev_line.strip() == "":
+                for name, pattern in SECTION_STARTS:
+                    if re.match(pattern, line) is not None:
+                        current = name
+                        break
+            if current is not None:
+                sections.setdefault(current, []).append(line)
+        prev_line = line
+    return sections
+
+
+def collect(device, custom_options="", test_mode=TESTMODE, notify=True):
+    """
+    Retrieve all that info(), extended_info(), capabilities(), error_logs(),
+    and test_logs() do, but from a single smartctl -a invocation: whose
+    output includes each of their sections.
+    :param device: disk device name
+    :param custom_options: string of user entered custom smart options.
+    :param test_mode: True causes cat from file rather than smartctl command
+    :param notify: email root on an error log, or self-test errors, as per
+    error_logs() and test_logs().
+    :return: dictionary of the above function's return values indexed by
+    their name.
+    """
+    dev_options = get_dev_options(device, custom_options)
+    smart_command = [SMART, "-a"] + dev_options
+    if not test_mode:
+        o, e, rc = run_command(smart_command, throw=False)
+    else:
+        o, e, rc = run_command([CAT, "/root/smartdumps/smart-a.out"])
+    # Other bits report on device health, logged errors, or failed SMART
+    # commands: ie when SMART is disabled; and so are expected.
+    if rc & (RC_PARSE_ERROR | RC_OPEN_FAILED):
+        e_msg = "non-zero code(%d) returned by command: %s output: " "%s error: %s" % (
+            rc,
+            smart_command,
+            o,
+            e,
+        )
+        logger.error(e_msg)
+        raise CommandException(("%s" % smart_command), o, e, rc)
+    for rc_bit, tab in (
+        (RC_ERROR_LOG, "Error logs"),
+        (RC_SELFTEST_ERRORS, "Self-Test Logs"),
+    ):
+        if rc & rc_bit:
+            e_msg = (
+                "Drive %s has logged S.M.A.R.T errors. Please view "
+                "the %s tab for this device." % (dev_options, tab)
+            )
+            logger.error(e_msg)
+            if notify:
+                email_root("S.M.A.R.T error", e_msg)
+    sections = split_sections(o)
+    return {
+        "info": parse_info(o),
+        "extended_info": parse_extended_info(o),
+        "capabilities": parse_capabilities(
+            [READ_SECTION] + sections.get("capabilities", [])
+        ),
+        "error_logs": parse_error_logs([READ_SECTION] + sections.get("error_log", [])),
+        "test_logs": parse_test_logs(sections.get("test_log", [])),
+    }
+
+
 def run_test(device, test, custom_options=""):
     # start a smart test(short, long or conveyance)
     return run_command([SMART, "-t", test] + get_dev_options(device, custom_options))
@@ -0,0 +1,237 @@
+"""
+Copyright (c) 2012-2021 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import collections
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Default upper limit on concurrently running tasks.
+MAX_WORKERS = 8
+# Task states, the latter three being final.
+WAITING = "waiting"
+READY = "ready"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+FINAL_STATES = (DONE, FAILED, SKIPPED)
+
+
+class TaskGraph(object):
+    """
+    Runs named tasks, each as soon as all the tasks it is ordered after have
+    finished, on a bounded number of worker threads. Tasks may add further
+    tasks while running, ie once the objects these cover become known. The
+    timing of each task is recorded: see report().
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, worker_exit=None):
+        """
+        :param max_workers: upper limit on concurrently running tasks.
+        :param worker_exit: callable run by each worker thread on exit, ie to
+        close its database connections.
+        """
+        self.max_workers = max_workers
+        self.worker_exit = worker_exit
+        self.tasks = collections.OrderedDict()
+        # Names of the tasks waiting on each unfinished task, by its name.
+        self.waiters = collections.defaultdict(list)
+        self.ready = collections.deque()
+        self.pending = 0
+        self.started = None
+        self.ended = None
+        self.cond = threading.Condition()
+
+    def add(self, name, func, args=(), deps=(), after=(), phase=None):
+        """
+        :param name: unique task name, ie "mount-share:12".
+        :param func: callable, run as func(*args).
+        :param args: tuple of func arguments.
+        :param deps: names of prior added tasks which must succeed first: our
+        task is skipped if any fail or are themselves skipped.
+        :param after: names of prior added tasks to run after, irrespective
+        of their outcome.
+        :param phase: name under which our task is reported, ie "mount-share".
+        Defaults to name.
+        """
+        with self.cond:
+            if name in self.tasks:
+                raise ValueError("Duplicate task ({}).".format(name))
+            for prior in tuple(deps) + tuple(after):
+                if prior not in self.tasks:
+                    raise ValueError(
+                        "Unknown task ({}) preceding task ({}).".format(prior, name)
+                    )
+            task = {
+                "name": name,
+                "func": func,
+                "args": tuple(args),
+                "deps": tuple(deps),
+                "after": tuple(after),
+                "phase": name if phase is None else phase,
+                "status": WAITING,
+                "blockers": 0,
+                "start": None,
+                "end": None,
+                "error": None,
+            }
+            self.tasks[name] = task
+            self.pending += 1
+            if self.started is not None:
+                self._schedule(task)
+
+    def _schedule(self, task):
+        # Caller holds self.cond.
+        blockers = [
+            prior
+            for prior in task["deps"] + task["after"]
+            if self.tasks[prior]["status"] not in FINAL_STATES
+        ]
+        if len(blockers) > 0:
+            task["blockers"] = len(blockers)
+            for prior in blockers:
+                self.waiters[prior].append(task["name"])
+            return
+        if any(self.tasks[prior]["status"] != DONE for prior in task["deps"]):
+            self._finish(task, SKIPPED)
+            return
+        task["status"] = READY
+        self.ready.append(task)
+        self.cond.notify()
+
+    def _finish(self, task, status):
+        # Caller holds self.cond.
+        task["status"] = status
+        task["end"] = time.time()
+        self.pending -= 1
+        for name in self.waiters.pop(task["name"], []):
+            waiter = self.tasks[name]
+            waiter["blockers"] -= 1
+            if waiter["blockers"] == 0:
+                self._schedule(waiter)
+        if self.pending == 0:
+            self.cond.notify_all()
+
+    def _run(self, task):
+        try:
+            task["func"](*task["args"])
+            status = DONE
+        except Exception as e:
+            logger.error("Task ({}) failed: {}".format(task["name"], e.__str__()))
+            logger.exception(e)
+            task["error"] = e.__str__()
+            status = FAILED
+        with self.cond:
+            self._finish(task, status)
+
+    def _worker(self):
+        try:
+            while True:
+                with self.cond:
+                    while len(self.ready) == 0 and self.pending > 0:
+                        self.cond.wait()
+                    if len(self.ready) == 0:
+                        return
+                    task = self.ready.popleft()
+                    task["status"] = RUNNING
+                    task["start"] = time.time()
+                self._run(task)
+        finally:
+            if self.worker_exit is not None:
+                self.worker_exit()
+
+    def run(self):
+        """
+        Run all tasks, including those added while running, returning once
+        all have finished.
+        :return: report()
+        """
+        with self.cond:
+            self.started = time.time()
+            for task in list(self.tasks.values()):
+                if task["status"] == WAITING and task["blockers"] == 0:
+                    self._schedule(task)
+        workers = [
+            threading.Thread(target=self._worker) for i in range(self.max_workers)
+        ]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.ended = time.time()
+        return self.report()
+
+    def report(self):
+        """
+        Timing report, all times being in seconds from the start of run().
+        :return: dict with "total": run duration, "phases": dict by phase of
+        dicts of task count, failed and skipped counts, start and end of the
+        phase's first and last task, and busy (sum of task durations), and
+        "tasks": list of dicts of each task's name, phase, status, start,
+        duration and error (message if failed), in order of addition.
+        """
+
+        def offset(t):
+            return None if t is None else round(t - self.started, 3)
+
+        phases = collections.OrderedDict()
+        tasks = []
+        for task in self.tasks.values():
+            duration = 0
+            if task["start"] is not None and task["end"] is not None:
+                duration = task["end"] - task["start"]
+            tasks.append(
+                {
+                    "name": task["name"],
+                    "phase": task["phase"],
+                    "status": task["status"],
+                    "start": offset(task["start"]),
+                    "duration": round(duration, 3),
+                    "error": task["error"],
+                }
+            )
+            phase = phases.setdefault(
+                task["phase"],
+                {
+                    "tasks": 0,
+                    "failed": 0,
+                    "skipped": 0,
+                    "start": None,
+                    "end": None,
+                    "busy": 0,
+                },
+            )
+            phase["tasks"] += 1
+            if task["status"] in (FAILED, SKIPPED):
+                phase[task["status"]] += 1
+            if task["start"] is not None:
+                start = offset(task["start"])
+                if phase["start"] is None or start < phase["start"]:
+                    phase["start"] = start
+            if task["end"] is not None and task["status"] != SKIPPED:
+                end = offset(task["end"])
+                if phase["end"] is None or end > phase["end"]:
+                    phase["end"] = end
+            phase["busy"] = round(phase["busy"] + duration, 3)
+        total = None
+        if self.started is not None and self.ended is not None:
+            total = round(self.ended - self.started, 3)
+        return {"total": total, "phases": phases, "tasks": tasks}
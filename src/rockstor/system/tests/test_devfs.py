@@ -0,0 +1,123 @@
+"""
+Copyright (c) 2012-2021 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from system import devfs
+from system.osi import (
+    get_byid_name_map,
+    get_byid_temp_name_map,
+    get_device_mapper_map,
+    get_uuid_name_map,
+)
+
+
+class SystemDevfsTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor-dev>
+    ./bin/test --settings=test-settings -v 3 -p test_devfs*
+    """
+
+    def setUp(self):
+        devfs.clear_cache()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.byid_dir = os.path.join(self.tmp_dir, "by-id")
+        os.mkdir(self.byid_dir)
+        for name, target in [
+            ("ata-QEMU_HARDDISK_QM00005", "../../sda"),
+            ("ata-QEMU_HARDDISK_QM00005-part1", "../../sda1"),
+            ("wwn-0x5000cca252017870", "../../sdb"),
+            ("scsi-35000cca252017870", "../../sdb"),
+        ]:
+            os.symlink(target, os.path.join(self.byid_dir, name))
+        # Subdirectory entries are not device links.
+        os.mkdir(os.path.join(self.byid_dir, "scsi-SDELL_PERC_6"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        devfs.clear_cache()
+
+    def test_dir_links(self):
+        expected = {
+            "ata-QEMU_HARDDISK_QM00005": "sda",
+            "ata-QEMU_HARDDISK_QM00005-part1": "sda1",
+            "wwn-0x5000cca252017870": "sdb",
+            "scsi-35000cca252017870": "sdb",
+        }
+        self.assertEqual(devfs.dir_links(self.byid_dir), expected)
+        self.assertIsNone(devfs.dir_links(os.path.join(self.tmp_dir, "bogus")))
+
+    def test_dir_links_memoized(self):
+        with patch("system.devfs._read_links", wraps=devfs._read_links) as reader:
+            devfs.dir_links(self.byid_dir)
+            devfs.dir_links(self.byid_dir)
+            self.assertEqual(reader.call_count, 1)
+            # A changed directory mtime invalidates our prior read.
+            os.symlink("../../sdc", os.path.join(self.byid_dir, "ata-new"))
+            os.utime(self.byid_dir, (0, 0))
+            self.assertEqual(devfs.dir_links(self.byid_dir)["ata-new"], "sdc")
+            self.assertEqual(reader.call_count, 2)
+
+    def test_read_udev_data(self):
+        data_file = os.path.join(self.tmp_dir, "b8:0")
+        with open(data_file, "w") as data:
+            data.write(
+                "S:disk/by-id/ata-QEMU_HARDDISK_QM00005\n"
+                "S:disk/by-path/pci-0000:00:05.0-ata-1.0\n"
+                "I:1176578\n"
+                "E:ID_ATA=1\n"
+                "E:ID_ATA_ROTATION_RATE_RPM=7200\n"
+                "G:systemd\n"
+            )
+        devlinks, properties = devfs._read_udev_data(data_file)
+        self.assertEqual(
+            devlinks,
+            [
+                "/dev/disk/by-id/ata-QEMU_HARDDISK_QM00005",
+                "/dev/disk/by-path/pci-0000:00:05.0-ata-1.0",
+            ],
+        )
+        self.assertEqual(
+            properties, {"ID_ATA": "1", "ID_ATA_ROTATION_RATE_RPM": "7200"}
+        )
+
+    @patch("system.osi.run_command")
+    def test_osi_maps_without_commands(self, mock_run_command):
+        links = {
+            "/dev/disk/by-id": devfs.dir_links(self.byid_dir),
+            "/dev/mapper": {"luks-dd6589a6": "dm-0"},
+            "/dev/disk/by-uuid": {"82fd9db1": "vdd"},
+        }
+        with patch("system.osi.dir_links", side_effect=links.get):
+            # Equal length names prefer reverse lexicographical, as 'ls -lr'.
+            self.assertEqual(
+                get_byid_name_map(),
+                {
+                    "sda": "ata-QEMU_HARDDISK_QM00005",
+                    "sda1": "ata-QEMU_HARDDISK_QM00005-part1",
+                    "sdb": "wwn-0x5000cca252017870",
+                },
+            )
+            self.assertEqual(
+                get_device_mapper_map(), {"dm-0": "/dev/mapper/luks-dd6589a6"}
+            )
+            self.assertEqual(get_uuid_name_map(), {"vdd": "82fd9db1"})
+            self.assertEqual(get_byid_temp_name_map(), links["/dev/disk/by-id"])
+        self.assertFalse(mock_run_command.called)
@@ -0,0 +1,203 @@
+"""
+Copyright (c) 2012-2021 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from mock import patch
+
+from system import diagbundle
+from system.diagbundle import (
+    BUNDLE_MIN_INTERVAL,
+    build_bundle,
+    capture_bundle,
+    log_segments,
+    request_bundle,
+)
+
+
+class DiagBundleTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor-dev>
+    ./bin/test --settings=test-settings -v 3 -p test_diagbundle*
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log_dir = os.path.join(self.tmp_dir, "log")
+        os.makedirs(os.path.join(self.log_dir, "nginx"))
+        self.bundle = os.path.join(self.tmp_dir, "logs", "error.tgz")
+        self.state = self.bundle + ".json"
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def append(self, name, data):
+        with open(os.path.join(self.log_dir, name), "a") as fo:
+            fo.write(data)
+
+    def members(self):
+        with tarfile.open(self.bundle) as tar:
+            return {
+                m.name: tar.extractfile(m).read().decode("utf-8")
+                for m in tar.getmembers()
+            }
+
+    def test_log_segments(self):
+        """
+        Only new or changed logs are included: from their prior size if
+        appended to, else whole. The most recent are kept within the cap.
+        """
+        prior = {
+            "rockstor.log": {"ino": 1, "size": 100, "mtime": 10},
+            "supervisord.log": {"ino": 2, "size": 50, "mtime": 10},
+            "rotated.log": {"ino": 3, "size": 500, "mtime": 10},
+            "old.log": {"ino": 4, "size": 70, "mtime": 5},
+        }
+        files = {
+            # appended to
+            "rockstor.log": {"ino": 1, "size": 180, "mtime": 40},
+            # unchanged
+            "supervisord.log": {"ino": 2, "size": 50, "mtime": 10},
+            # rotated, by copytruncate
+            "rotated.log": {"ino": 3, "size": 20, "mtime": 30},
+            # new
+            "nginx/access.log": {"ino": 5, "size": 60, "mtime": 20},
+            "old.log.gz": {"ino": 6, "size": 30, "mtime": 5},
+        }
+        segments, dropped = log_segments(files, prior, max_bytes=1000, min_tail=0)
+        self.assertEqual(
+            segments,
+            [
+                ("nginx/access.log", 0, 60),
+                ("old.log.gz", 0, 30),
+                ("rockstor.log", 100, 180),
+                ("rotated.log", 0, 20),
+            ],
+        )
+        self.assertEqual(dropped, [])
+        # Capped: newest first, each log's tail retained.
+        segments, dropped = log_segments(files, prior, max_bytes=110, min_tail=0)
+        self.assertEqual(
+            segments,
+            [
+                ("nginx/access.log", 50, 60),
+                ("rockstor.log", 100, 180),
+                ("rotated.log", 0, 20),
+            ],
+        )
+        self.assertEqual(dropped, [("nginx/access.log", 50), ("old.log.gz", 30)])
+        # Changed logs include at least their last min_tail bytes.
+        segments, dropped = log_segments(files, prior, max_bytes=1000, min_tail=150)
+        self.assertEqual(
+            segments,
+            [
+                ("nginx/access.log", 0, 60),
+                ("old.log.gz", 0, 30),
+                ("rockstor.log", 30, 180),
+                ("rotated.log", 0, 20),
+            ],
+        )
+
+    def test_build_bundle(self):
+        """
+        Bundles hold what is new since the last, along with the tail of each
+        changed log, and are rate limited and skipped when nothing has changed.
+        """
+        self.append("rockstor.log", "first error\n")
+        self.append("nginx/access.log", "GET /\n")
+        segments = build_bundle(self.log_dir, self.bundle, self.state, now=1000)
+        self.assertEqual(
+            segments, [("nginx/access.log", 0, 6), ("rockstor.log", 0, 12)]
+        )
+        members = self.members()
+        self.assertEqual(members["log/rockstor.log"], "first error\n")
+        self.assertEqual(members["log/nginx/access.log"], "GET /\n")
+        self.assertTrue("since their start" in members["MANIFEST"])
+        self.append("rockstor.log", "second error\n")
+        # Within min_interval of our last bundle.
+        self.assertIsNone(build_bundle(self.log_dir, self.bundle, self.state, now=1030))
+        segments = build_bundle(
+            self.log_dir, self.bundle, self.state, now=1100, min_tail=0
+        )
+        self.assertEqual(segments, [("rockstor.log", 12, 25)])
+        members = self.members()
+        self.assertEqual(members["log/rockstor.log"], "second error\n")
+        self.assertFalse("log/nginx/access.log" in members)
+        self.assertFalse(os.path.exists(self.bundle + ".tmp"))
+        # Nothing new, prior bundle retained.
+        self.assertIsNone(build_bundle(self.log_dir, self.bundle, self.state, now=1200))
+        self.assertEqual(self.members()["log/rockstor.log"], "second error\n")
+        # By default the prior context of a changed log is included.
+        self.append("rockstor.log", "third error\n")
+        segments = build_bundle(self.log_dir, self.bundle, self.state, now=1300)
+        self.assertEqual(segments, [("rockstor.log", 0, 37)])
+        self.assertEqual(
+            self.members()["log/rockstor.log"],
+            "first error\nsecond error\nthird error\n",
+        )
+
+    @patch("system.diagbundle.capture_bundle")
+    def test_request_bundle(self, mock_capture):
+        """
+        Requests within BUNDLE_MIN_INTERVAL of a bundle are coalesced into a
+        single bundle built once the interval has passed, never dropped.
+        """
+        diagbundle._next_build[0] = 0
+        with patch("system.diagbundle.BUNDLE_STATE", self.state), patch(
+            "system.diagbundle.time.time"
+        ) as mock_time:
+            mock_time.return_value = 1000
+            self.assertTrue(request_bundle())
+            self.assertEqual(mock_capture.async.call_count, 1)
+            # Our first bundle is built.
+            self.append("rockstor.log", "first error\n")
+            build_bundle(self.log_dir, self.bundle, self.state, now=1000)
+            # A later error is bundled once the interval is up.
+            mock_time.return_value = 1010
+            self.assertTrue(request_bundle())
+            mock_capture.after.assert_called_once_with(50)
+            # Coalesced with the bundle queued.
+            mock_time.return_value = 1030
+            self.assertTrue(request_bundle())
+            self.assertEqual(mock_capture.after.call_count, 1)
+            # After that bundle is due, another is queued for the next interval.
+            mock_time.return_value = 1065
+            self.assertTrue(request_bundle())
+            mock_capture.after.assert_called_with(55)
+        mock_capture.async.side_effect = Exception("ztaskd unavailable")
+        diagbundle._next_build[0] = 0
+        with patch("system.diagbundle.BUNDLE_STATE", self.state):
+            self.assertFalse(request_bundle())
+
+    @patch("system.diagbundle.capture_bundle.after")
+    def test_capture_bundle_retry(self, mock_after):
+        """
+        A capture run within BUNDLE_MIN_INTERVAL of a bundle re-queues itself.
+        """
+        self.append("rockstor.log", "first error\n")
+        with patch("system.diagbundle.LOG_DIR", self.log_dir), patch(
+            "system.diagbundle.BUNDLE", self.bundle
+        ), patch("system.diagbundle.BUNDLE_STATE", self.state):
+            capture_bundle()
+            self.assertTrue(os.path.isfile(self.bundle))
+            self.assertFalse(mock_after.called)
+            self.append("rockstor.log", "second error\n")
+            capture_bundle()
+            self.assertEqual(mock_after.call_count, 1)
+            self.assertTrue(0 < mock_after.call_args[0][0] <= BUNDLE_MIN_INTERVAL)
@@ -0,0 +1,167 @@
+"""
+Copyright (c) 2012-2021 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+from mock import patch
+
+from system.logreader import (
+    read_page,
+    tail_lines,
+    follow,
+    line_index,
+    search_log,
+    parse_time,
+    SearchCancelled,
+)
+
+
+class SystemLogReaderTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor-dev>
+    ./bin/test --settings=test-settings -v 3 -p test_logreader*
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmp_dir, "log.smbd")
+        self.lines = ["line {}\n".format(n) for n in range(25)]
+        self.write(self.lines)
+        # Small stride and blocks to exercise index and block boundaries.
+        patch("system.logreader.INDEX_STRIDE", 4).start()
+        patch("system.logreader.READ_BLOCK", 16).start()
+
+    def tearDown(self):
+        patch.stopall()
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, lines, mode="w"):
+        with open(self.log, mode) as fo:
+            fo.write("".join(lines))
+
+    def test_read_page(self):
+        self.assertEqual(read_page(self.log, 0, 3), (0, self.lines[0:3], 25))
+        self.assertEqual(read_page(self.log, 9, 6), (9, self.lines[9:15], 25))
+        self.assertEqual(read_page(self.log, -2, 5), (23, self.lines[23:], 25))
+        self.assertEqual(read_page(self.log, 30, 5), (30, [], 25))
+        self.assertEqual(line_index(self.log).offsets[1], len("".join(self.lines[:4])))
+        # Unterminated last line.
+        self.write(["partial"], mode="a")
+        self.assertEqual(read_page(self.log, 24, 5), (24, ["line 24\n", "partial"], 26))
+
+    def test_read_page_growth_and_rotation(self):
+        read_page(self.log, 0, 1)
+        index = line_index(self.log)
+        scanned = index.size
+        self.write(["more {}\n".format(n) for n in range(5)], mode="a")
+        self.assertEqual(
+            read_page(self.log, 27, 5), (27, ["more 2\n", "more 3\n", "more 4\n"], 30)
+        )
+        # Only the new content was scanned, by the same index.
+        self.assertIs(line_index(self.log), index)
+        self.assertGreater(index.size, scanned)
+        # Rotation, ie a new file of the same name.
+        os.rename(self.log, self.log + ".old")
+        self.write(["new 0\n", "new 1\n"])
+        self.assertEqual(read_page(self.log, 0, 5), (0, ["new 0\n", "new 1\n"], 2))
+
+    def test_tail_lines(self):
+        self.assertEqual(tail_lines(self.log, 3), self.lines[-3:])
+        self.assertEqual(tail_lines(self.log, 100), self.lines)
+        self.write(["partial"], mode="a")
+        self.assertEqual(tail_lines(self.log, 2), ["line 24\n", "partial"])
+
+    def test_follow(self):
+        appended = follow(self.log, timeout=0.1)
+        self.assertEqual(next(appended), [])
+        self.write(["new 0\n", "new"], mode="a")
+        self.assertEqual(next(appended), ["new 0\n"])
+        self.write([" 1\n"], mode="a")
+        self.assertEqual(next(appended), ["new 1\n"])
+        self.assertEqual(next(appended), [])
+        # Truncation restarts from the start of the file.
+        self.write(["truncated\n"])
+        self.assertEqual(next(appended), ["truncated\n"])
+        appended.close()
+
+    def test_search_log(self):
+        smbd_lines = [
+            "[2021/10/18 19:00:00.000001,  0] ../source3/smbd/server.c:1\n",
+            "  smbd version 4.13 started.\n",
+            "[2021/10/18 19:05:00.000001,  0] ../source3/auth/auth.c:2\n",
+            "  check_ntlm_password: NT_STATUS_NO_SUCH_USER\n",
+            "[2021/10/18 19:10:00.000001,  0] ../source3/auth/auth.c:2\n",
+            "  check_ntlm_password: nt_status_wrong_password\n",
+        ]
+        self.write(smbd_lines)
+        result = search_log(self.log, "NT_STATUS")
+        self.assertEqual(result["total"], 1)
+        self.assertEqual(result["matches"][0]["line_number"], 4)
+        self.assertEqual(result["matches"][0]["offset"], len("".join(smbd_lines[:3])))
+        result = search_log(self.log, "NT_STATUS", ignore_case=True)
+        self.assertEqual(result["total"], 2)
+        result = search_log(self.log, r"auth\.c:\d", regex=True, start=1, count=5)
+        self.assertEqual(result["total"], 2)
+        self.assertEqual([m["line_number"] for m in result["matches"]], [5])
+        # Continuation lines take the time of their preceding line.
+        result = search_log(
+            self.log,
+            "check_ntlm",
+            since=datetime(2021, 10, 18, 19, 6),
+            until=parse_time("2021-10-18 19:10:00"),
+        )
+        self.assertEqual([m["line_number"] for m in result["matches"]], [6])
+        # Rotated and compressed.
+        gz_log = self.log + "-20211018.gz"
+        gz = gzip.open(gz_log, "wb")
+        gz.write("".join(smbd_lines * 3).encode())
+        gz.close()
+        result = search_log(gz_log, "NT_STATUS", ignore_case=True)
+        self.assertEqual(result["total"], 6)
+        self.assertEqual(result["matches"][5]["line_number"], 18)
+
+    def test_search_log_cache(self):
+        with patch("system.logreader._scan_log") as mock_scan:
+            mock_scan.return_value = [], False
+            search_log(self.log, "line 1")
+            search_log(self.log, "line 1", start=100)
+            self.assertEqual(mock_scan.call_count, 1)
+            search_log(self.log, "line 2")
+            self.assertEqual(mock_scan.call_count, 2)
+            # A new log generation is scanned afresh.
+            self.write(["line 100\n"], mode="a")
+            search_log(self.log, "line 1")
+            self.assertEqual(mock_scan.call_count, 3)
+
+    def test_search_log_cancelled(self):
+        with patch("system.logreader.SEARCH_CHECK_LINES", 10):
+            checks = []
+
+            def cancelled():
+                checks.append(1)
+                return len(checks) > 1
+
+            with self.assertRaises(SearchCancelled):
+                search_log(self.log, "line 2", cancelled=cancelled)
+            # Not cached.
+            result = search_log(self.log, "line 2")
+            self.assertEqual(result["total"], 6)
+        with self.assertRaises(ValueError):
+            parse_time("18/10/2021")
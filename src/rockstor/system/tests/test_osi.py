@@ -13,10 +13,20 @@ You should have received a copy of the GNU General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 import operator
+import os
+import shutil
+import tempfile
+import time
 import unittest
-from mock import patch
+from mock import call, patch
+from multiprocessing.pool import ThreadPool
 
+from system import devfs
 from system.osi import get_dev_byid_name, Disk, scan_disks, get_byid_name_map
+from system.osi import (get_byid_temp_name_map, get_disks_power_info,
+                        read_hdparm_settings, run_command)
+from system.osi import (EXPORTFS, exports_pairs, nfs_export_table,
+                        nfs_options_current, refresh_nfs_exports)
 
 
 class Pool(object):
@@ -48,6 +58,15 @@ class OSITests(unittest.TestCase):
         self.mock_root_disk = self.patch_root_disk.start()
         self.mock_root_disk.return_value = '/dev/sda'
 
+        # Our command output fixtures are only consulted when the native
+        # /dev and udev database readers find nothing, so default to that.
+        self.patch_dir_links = patch('system.osi.dir_links')
+        self.mock_dir_links = self.patch_dir_links.start()
+        self.mock_dir_links.return_value = None
+        self.patch_udev_properties = patch('system.osi.udev_properties')
+        self.mock_udev_properties = self.patch_udev_properties.start()
+        self.mock_udev_properties.return_value = None
+
     def tearDown(self):
         patch.stopall()
 
@@ -1922,3 +1941,295 @@ class OSITests(unittest.TestCase):
 #                 # But readlines() != splitlines() on break !!! readlines splits on \n only.
 #                 # https://discuss.python.org/t/changing-str-splitlines-to-match-file-readlines/174
 #             self.mocked_open.assertEqual(returned, expected)
+
+
+class RunCommandTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_osi*
+    """
+    def test_run_command_timeout(self):
+        """
+        A command still running at timeout is killed, raising regardless of
+        throw, while one exiting in time is unaffected.
+        """
+        t0 = time.time()
+        with self.assertRaisesRegexp(Exception, 'killed after 0.2 seconds'):
+            run_command(['sleep', '10'], throw=False, timeout=0.2)
+        self.assertLess(time.time() - t0, 5)
+        out, err, rc = run_command(['echo', 'done'], timeout=5)
+        self.assertEqual((out[0], rc), ('done', 0))
+
+
+class DiskPropsTests(unittest.TestCase):
+    """
+    Bulk disk property readers, as used by
+    storageadmin.views.disk.resolve_disk_props().
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_osi*
+    """
+    def setUp(self):
+        devfs.clear_cache()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.patch_power_status = patch('system.osi.get_disk_power_status')
+        self.mock_power_status = self.patch_power_status.start()
+        self.patch_apm_level = patch('system.osi.get_disk_APM_level')
+        self.mock_apm_level = self.patch_apm_level.start()
+
+    def tearDown(self):
+        patch.stopall()
+        shutil.rmtree(self.tmp_dir)
+        devfs.clear_cache()
+
+    def test_get_byid_temp_name_map(self):
+        """
+        by-id names, including partitions and multiple names for the same
+        device, map to their kernel names from a single directory read.
+        """
+        byid_dir = os.path.join(self.tmp_dir, 'by-id')
+        os.mkdir(byid_dir)
+        for name, target in [
+            ('ata-QEMU_HARDDISK_QM00005', '../../sda'),
+            ('ata-QEMU_HARDDISK_QM00005-part1', '../../sda1'),
+            ('wwn-0x5000cca252017870', '../../sdb'),
+            ('scsi-35000cca252017870', '../../sdb'),
+            ('nvme-eui.0025388b71b09451', '../../nvme0n1'),
+        ]:
+            os.symlink(target, os.path.join(byid_dir, name))
+        os.mkdir(os.path.join(byid_dir, 'scsi-SDELL_PERC_6'))
+        with patch('system.osi.dir_links',
+                   side_effect=lambda path: devfs.dir_links(byid_dir)):
+            self.assertEqual(get_byid_temp_name_map(), {
+                'ata-QEMU_HARDDISK_QM00005': 'sda',
+                'ata-QEMU_HARDDISK_QM00005-part1': 'sda1',
+                'wwn-0x5000cca252017870': 'sdb',
+                'scsi-35000cca252017870': 'sdb',
+                'nvme-eui.0025388b71b09451': 'nvme0n1',
+            })
+        # An unreadable by-id directory, ie no disks with serials, maps none.
+        with patch('system.osi.dir_links', return_value=None):
+            self.assertEqual(get_byid_temp_name_map(), {})
+
+    def test_read_hdparm_settings(self):
+        """
+        Each device's setting is the comment directly following its
+        ExecStart line, as written by update_hdparm_service().
+        """
+        service = os.path.join(self.tmp_dir, 'rockstor-hdparm.service')
+        with open(service, 'w') as sfo:
+            sfo.write(
+                '[Unit]\n'
+                'Description=Rockstor hdparm settings\n'
+                '# N.B. Requires a clear line after Unit & Service sections.\n'
+                '\n'
+                '[Service]\n'
+                'Type=oneshot\n'
+                'ExecStart=/usr/sbin/hdparm -q -S240 -q -B127 '
+                '/dev/disk/by-id/ata-QEMU_HARDDISK_QM00005\n'
+                '# 20 minutes\n'
+                'ExecStart=/usr/sbin/hdparm -q -S60 '
+                '/dev/disk/by-id/ata-QEMU_HARDDISK_QM00007\n'
+                'ExecStart=/usr/sbin/hdparm -q -S120 -q -B64 '
+                '/dev/disk/by-id/wwn-0x5000cca252017870\n'
+                '# 10 minutes\n'
+                '\n'
+                '[Install]\n'
+                'WantedBy=suspend.target basic.target\n')
+        with patch('system.osi.HDPARM_SERVICE', service):
+            # QM00007 has no comment following its entry.
+            self.assertEqual(read_hdparm_settings(), {
+                'ata-QEMU_HARDDISK_QM00005': '20 minutes',
+                'wwn-0x5000cca252017870': '10 minutes',
+            })
+        with patch('system.osi.HDPARM_SERVICE',
+                   os.path.join(self.tmp_dir, 'bogus')):
+            self.assertEqual(read_hdparm_settings(), {})
+
+    def test_get_disks_power_info(self):
+        """
+        Power state and APM level are queried per device within a pool of
+        no more than max_workers threads.
+        """
+        self.mock_power_status.side_effect = lambda dev: {
+            'disk-1': 'active/idle', 'disk-2': 'standby',
+            'disk-3': 'active/idle'}[dev]
+        self.mock_apm_level.side_effect = lambda dev: {
+            'disk-1': 127, 'disk-2': 254, 'disk-3': 0}[dev]
+        with patch('system.osi.ThreadPool', wraps=ThreadPool) as mock_pool:
+            self.assertEqual(
+                get_disks_power_info(['disk-1', 'disk-2', 'disk-3'],
+                                     max_workers=2),
+                {'disk-1': ('active/idle', 127), 'disk-2': ('standby', 254),
+                 'disk-3': ('active/idle', 0)})
+            mock_pool.assert_called_once_with(2)
+            # No more workers than devices.
+            get_disks_power_info(['disk-1'], max_workers=2)
+            mock_pool.assert_called_with(1)
+            # Nor any pool at all for no devices.
+            self.assertEqual(get_disks_power_info([]), {})
+            self.assertEqual(mock_pool.call_count, 2)
+
+    def test_get_disks_power_info_failure(self):
+        """
+        A device whose queries raise reports (None, None) without failing,
+        or losing, the results of others.
+        """
+        def power_status(dev):
+            if dev == 'disk-2':
+                raise Exception('hdparm failed')
+            return 'active/idle'
+        self.mock_power_status.side_effect = power_status
+        self.mock_apm_level.return_value = 127
+        self.assertEqual(
+            get_disks_power_info(['disk-1', 'disk-2', 'disk-3']),
+            {'disk-1': ('active/idle', 127), 'disk-2': (None, None),
+             'disk-3': ('active/idle', 127)})
+
+
+class NFSExportTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_osi*
+    """
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.etab = os.path.join(self.tmp_dir, 'etab')
+        self.exports = os.path.join(self.tmp_dir, 'exports')
+        self.patch_etab = patch('system.osi.NFS_ETAB', self.etab)
+        self.patch_etab.start()
+        self.patch_exports = patch('system.osi.NFS_EXPORTS', self.exports)
+        self.patch_exports.start()
+        self.patch_run_command = patch('system.osi.run_command')
+        self.mock_run_command = self.patch_run_command.start()
+        self.patch_is_mounted = patch('system.osi.is_mounted')
+        self.mock_is_mounted = self.patch_is_mounted.start()
+        self.mock_is_mounted.return_value = True
+        self.patch_teardown = patch('system.osi.nfs4_mount_teardown')
+        self.mock_teardown = self.patch_teardown.start()
+
+    def tearDown(self):
+        patch.stopall()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_nfs_export_table(self):
+        with open(self.etab, 'w') as fo:
+            fo.write(
+                '/export/share1\t*(ro,async,wdelay,hide,insecure,root_squash)\n'
+                '/export/share2\t192.168.1.0/24(rw,sync,no_root_squash)\n')
+        self.assertEqual(nfs_export_table(self.etab), {
+            ('/export/share1', '*'): set(
+                ['ro', 'async', 'wdelay', 'hide', 'insecure', 'root_squash']),
+            ('/export/share2', '192.168.1.0/24'): set(
+                ['rw', 'sync', 'no_root_squash']),
+        })
+        self.assertEqual(
+            nfs_export_table(os.path.join(self.tmp_dir, 'none')), {})
+
+    def test_refresh_nfs_exports(self):
+        """
+        Only new or changed client/export pairs are exported, and those no
+        longer wanted unexported, against the active export table.
+        """
+        with open(self.etab, 'w') as fo:
+            # unchanged: our options are a subset of those in force.
+            fo.write('/export/share1\t*(ro,async,wdelay,hide,insecure)\n')
+            # options changed
+            fo.write('/export/share2\t*(ro,async,insecure)\n')
+            # no longer wanted
+            fo.write('/export/share3\thost3(rw,async,insecure)\n')
+        exports = {
+            '/export/share1': [{'client_str': '*',
+                                'option_list': 'ro,async,insecure',
+                                'mnt_pt': '/mnt2/share1'}],
+            '/export/share2': [{'client_str': '*',
+                                'option_list': 'rw,async,insecure',
+                                'mnt_pt': '/mnt2/share2'},
+                               {'client_str': 'host2',
+                                'option_list': 'rw,async,insecure',
+                                'mnt_pt': '/mnt2/share2'}],
+            '/export/share4': [],
+        }
+        exported, unexported = refresh_nfs_exports(exports)
+        self.assertEqual(
+            exported, [('*', '/export/share2'), ('host2', '/export/share2')])
+        self.assertEqual(unexported, [('host3', '/export/share3')])
+        self.assertEqual(self.mock_run_command.call_args_list, [
+            call([EXPORTFS, '-u', 'host3:/export/share3']),
+            call([EXPORTFS, '-i', '-o', 'rw,async,insecure',
+                  '*:/export/share2', 'host2:/export/share2']),
+        ])
+        self.mock_teardown.assert_called_once_with('/export/share4')
+        with open(self.exports) as fo:
+            self.assertEqual(
+                fo.read(),
+                '/export/share1 *(ro,async,insecure) \n'
+                '/export/share2 *(rw,async,insecure) '
+                'host2(rw,async,insecure) \n')
+
+        # Once active, nothing is left to do.
+        with open(self.etab, 'w') as fo:
+            fo.write('/export/share1\t*(ro,async,insecure)\n'
+                     '/export/share2\t*(rw,async,insecure)\n'
+                     '/export/share2\thost2(rw,async,insecure)\n')
+        self.mock_run_command.reset_mock()
+        self.assertEqual(refresh_nfs_exports(exports), ([], []))
+        self.assertEqual(self.mock_run_command.call_count, 0)
+
+    def test_nfs_options_current(self):
+        active = set(['rw', 'async', 'wdelay', 'hide', 'insecure',
+                      'no_root_squash', 'no_all_squash', 'no_subtree_check',
+                      'sec=sys', 'anonuid=65534'])
+        self.assertTrue(nfs_options_current(
+            'rw,async,insecure,no_root_squash', active))
+        # Flags left at their default must be so in force.
+        self.assertFalse(nfs_options_current('rw,async,insecure', active))
+        self.assertFalse(nfs_options_current(
+            'rw,async,insecure,no_root_squash,nohide', active))
+        self.assertFalse(nfs_options_current(
+            'rw,async,insecure,no_root_squash,anonuid=1000', active))
+        # The last given of a pair takes precedence.
+        self.assertTrue(nfs_options_current(
+            'ro,rw,async,insecure,no_root_squash', active))
+
+    def test_refresh_nfs_exports_dropped_option(self):
+        """
+        Dropping an option, ie no_root_squash with the admin host, re-exports
+        so the default (root_squash) is in force.
+        """
+        with open(self.etab, 'w') as fo:
+            fo.write('/export/share1\t*(rw,async,wdelay,hide,insecure,'
+                     'no_root_squash,no_subtree_check,sec=sys)\n')
+        exports = {
+            '/export/share1': [{'client_str': '*',
+                                'option_list': 'rw,async,insecure',
+                                'mnt_pt': '/mnt2/share1'}],
+        }
+        self.assertEqual(refresh_nfs_exports(exports),
+                         ([('*', '/export/share1')], []))
+        self.assertEqual(self.mock_run_command.call_args_list, [
+            call([EXPORTFS, '-i', '-o', 'rw,async,insecure',
+                  '*:/export/share1']),
+        ])
+
+    def test_refresh_nfs_exports_unmanaged(self):
+        """
+        Only our own exports are unexported: those under NFS_EXPORT_ROOT or
+        in our prior /etc/exports, not those from /etc/exports.d or by hand.
+        """
+        with open(self.exports, 'w') as fo:
+            fo.write('/srv/legacy host1(rw,async) host2(ro) \n')
+        with open(self.etab, 'w') as fo:
+            fo.write('/export/share1\t*(rw,async,insecure)\n'
+                     '/srv/legacy\thost1(rw,async)\n'
+                     '/srv/other\t*(ro,sync)\n')
+        self.assertEqual(refresh_nfs_exports({}), ([], [
+            ('*', '/export/share1'), ('host1', '/srv/legacy')]))
+        self.assertEqual(self.mock_run_command.call_args_list, [
+            call([EXPORTFS, '-u', '*:/export/share1', 'host1:/srv/legacy']),
+        ])
+        self.assertEqual(exports_pairs('# comment\n/export/share1 *(ro) h2\n'),
+                         set([('/export/share1', '*'),
+                              ('/export/share1', 'h2')]))
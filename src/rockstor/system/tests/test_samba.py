@@ -0,0 +1,127 @@
+"""
+Copyright (c) 2012-2021 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock, patch
+
+from system.samba import RS_SHARES_FOOTER, RS_SHARES_HEADER, refresh_smb_config
+
+
+class SystemSambaTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor-dev>
+    ./bin/test --settings=test-settings -v 3 -p test_samba*
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.shares_dir = os.path.join(self.tmp_dir, "rockstor-shares")
+        self.smb_conf = os.path.join(self.tmp_dir, "smb.conf")
+        with open(self.smb_conf, "w") as fo:
+            fo.write("[global]\n    workgroup = SAMBA\n\n")
+        self.patch_smb_config = patch("system.samba.SMB_CONFIG", self.smb_conf)
+        self.patch_smb_config.start()
+        self.patch_shares_dir = patch("system.samba.SMB_SHARES_DIR", self.shares_dir)
+        self.patch_shares_dir.start()
+        self.patch_test_parm = patch("system.samba.test_parm")
+        self.mock_test_parm = self.patch_test_parm.start()
+
+    def tearDown(self):
+        patch.stopall()
+        shutil.rmtree(self.tmp_dir)
+
+    def export(self, name, comment="samba export", custom_config=()):
+        e = MagicMock()
+        e.share.name = name
+        e.path = "/mnt2/{}".format(name)
+        e.comment = comment
+        e.browsable = "yes"
+        e.read_only = "no"
+        e.guest_ok = "no"
+        e.shadow_copy = False
+        e.time_machine = False
+        e.admin_users.all.return_value = []
+        e.sambacustomconfig_set.all.return_value = [
+            MagicMock(custom_config=cc) for cc in custom_config
+        ]
+        return e
+
+    def read(self, path):
+        with open(path) as fo:
+            return fo.read()
+
+    def test_refresh_smb_config(self):
+        """
+        Only changed export configs are rewritten, and smb.conf only when
+        exports are added or removed.
+        """
+        share1 = self.export("share1")
+        share2 = self.export("share2")
+        self.assertEqual(refresh_smb_config([share1, share2]), ["share1", "share2"])
+        self.assertEqual(
+            self.read(self.smb_conf),
+            "[global]\n    workgroup = SAMBA\n\n"
+            "{}\n"
+            "include = {}/share1.conf\n"
+            "include = {}/share2.conf\n"
+            "{}\n".format(
+                RS_SHARES_HEADER, self.shares_dir, self.shares_dir, RS_SHARES_FOOTER
+            ),
+        )
+        self.assertTrue(
+            "[share1]\n" in self.read(os.path.join(self.shares_dir, "share1.conf"))
+        )
+        smb_conf_mtime = os.stat(self.smb_conf).st_mtime
+        share1_mtime = os.stat(os.path.join(self.shares_dir, "share1.conf")).st_mtime
+
+        # Nothing changed.
+        self.assertEqual(refresh_smb_config([share1, share2]), [])
+
+        # A single export changed.
+        share2 = self.export("share2", custom_config=["force user = nobody"])
+        os.utime(self.smb_conf, (0, 0))
+        self.assertEqual(refresh_smb_config([share1, share2]), ["share2"])
+        self.assertEqual(os.stat(self.smb_conf).st_mtime, 0)
+        self.assertEqual(
+            os.stat(os.path.join(self.shares_dir, "share1.conf")).st_mtime,
+            share1_mtime,
+        )
+        self.assertTrue(
+            "    force user = nobody\n"
+            in self.read(os.path.join(self.shares_dir, "share2.conf"))
+        )
+
+        # An export removed.
+        self.assertEqual(refresh_smb_config([share2]), ["share1"])
+        self.assertFalse(os.path.exists(os.path.join(self.shares_dir, "share1.conf")))
+        self.assertFalse("share1" in self.read(self.smb_conf))
+        self.assertNotEqual(os.stat(self.smb_conf).st_mtime, smb_conf_mtime)
+
+    def test_refresh_smb_config_invalid(self):
+        """
+        Nothing is changed if testparm rejects the resulting config.
+        """
+        share1 = self.export("share1")
+        refresh_smb_config([share1])
+        smb_conf = self.read(self.smb_conf)
+        self.mock_test_parm.side_effect = Exception("Syntax error")
+        with self.assertRaises(Exception):
+            refresh_smb_config([share1, self.export("share2")])
+        self.assertEqual(self.read(self.smb_conf), smb_conf)
+        self.assertEqual(os.listdir(self.shares_dir), ["share1.conf"])
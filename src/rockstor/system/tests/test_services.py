@@ -0,0 +1,118 @@
+"""
+Copyright (c) 2012-2021 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import threading
+import time
+import unittest
+
+from mock import patch
+
+from system.services import service_statuses, clear_status_cache
+
+
+class SystemServicesTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor-dev>
+    ./bin/test --settings=test-settings -v 3 -p test_services*
+    """
+
+    def setUp(self):
+        clear_status_cache()
+        self.patch_service_status = patch("system.services.service_status")
+        self.mock_service_status = self.patch_service_status.start()
+
+    def tearDown(self):
+        patch.stopall()
+        clear_status_cache()
+
+    def test_service_statuses_concurrent(self):
+        # Each probe only returns once all have started.
+        services = [("nfs", None), ("smb", None), ("ldap", {"server": "ldap"})]
+        started = []
+        all_started = threading.Condition()
+
+        def probe(service_name, config, timeout=None):
+            with all_started:
+                started.append(service_name)
+                all_started.notify_all()
+                while len(started) < len(services):
+                    all_started.wait(1)
+            return [""], [""], 0 if service_name != "smb" else 3
+
+        self.mock_service_status.side_effect = probe
+        statuses = service_statuses(services, timeout=5)
+        self.assertEqual(len(started), 3)
+        self.assertEqual(statuses["nfs"][2], 0)
+        self.assertEqual(statuses["smb"][2], 3)
+        self.assertEqual(statuses["ldap"][2], 0)
+
+    def test_service_statuses_cache(self):
+        self.mock_service_status.return_value = [""], [""], 0
+        service_statuses([("nfs", None), ("smb", None)])
+        self.assertEqual(self.mock_service_status.call_count, 2)
+        # Within ttl only a service not already probed, or with a new config,
+        # is probed again.
+        statuses = service_statuses([("nfs", None), ("sftp", None)])
+        self.assertEqual(self.mock_service_status.call_count, 3)
+        self.assertEqual(sorted(statuses.keys()), ["nfs", "sftp"])
+        service_statuses([("nfs", {"server": "x"})])
+        self.assertEqual(self.mock_service_status.call_count, 4)
+        service_statuses([("nfs", None)], ttl=0)
+        self.assertEqual(self.mock_service_status.call_count, 5)
+        clear_status_cache()
+        service_statuses([("nfs", None)])
+        self.assertEqual(self.mock_service_status.call_count, 6)
+
+    def test_service_statuses_timeout(self):
+        """
+        A hung probe times out from its own start, is passed our timeout for
+        its commands, and is not started again while it is still running.
+        """
+        release = threading.Event()
+
+        def probe(service_name, config, timeout=None):
+            if service_name == "smb":
+                release.wait(10)
+            return [""], [""], 0
+
+        self.mock_service_status.side_effect = probe
+        services = [("nfs", None), ("smb", None), ("sftp", None)]
+        t0 = time.time()
+        statuses = service_statuses(services, timeout=0.5, max_workers=2)
+        self.assertLess(time.time() - t0, 1.5)
+        self.assertEqual(statuses["nfs"][2], 0)
+        self.assertIsNone(statuses["smb"])
+        self.assertEqual(statuses["sftp"][2], 0)
+        self.mock_service_status.assert_any_call("smb", None, timeout=0.5)
+        # Even when forced, the outstanding probe is shared, not repeated.
+        t0 = time.time()
+        statuses = service_statuses([("smb", None)], ttl=0, timeout=0.5)
+        self.assertLess(time.time() - t0, 0.5)
+        self.assertIsNone(statuses["smb"])
+        self.assertEqual(self.mock_service_status.call_count, 3)
+        # Once returned, its result is cached.
+        release.set()
+        for _ in range(50):
+            if service_statuses([("smb", None)], timeout=0.5)["smb"] is not None:
+                break
+            time.sleep(0.1)
+        self.assertEqual(service_statuses([("smb", None)])["smb"][2], 0)
+        self.assertEqual(self.mock_service_status.call_count, 3)
+
+    def test_service_statuses_failure_cached(self):
+        self.mock_service_status.side_effect = Exception("systemctl failed")
+        self.assertIsNone(service_statuses([("nfs", None)])["nfs"])
+        self.assertIsNone(service_statuses([("nfs", None)])["nfs"])
+        self.assertEqual(self.mock_service_status.call_count, 1)
@@ -0,0 +1,173 @@
+"""
+Copyright (c) 2012-2021 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import unittest
+
+from mock import patch
+
+from system.exceptions import CommandException
+from system.smart import (
+    collect,
+    parse_info,
+    parse_capabilities,
+    parse_error_logs,
+    parse_test_logs,
+    READ_SECTION,
+)
+
+
+class SystemSmartTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor-dev>
+    ./bin/test --settings=test-settings -v 3 -p test_smart*
+    """
+
+    def setUp(self):
+        self.preamble = [
+            "smartctl 7.0 2019-05-21 r4917 [x86_64-linux-5.3.18-lp152.63-default] (SUSE RPM)",  # noqa E501
+            "Copyright (C) 2002-18, Bruce Allen, Christian Franke, www.smartmontools.org",  # noqa E501
+            "",
+        ]
+        self.info = [
+            "=== START OF INFORMATION SECTION ===",
+            "Model Family:     Western Digital Red",
+            "Device Model:     WDC WD40EFRX-68N32N0",
+            "Serial Number:    WD-WCC7K1234567",
+            "Firmware Version: 82.00A82",
+            "User Capacity:    4,000,787,030,016 bytes [4.00 TB]",
+            "Device is:        In smartctl database [for details use: -P show]",
+            "SMART support is: Available - device has SMART capability.",
+            "SMART support is: Enabled",
+            "",
+        ]
+        self.health = [
+            "SMART overall-health self-assessment test result: PASSED",
+            "",
+        ]
+        self.capabilities = [
+            "General SMART Values:",
+            "Offline data collection status:  (0x00)\tOffline data collection activity",  # noqa E501
+            "\t\t\t\t\twas never started.",
+            "Self-test execution status:      (   0)\tThe previous self-test routine completed",  # noqa E501
+            "\t\t\t\t\twithout error or no self-test has ever ",
+            "\t\t\t\t\tbeen run.",
+            "Short self-test routine ",
+            "recommended polling time: \t (   2) minutes.",
+            "",
+        ]
+        self.attributes = [
+            "SMART Attributes Data Structure revision number: 16",
+            "Vendor Specific SMART Attributes with Thresholds:",
+            "ID# ATTRIBUTE_NAME          FLAG     VALUE WORST THRESH TYPE      UPDATED  WHEN_FAILED RAW_VALUE",  # noqa E501
+            "  1 Raw_Read_Error_Rate     0x002f   200   200   051    Pre-fail  Always       -       0",  # noqa E501
+            "  9 Power_On_Hours          0x0032   071   071   000    Old_age   Always       -       21234",  # noqa E501
+            "",
+        ]
+        self.error_log = [
+            "SMART Error Log Version: 1",
+            "ATA Error Count: 1",
+            "",
+            "Error 1 occurred at disk power-on lifetime: 20000 hours (833 days + 8 hours)",  # noqa E501
+            "  When the command that caused the error occurred, the device was active or idle.",  # noqa E501
+            "",
+            "  After command completion occurred, registers were:",
+            "  40 51 00 ff ff ff 0f  Error: UNC at LBA = 0x0fffffff = 268435455",
+            "",
+        ]
+        self.test_log = [
+            "SMART Self-test log structure revision number 1",
+            "Num  Test_Description    Status                  Remaining  LifeTime(hours)  LBA_of_first_error",  # noqa E501
+            "# 1  Short offline       Completed without error       00%     21200         -",  # noqa E501
+            "# 2  Extended offline    Completed without error       00%     20100         -",  # noqa E501
+            "",
+            "SMART Selective self-test log data structure revision number 1",
+            " SPAN  MIN_LBA  MAX_LBA  CURRENT_TEST_STATUS",
+            "    1        0        0  Not_testing",
+            "",
+        ]
+        self.a_out = (
+            self.preamble
+            + self.info
+            + [READ_SECTION]
+            + self.health
+            + self.capabilities
+            + self.attributes
+            + self.error_log
+            + self.test_log
+        )
+        self.patch_run_command = patch("system.smart.run_command")
+        self.mock_run_command = self.patch_run_command.start()
+        self.mock_run_command.return_value = self.a_out, [""], 64
+        self.patch_get_dev_options = patch("system.smart.get_dev_options")
+        self.mock_get_dev_options = self.patch_get_dev_options.start()
+        self.mock_get_dev_options.return_value = ["/dev/sda"]
+        self.patch_email_root = patch("system.smart.email_root")
+        self.mock_email_root = self.patch_email_root.start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_collect(self):
+        """
+        A single smartctl -a call parses as per the individual commands.
+        """
+        data = collect("ata-WDC_WD40EFRX-68N32N0_WD-WCC7K1234567")
+        self.mock_run_command.assert_called_once_with(
+            ["/usr/sbin/smartctl", "-a", "/dev/sda"], throw=False
+        )
+        # smartctl -H --info
+        self.assertEqual(
+            data["info"],
+            parse_info(self.preamble + self.info + [READ_SECTION] + self.health),
+        )
+        self.assertEqual(data["info"][2], "WD-WCC7K1234567")
+        self.assertEqual(data["info"][15], "PASSED")
+        # smartctl -c
+        self.assertEqual(
+            data["capabilities"],
+            parse_capabilities(self.preamble + [READ_SECTION] + self.capabilities),
+        )
+        self.assertEqual(len(data["capabilities"]), 3)
+        self.assertEqual(
+            sorted(data["extended_info"].keys()),
+            ["Power_On_Hours", "Raw_Read_Error_Rate"],
+        )
+        # smartctl -l error
+        self.assertEqual(
+            data["error_logs"],
+            parse_error_logs(self.preamble + [READ_SECTION] + self.error_log),
+        )
+        self.assertEqual(data["error_logs"][0]["1"][0], 20000)
+        # smartctl -l selftest -l selective
+        self.assertEqual(
+            data["test_logs"], parse_test_logs(self.preamble + self.test_log)
+        )
+        self.assertEqual(sorted(data["test_logs"][0].keys()), ["1", "2"])
+        self.assertIn("    1        0        0  Not_testing", data["test_logs"][1])
+        # Error log entries are notified.
+        self.assertEqual(self.mock_email_root.call_count, 1)
+        collect("ata-WDC_WD40EFRX-68N32N0_WD-WCC7K1234567", notify=False)
+        self.assertEqual(self.mock_email_root.call_count, 1)
+
+    def test_collect_failed(self):
+        # SMART disabled: command failure bit only.
+        self.mock_run_command.return_value = self.preamble + self.info, [""], 4
+        data = collect("ata-WDC_WD40EFRX-68N32N0_WD-WCC7K1234567")
+        self.assertEqual(data["capabilities"], {})
+        self.assertEqual(data["test_logs"], ({}, []))
+        # Device open failed.
+        self.mock_run_command.return_value = self.preamble, [""], 2
+        with self.assertRaises(CommandException):
+            collect("ata-WDC_WD40EFRX-68N32N0_WD-WCC7K1234567")
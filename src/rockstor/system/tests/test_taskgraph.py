@@ -0,0 +1,161 @@
+"""
+Copyright (c) 2012-2021 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import threading
+import time
+import unittest
+
+from system.taskgraph import DONE, FAILED, SKIPPED, TaskGraph
+
+
+class TaskGraphTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor-dev>
+    ./bin/test --settings=test-settings -v 3 -p test_taskgraph*
+    """
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.order = []
+
+    def record(self, name, delay=0):
+        time.sleep(delay)
+        with self.lock:
+            self.order.append(name)
+
+    def failing(self, name):
+        self.record(name)
+        raise Exception("{} failed".format(name))
+
+    def statuses(self, report):
+        return {t["name"]: t["status"] for t in report["tasks"]}
+
+    def test_dependency_order(self):
+        """
+        Tasks run after those they depend on, independent tasks concurrently.
+        """
+        graph = TaskGraph(max_workers=4)
+        graph.add("disks", self.record, ("disks",))
+        graph.add("pool:1", self.record, ("pool:1", 0.1), deps=("disks",))
+        graph.add("pool:2", self.record, ("pool:2",), deps=("disks",))
+        graph.add("share:1", self.record, ("share:1",), deps=("pool:1",))
+        report = graph.run()
+        self.assertEqual(self.order[0], "disks")
+        # pool:2 does not wait on the slower pool:1.
+        self.assertEqual(self.order[1:], ["pool:2", "pool:1", "share:1"])
+        self.assertTrue(all(s == DONE for s in self.statuses(report).values()))
+
+    def test_failure_skips_dependants(self):
+        """
+        A failed task skips its dependants, transitively, but not the tasks
+        merely ordered after it, or unrelated tasks.
+        """
+        graph = TaskGraph(max_workers=2)
+        graph.add("pool:1", self.failing, ("pool:1",))
+        graph.add("shares:1", self.record, ("shares:1",), deps=("pool:1",))
+        graph.add("share:1", self.record, ("share:1",), deps=("shares:1",))
+        graph.add("nfs", self.record, ("nfs",), after=("share:1",))
+        graph.add("pool:2", self.record, ("pool:2",))
+        report = graph.run()
+        self.assertEqual(
+            self.statuses(report),
+            {
+                "pool:1": FAILED,
+                "shares:1": SKIPPED,
+                "share:1": SKIPPED,
+                "nfs": DONE,
+                "pool:2": DONE,
+            },
+        )
+        self.assertEqual(sorted(self.order), ["nfs", "pool:1", "pool:2"])
+        self.assertEqual(report["tasks"][0]["error"], "pool:1 failed")
+
+    def test_tasks_added_while_running(self):
+        """
+        Tasks may add further tasks, including ones depending on themselves.
+        """
+        graph = TaskGraph(max_workers=2)
+
+        def add_shares():
+            self.record("shares")
+            for i in range(3):
+                graph.add(
+                    "share:{}".format(i),
+                    self.record,
+                    ("share:{}".format(i),),
+                    deps=("shares",),
+                    phase="mount-share",
+                )
+            graph.add(
+                "nfs", self.record, ("nfs",), after=("share:0", "share:1", "share:2")
+            )
+
+        graph.add("shares", add_shares)
+        report = graph.run()
+        self.assertEqual(self.order[0], "shares")
+        self.assertEqual(self.order[-1], "nfs")
+        self.assertEqual(len(self.order), 5)
+        self.assertEqual(report["phases"]["mount-share"]["tasks"], 3)
+
+    def test_max_workers(self):
+        """
+        No more than max_workers tasks run at once.
+        """
+        running = [0]
+        peak = [0]
+
+        def task():
+            with self.lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with self.lock:
+                running[0] -= 1
+
+        exits = []
+        graph = TaskGraph(max_workers=3, worker_exit=lambda: exits.append(1))
+        for i in range(10):
+            graph.add("task:{}".format(i), task)
+        graph.run()
+        self.assertEqual(peak[0], 3)
+        self.assertEqual(len(exits), 3)
+
+    def test_report(self):
+        """
+        Phases are reported with task counts and timing.
+        """
+        graph = TaskGraph(max_workers=2)
+        graph.add("pool:1", self.record, ("pool:1", 0.05), phase="mount-pool")
+        graph.add("pool:2", self.failing, ("pool:2",), phase="mount-pool")
+        graph.add("shares:2", self.record, ("shares:2",), deps=("pool:2",))
+        report = graph.run()
+        phase = report["phases"]["mount-pool"]
+        self.assertEqual(phase["tasks"], 2)
+        self.assertEqual(phase["failed"], 1)
+        self.assertEqual(phase["skipped"], 0)
+        self.assertEqual(report["phases"]["shares:2"]["skipped"], 1)
+        self.assertTrue(phase["busy"] >= 0.05)
+        self.assertTrue(phase["end"] <= report["total"])
+        self.assertEqual(
+            [t["name"] for t in report["tasks"]], ["pool:1", "pool:2", "shares:2"]
+        )
+
+    def test_unknown_and_duplicate_tasks(self):
+        graph = TaskGraph()
+        graph.add("disks", self.record, ("disks",))
+        with self.assertRaises(ValueError):
+            graph.add("disks", self.record, ("disks",))
+        with self.assertRaises(ValueError):
+            graph.add("pools", self.record, ("pools",), deps=("unknown",))
@@ -0,0 +1,77 @@
+"""
+Copyright (c) 2012-2021 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import unittest
+
+from system.udev import read_udev_events, BlockDeviceTable
+
+
+class SystemUdevTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor-dev>
+    ./bin/test --settings=test-settings -v 3 -p test_udev*
+    """
+
+    def setUp(self):
+        # udevadm monitor --udev --property --subsystem-match=block
+        self.monitor_out = [
+            "monitor will print the received events for:\n",
+            "UDEV - the event which udev sends out after rule processing\n",
+            "\n",
+            "UDEV  [6062.282329] add      /devices/pci0000:00/0000:00:05.0/virtio2/host2/target2:0:0/2:0:0:1/block/sdb (block)\n",  # noqa E501
+            "ACTION=add\n",
+            "DEVNAME=/dev/sdb\n",
+            "DEVPATH=/devices/pci0000:00/0000:00:05.0/virtio2/host2/target2:0:0/2:0:0:1/block/sdb\n",  # noqa E501
+            "DEVTYPE=disk\n",
+            "ID_SERIAL=0QEMU_QEMU_HARDDISK_sdb-serial\n",
+            "SUBSYSTEM=block\n",
+            "\n",
+            "UDEV  [6062.301004] add      /devices/pci0000:00/0000:00:05.0/virtio2/host2/target2:0:0/2:0:0:1/block/sdb/sdb1 (block)\n",  # noqa E501
+            "ACTION=add\n",
+            "DEVNAME=/dev/sdb1\n",
+            "DEVPATH=/devices/pci0000:00/0000:00:05.0/virtio2/host2/target2:0:0/2:0:0:1/block/sdb/sdb1\n",  # noqa E501
+            "DEVTYPE=partition\n",
+            "ID_FS_TYPE=btrfs\n",
+            "SUBSYSTEM=block\n",
+            "\n",
+            "UDEV  [6063.100000] change   /devices/virtual/block/loop0 (block)\n",
+            "ACTION=change\n",
+            "DEVNAME=/dev/loop0\n",
+            "DEVTYPE=disk\n",
+            "\n",
+        ]
+
+    def test_read_udev_events(self):
+        events = list(read_udev_events(self.monitor_out))
+        self.assertEqual(len(events), 3)
+        self.assertEqual(events[0]["ACTION"], "add")
+        self.assertEqual(events[0]["DEVNAME"], "/dev/sdb")
+        self.assertEqual(events[1]["ID_FS_TYPE"], "btrfs")
+
+    def test_block_device_table(self):
+        table = BlockDeviceTable()
+        events = list(read_udev_events(self.monitor_out))
+        self.assertEqual([table.apply(e) for e in events], [True, True, False])
+        # A partition event flags its parent disk.
+        self.assertEqual(table.pop_changed(), {"/dev/sdb", "/dev/sdb1"})
+        self.assertEqual(table.pop_changed(), set())
+        # A change event with no change in our watched properties is ignored.
+        change = dict(events[0], ACTION="change", SEQNUM="2345")
+        self.assertFalse(table.apply(change))
+        change["ID_SERIAL"] = "0QEMU_QEMU_HARDDISK_new-serial"
+        self.assertTrue(table.apply(change))
+        self.assertTrue(table.apply(dict(events[1], ACTION="remove")))
+        self.assertEqual(table.pop_changed(), {"/dev/sdb", "/dev/sdb1"})
+        self.assertNotIn("/dev/sdb1", table.devices)
@@ -0,0 +1,121 @@
+"""
+Copyright (c) 2012-2021 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import re
+from system.osi import UDEVADM
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Long lived udev netlink listener for block device events, as processed by
+# udev rules so that by-id links and ID_* properties are current.
+UDEV_MONITOR_CMD = [
+    UDEVADM,
+    "monitor",
+    "--udev",
+    "--property",
+    "--subsystem-match=block",
+]
+# Properties whose change on a known device warrants a disk re-scan.
+WATCHED_PROPERTIES = (
+    "DEVTYPE",
+    "ID_SERIAL",
+    "ID_SERIAL_SHORT",
+    "ID_FS_TYPE",
+    "ID_FS_UUID",
+    "ID_PART_TABLE_TYPE",
+    "DM_NAME",
+    "DM_UUID",
+)
+# Devices of no interest to scan_disks().
+IGNORED_DEVICES = "/dev/loop|/dev/ram|/dev/zram"
+
+
+def read_udev_events(lines):
+    """
+    Parses 'udevadm monitor --property' output into events, ie:
+    UDEV  [6062.282329] add      /devices/.../block/sdb (block)
+    ACTION=add
+    DEVNAME=/dev/sdb
+    DEVTYPE=disk
+    ...
+    followed by a blank line.
+    :param lines: iterable of output lines, consumed as they arrive.
+    :return: generator of event dicts, indexed by property name.
+    """
+    event = {}
+    for line in lines:
+        line = line.strip()
+        if line == "":
+            if "ACTION" in event:
+                yield event
+            event = {}
+            continue
+        fields = line.split("=", 1)
+        if len(fields) == 2:
+            event[fields[0]] = fields[1]
+
+
+class BlockDeviceTable(object):
+    """
+    In memory table of block devices, by kernel device name, kept current
+    from udev events. Tracks the names of devices added, removed, or with a
+    change in any of WATCHED_PROPERTIES, since last collected via
+    pop_changed(). The names are those used by scan_disks(): ie '/dev/sdb',
+    or '/dev/mapper/luks-<uuid>' for device mapper devices. A partition event
+    also flags its parent disk.
+    """
+
+    def __init__(self):
+        self.devices = {}
+        self.changed = set()
+        # True while a monitor is feeding us events.
+        self.monitoring = False
+
+    def _names(self, event):
+        names = [event["DEVNAME"]]
+        if "DM_NAME" in event:
+            names.append("/dev/mapper/{}".format(event["DM_NAME"]))
+        if event.get("DEVTYPE") == "partition" and "DEVPATH" in event:
+            # DEVPATH=/devices/.../block/sdb/sdb1
+            names.append("/dev/{}".format(event["DEVPATH"].split("/")[-2]))
+        return names
+
+    def apply(self, event):
+        """
+        Update our table with the given udev event.
+        :param event: dict as generated by read_udev_events().
+        :return: True if the event flagged a device as changed.
+        """
+        devname = event.get("DEVNAME")
+        if devname is None or re.match(IGNORED_DEVICES, devname) is not None:
+            return False
+        if event["ACTION"] == "remove":
+            self.devices.pop(devname, None)
+        else:
+            props = {k: event.get(k) for k in WATCHED_PROPERTIES}
+            if self.devices.get(devname) == props:
+                return False
+            self.devices[devname] = props
+        logger.debug("udev {} event for ({}).".format(event["ACTION"], devname))
+        self.changed.update(self._names(event))
+        return True
+
+    def pop_changed(self):
+        changed = self.changed
+        self.changed = set()
+        return changed
@@ -19,7 +19,7 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 from exceptions import CommandException
 from osi import run_command
 import subprocess
-import fcntl
+import select
 import time
 import re
 import os
@@ -46,47 +46,88 @@ SMBPASSWD = "/usr/bin/smbpasswd"
 CHOWN = "/usr/bin/chown"
 
 
-# this is a hack for AD to get as many users as possible within 90 seconds.  If
-# there are several thousands of domain users and AD isn't that fast, winbind
-# takes a long time to enumerate the users for getent. Subsequent queries
-# finish faster because of caching. But this prevents timing out.
-def get_users(max_wait=90):
-    t0 = time.time()
+def decode_name(name):
+    """
+    Decode a passwd or group database name: as utf-8, else per chardet.
+    """
+    try:
+        return name.decode("utf-8")
+    except UnicodeDecodeError:
+        charset = chardet.detect(name)
+        return name.decode(charset["encoding"])
+
+
+# With several thousands of directory service (AD/LDAP) users winbind/sssd can
+# take a long time to enumerate them for getent, subsequent queries being
+# faster because of caching. We take as many users as we can within max_wait
+# seconds, waiting on the pipe rather than polling it.
+def enumerate_users(max_wait=90):
+    """
+    :param max_wait: seconds after which enumeration is abandoned, returning
+    the users received so far.
+    :return: tuple of dict of (uid, gid, shell) tuples by username, and True
+    if enumeration completed, False if abandoned or failed: ie the users are
+    then not all the users.
+    """
+    deadline = time.time() + max_wait
     users = {}
+    complete = False
     p = subprocess.Popen(
         ["/usr/bin/getent", "passwd"],
         shell=False,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
     )
-    fcntl.fcntl(p.stdout.fileno(), fcntl.F_SETFL, os.O_NONBLOCK)
-    alive = True
+    fd = p.stdout.fileno()
     user_data = ""
-    while alive:
-        try:
-            if p.poll() is not None:
-                alive = False
-            user_data += p.stdout.read()
-        except IOError:
-            if time.time() - t0 < max_wait:
-                continue
-        except Exception as e:
-            logger.exception(e)
-            p.terminate()
-        uf = user_data.split("\n")
-        # If the feed ends in \n, the last element will be '', if not, it will
-        # be a partial line to be processed next time around.
-        user_data = uf[-1]
-        for u in uf[:-1]:
-            ufields = u.split(":")
-            if len(ufields) > 3:
-                charset = chardet.detect(ufields[0])
-                uname = ufields[0].decode(charset["encoding"])
-                users[uname] = (int(ufields[2]), int(ufields[3]), str(ufields[6]))
-            if time.time() - t0 > max_wait:
+    try:
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                logger.error(
+                    "User enumeration incomplete after {} seconds.".format(max_wait)
+                )
                 p.terminate()
                 break
-    return users
+            readable, _, _ = select.select([fd], [], [], remaining)
+            if len(readable) == 0:
+                continue
+            data = os.read(fd, 65536)
+            if data == "":
+                # EOF: getent is done.
+                complete = True
+                break
+            uf = (user_data + data).split("\n")
+            # If the feed ends in \n, the last element will be '', if not, it
+            # will be a partial line to be processed next time around.
+            user_data = uf[-1]
+            for u in uf[:-1]:
+                ufields = u.split(":")
+                if len(ufields) > 6:
+                    users[decode_name(ufields[0])] = (
+                        int(ufields[2]),
+                        int(ufields[3]),
+                        str(ufields[6]),
+                    )
+    except Exception as e:
+        logger.exception(e)
+        p.terminate()
+    finally:
+        p.stdout.close()
+        p.stderr.close()
+        p.wait()
+    if complete and p.returncode != 0:
+        logger.error("User enumeration failed (getent rc: {}).".format(p.returncode))
+        complete = False
+    return users, complete
+
+
+def get_users(max_wait=90):
+    """
+    :return: dict of (uid, gid, shell) tuples by username, as per
+    enumerate_users(), whether complete or not.
+    """
+    return enumerate_users(max_wait)[0]
 
 
 def get_groups(*gids):
@@ -94,14 +135,10 @@ def get_groups(*gids):
     if len(gids) > 0:
         for g in gids:
             entry = grp.getgrgid(g)
-            charset = chardet.detect(entry.gr_name)
-            gr_name = entry.gr_name.decode(charset["encoding"])
-            groups[gr_name] = entry.gr_gid
+            groups[decode_name(entry.gr_name)] = entry.gr_gid
     else:
         for g in grp.getgrall():
-            charset = chardet.detect(g.gr_name)
-            gr_name = g.gr_name.decode(charset["encoding"])
-            groups[gr_name] = g.gr_gid
+            groups[decode_name(g.gr_name)] = g.gr_gid
     return groups
 
 